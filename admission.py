@@ -0,0 +1,286 @@
+"""
+Контроль нагрузки: ограничение частоты отправок и квоты
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from database import Database
+
+# Счетчики, которые поддерживают триггеры, чтобы не считать COUNT(*) при каждой отправке
+COUNTER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS student_test_counts (
+        student_id INTEGER PRIMARY KEY,
+        tests INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS admission_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS count_tests_insert AFTER INSERT ON tests
+    WHEN new.student_id IS NOT NULL BEGIN
+        INSERT INTO student_test_counts (student_id, tests) VALUES (new.student_id, 1)
+        ON CONFLICT (student_id) DO UPDATE SET tests = tests + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS count_tests_delete AFTER DELETE ON tests BEGIN
+        UPDATE student_test_counts SET tests = tests - 1 WHERE student_id = old.student_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS count_tests_move AFTER UPDATE OF student_id ON tests
+    WHEN old.student_id IS NOT new.student_id AND new.student_id IS NOT NULL BEGIN
+        UPDATE student_test_counts SET tests = tests - 1 WHERE student_id = old.student_id;
+        INSERT INTO student_test_counts (student_id, tests) VALUES (new.student_id, 1)
+        ON CONFLICT (student_id) DO UPDATE SET tests = tests + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS count_students_insert AFTER INSERT ON users
+    WHEN new.role = 'student' AND new.is_approved BEGIN
+        UPDATE admission_counters SET value = value + 1 WHERE name = 'approved_students';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS count_students_update AFTER UPDATE OF role, is_approved ON users BEGIN
+        UPDATE admission_counters
+        SET value = value
+            + (new.role = 'student' AND COALESCE(new.is_approved, 0) != 0)
+            - (old.role = 'student' AND COALESCE(old.is_approved, 0) != 0)
+        WHERE name = 'approved_students';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS count_students_delete AFTER DELETE ON users
+    WHEN old.role = 'student' AND old.is_approved BEGIN
+        UPDATE admission_counters SET value = value - 1 WHERE name = 'approved_students';
+    END
+    '''
+]
+
+
+class TokenBucket:
+    """Ограничение частоты запросов пользователя в памяти процесса"""
+
+    def __init__(self, rate_per_minute: float, burst: int, idle_ttl: float = 3600):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def consume(self, key: str, cost: float = 1) -> Tuple[bool, float]:
+        """Списание токенов: (разрешено, через сколько секунд повторить)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                allowed, retry_after = True, 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed, retry_after = False, (cost - tokens) / self.rate
+
+            if now - self._last_prune > self.idle_ttl:
+                self._prune(now)
+        return allowed, retry_after
+
+    def _prune(self, now: float):
+        """Удаление давно неактивных пользователей"""
+        self._buckets = {
+            key: value for key, value in self._buckets.items()
+            if now - value[1] < self.idle_ttl
+        }
+        self._last_prune = now
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """Ограничение частоты с общим состоянием в базе для нескольких процессов"""
+
+    def __init__(self, db: Database, rate_per_minute: float, burst: int, idle_ttl: float = 3600):
+        super().__init__(rate_per_minute, burst, idle_ttl)
+        self.db = db
+        self._last_prune = time.time()
+        with sqlite3.connect(self.db.db_name) as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            connection.commit()
+
+    def consume(self, key: str, cost: float = 1) -> Tuple[bool, float]:
+        """Списание токенов в транзакции записи"""
+        def operation(cursor):
+            # Время стены, а не monotonic: оно общее для всех процессов
+            now = time.time()
+            cursor.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            tokens, updated = row if row else (self.burst, now)
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                result = (True, 0.0)
+            else:
+                result = (False, (cost - tokens) / self.rate)
+
+            cursor.execute('''
+                INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at
+            ''', (key, tokens, now))
+            if now - self._last_prune > self.idle_ttl:
+                cursor.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - self.idle_ttl,))
+                self._last_prune = now
+            return result
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            # Ошибка учета не должна блокировать отправку тестов
+            logging.error(f"Ошибка ограничения частоты: {e}")
+            return True, 0.0
+
+
+def create_rate_limiter(db: Database, backend: str, rate_per_minute: float, burst: int) -> TokenBucket:
+    """Ограничитель частоты: 'memory' - в процессе, 'sqlite' - общий для процессов"""
+    database = getattr(db, 'database', db)
+    if backend == 'sqlite' and isinstance(database, Database):
+        return SQLiteTokenBucket(database, rate_per_minute, burst)
+    if backend == 'sqlite':
+        logging.warning("Общий ограничитель частоты работает только с SQLite, используется ограничитель в памяти")
+    return TokenBucket(rate_per_minute, burst)
+
+
+class AdmissionControl:
+    """Проверка отправок и регистраций перед записью в базу.
+
+    ``db`` - Database или хранилище из storage.py. Счетчики на триггерах
+    ведутся только в SQLite, другие хранилища считают строки сами.
+    """
+
+    def __init__(self, db: Database, rate_limiter: Optional[TokenBucket],
+                 max_tests_per_student: Optional[int] = None, max_students: Optional[int] = None):
+        self.db = db
+        self.rate_limiter = rate_limiter
+        self.max_tests_per_student = max_tests_per_student
+        self.max_students = max_students
+        self.stats = {'admitted': 0, 'rate_limited': 0, 'quota_rejected': 0, 'students_rejected': 0}
+        database = getattr(db, 'database', db)
+        self.counter_db = database if isinstance(database, Database) else None
+        if self.counter_db is not None:
+            self.setup_counters()
+
+    def setup_counters(self):
+        """Создание счетчиков и триггеров; первичный подсчет при создании"""
+        with sqlite3.connect(self.counter_db.db_name) as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'admission_counters'")
+            created = cursor.fetchone() is None
+
+            for statement in COUNTER_SCHEMA:
+                cursor.execute(statement)
+
+            if created:
+                cursor.execute('''
+                    INSERT INTO student_test_counts (student_id, tests)
+                    SELECT student_id, COUNT(*) FROM tests
+                    WHERE student_id IS NOT NULL
+                    GROUP BY student_id
+                ''')
+                cursor.execute('''
+                    INSERT INTO admission_counters (name, value)
+                    SELECT 'approved_students', COUNT(*) FROM users
+                    WHERE role = 'student' AND is_approved
+                ''')
+            connection.commit()
+
+    def get_test_count(self, user_id: int) -> int:
+        """Число тестов студента по счетчику"""
+        if self.counter_db is None:
+            return self.db.count_student_tests(user_id)
+        with sqlite3.connect(self.counter_db.db_name) as connection:
+            row = connection.execute(
+                'SELECT tests FROM student_test_counts WHERE student_id = ?', (user_id,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get_student_count(self) -> int:
+        """Число одобренных студентов по счетчику"""
+        if self.counter_db is None:
+            return self.db.count_approved_students()
+        with sqlite3.connect(self.counter_db.db_name) as connection:
+            row = connection.execute(
+                "SELECT value FROM admission_counters WHERE name = 'approved_students'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def remaining_student_slots(self) -> Optional[int]:
+        """Сколько студентов еще можно зарегистрировать (None - без ограничения)"""
+        if not self.max_students:
+            return None
+        return max(0, self.max_students - self.get_student_count())
+
+    def check_submission(self, user_id: int, test_count: int = 1) -> Optional[str]:
+        """Проверка отправки тестов; None - можно отправлять, иначе текст отказа"""
+        try:
+            if self.rate_limiter is not None:
+                allowed, retry_after = self.rate_limiter.consume(f'submit:{user_id}')
+                if not allowed:
+                    self.stats['rate_limited'] += 1
+                    return (f"Слишком много отправок подряд. "
+                            f"Попробуйте снова через {max(1, round(retry_after))} с.")
+
+            if self.max_tests_per_student:
+                current = self.get_test_count(user_id)
+                if current + test_count > self.max_tests_per_student:
+                    self.stats['quota_rejected'] += 1
+                    left = max(0, self.max_tests_per_student - current)
+                    return (f"Достигнут лимит тестов: {self.max_tests_per_student} на студента "
+                            f"(отправлено {current}, можно еще {left}).")
+        except Exception as e:
+            logging.error(f"Ошибка проверки отправки: {e}")
+            return None
+
+        self.stats['admitted'] += 1
+        return None
+
+    def check_registration(self, user_id: Optional[int] = None) -> Optional[str]:
+        """Проверка регистрации студента; уже зарегистрированные проходят всегда"""
+        if not self.max_students:
+            return None
+
+        try:
+            if user_id is not None:
+                user = self.db.get_user(user_id)
+                if user and user['role'] == 'student' and user['is_approved']:
+                    return None
+
+            if self.get_student_count() >= self.max_students:
+                self.stats['students_rejected'] += 1
+                return f"Набор закрыт: зарегистрировано максимальное число студентов ({self.max_students})."
+        except Exception as e:
+            logging.error(f"Ошибка проверки регистрации: {e}")
+        return None
+
+    def get_stats(self) -> Dict:
+        """Статистика решений"""
+        stats = dict(self.stats)
+        stats['students'] = self.get_student_count()
+        stats['max_students'] = self.max_students
+        stats['max_tests_per_student'] = self.max_tests_per_student
+        return stats
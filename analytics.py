@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Аналитика по снимкам базы данных
+
+Отчеты считаются по снимку таблиц users, tests и feedback, а не по
+рабочей базе, поэтому тяжелые запросы не конкурируют с записью бота.
+
+Использование:
+    python analytics.py snapshot  - создать снимок
+    python analytics.py report    - отчет по последнему снимку
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import config
+
+SNAPSHOT_TABLES = ['users', 'tests', 'feedback']
+
+SNAPSHOT_INDEXES = [
+    'CREATE INDEX snapshot.idx_snapshot_tests_student ON tests (student_id)',
+    'CREATE INDEX snapshot.idx_snapshot_tests_submitted ON tests (submitted_at)'
+]
+
+# Отправки, проверки и активные студенты по неделям; date(x, 'weekday 0', '-6 days') - понедельник недели
+# {condition} - дополнительное условие на тесты (например, на группы), иначе TRUE
+WEEKLY_ACTIVITY_QUERY = '''
+    SELECT week, SUM(submissions), SUM(reviews), MAX(active_students) FROM (
+        SELECT date(submitted_at, 'weekday 0', '-6 days') AS week,
+               COUNT(*) AS submissions, 0 AS reviews, COUNT(DISTINCT student_id) AS active_students
+        FROM tests WHERE {condition} GROUP BY week
+        UNION ALL
+        SELECT date(reviewed_at, 'weekday 0', '-6 days') AS week, 0, COUNT(*), 0
+        FROM tests WHERE is_reviewed AND reviewed_at IS NOT NULL AND {condition} GROUP BY week
+    )
+    GROUP BY week
+    ORDER BY week
+'''
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией, как numpy.percentile"""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class AnalyticsSnapshot:
+    """Снимки для отчетов: копия SQLite только для чтения и, если
+    установлены pandas и pyarrow, файлы Parquet по таблицам.
+
+    Снимок делается внутри одной читающей транзакции, поэтому таблицы
+    согласованы между собой, а в режиме WAL запись в базу не
+    останавливается. Новый снимок заменяет старый атомарно.
+    """
+
+    def __init__(self, db_name: str = config.DATABASE_NAME, snapshot_dir: str = 'analytics',
+                 parquet: bool = False):
+        self.db_name = db_name
+        self.snapshot_dir = snapshot_dir
+        self.parquet = parquet
+        prefix = os.path.splitext(os.path.basename(db_name))[0]
+        self.path = os.path.join(snapshot_dir, f'{prefix}-analytics.db')
+        self.last_report: Dict = {}
+
+    def create_snapshot(self) -> Dict:
+        """Снимок таблиц; возвращает отчет с числом строк и длительностью"""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        report = {'path': self.path, 'rows': {}, 'parquet': [], 'elapsed_ms': 0, 'error': None}
+        started = time.perf_counter()
+
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+            source = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+            try:
+                source.execute('ATTACH DATABASE ? AS snapshot', (temp_path,))
+                # Читающая транзакция по рабочей базе; пишется только снимок
+                source.execute('BEGIN')
+                for table in SNAPSHOT_TABLES:
+                    source.execute(f'CREATE TABLE snapshot.{table} AS SELECT * FROM main.{table}')
+                    report['rows'][table] = source.execute(
+                        f'SELECT COUNT(*) FROM snapshot.{table}'
+                    ).fetchone()[0]
+                for statement in SNAPSHOT_INDEXES:
+                    source.execute(statement)
+                source.execute('COMMIT')
+                source.execute('DETACH DATABASE snapshot')
+            finally:
+                source.close()
+
+            os.replace(temp_path, self.path)
+            if self.parquet:
+                report['parquet'] = self.export_parquet()
+        except Exception as e:
+            logging.error(f"Ошибка создания снимка для аналитики: {e}")
+            report['error'] = str(e)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if not report['error']:
+            logging.info(f"Снимок для аналитики {self.path}: {report['rows']} за {report['elapsed_ms']} мс")
+        self.last_report = report
+        return report
+
+    def export_parquet(self) -> List[str]:
+        """Таблицы снимка в Parquet (нужны pandas и pyarrow)"""
+        try:
+            import pandas as pd
+        except ImportError:
+            logging.warning("Для выгрузки в Parquet установите пакеты из requirements_analytics.txt")
+            return []
+
+        paths = []
+        with self.connect() as connection:
+            for table in SNAPSHOT_TABLES:
+                path = os.path.join(self.snapshot_dir, f'{table}.parquet')
+                frame = pd.read_sql_query(f'SELECT * FROM {table}', connection)
+                frame.to_parquet(path + '.tmp', index=False)
+                os.replace(path + '.tmp', path)
+                paths.append(path)
+        return paths
+
+    def connect(self) -> sqlite3.Connection:
+        """Соединение со снимком только для чтения"""
+        return sqlite3.connect(f'file:{os.path.abspath(self.path)}?mode=ro', uri=True)
+
+    def get_age(self) -> Optional[float]:
+        """Возраст снимка в секундах (None - снимка нет)"""
+        if not os.path.exists(self.path):
+            return None
+        return time.time() - os.path.getmtime(self.path)
+
+    def ensure_fresh(self, max_age: float) -> Dict:
+        """Новый снимок, если текущего нет или он старше ``max_age`` секунд"""
+        age = self.get_age()
+        if age is None or age > max_age:
+            return self.create_snapshot()
+        return {'path': self.path, 'error': None}
+
+    def compute_reports(self) -> Dict:
+        """Отчеты по снимку: векторно в pandas, без него - запросами SQL"""
+        try:
+            import pandas as pd  # noqa: F401
+        except ImportError:
+            pd = None
+
+        with self.connect() as connection:
+            if pd is not None:
+                reports = self._reports_pandas(connection)
+            else:
+                reports = self._reports_sql(connection)
+        reports['snapshot_at'] = datetime.fromtimestamp(os.path.getmtime(self.path)).strftime('%Y-%m-%d %H:%M:%S')
+        return reports
+
+    @staticmethod
+    def _reports_pandas(connection: sqlite3.Connection) -> Dict:
+        """Отчеты векторными операциями pandas/NumPy"""
+        import numpy as np
+        import pandas as pd
+
+        tests = pd.read_sql_query(
+            'SELECT student_id, submitted_at, is_reviewed, score, reviewed_at FROM tests', connection,
+            parse_dates=['submitted_at', 'reviewed_at']
+        )
+        feedback = pd.read_sql_query('SELECT feedback_type, rating FROM feedback', connection)
+
+        reviewed = tests[tests['is_reviewed'].astype(bool)]
+        distribution = reviewed['score'].value_counts().sort_index()
+
+        hours = ((reviewed['reviewed_at'] - reviewed['submitted_at']).dt.total_seconds() / 3600).dropna()
+        hours = hours[hours >= 0].to_numpy()
+        median, p90 = np.percentile(hours, [50, 90]) if hours.size else (0.0, 0.0)
+
+        # Неделя начинается с понедельника
+        submitted_week = tests['submitted_at'].dt.to_period('W-SUN').dt.start_time.dt.strftime('%Y-%m-%d')
+        reviewed_week = reviewed['reviewed_at'].dropna().dt.to_period('W-SUN').dt.start_time.dt.strftime('%Y-%m-%d')
+        submissions = tests.groupby(submitted_week).agg(
+            submissions=('student_id', 'size'), active_students=('student_id', 'nunique')
+        )
+        reviews = reviewed_week.value_counts()
+        weekly = [
+            {
+                'week': week,
+                'submissions': int(submissions['submissions'].get(week, 0)),
+                'reviews': int(reviews.get(week, 0)),
+                'active_students': int(submissions['active_students'].get(week, 0))
+            }
+            for week in sorted(set(submissions.index) | set(reviews.index))
+        ]
+
+        feedback_stats = feedback.groupby('feedback_type')['rating'].agg(['size', 'mean'])
+        return {
+            'total_tests': int(len(tests)),
+            'reviewed_tests': int(len(reviewed)),
+            'average_score': round(float(reviewed['score'].mean()), 2) if len(reviewed) else 0.0,
+            'score_distribution': {int(score): int(count) for score, count in distribution.items()},
+            'turnaround_hours': {
+                'count': int(hours.size),
+                'median': round(float(median), 1),
+                'p90': round(float(p90), 1),
+                'average': round(float(hours.mean()), 1) if hours.size else 0.0
+            },
+            'weekly_activity': weekly,
+            'feedback': {
+                feedback_type: {
+                    'count': int(row['size']),
+                    'average_rating': round(float(row['mean']), 2) if pd.notna(row['mean']) else None
+                }
+                for feedback_type, row in feedback_stats.iterrows()
+            }
+        }
+
+    @staticmethod
+    def _reports_sql(connection: sqlite3.Connection) -> Dict:
+        """Те же отчеты запросами SQL, когда pandas не установлен"""
+        cursor = connection.cursor()
+
+        cursor.execute('''
+            SELECT COUNT(*), COALESCE(SUM(is_reviewed), 0), AVG(CASE WHEN is_reviewed THEN score END)
+            FROM tests
+        ''')
+        total_tests, reviewed_tests, average_score = cursor.fetchone()
+
+        cursor.execute('SELECT score, COUNT(*) FROM tests WHERE is_reviewed GROUP BY score ORDER BY score')
+        distribution = {int(score): count for score, count in cursor.fetchall()}
+
+        cursor.execute('''
+            SELECT (julianday(reviewed_at) - julianday(submitted_at)) * 24 AS hours
+            FROM tests
+            WHERE is_reviewed AND reviewed_at IS NOT NULL AND hours >= 0
+            ORDER BY hours
+        ''')
+        hours = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(WEEKLY_ACTIVITY_QUERY.format(condition='TRUE'))
+        weekly = [
+            {'week': week, 'submissions': submissions, 'reviews': reviews, 'active_students': active}
+            for week, submissions, reviews, active in cursor.fetchall()
+        ]
+
+        cursor.execute('SELECT feedback_type, COUNT(*), AVG(rating) FROM feedback GROUP BY feedback_type')
+        feedback = {
+            feedback_type: {
+                'count': count,
+                'average_rating': round(rating, 2) if rating is not None else None
+            }
+            for feedback_type, count, rating in cursor.fetchall()
+        }
+
+        return {
+            'total_tests': total_tests,
+            'reviewed_tests': reviewed_tests,
+            'average_score': round(average_score, 2) if average_score is not None else 0.0,
+            'score_distribution': distribution,
+            'turnaround_hours': {
+                'count': len(hours),
+                'median': round(percentile(hours, 50), 1),
+                'p90': round(percentile(hours, 90), 1),
+                'average': round(sum(hours) / len(hours), 1) if hours else 0.0
+            },
+            'weekly_activity': weekly,
+            'feedback': feedback
+        }
+
+    async def run_forever(self, interval: float = 86400):
+        """Периодическое обновление снимка в фоне"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.create_snapshot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка фонового снимка для аналитики: {e}")
+            await asyncio.sleep(interval)
+
+
+def format_analytics_report(reports: Dict, weeks: int = 4) -> str:
+    """Отчет для сообщения бота"""
+    turnaround = reports['turnaround_hours']
+    lines = [
+        f"📈 Аналитика (снимок от {reports['snapshot_at']})",
+        f"• Тестов: {reports['total_tests']}, проверено: {reports['reviewed_tests']}",
+        f"• Средний балл: {reports['average_score']}",
+        "• Распределение баллов: " + (', '.join(
+            f"{score}: {count}" for score, count in reports['score_distribution'].items()
+        ) or "нет данных"),
+        f"• Время проверки: медиана {turnaround['median']} ч, 90% за {turnaround['p90']} ч"
+    ]
+
+    if reports['weekly_activity']:
+        lines.append("\n📅 По неделям (отправлено / проверено / студентов):")
+        for week in reports['weekly_activity'][-weeks:]:
+            lines.append(f"• {week['week']}: {week['submissions']} / {week['reviews']} / {week['active_students']}")
+
+    if reports['feedback']:
+        lines.append("\n💬 Обратная связь:")
+        for feedback_type, stats in reports['feedback'].items():
+            rating = f", оценка {stats['average_rating']}" if stats['average_rating'] is not None else ""
+            lines.append(f"• {feedback_type}: {stats['count']}{rating}")
+    return '\n'.join(lines)
+
+
+def main() -> bool:
+    """Командная строка: snapshot | report"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    snapshot = AnalyticsSnapshot(config.DATABASE_NAME, config.ANALYTICS_DIR, config.ANALYTICS_PARQUET)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'report'
+
+    if command == 'snapshot':
+        report = snapshot.create_snapshot()
+        if report['error']:
+            print(f"❌ Ошибка создания снимка: {report['error']}")
+            return False
+        print(f"✅ Снимок {report['path']}: {report['rows']} за {report['elapsed_ms']} мс")
+        for path in report['parquet']:
+            print(f"📦 {path}")
+        return True
+
+    if command == 'report':
+        if snapshot.ensure_fresh(config.ANALYTICS_INTERVAL)['error']:
+            return False
+        print(format_analytics_report(snapshot.compute_reports(), weeks=12))
+        return True
+
+    print(__doc__)
+    return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
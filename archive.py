@@ -0,0 +1,384 @@
+"""
+Семестры и архивирование данных прошедших семестров
+"""
+
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import Database
+
+# Колонки, которые переносятся в архив вместе со строкой
+TEST_COLUMNS = ('id', 'student_id', 'full_name', 'stepik_id', 'test_url', 'test_type',
+                'submitted_at', 'is_reviewed', 'score', 'teacher_comment', 'reviewed_at',
+                'test_url_norm', 'reviewed_by', 'group_id')
+NOTIFICATION_COLUMNS = ('id', 'user_id', 'message', 'notification_type', 'is_read', 'created_at')
+FEEDBACK_COLUMNS = ('id', 'user_id', 'feedback_type', 'message', 'rating', 'is_processed', 'created_at',
+                    'processed_at', 'processed_by')
+
+# Таблицы архива: id совпадает с id в рабочей базе, term_id - семестр
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS archive.tests (
+        id INTEGER PRIMARY KEY,
+        student_id INTEGER,
+        full_name TEXT,
+        stepik_id TEXT,
+        test_url TEXT,
+        test_type TEXT,
+        submitted_at TIMESTAMP,
+        is_reviewed BOOLEAN,
+        score INTEGER,
+        teacher_comment TEXT,
+        reviewed_at TIMESTAMP,
+        test_url_norm TEXT,
+        reviewed_by INTEGER,
+        group_id INTEGER,
+        term_id INTEGER NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archived_tests_student ON tests (student_id, term_id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archived_tests_term ON tests (term_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.notifications (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        message TEXT,
+        notification_type TEXT,
+        is_read BOOLEAN,
+        created_at TIMESTAMP,
+        term_id INTEGER NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS archive.idx_archived_notifications_user ON notifications (user_id)',
+    '''
+    CREATE TABLE IF NOT EXISTS archive.feedback (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        feedback_type TEXT,
+        message TEXT,
+        rating INTEGER,
+        is_processed BOOLEAN,
+        created_at TIMESTAMP,
+        processed_at TIMESTAMP,
+        processed_by INTEGER,
+        term_id INTEGER NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+]
+
+# Колонки, появившиеся позже: добавляются в уже созданные файлы архива
+ARCHIVE_COLUMNS = [
+    ('tests', 'reviewed_by', 'INTEGER'),
+    ('tests', 'group_id', 'INTEGER'),
+    ('feedback', 'processed_at', 'TIMESTAMP'),
+    ('feedback', 'processed_by', 'INTEGER'),
+]
+
+
+class TermArchive:
+    """Семестры и перенос данных закрытых семестров в отдельный файл базы.
+
+    Оцененные тесты, прочитанные уведомления и обработанные отзывы закрытого
+    семестра переносятся в архивную базу (ATTACH), поэтому агрегаты рабочей
+    базы считают только текущий поток. Архив остается доступным для запросов.
+    """
+
+    def __init__(self, db: Database, archive_path: Optional[str] = None):
+        self.db = db
+        self.archive_path = archive_path or f"{os.path.splitext(db.db_name)[0]}_archive.db"
+        self.setup_archive()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с рабочей базой и подключенным архивом"""
+        connection = sqlite3.connect(self.db.db_name, timeout=30)
+        connection.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        return connection
+
+    def setup_archive(self):
+        """Создание таблицы семестров и таблиц архива"""
+        connection = self._connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS main.terms (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT UNIQUE NOT NULL,
+                    starts_on DATE NOT NULL,
+                    ends_on DATE NOT NULL,
+                    archived_at TIMESTAMP
+                )
+            ''')
+            # Выбор тестов семестра по дате отправки
+            cursor.execute('CREATE INDEX IF NOT EXISTS main.idx_tests_submitted ON tests (submitted_at)')
+            for statement in ARCHIVE_SCHEMA:
+                cursor.execute(statement)
+            for table, column, definition in ARCHIVE_COLUMNS:
+                cursor.execute(f'PRAGMA archive.table_info({table})')
+                if column not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {column} {definition}')
+            connection.commit()
+        finally:
+            connection.close()
+
+    def add_term(self, name: str, starts_on: str, ends_on: str) -> Optional[int]:
+        """Добавление семестра; даты в формате ГГГГ-ММ-ДД"""
+        try:
+            start = datetime.strptime(starts_on, '%Y-%m-%d').date()
+            end = datetime.strptime(ends_on, '%Y-%m-%d').date()
+            if end < start:
+                logging.error(f"Семестр {name}: дата окончания раньше даты начала")
+                return None
+
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    'INSERT INTO terms (name, starts_on, ends_on) VALUES (?, ?, ?)',
+                    (name, start.isoformat(), end.isoformat())
+                )
+                connection.commit()
+                return cursor.lastrowid
+        except Exception as e:
+            logging.error(f"Ошибка добавления семестра: {e}")
+            return None
+
+    def get_terms(self) -> List[Dict]:
+        """Список семестров с числом архивных тестов"""
+        try:
+            connection = self._connect()
+            try:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    SELECT t.id, t.name, t.starts_on, t.ends_on, t.archived_at,
+                           (SELECT COUNT(*) FROM archive.tests a WHERE a.term_id = t.id)
+                    FROM main.terms t
+                    ORDER BY t.starts_on
+                ''')
+                return [{
+                    'id': row[0],
+                    'name': row[1],
+                    'starts_on': row[2],
+                    'ends_on': row[3],
+                    'archived_at': row[4],
+                    'archived_tests': row[5]
+                } for row in cursor.fetchall()]
+            finally:
+                connection.close()
+        except Exception as e:
+            logging.error(f"Ошибка получения семестров: {e}")
+            return []
+
+    def get_term(self, term_id: int) -> Optional[Dict]:
+        """Семестр по ID"""
+        return next((term for term in self.get_terms() if term['id'] == term_id), None)
+
+    @staticmethod
+    def _move(cursor, table: str, columns: tuple, condition: str, params: tuple, term_id: int) -> int:
+        """Копирование строк в архив и удаление из рабочей базы.
+
+        Файлы баз фиксируются по отдельности (в режиме WAL атомарность между
+        ними не гарантируется), поэтому копирование идемпотентно, а удаляются
+        только строки, уже лежащие в архиве: повторный запуск после сбоя
+        доводит перенос до конца.
+        """
+        column_list = ', '.join(columns)
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO archive.{table} ({column_list}, term_id)
+            SELECT {column_list}, ? FROM main.{table} WHERE {condition}
+        ''', (term_id,) + params)
+        cursor.execute(f'''
+            DELETE FROM main.{table}
+            WHERE {condition} AND id IN (SELECT id FROM archive.{table} WHERE term_id = ?)
+        ''', params + (term_id,))
+        return cursor.rowcount
+
+    def archive_term(self, term_id: int) -> Dict:
+        """Перенос данных закончившегося семестра в архив.
+
+        Неоцененные тесты, непрочитанные уведомления и необработанные отзывы
+        остаются в рабочей базе.
+        """
+        started = time.perf_counter()
+        report = {'term_id': term_id, 'tests': 0, 'notifications': 0, 'feedback': 0,
+                  'elapsed_ms': 0, 'error': None}
+
+        term = self.get_term(term_id)
+        if term is None:
+            report['error'] = "Семестр не найден"
+            return report
+        if term['ends_on'] >= datetime.now().date().isoformat():
+            report['error'] = f"Семестр «{term['name']}» еще не закончился ({term['ends_on']})"
+            return report
+
+        # Граница по датам: конец семестра включается целиком
+        period = (term['starts_on'], term['ends_on'])
+        connection = self._connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")
+            tables = {row[0] for row in cursor.fetchall()}
+
+            cursor.execute('BEGIN IMMEDIATE')
+            report['tests'] = self._move(
+                cursor, 'tests', TEST_COLUMNS,
+                "is_reviewed = TRUE AND submitted_at >= ? AND submitted_at < date(?, '+1 day')",
+                period, term_id
+            )
+            # Служебные записи об архивных тестах больше не нужны
+            cursor.execute('''
+                DELETE FROM main.idempotency_keys
+                WHERE test_id IN (SELECT id FROM archive.tests WHERE term_id = ?)
+            ''', (term_id,))
+            if 'test_verifications' in tables:
+                cursor.execute('''
+                    DELETE FROM main.test_verifications
+                    WHERE test_id IN (SELECT id FROM archive.tests WHERE term_id = ?)
+                ''', (term_id,))
+
+            if 'notifications' in tables:
+                report['notifications'] = self._move(
+                    cursor, 'notifications', NOTIFICATION_COLUMNS,
+                    "is_read = TRUE AND created_at >= ? AND created_at < date(?, '+1 day')",
+                    period, term_id
+                )
+            if 'feedback' in tables:
+                report['feedback'] = self._move(
+                    cursor, 'feedback', FEEDBACK_COLUMNS,
+                    "is_processed = TRUE AND created_at >= ? AND created_at < date(?, '+1 day')",
+                    period, term_id
+                )
+
+            cursor.execute('UPDATE main.terms SET archived_at = CURRENT_TIMESTAMP WHERE id = ?', (term_id,))
+            connection.commit()
+
+            # Обновляем статистику планировщика для уменьшившихся таблиц
+            connection.execute('PRAGMA main.optimize')
+        except Exception as e:
+            connection.rollback()
+            logging.error(f"Ошибка архивирования семестра: {e}")
+            report['error'] = str(e)
+        finally:
+            connection.close()
+
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if not report['error']:
+            logging.info(
+                f"Семестр «{term['name']}» перенесен в архив: тестов {report['tests']}, "
+                f"уведомлений {report['notifications']}, отзывов {report['feedback']} "
+                f"за {report['elapsed_ms']} мс"
+            )
+        return report
+
+    def get_archived_tests(self, student_id: Optional[int] = None,
+                           term_id: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        """Архивные тесты студента и/или семестра"""
+        conditions, params = [], []
+        if student_id is not None:
+            conditions.append('a.student_id = ?')
+            params.append(student_id)
+        if term_id is not None:
+            conditions.append('a.term_id = ?')
+            params.append(term_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        try:
+            connection = self._connect()
+            try:
+                cursor = connection.cursor()
+                cursor.execute(f'''
+                    SELECT a.id, a.student_id, a.full_name, a.stepik_id, a.test_url, a.test_type,
+                           a.submitted_at, a.score, a.teacher_comment, a.reviewed_at,
+                           a.term_id, t.name
+                    FROM archive.tests a
+                    LEFT JOIN main.terms t ON t.id = a.term_id
+                    {where}
+                    ORDER BY a.submitted_at DESC
+                    LIMIT ?
+                ''', params + [limit])
+                return [{
+                    'id': row[0],
+                    'student_id': row[1],
+                    'full_name': row[2],
+                    'stepik_id': row[3],
+                    'test_url': row[4],
+                    'test_type': row[5],
+                    'submitted_at': row[6],
+                    'is_reviewed': True,
+                    'score': row[7],
+                    'teacher_comment': row[8],
+                    'reviewed_at': row[9],
+                    'term_id': row[10],
+                    'term_name': row[11]
+                } for row in cursor.fetchall()]
+            finally:
+                connection.close()
+        except Exception as e:
+            logging.error(f"Ошибка получения архивных тестов: {e}")
+            return []
+
+    def get_student_archive_summary(self, student_id: int) -> List[Dict]:
+        """Итоги студента по архивным семестрам"""
+        try:
+            connection = self._connect()
+            try:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    SELECT a.term_id, t.name, COUNT(*), COALESCE(SUM(a.score), 0)
+                    FROM archive.tests a
+                    LEFT JOIN main.terms t ON t.id = a.term_id
+                    WHERE a.student_id = ?
+                    GROUP BY a.term_id
+                    ORDER BY t.starts_on
+                ''', (student_id,))
+                return [{
+                    'term_id': row[0],
+                    'term_name': row[1],
+                    'tests': row[2],
+                    'total_score': row[3]
+                } for row in cursor.fetchall()]
+            finally:
+                connection.close()
+        except Exception as e:
+            logging.error(f"Ошибка получения архива студента: {e}")
+            return []
+
+    def get_term_statistics(self, term_id: int) -> Dict:
+        """Статистика архивного семестра"""
+        try:
+            connection = self._connect()
+            try:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    SELECT COUNT(*), COUNT(DISTINCT student_id), AVG(score)
+                    FROM archive.tests
+                    WHERE term_id = ?
+                ''', (term_id,))
+                tests, students, avg_score = cursor.fetchone()
+                return {
+                    'tests': tests,
+                    'students': students,
+                    'average_score': round(avg_score or 0, 2)
+                }
+            finally:
+                connection.close()
+        except Exception as e:
+            logging.error(f"Ошибка получения статистики семестра: {e}")
+            return {}
+
+
+def format_terms(terms: List[Dict]) -> str:
+    """Список семестров для сообщения бота"""
+    if not terms:
+        return "📅 Семестры не заданы."
+
+    text = "📅 <b>Семестры:</b>\n\n"
+    for term in terms:
+        status = f"📦 в архиве ({term['archived_tests']} тестов)" if term['archived_at'] else "🟢 в работе"
+        text += f"#{term['id']} {term['name']}: {term['starts_on']} — {term['ends_on']}, {status}\n"
+    return text
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Резервное копирование базы данных без остановки бота
+
+Использование:
+    python backup.py create        - создать копию
+    python backup.py list          - список копий
+    python backup.py restore FILE  - восстановить базу из копии
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import config
+
+
+class BackupManager:
+    """Онлайн-копии базы через backup API SQLite со сжатием и ротацией.
+
+    Копирование идет порциями по ``pages_per_step`` страниц с паузой между
+    ними, поэтому запись в базу не останавливается. В режиме WAL копия
+    снимается внутри одной читающей транзакции и соответствует моменту ее
+    начала; в остальных режимах SQLite перезапускает копирование, если базу
+    изменили во время него.
+    """
+
+    def __init__(self, db_name: str = config.DATABASE_NAME, backup_dir: str = 'backups',
+                 keep: int = 7, pages_per_step: int = 256, step_pause: float = 0.005):
+        self.db_name = db_name
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.prefix = os.path.splitext(os.path.basename(db_name))[0]
+        self.last_report: Dict = {}
+
+    def create_backup(self, label: Optional[str] = None) -> Dict:
+        """Создание сжатой копии базы; возвращает отчет с длительностью и скоростью"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        name = f"{self.prefix}-{stamp}{'-' + label if label else ''}.db"
+        temp_path = os.path.join(self.backup_dir, name + '.tmp')
+        path = os.path.join(self.backup_dir, name + '.gz')
+
+        report = {'path': path, 'pages': 0, 'steps': 0, 'elapsed_ms': 0,
+                  'pages_per_second': 0, 'size': 0, 'error': None}
+        started = time.perf_counter()
+
+        def progress(status, remaining, total):
+            report['pages'] = total
+            report['steps'] += 1
+            # Пауза между порциями оставляет окно для записи
+            time.sleep(self.step_pause)
+
+        try:
+            source = sqlite3.connect(self.db_name, timeout=30, isolation_level=None)
+            target = sqlite3.connect(temp_path)
+            try:
+                snapshot = source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+                if snapshot:
+                    # Читающая транзакция фиксирует снимок и не мешает писателям
+                    source.execute('BEGIN')
+                    source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                source.backup(target, pages=self.pages_per_step, progress=progress)
+                if snapshot:
+                    source.execute('COMMIT')
+
+                check = target.execute('PRAGMA quick_check').fetchone()[0]
+                if check != 'ok':
+                    raise sqlite3.DatabaseError(f"копия повреждена: {check}")
+            finally:
+                target.close()
+                source.close()
+
+            copy_elapsed = time.perf_counter() - started
+            with open(temp_path, 'rb') as raw, gzip.open(path, 'wb', compresslevel=6) as compressed:
+                shutil.copyfileobj(raw, compressed, 1024 * 1024)
+
+            report['size'] = os.path.getsize(path)
+            report['pages_per_second'] = round(report['pages'] / copy_elapsed) if copy_elapsed > 0 else 0
+            self.rotate()
+        except Exception as e:
+            logging.error(f"Ошибка резервного копирования: {e}")
+            report['error'] = str(e)
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if not report['error']:
+            logging.info(
+                f"Резервная копия {path}: {report['pages']} страниц за {report['elapsed_ms']} мс "
+                f"({report['pages_per_second']} стр/с), {report['size']} байт"
+            )
+        self.last_report = report
+        return report
+
+    def list_backups(self) -> List[Dict]:
+        """Копии этой базы, новые первыми"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+
+        backups = []
+        for name in os.listdir(self.backup_dir):
+            if name.startswith(self.prefix + '-') and name.endswith('.db.gz'):
+                path = os.path.join(self.backup_dir, name)
+                backups.append({
+                    'name': name,
+                    'path': path,
+                    'size': os.path.getsize(path),
+                    'created_at': datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
+                })
+        # Имя содержит время создания, поэтому сортировка по имени хронологическая
+        return sorted(backups, key=lambda backup: backup['name'], reverse=True)
+
+    def rotate(self) -> int:
+        """Удаление старых копий сверх ``keep``; копии с меткой не удаляются"""
+        pattern = re.compile(rf'{re.escape(self.prefix)}-\d{{8}}-\d{{6}}\.db\.gz')
+        scheduled = [backup for backup in self.list_backups() if pattern.fullmatch(backup['name'])]
+        removed = 0
+        for backup in scheduled[self.keep:]:
+            os.remove(backup['path'])
+            removed += 1
+        return removed
+
+    def restore(self, backup_path: str) -> bool:
+        """Восстановление базы из копии.
+
+        Текущая база сначала сохраняется с меткой before-restore, затем
+        содержимое копии записывается в нее через backup API, так что
+        открытые соединения сразу видят восстановленные данные.
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        temp_path = os.path.join(self.backup_dir, os.path.basename(backup_path) + '.restore')
+        try:
+            with gzip.open(backup_path, 'rb') as compressed, open(temp_path, 'wb') as raw:
+                shutil.copyfileobj(compressed, raw, 1024 * 1024)
+
+            source = sqlite3.connect(temp_path)
+            try:
+                check = source.execute('PRAGMA quick_check').fetchone()[0]
+                if check != 'ok':
+                    logging.error(f"Копия {backup_path} повреждена: {check}")
+                    return False
+
+                if os.path.exists(self.db_name):
+                    safety = self.create_backup('before-restore')
+                    if safety['error']:
+                        return False
+
+                target = sqlite3.connect(self.db_name, timeout=30)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+            finally:
+                source.close()
+
+            logging.info(f"База {self.db_name} восстановлена из {backup_path}")
+            return True
+        except Exception as e:
+            logging.error(f"Ошибка восстановления из копии: {e}")
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def run_forever(self, interval: float = 86400):
+        """Периодическое резервное копирование в фоне"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.create_backup)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка фонового резервного копирования: {e}")
+            await asyncio.sleep(interval)
+
+
+def format_backup_report(report: Dict) -> str:
+    """Отчет о копии для сообщения бота"""
+    if report.get('error'):
+        return f"❌ Ошибка резервного копирования: {report['error']}"
+    return (
+        f"💾 Резервная копия создана: {os.path.basename(report['path'])}\n"
+        f"• Страниц: {report['pages']} за {report['elapsed_ms']} мс ({report['pages_per_second']} стр/с)\n"
+        f"• Размер: {report['size'] // 1024} КБ"
+    )
+
+
+def main() -> bool:
+    """Командная строка: create | list | restore FILE"""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    manager = BackupManager(config.DATABASE_NAME, config.BACKUP_DIR, config.BACKUP_KEEP,
+                            config.BACKUP_PAGES_PER_STEP)
+    command = sys.argv[1] if len(sys.argv) > 1 else 'create'
+
+    if command == 'create':
+        report = manager.create_backup()
+        print(format_backup_report(report))
+        return not report['error']
+
+    if command == 'list':
+        backups = manager.list_backups()
+        if not backups:
+            print("ℹ️ Резервных копий нет")
+        for backup in backups:
+            print(f"{backup['name']}  {backup['size'] // 1024} КБ  {backup['created_at']}")
+        return True
+
+    if command == 'restore' and len(sys.argv) > 2:
+        path = sys.argv[2]
+        if not os.path.exists(path):
+            path = os.path.join(manager.backup_dir, path)
+        if manager.restore(path):
+            print(f"✅ База восстановлена из {path}")
+            return True
+        print("❌ Не удалось восстановить базу")
+        return False
+
+    print(__doc__)
+    return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -1,18 +1,55 @@
 import logging
 import asyncio
 from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Dict, List, Optional
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultArticle, InputTextMessageContent
+)
 from telegram.ext import (
-    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler,
     ContextTypes, filters, ConversationHandler
 )
 from database import Database
-from config import BOT_TOKEN, ADMIN_PASSWORD
+from config import (
+    BOT_TOKEN, ADMIN_PASSWORD, GROUP_COMMIT_DELAY, GROUP_COMMIT_MAX_BATCH,
+    STEPIK_API_URL, STEPIK_CLIENT_ID, STEPIK_CLIENT_SECRET, STEPIK_MAX_CONCURRENCY,
+    STEPIK_VERIFY_ENABLED, STEPIK_VERIFY_INTERVAL, STEPIK_AUTO_GRADE,
+    STEPIK_METADATA_TTL, STEPIK_METADATA_NEGATIVE_TTL,
+    MAX_STUDENTS, MAX_TESTS_PER_STUDENT, SUBMISSION_RATE_PER_MINUTE, SUBMISSION_BURST,
+    RATE_LIMIT_BACKEND, ARCHIVE_DATABASE_NAME,
+    NOTIFICATION_RETENTION_DAYS, MAINTENANCE_INTERVAL, INCREMENTAL_VACUUM_PAGES,
+    BACKUP_DIR, BACKUP_KEEP, BACKUP_INTERVAL, BACKUP_PAGES_PER_STEP,
+    ANALYTICS_DIR, ANALYTICS_INTERVAL, ANALYTICS_PARQUET,
+    REVIEW_SLA_HOURS, TURNAROUND_WINDOW_DAYS, GRADING_LEASE_SECONDS, GRADING_BATCH_SIZE,
+    REMINDER_INTERVAL, REMINDER_HOURS_BEFORE, REMINDER_MESSAGES_PER_SECOND, DIGEST_WINDOW_MINUTES,
+    LOOP_LAG_INTERVAL, LOOP_BLOCK_WARN_MS,
+    DATABASE_NAME, TENANTS_FILE
+)
 from utils import (
-    validate_test_data, format_statistics_summary, 
-    generate_feedback_message, format_test_submission_guide
+    parse_test_submissions, format_statistics_summary, 
+    generate_feedback_message, format_test_submission_guide, format_groups
 )
-from feedback import FeedbackSystem
+from feedback import FeedbackSystem, FEEDBACK_TYPES, format_feedback_inbox
+from roster import decode_upload, import_roster, format_import_report
+from gradebook import import_gradebook, format_gradebook_report
+from stepik_api import StepikClient
+from stepik_verifier import StepikVerifier, get_verifications, format_verification
+from metadata_cache import MetadataCache
+from search import SearchIndex
+from admission import AdmissionControl, create_rate_limiter
+from archive import TermArchive, format_terms
+from backup import BackupManager, format_backup_report
+from analytics import AnalyticsSnapshot, format_analytics_report
+from progress import ProgressReports, format_progress_summary, format_student_curve
+from turnaround import TurnaroundTracker, format_turnaround_summary
+from leaderboard import Leaderboard, format_leaderboard
+from grading_queue import GradingQueue, format_queue_stats
+from reminders import ReminderScheduler, format_deadlines, parse_due_at
+from digest import TeacherDigest, format_digest
+from instrumentation import BotInstrumentation, format_instrumentation_report
+from tenants import SharedResources, default_tenant, load_tenants
+from storage import sqlite_path
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,12 +61,67 @@ logger = logging.getLogger(__name__)
 # Состояния для ConversationHandler
 REGISTRATION, TEACHER_PASSWORD, STUDENT_DATA, TEST_SUBMISSION = range(4)
 
+# Сколько студентов показывать кнопками; остальных можно найти поиском
+STUDENT_LIST_LIMIT = 50
+
 class StepikBot:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, tenant: Optional[Dict] = None, shared: Optional[SharedResources] = None,
+                 instrumentation: Optional[BotInstrumentation] = None):
+        """Бот одного курса; ``shared`` - ресурсы, общие с ботами других курсов процесса.
+        
+        ``instrumentation`` передается, когда несколько ботов работают в одном
+        цикле событий: задержку цикла достаточно измерять один раз.
+        """
+        self.tenant = tenant or default_tenant(
+            BOT_TOKEN, sqlite_path(db_name=DATABASE_NAME), ARCHIVE_DATABASE_NAME, BACKUP_DIR, ANALYTICS_DIR
+        )
+        self.shared = shared
+        self.db = Database(self.tenant['database'])
+        self.db.enable_group_commit(GROUP_COMMIT_DELAY, GROUP_COMMIT_MAX_BATCH)
         self.feedback_system = FeedbackSystem(self.db)
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        if shared:
+            self.stepik_client = shared.stepik_client
+        else:
+            self.stepik_client = StepikClient(
+                STEPIK_API_URL, STEPIK_CLIENT_ID, STEPIK_CLIENT_SECRET, STEPIK_MAX_CONCURRENCY
+            )
+        self.verifier = StepikVerifier(
+            self.db, self.stepik_client, STEPIK_AUTO_GRADE, self.feedback_system
+        )
+        # У кеша названий свой клиент: запросы идут из отдельного потока
+        self.metadata_cache = MetadataCache(
+            self.db,
+            shared.metadata_client if shared else
+            StepikClient(STEPIK_API_URL, STEPIK_CLIENT_ID, STEPIK_CLIENT_SECRET, STEPIK_MAX_CONCURRENCY),
+            STEPIK_METADATA_TTL,
+            STEPIK_METADATA_NEGATIVE_TTL,
+            shared.metadata_loop if shared else None
+        )
+        self.search_index = SearchIndex(self.db)
+        self.admission = AdmissionControl(
+            self.db,
+            create_rate_limiter(self.db, RATE_LIMIT_BACKEND, SUBMISSION_RATE_PER_MINUTE, SUBMISSION_BURST),
+            MAX_TESTS_PER_STUDENT,
+            MAX_STUDENTS
+        )
+        self.archive = TermArchive(self.db, self.tenant['archive_database'])
+        self.backup_manager = BackupManager(
+            self.db.db_name, self.tenant['backup_dir'], BACKUP_KEEP, BACKUP_PAGES_PER_STEP
+        )
+        self.analytics = AnalyticsSnapshot(self.db.db_name, self.tenant['analytics_dir'], ANALYTICS_PARQUET)
+        self.progress_reports = ProgressReports(self.db)
+        self.turnaround = TurnaroundTracker(self.db, REVIEW_SLA_HOURS, TURNAROUND_WINDOW_DAYS)
+        self.leaderboard = Leaderboard(self.db)
+        self.grading_queue = GradingQueue(self.db, GRADING_LEASE_SECONDS, GRADING_BATCH_SIZE)
+        self.reminders = ReminderScheduler(
+            self.db, self._send_message, REMINDER_HOURS_BEFORE, REMINDER_MESSAGES_PER_SECOND
+        )
+        self.digest = TeacherDigest(self.db, self._send_message, DIGEST_WINDOW_MINUTES, REVIEW_SLA_HOURS)
+        self.background_tasks = []
+        self.application = Application.builder().token(self.tenant['bot_token']).build()
         self.setup_handlers()
+        self.instrumentation = instrumentation or BotInstrumentation(LOOP_LAG_INTERVAL, LOOP_BLOCK_WARN_MS)
+        self.instrumentation.instrument_application(self.application)
     
     def setup_handlers(self):
         """Настройка обработчиков команд"""
@@ -52,6 +144,13 @@ class StepikBot:
         self.application.add_handler(CommandHandler('profile', self.profile_command))
         self.application.add_handler(CommandHandler('stats', self.stats_command))
         self.application.add_handler(CommandHandler('admin', self.admin_command))
+        self.application.add_handler(CommandHandler('terms', self.terms_command))
+        self.application.add_handler(CommandHandler('groups', self.groups_command))
+        self.application.add_handler(CommandHandler('deadline', self.deadline_command))
+        self.application.add_handler(CommandHandler('digest', self.digest_command))
+        self.application.add_handler(CommandHandler('inbox', self.inbox_command))
+        self.application.add_handler(CommandHandler('backup', self.backup_command))
+        self.application.add_handler(CommandHandler('analytics', self.analytics_command))
         self.application.add_handler(CommandHandler('feedback', self.feedback_command))
         self.application.add_handler(CommandHandler('notifications', self.notifications_command))
         
@@ -61,6 +160,12 @@ class StepikBot:
         # Обработчик текстовых сообщений
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text))
         
+        # Обработчик файлов (импорт списка студентов и выгрузок Степика)
+        self.application.add_handler(MessageHandler(filters.Document.ALL, self.handle_document))
+        
+        # Inline-поиск студентов и тестов для преподавателей
+        self.application.add_handler(InlineQueryHandler(self.inline_search))
+        
         # Обработчик ошибок
         self.application.add_error_handler(self.error_handler)
     
@@ -163,6 +268,11 @@ class StepikBot:
             return STUDENT_DATA
         
         user = update.effective_user
+        rejection = self.admission.check_registration(user.id)
+        if rejection:
+            await update.message.reply_text(f"❌ {rejection}\nОбратитесь к преподавателю.")
+            return ConversationHandler.END
+        
         success = self.db.add_user(
             user.id, user.username or "", 
             user.first_name or "", user.last_name or "", 
@@ -196,6 +306,7 @@ class StepikBot:
     async def show_teacher_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню преподавателя"""
         keyboard = [
+            [InlineKeyboardButton("▶️ Следующий тест", callback_data="grade_next")],
             [InlineKeyboardButton("📋 Просмотр тестов", callback_data="view_tests")],
             [InlineKeyboardButton("👥 Выбрать студента", callback_data="select_student")]
         ]
@@ -218,15 +329,22 @@ class StepikBot:
         keyboard = [
             [InlineKeyboardButton("📤 Отправить тест", callback_data="submit_test")],
             [InlineKeyboardButton("📊 Мои результаты", callback_data="my_results")],
+            [InlineKeyboardButton("🏆 Рейтинг", callback_data="leaderboard")],
             [InlineKeyboardButton("ℹ️ Помощь", callback_data="help")]
         ]
+        unread = self.feedback_system.get_unread_count(user.id)
+        if unread:
+            keyboard.insert(2, [InlineKeyboardButton(f"🔔 Уведомления ({unread})", callback_data="notifications")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         text = "👨‍🎓 <b>Панель студента</b>\n\n"
         text += f"🎯 <b>Ваши баллы:</b> {total_score}\n"
         text += f"📝 <b>Отправлено тестов:</b> {total_tests}\n"
-        text += f"✅ <b>Проверено:</b> {reviewed_tests}\n\n"
-        text += "Выберите действие:"
+        text += f"✅ <b>Проверено:</b> {reviewed_tests}\n"
+        rank = self.leaderboard.get_rank(user.id)
+        if rank:
+            text += f"🏆 <b>Место в рейтинге:</b> {rank['rank']} из {rank['students']}\n"
+        text += "\nВыберите действие:"
         
         await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
     
@@ -247,6 +365,8 @@ class StepikBot:
         
         if action == "view_tests" and user_data['role'] == 'teacher':
             await self.show_pending_tests(query, context)
+        elif action == "grade_next" and user_data['role'] == 'teacher':
+            await self.show_next_test(query, context)
         elif action == "select_student" and user_data['role'] == 'teacher':
             logger.info("Обрабатываем select_student для преподавателя")
             await self.show_student_selection(query, context)
@@ -254,6 +374,8 @@ class StepikBot:
             await self.start_test_submission(query, context)
         elif action == "my_results" and user_data['role'] == 'student':
             await self.show_student_results(query, context)
+        elif action == "leaderboard" and user_data['role'] == 'student':
+            await self.show_leaderboard(query, context)
         elif action == "help":
             await self.show_help(query, context)
         elif action.startswith("review_test_"):
@@ -285,6 +407,11 @@ class StepikBot:
             await self.show_feedback_menu(query, context)
         elif action == "notifications":
             await self.show_notifications(query, context)
+        elif action.startswith("inbox_") and user_data['role'] == 'teacher':
+            await self.handle_inbox_callback(query, context, action)
+        elif action == "notifications_read_all":
+            marked = self.feedback_system.mark_all_read(query.from_user.id)
+            await query.edit_message_text(f"✅ Отмечено прочитанными: {marked}.")
         elif action.startswith("feedback_"):
             parts = action.split("_")
             if len(parts) >= 2:
@@ -324,8 +451,8 @@ class StepikBot:
             await self.show_student_menu_from_callback(query, context)
     
     async def show_pending_tests(self, query, context: ContextTypes.DEFAULT_TYPE):
-        """Показ неоцененных тестов"""
-        tests = self.db.get_pending_tests()
+        """Показ неоцененных тестов групп преподавателя"""
+        tests = self.db.get_pending_tests(self.db.get_group_scope(query.from_user.id))
         
         if not tests:
             await query.edit_message_text("📋 Нет неоцененных тестов.")
@@ -333,14 +460,22 @@ class StepikBot:
         
         text = "📋 <b>Неоцененные тесты:</b>\n\n"
         keyboard = []
+        verifications = get_verifications(self.db, [test['id'] for test in tests[:10]])
+        self.metadata_cache.annotate(tests[:10])
+        held = self.grading_queue.get_held_by_others(query.from_user.id)
         
         for test in tests[:10]:  # Показываем первые 10
-            text += f"🆔 ID: {test['id']}\n"
+            text += f"🆔 ID: {test['id']}"
+            text += " 🔒 проверяет другой преподаватель\n" if test['id'] in held else "\n"
             text += f"👤 Студент: {test['full_name']}\n"
             text += f"🆔 Степик ID: {test['stepik_id']}\n"
+            if test['lesson_title']:
+                text += f"📚 Урок: {test['lesson_title']}\n"
             text += f"🔗 Ссылка: {test['test_url']}\n"
             text += f"📝 Тип: {test['test_type']} баллов\n"
             text += f"📅 Дата: {test['submitted_at']}\n"
+            if test['id'] in verifications:
+                text += format_verification(verifications[test['id']]) + "\n"
             text += "─" * 30 + "\n"
             
             keyboard.append([
@@ -353,21 +488,56 @@ class StepikBot:
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
     
-    async def start_test_review(self, query, context: ContextTypes.DEFAULT_TYPE, test_id: int):
+    async def show_next_test(self, query, context: ContextTypes.DEFAULT_TYPE):
+        """Выдача преподавателю следующих тестов из очереди и открытие первого"""
+        tests = self.grading_queue.claim_next(
+            query.from_user.id, group_ids=self.db.get_group_scope(query.from_user.id)
+        )
+        
+        if not tests:
+            keyboard = [[InlineKeyboardButton("🔙 Назад к меню", callback_data="back_to_teacher_menu")]]
+            await query.edit_message_text(
+                "✅ Свободных тестов в очереди нет.",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return
+        
+        await self.start_test_review(query, context, tests[0]['id'], queued=len(tests) - 1)
+    
+    async def start_test_review(self, query, context: ContextTypes.DEFAULT_TYPE, test_id: int, queued: int = 0):
         """Начало оценки теста"""
-        tests = self.db.get_pending_tests()
-        test = next((t for t in tests if t['id'] == test_id), None)
+        test = self.db.get_pending_test(test_id, self.db.get_group_scope(query.from_user.id))
         
         if not test:
             await query.edit_message_text("❌ Тест не найден.")
             return
         
+        if not self.grading_queue.claim(test_id, query.from_user.id):
+            keyboard = [
+                [InlineKeyboardButton("▶️ Следующий тест", callback_data="grade_next")],
+                [InlineKeyboardButton("🔙 Назад к тестам", callback_data="view_tests")]
+            ]
+            await query.edit_message_text(
+                f"🔒 Тест #{test_id} уже проверяет другой преподаватель.",
+                reply_markup=InlineKeyboardMarkup(keyboard)
+            )
+            return
+        
+        self.metadata_cache.annotate([test])
+        
         text = f"📝 <b>Оценка теста #{test_id}</b>\n\n"
         text += f"👤 Студент: {test['full_name']}\n"
         text += f"🆔 Степик ID: {test['stepik_id']}\n"
+        if test['lesson_title']:
+            text += f"📚 Урок: {test['lesson_title']}\n"
         text += f"🔗 Ссылка: {test['test_url']}\n"
-        text += f"📝 Тип: {test['test_type']} баллов\n\n"
-        text += "Выберите оценку:"
+        text += f"📝 Тип: {test['test_type']} баллов\n"
+        verification = get_verifications(self.db, [test_id]).get(test_id)
+        if verification:
+            text += format_verification(verification) + "\n"
+        if queued:
+            text += f"\n📥 За вами в очереди еще тестов: {queued}"
+        text += "\nВыберите оценку:"
         
         # Получаем максимальный балл за тест
         max_score = int(test['test_type']) if test['test_type'] else 5
@@ -387,8 +557,7 @@ class StepikBot:
             logger.info(f"Начинаем оценку теста {test_id} с баллом {score}")
             
             # Сначала получаем информацию о тесте до его обновления
-            tests = self.db.get_pending_tests()
-            test = next((t for t in tests if t['id'] == test_id), None)
+            test = self.db.get_pending_test(test_id, self.db.get_group_scope(query.from_user.id))
             
             if not test:
                 logger.error(f"Тест {test_id} не найден в списке неоцененных")
@@ -397,7 +566,8 @@ class StepikBot:
             
             logger.info(f"Найден тест: {test}")
             
-            success = self.db.review_test(test_id, score, "Оценено преподавателем")
+            # Оценка проходит, только если тест не забрал другой преподаватель
+            success = self.grading_queue.review(test_id, query.from_user.id, score, "Оценено преподавателем")
             
             if success:
                 logger.info(f"Тест {test_id} успешно оценен")
@@ -414,7 +584,10 @@ class StepikBot:
                 except Exception as e:
                     logger.error(f"Ошибка отправки уведомления: {e}")
                 
-                keyboard = [[InlineKeyboardButton("🔙 Назад к тестам", callback_data="view_tests")]]
+                keyboard = [
+                    [InlineKeyboardButton("▶️ Следующий тест", callback_data="grade_next")],
+                    [InlineKeyboardButton("🔙 Назад к тестам", callback_data="view_tests")]
+                ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 if score > 0:
@@ -434,8 +607,15 @@ class StepikBot:
                         reply_markup=reply_markup
                     )
             else:
-                logger.error(f"Ошибка при оценке теста {test_id}")
-                await query.edit_message_text("❌ Ошибка при оценке теста.")
+                logger.info(f"Тест {test_id} не оценен: уже оценен или в аренде у другого преподавателя")
+                keyboard = [
+                    [InlineKeyboardButton("▶️ Следующий тест", callback_data="grade_next")],
+                    [InlineKeyboardButton("🔙 Назад к тестам", callback_data="view_tests")]
+                ]
+                await query.edit_message_text(
+                    f"🔒 Тест #{test_id} уже оценен или его проверяет другой преподаватель.",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
                 
         except Exception as e:
             logger.error(f"Критическая ошибка в set_test_score: {e}")
@@ -443,10 +623,14 @@ class StepikBot:
     
     async def show_teacher_statistics(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Показ статистики для преподавателя"""
-        stats = self.db.get_statistics()
+        group_ids = self.db.get_group_scope(query.from_user.id)
+        stats = self.db.get_statistics(group_ids)
         feedback_stats = self.feedback_system.get_feedback_stats()
         
         text = format_statistics_summary(stats)
+        text += format_progress_summary(self.progress_reports.get_report(group_ids))
+        text += format_turnaround_summary(self.turnaround.get_summary(group_ids))
+        text += format_queue_stats(self.grading_queue.get_queue_stats())
         
         if feedback_stats:
             text += "\n💬 <b>Обратная связь:</b>\n"
@@ -457,8 +641,9 @@ class StepikBot:
         await query.edit_message_text(text, parse_mode='HTML')
     
     async def show_students_scores(self, query, context: ContextTypes.DEFAULT_TYPE):
-        """Показ баллов всех студентов"""
-        students = self.db.get_students_scores()
+        """Показ лидеров рейтинга студентов"""
+        students = self.leaderboard.get_top(20)
+        totals = self.leaderboard.get_totals()
         
         if not students:
             await query.edit_message_text("👥 Нет зарегистрированных студентов.")
@@ -466,12 +651,8 @@ class StepikBot:
         
         text = "🏆 <b>Баллы студентов:</b>\n\n"
         
-        for i, student in enumerate(students, 1):
-            # Формируем имя студента
-            name = student.get('full_name', '') or f"Студент #{student['user_id']}"
-            
-            text += f"{i}. <b>{name}</b>\n"
-            text += f"   🆔 Степик ID: {student.get('stepik_id', 'Не указан')}\n"
+        for student in students:
+            text += f"{student['rank']}. <b>{student['full_name']}</b>\n"
             text += f"   🎯 Баллов: {student['total_score']}\n"
             text += f"   📝 Тестов: {student['reviewed_tests']}/{student['total_tests']}\n"
             
@@ -481,12 +662,14 @@ class StepikBot:
             
             text += "─" * 30 + "\n"
         
+        if totals['students'] > len(students):
+            text += f"... и еще {totals['students'] - len(students)} студентов\n"
+        
         # Добавляем общую статистику
-        total_score = sum(s['total_score'] for s in students)
         text += f"\n📈 <b>Общая статистика:</b>\n"
-        text += f"👥 Студентов: {len(students)}\n"
-        text += f"🎯 Всего баллов: {total_score}\n"
-        text += f"📊 Средний балл: {total_score / len(students) if students else 0:.1f}"
+        text += f"👥 Студентов: {totals['students']}\n"
+        text += f"🎯 Всего баллов: {totals['total_score']}\n"
+        text += f"📊 Средний балл: {totals['total_score'] / totals['students']:.1f}"
         
         keyboard = [[InlineKeyboardButton("🔙 Назад к меню", callback_data="back_to_teacher_menu")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -497,7 +680,7 @@ class StepikBot:
         """Показ списка студентов для выбора"""
         try:
             logger.info("Начинаем показ списка студентов")
-            students = self.db.get_students_scores()
+            students = self.db.get_students_scores(self.db.get_group_scope(query.from_user.id))
             logger.info(f"Получено студентов: {len(students) if students else 0}")
             
             if not students:
@@ -506,9 +689,12 @@ class StepikBot:
                 return
             
             text = "👥 <b>Выберите студента для просмотра:</b>\n\n"
+            if len(students) > STUDENT_LIST_LIMIT:
+                text += (f"Показаны первые {STUDENT_LIST_LIMIT} из {len(students)}. "
+                         "Остальных найдите через «🔎 Поиск студента».\n")
             
             keyboard = []
-            for student in students:
+            for student in students[:STUDENT_LIST_LIMIT]:
                 # Формируем имя студента
                 name = student.get('full_name', '') or f"Студент #{student['user_id']}"
                 
@@ -516,6 +702,7 @@ class StepikBot:
                 keyboard.append([InlineKeyboardButton(button_text, callback_data=f"student_{student['user_id']}")])
                 logger.info(f"Добавлен студент: {name} (ID: {student['user_id']})")
             
+            keyboard.append([InlineKeyboardButton("🔎 Поиск студента", switch_inline_query_current_chat="")])
             keyboard.append([InlineKeyboardButton("🔙 Назад к меню", callback_data="back_to_teacher_menu")])
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -566,6 +753,12 @@ class StepikBot:
             percentage = (reviewed_tests / total_tests) * 100
             text += f"📈 <b>Выполнено:</b> {percentage:.1f}%\n\n"
         
+        curve = format_student_curve(self.progress_reports.get_student_curve(
+            student_id, self.db.get_group_scope(query.from_user.id)
+        ))
+        if curve:
+            text += curve + "\n"
+        
         # Показываем последние тесты
         if student_tests:
             text += f"📋 <b>Последние тесты:</b>\n"
@@ -577,6 +770,12 @@ class StepikBot:
             if total_tests > 5:
                 text += f"... и еще {total_tests - 5} тестов\n"
         
+        archived_terms = self.archive.get_student_archive_summary(student_id)
+        if archived_terms:
+            text += f"\n📦 <b>Прошлые семестры:</b>\n"
+            for term in archived_terms:
+                text += f"• {term['term_name'] or term['term_id']}: {term['tests']} тестов, {term['total_score']} баллов\n"
+        
         keyboard = [
             [InlineKeyboardButton("🔙 Назад к выбору", callback_data="select_student")],
             [InlineKeyboardButton("🔙 Назад к меню", callback_data="back_to_teacher_menu")]
@@ -631,6 +830,16 @@ class StepikBot:
         
         await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
     
+    async def show_leaderboard(self, query, context: ContextTypes.DEFAULT_TYPE):
+        """Показ рейтинга: лидеры и соседи студента"""
+        standing = self.leaderboard.get_standing(query.from_user.id, top=5, radius=2)
+        text = format_leaderboard(standing, query.from_user.id)
+        
+        keyboard = [[InlineKeyboardButton("🔙 Назад к меню", callback_data="back_to_student_menu")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+    
     async def show_help(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Показ справки"""
         text = """
@@ -667,9 +876,10 @@ ID Степика: 123456
         
         text = update.message.text.strip()
         
-        # Проверяем, является ли сообщение отправкой теста
-        if self.is_test_submission(text):
-            await self.process_test_submission(update, context, text)
+        # Проверяем, является ли сообщение отправкой тестов (разбор за один проход)
+        submission = parse_test_submissions(text)
+        if submission:
+            await self.process_test_submission(update, context, submission)
         # Проверяем, является ли сообщение обратной связью
         elif 'feedback_type' in context.user_data:
             await self.process_feedback_submission(update, context, text)
@@ -678,14 +888,107 @@ ID Степика: 123456
                 "❓ Не понимаю команду. Используйте /help для получения справки."
             )
     
-    def is_test_submission(self, text: str) -> bool:
-        """Проверка, является ли текст отправкой теста"""
-        lines = text.split('\n')
-        required_fields = ['ФИО:', 'ID Степика:', 'Ссылка на тест:', 'Тип теста:']
-        return all(any(field in line for line in lines) for field in required_fields)
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработка загруженных файлов"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Загрузка файлов доступна только преподавателям.")
+            return
+        
+        document = update.message.document
+        file_name = (document.file_name or '').lower()
+        caption = (update.message.caption or '').lower()
+        
+        if not file_name.endswith(('.csv', '.xlsx')):
+            await update.message.reply_text("❌ Поддерживаются только файлы CSV и XLSX.")
+            return
+        
+        # XLSX или подпись "оценки" - выгрузка успеваемости Степика, иначе список студентов
+        is_gradebook = file_name.endswith('.xlsx') or 'оценки' in caption
+        # Подпись "проверка" - только проверить файл, ничего не сохраняя
+        dry_run = 'проверка' in caption
+        
+        try:
+            file = await document.get_file()
+            data = bytes(await file.download_as_bytearray())
+            loop = asyncio.get_running_loop()
+            
+            if is_gradebook:
+                report = await loop.run_in_executor(
+                    None, import_gradebook, self.db, data, file_name, dry_run, self.feedback_system
+                )
+                text = format_gradebook_report(report)
+            else:
+                report = await loop.run_in_executor(
+                    None, import_roster, self.db, decode_upload(data).splitlines(), dry_run,
+                    self.admission.remaining_student_slots()
+                )
+                text = format_import_report(report)
+                if dry_run:
+                    text += "\nℹ️ Режим проверки: студенты не добавлены."
+            
+            await update.message.reply_text(text, parse_mode='HTML')
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+        except Exception as e:
+            logger.error(f"Ошибка импорта файла: {e}")
+            await update.message.reply_text("❌ Ошибка при обработке файла.")
+    
+    async def inline_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Inline-поиск студентов и тестов (только для преподавателей)"""
+        inline_query = update.inline_query
+        user_data = self.db.get_user(inline_query.from_user.id)
+        
+        if not user_data or user_data['role'] != 'teacher' or not inline_query.query.strip():
+            await inline_query.answer([], cache_time=60, is_personal=True)
+            return
+        
+        found = self.search_index.search(
+            inline_query.query, limit=25, group_ids=self.db.get_group_scope(inline_query.from_user.id)
+        )
+        results = []
+        
+        for student in found['students']:
+            results.append(InlineQueryResultArticle(
+                id=f"student_{student['user_id']}",
+                title=f"👤 {student['full_name']}",
+                description=f"Степик ID: {student['stepik_id'] or 'Не указан'}",
+                input_message_content=InputTextMessageContent(
+                    f"👤 <b>{student['full_name']}</b>\n🆔 Степик ID: {student['stepik_id'] or 'Не указан'}",
+                    parse_mode='HTML'
+                ),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("📊 Подробнее", callback_data=f"student_{student['user_id']}")
+                ]])
+            ))
+        
+        for test in found['tests'][:50 - len(results)]:
+            status = f"✅ {test['score']} баллов" if test['is_reviewed'] else "⏳ Ожидает проверки"
+            description = status
+            if test['teacher_comment']:
+                description += f" · {test['teacher_comment']}"
+            buttons = [] if test['is_reviewed'] else [[
+                InlineKeyboardButton(f"Оценить тест #{test['id']}", callback_data=f"review_test_{test['id']}")
+            ]]
+            results.append(InlineQueryResultArticle(
+                id=f"test_{test['id']}",
+                title=f"📝 Тест #{test['id']} — {test['full_name']}",
+                description=description,
+                input_message_content=InputTextMessageContent(
+                    f"📝 <b>Тест #{test['id']}</b>\n👤 {test['full_name']}\n"
+                    f"🔗 {test['test_url']}\n{status}",
+                    parse_mode='HTML'
+                ),
+                reply_markup=InlineKeyboardMarkup(buttons) if buttons else None
+            ))
+        
+        # Результаты персональные: поиск доступен только преподавателям
+        await inline_query.answer(results, cache_time=30, is_personal=True)
     
-    async def process_test_submission(self, update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
-        """Обработка отправки теста"""
+    async def process_test_submission(self, update: Update, context: ContextTypes.DEFAULT_TYPE, submission: Dict):
+        """Обработка отправки одного или нескольких тестов"""
         user = update.effective_user
         user_data = self.db.get_user(user.id)
         
@@ -694,63 +997,88 @@ ID Степика: 123456
             return
         
         try:
-            # Парсим данные
-            lines = text.split('\n')
-            data = {}
-            
-            for line in lines:
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    data[key.strip()] = value.strip()
-            
-            # Валидируем данные
-            validation = validate_test_data(data)
-            if not validation['is_valid']:
+            # Все тесты проверяются вместе, до сохранения
+            if submission['errors']:
                 await update.message.reply_text(
-                    f"❌ Ошибки в данных:\n" + "\n".join(validation['errors'])
+                    "❌ Ошибки в данных:\n" + "\n".join(submission['errors'])
                 )
                 return
             
-            test_type = data['Тип теста']
-            test_url = data['Ссылка на тест']
+            tests = submission['tests']
             
-            # Сохраняем тест
-            success = self.db.add_test(
-                user.id,
-                data['ФИО'],
-                data['ID Степика'],
-                test_url,
-                test_type
-            )
+            # Ограничение частоты и квота тестов до обращения к записи
+            rejection = self.admission.check_submission(user.id, len(tests))
+            if rejection:
+                await update.message.reply_text(f"🚫 {rejection}")
+                return
             
-            if success:
-                # Получаем обновленную статистику студента
-                student_tests = self.db.get_student_tests(user.id)
-                total_tests = len(student_tests)
-                reviewed_tests = len([t for t in student_tests if t['is_reviewed']])
-                total_score = sum(t['score'] for t in student_tests if t['is_reviewed'])
-                
+            # Сохраняем тесты одной транзакцией через общий поток записи, не блокируя цикл событий
+            try:
+                results = await asyncio.wrap_future(self.db.submit_tests(
+                    user.id,
+                    submission['full_name'],
+                    submission['stepik_id'],
+                    [(test['test_url'], test['test_type']) for test in tests]
+                ))
+            except Exception as e:
+                logger.error(f"Ошибка сохранения тестов: {e}")
+                await update.message.reply_text("❌ Ошибка при сохранении теста.")
+                return
+            
+            statuses = [result['status'] for result in results]
+            if all(status == 'duplicate' for status in statuses):
                 keyboard = [
+                    [InlineKeyboardButton("📊 Мои результаты", callback_data="my_results")],
                     [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_student_menu")]
                 ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
+                ids = ", ".join(f"#{result['id']}" for result in results)
                 await update.message.reply_text(
-                    "✅ <b>Тест успешно отправлен!</b>\n\n"
-                    f"👤 ФИО: {data['ФИО']}\n"
-                    f"🆔 ID Степика: {data['ID Степика']}\n"
-                    f"🔗 Ссылка: {test_url}\n"
-                    f"📝 Тип: {test_type} баллов\n\n"
-                    f"📊 <b>Ваша статистика:</b>\n"
-                    f"🎯 Баллов: {total_score}\n"
-                    f"📝 Тестов отправлено: {total_tests}\n"
-                    f"✅ Проверено: {reviewed_tests}\n\n"
-                    "Преподаватель оценит ваш тест в ближайшее время.",
-                    parse_mode='HTML',
-                    reply_markup=reply_markup
+                    f"ℹ️ {'Этот тест уже отправлен' if len(results) == 1 else 'Эти тесты уже отправлены'} "
+                    f"({ids}).\nПовторно отправлять не нужно.",
+                    reply_markup=InlineKeyboardMarkup(keyboard)
+                )
+                return
+            
+            # Получаем обновленную статистику студента
+            student_tests = self.db.get_student_tests(user.id)
+            total_tests = len(student_tests)
+            reviewed_tests = len([t for t in student_tests if t['is_reviewed']])
+            total_score = sum(t['score'] for t in student_tests if t['is_reviewed'])
+            
+            keyboard = [
+                [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_student_menu")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            if len(tests) == 1:
+                title = "🔄 <b>Тест отправлен на повторную проверку!</b>" \
+                    if statuses[0] == 'resubmitted' else "✅ <b>Тест успешно отправлен!</b>"
+                details = (
+                    f"🔗 Ссылка: {tests[0]['test_url']}\n"
+                    f"📝 Тип: {tests[0]['test_type']} баллов\n\n"
                 )
             else:
-                await update.message.reply_text("❌ Ошибка при сохранении теста.")
+                saved = len(tests) - statuses.count('duplicate')
+                title = f"✅ <b>Отправлено тестов: {saved} из {len(tests)}</b>"
+                marks = {'created': "✅", 'resubmitted': "🔄", 'duplicate': "ℹ️ уже отправлен,"}
+                details = "".join(
+                    f"{marks[result['status']]} #{result['id']} {test['test_url']} ({test['test_type']} б.)\n"
+                    for test, result in zip(tests, results)
+                ) + "\n"
+            
+            await update.message.reply_text(
+                f"{title}\n\n"
+                f"👤 ФИО: {submission['full_name']}\n"
+                f"🆔 ID Степика: {submission['stepik_id']}\n"
+                f"{details}"
+                f"📊 <b>Ваша статистика:</b>\n"
+                f"🎯 Баллов: {total_score}\n"
+                f"📝 Тестов отправлено: {total_tests}\n"
+                f"✅ Проверено: {reviewed_tests}\n\n"
+                "Преподаватель оценит ваши тесты в ближайшее время.",
+                parse_mode='HTML',
+                reply_markup=reply_markup
+            )
                 
         except Exception as e:
             logger.error(f"Ошибка обработки теста: {e}")
@@ -805,6 +1133,10 @@ ID Степика: 123456
             return
         
         stats = self.db.get_statistics()
+        writer_stats = self.db.writer.get_stats() if self.db.writer else {}
+        verify_report = self.verifier.last_report
+        admission_stats = self.admission.get_stats()
+        loop_text = format_instrumentation_report(self.instrumentation.get_report()).rstrip()
         text = f"""
 🔧 <b>Админ панель</b>
 
@@ -814,13 +1146,354 @@ ID Степика: 123456
 • Оценено: {stats.get('reviewed_tests', 0)}
 • Ожидает: {stats.get('pending_tests', 0)}
 
+💾 Запись в БД:
+• Пакетов: {writer_stats.get('batches', 0)}
+• Средний размер пакета: {writer_stats.get('avg_batch_size', 0)}
+• Средняя фиксация: {writer_stats.get('avg_commit_ms', 0)} мс
+
+🚦 Контроль нагрузки:
+• Студентов: {admission_stats['students']}/{MAX_STUDENTS}
+• Лимит тестов на студента: {MAX_TESTS_PER_STUDENT}
+• Отклонено по частоте: {admission_stats['rate_limited']}
+• Отклонено по квоте: {admission_stats['quota_rejected']}
+
+🤖 Проверка Степика: {'включена' if STEPIK_VERIFY_ENABLED else 'выключена'}
+• Проверено за проход: {verify_report.get('checked', 0)}
+• Скорость: {verify_report.get('tests_per_second', 0)} тест/с
+• Задержка p95: {verify_report.get('p95_latency_ms', 0)} мс
+{loop_text}
+
 🛠️ Доступные команды:
 • /stats - статистика
 • /profile - профиль
+• /terms - семестры и архив
+• /groups - группы студентов
+• /deadline - сроки сдачи и напоминания
+• /digest - сводка новых тестов и обратной связи
+• /inbox - входящие отзывы
+• /backup - резервная копия базы
+• /analytics - аналитика по снимку базы
         """
         
         await update.message.reply_text(text, parse_mode='HTML')
     
+    async def backup_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /backup: резервная копия базы без остановки бота"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        await update.message.reply_text("⏳ Создаем резервную копию...")
+        report = await asyncio.get_running_loop().run_in_executor(None, self.backup_manager.create_backup)
+        
+        backups = self.backup_manager.list_backups()
+        text = format_backup_report(report)
+        if backups:
+            text += f"\n• Хранится копий: {len(backups)}"
+        await update.message.reply_text(text)
+    
+    async def analytics_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /analytics: отчеты по снимку базы, а не по рабочей базе"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        def build_report():
+            snapshot = self.analytics.ensure_fresh(ANALYTICS_INTERVAL or 86400)
+            if snapshot['error']:
+                return f"❌ Ошибка создания снимка: {snapshot['error']}"
+            return format_analytics_report(self.analytics.compute_reports())
+        
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(None, build_report)
+        except Exception as e:
+            logger.error(f"Ошибка построения аналитики: {e}")
+            text = "❌ Не удалось построить отчет."
+        await update.message.reply_text(text)
+    
+    async def terms_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /terms: семестры и перенос закрытых семестров в архив"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        args = context.args or []
+        usage = (
+            "\n\nКоманды:\n"
+            "• /terms add Название 2025-09-01 2026-01-31 - добавить семестр\n"
+            "• /terms archive ID - перенести закончившийся семестр в архив"
+        )
+        
+        if len(args) >= 4 and args[0] == 'add':
+            term_id = self.archive.add_term(' '.join(args[1:-2]), args[-2], args[-1])
+            if term_id is None:
+                await update.message.reply_text("❌ Не удалось добавить семестр. Проверьте название и даты (ГГГГ-ММ-ДД).")
+                return
+            await update.message.reply_text(f"✅ Семестр #{term_id} добавлен.")
+            return
+        
+        if len(args) == 2 and args[0] == 'archive' and args[1].isdigit():
+            await update.message.reply_text("⏳ Переносим данные семестра в архив...")
+            report = await asyncio.get_running_loop().run_in_executor(
+                None, self.archive.archive_term, int(args[1])
+            )
+            if report['error']:
+                await update.message.reply_text(f"❌ {report['error']}")
+                return
+            await update.message.reply_text(
+                f"📦 Перенесено в архив: тестов {report['tests']}, уведомлений {report['notifications']}, "
+                f"отзывов {report['feedback']} ({report['elapsed_ms']} мс)."
+            )
+            return
+        
+        await update.message.reply_text(format_terms(self.archive.get_terms()) + usage, parse_mode='HTML')
+    
+    async def groups_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /groups: группы студентов и закрепление за ними преподавателей"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        args = context.args or []
+        usage = (
+            "\n\nКоманды:\n"
+            "• /groups add Название - создать группу и закрепить ее за собой\n"
+            "• /groups join ID, /groups leave ID - закрепить или открепить группу\n"
+            "• /groups move ID USER_ID ... - перевести студентов в группу"
+        )
+        group_ids = {group['id'] for group in self.db.get_groups()}
+        
+        if len(args) >= 2 and args[0] == 'add':
+            group_id = self.db.create_group(' '.join(args[1:]))
+            if group_id is None or not self.db.add_teacher_group(user.id, group_id):
+                await update.message.reply_text("❌ Не удалось создать группу.")
+                return
+            await update.message.reply_text(f"✅ Группа #{group_id} создана и закреплена за вами.")
+            return
+        
+        if len(args) == 2 and args[0] in ('join', 'leave') and args[1].isdigit():
+            group_id = int(args[1])
+            if group_id not in group_ids:
+                await update.message.reply_text(f"❌ Группа #{group_id} не найдена.")
+                return
+            if args[0] == 'join':
+                self.db.add_teacher_group(user.id, group_id)
+                await update.message.reply_text(f"✅ Группа #{group_id} закреплена за вами.")
+            else:
+                self.db.remove_teacher_group(user.id, group_id)
+                await update.message.reply_text(f"✅ Группа #{group_id} откреплена.")
+            return
+        
+        if len(args) >= 3 and args[0] == 'move' and all(arg.lstrip('-').isdigit() for arg in args[1:]):
+            group_id = int(args[1])
+            if group_id not in group_ids:
+                await update.message.reply_text(f"❌ Группа #{group_id} не найдена.")
+                return
+            moved = 0
+            for student_id in map(int, args[2:]):
+                student = self.db.get_user(student_id)
+                if student and student['role'] == 'student' and self.db.set_user_group(student_id, group_id):
+                    moved += 1
+            await update.message.reply_text(f"✅ Переведено в группу #{group_id}: {moved} из {len(args) - 2}.")
+            return
+        
+        await update.message.reply_text(
+            format_groups(self.db.get_groups(), self.db.get_teacher_group_ids(user.id)) + usage,
+            parse_mode='HTML'
+        )
+    
+    async def deadline_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /deadline: сроки сдачи и напоминания студентам без отправки"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        args = context.args or []
+        usage = (
+            "\n\nКоманды:\n"
+            "• /deadline add 2025-10-01 [18:00] ссылка Название - срок для всех студентов\n"
+            "• /deadline add группа=ID 2025-10-01 ссылка Название - срок для группы\n"
+            "• /deadline remind ID - напомнить сейчас\n"
+            "• /deadline delete ID - удалить срок\n"
+            f"Напоминание уходит за {REMINDER_HOURS_BEFORE:g} ч до срока тем, кто еще не отправил тест."
+        )
+        
+        if len(args) >= 4 and args[0] == 'add':
+            args = args[1:]
+            group_id = None
+            if args[0].startswith('группа='):
+                group_text = args.pop(0).split('=', 1)[1]
+                group_id = int(group_text) if group_text.isdigit() else -1
+            time_text = args[1] if len(args) > 1 and ':' in args[1] and '/' not in args[1] else None
+            if time_text:
+                args = [args[0]] + args[2:]
+            due_at = parse_due_at(args[0], time_text) if args else None
+            
+            if group_id is not None and group_id not in {group['id'] for group in self.db.get_groups()}:
+                await update.message.reply_text("❌ Группа не найдена.")
+                return
+            if due_at is None or len(args) < 3 or not args[1].startswith('http'):
+                await update.message.reply_text("❌ Проверьте дату (ГГГГ-ММ-ДД ЧЧ:ММ), ссылку и название." + usage)
+                return
+            deadline_id = self.reminders.add_deadline(' '.join(args[2:]), args[1], due_at, group_id, user.id)
+            if deadline_id is None:
+                await update.message.reply_text("❌ Не удалось добавить срок.")
+                return
+            missing = len(self.reminders.get_missing_students(deadline_id))
+            await update.message.reply_text(f"✅ Срок #{deadline_id} добавлен. Еще не сдали: {missing}.")
+            return
+        
+        if len(args) == 2 and args[0] in ('remind', 'delete') and args[1].isdigit():
+            deadline_id = int(args[1])
+            if not self.reminders.get_deadline(deadline_id):
+                await update.message.reply_text(f"❌ Срок #{deadline_id} не найден.")
+                return
+            if args[0] == 'delete':
+                self.reminders.delete_deadline(deadline_id)
+                await update.message.reply_text(f"✅ Срок #{deadline_id} удален.")
+                return
+            queued = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: self.reminders.enqueue_due(deadline_id=deadline_id)
+            )
+            await update.message.reply_text(
+                f"📨 Напоминаний поставлено в очередь: {queued}. Они уйдут в течение нескольких минут."
+            )
+            if REMINDER_INTERVAL <= 0:
+                await self.reminders.deliver_pending()
+            return
+        
+        deadlines = self.reminders.get_deadlines(group_ids=self.db.get_group_scope(user.id))
+        await update.message.reply_text(format_deadlines(deadlines) + usage, parse_mode='HTML')
+    
+    async def digest_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /digest: сводка событий курса и окно сводок"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        args = context.args or []
+        if len(args) == 1 and (args[0].isdigit() or args[0] == 'off'):
+            if DIGEST_WINDOW_MINUTES <= 0:
+                await update.message.reply_text("❌ Сводки выключены в настройках бота (DIGEST_WINDOW_MINUTES).")
+                return
+            minutes = 0 if args[0] == 'off' else int(args[0])
+            if not self.digest.set_window(user.id, minutes):
+                await update.message.reply_text("❌ Не удалось изменить окно сводки.")
+                return
+            window = self.digest.get_window(user.id)
+            await update.message.reply_text(
+                f"✅ Сводка будет приходить раз в {window} мин." if window else "✅ Сводки отключены."
+            )
+            return
+        
+        summary = await asyncio.get_running_loop().run_in_executor(None, self.digest.take_digest, user.id)
+        window = self.digest.get_window(user.id)
+        await update.message.reply_text(
+            format_digest(summary) +
+            f"\n\n⚙️ Окно сводки: {f'{window} мин' if window else 'сводки отключены'}. "
+            "Изменить: /digest МИНУТЫ или /digest off",
+            parse_mode='HTML'
+        )
+    
+    async def inbox_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /inbox: входящие отзывы с фильтрами, поиском и массовой отметкой"""
+        user = update.effective_user
+        user_data = self.db.get_user(user.id)
+        
+        if not user_data or user_data['role'] != 'teacher':
+            await update.message.reply_text("❌ Доступно только преподавателям.")
+            return
+        
+        args = context.args or []
+        if len(args) >= 2 and args[0] == 'done' and all(arg.isdigit() for arg in args[1:]):
+            marked = self.feedback_system.mark_feedback_processed([int(arg) for arg in args[1:]], user.id)
+            await update.message.reply_text(f"✅ Отмечено обработанными: {marked}.")
+            return
+        
+        feedback_type = args.pop(0) if args and args[0] in FEEDBACK_TYPES else None
+        processed = False
+        if args and args[0] == 'все':
+            processed = None
+            args.pop(0)
+        search = ' '.join(args) or None
+        
+        text, keyboard = self.build_feedback_inbox(feedback_type, processed, search)
+        if not search and processed is False:
+            text += ("Фильтры: /inbox bug|suggestion|compliment|question, /inbox все, /inbox текст для поиска\n"
+                     "Отметить: /inbox done ID ...")
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=keyboard)
+    
+    def build_feedback_inbox(self, feedback_type: Optional[str] = None, processed: Optional[bool] = False,
+                             search: Optional[str] = None, before_id: Optional[int] = None):
+        """Страница входящих отзывов и кнопки для нее"""
+        page = self.feedback_system.get_feedback_inbox(
+            feedback_type, processed=processed, query=search, before_id=before_id, limit=5
+        )
+        unprocessed = self.feedback_system.get_feedback_stats().get('unprocessed_feedback', 0)
+        text = format_feedback_inbox(page, unprocessed)
+        
+        # В кнопках помещаются только тип и ID, поэтому листать можно входящие
+        # без поиска; поиск и «все» показывают первую страницу
+        buttons = []
+        type_key = feedback_type or 'all'
+        open_ids = [str(item['id']) for item in page['items'] if not item['is_processed']]
+        if open_ids:
+            buttons.append([InlineKeyboardButton(
+                "✅ Отметить страницу обработанной", callback_data=f"inbox_done_{type_key}_{'-'.join(open_ids)}"
+            )])
+        if page['next_before_id'] and not search and processed is False:
+            buttons.append([InlineKeyboardButton(
+                "▶️ Дальше", callback_data=f"inbox_page_{type_key}_{page['next_before_id']}"
+            )])
+        return text, InlineKeyboardMarkup(buttons) if buttons else None
+    
+    async def handle_inbox_callback(self, query, context: ContextTypes.DEFAULT_TYPE, action: str):
+        """Кнопки входящих отзывов: следующая страница и отметка страницы"""
+        parts = action.split("_")
+        if len(parts) != 4 or (parts[2] != 'all' and parts[2] not in FEEDBACK_TYPES):
+            await query.edit_message_text("❌ Ошибка в данных кнопки.")
+            return
+        feedback_type = None if parts[2] == 'all' else parts[2]
+        
+        try:
+            if parts[1] == 'done':
+                self.feedback_system.mark_feedback_processed(
+                    [int(feedback_id) for feedback_id in parts[3].split('-')], query.from_user.id
+                )
+                before_id = None
+            elif parts[1] == 'page':
+                before_id = int(parts[3])
+            else:
+                raise ValueError(parts[1])
+        except ValueError:
+            await query.edit_message_text("❌ Ошибка в данных кнопки.")
+            return
+        
+        text, keyboard = self.build_feedback_inbox(feedback_type, before_id=before_id)
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=keyboard)
+    
+    async def _send_message(self, chat_id: int, text: str):
+        """Отправка сообщения пользователю через бота (напоминания и сводки)"""
+        await self.application.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+    
     async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Команда /cancel"""
         await update.message.reply_text("❌ Операция отменена.")
@@ -868,7 +1541,14 @@ ID Степика: 123456
             text += f"{emoji} {notif['message']}\n"
             text += f"📅 {notif['created_at']}\n\n"
         
-        await update.message.reply_text(text, parse_mode='HTML')
+        unread = self.feedback_system.get_unread_count(user.id)
+        if unread > len(notifications):
+            text += f"Показаны последние {len(notifications)} из {unread}.\n"
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ Прочитать все", callback_data="notifications_read_all")]
+        ])
+        
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
     
     async def show_feedback_menu(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Показ меню обратной связи"""
@@ -899,7 +1579,14 @@ ID Степика: 123456
             text += f"{emoji} {notif['message']}\n"
             text += f"📅 {notif['created_at']}\n\n"
         
-        await query.edit_message_text(text, parse_mode='HTML')
+        unread = self.feedback_system.get_unread_count(user.id)
+        if unread > len(notifications):
+            text += f"Показаны последние {len(notifications)} из {unread}.\n"
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ Прочитать все", callback_data="notifications_read_all")]
+        ])
+        
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
     
     async def start_feedback_submission(self, query, context: ContextTypes.DEFAULT_TYPE, feedback_type: str):
         """Начало отправки отзыва"""
@@ -963,21 +1650,15 @@ ID Степика: 123456
     
     async def notify_teachers_about_feedback(self, feedback_type: str, message: str):
         """Уведомление преподавателей о новой обратной связи"""
+        # В режиме сводок отзыв попадает в сводку через журнал событий
+        if DIGEST_WINDOW_MINUTES > 0:
+            return
         try:
-            # Получаем всех преподавателей
-            import sqlite3
-            with sqlite3.connect(self.db.db_name) as connection:
-                cursor = connection.cursor()
-                cursor.execute('SELECT user_id FROM users WHERE role = "teacher" AND is_approved = TRUE')
-                teachers = cursor.fetchall()
-            
-            # Отправляем уведомления
-            for teacher_id, in teachers:
-                self.feedback_system.send_notification(
-                    teacher_id,
-                    f"Новая обратная связь ({feedback_type}): {message[:100]}...",
-                    'info'
-                )
+            # Отправляем уведомления всем преподавателям одной транзакцией
+            self.feedback_system.send_notifications([
+                (teacher_id, f"Новая обратная связь ({feedback_type}): {message[:100]}...", 'info')
+                for teacher_id in self.db.get_teacher_ids()
+            ])
         except Exception as e:
             logger.error(f"Ошибка уведомления преподавателей: {e}")
     
@@ -997,6 +1678,7 @@ ID Степика: 123456
     async def show_teacher_menu_from_callback(self, query, context: ContextTypes.DEFAULT_TYPE):
         """Меню преподавателя из callback"""
         keyboard = [
+            [InlineKeyboardButton("▶️ Следующий тест", callback_data="grade_next")],
             [InlineKeyboardButton("📋 Просмотр тестов", callback_data="view_tests")],
             [InlineKeyboardButton("👥 Выбрать студента", callback_data="select_student")]
         ]
@@ -1019,15 +1701,22 @@ ID Степика: 123456
         keyboard = [
             [InlineKeyboardButton("📤 Отправить тест", callback_data="submit_test")],
             [InlineKeyboardButton("📊 Мои результаты", callback_data="my_results")],
+            [InlineKeyboardButton("🏆 Рейтинг", callback_data="leaderboard")],
             [InlineKeyboardButton("ℹ️ Помощь", callback_data="help")]
         ]
+        unread = self.feedback_system.get_unread_count(user.id)
+        if unread:
+            keyboard.insert(2, [InlineKeyboardButton(f"🔔 Уведомления ({unread})", callback_data="notifications")])
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         text = "👨‍🎓 <b>Панель студента</b>\n\n"
         text += f"🎯 <b>Ваши баллы:</b> {total_score}\n"
         text += f"📝 <b>Отправлено тестов:</b> {total_tests}\n"
-        text += f"✅ <b>Проверено:</b> {reviewed_tests}\n\n"
-        text += "Выберите действие:"
+        text += f"✅ <b>Проверено:</b> {reviewed_tests}\n"
+        rank = self.leaderboard.get_rank(user.id)
+        if rank:
+            text += f"🏆 <b>Место в рейтинге:</b> {rank['rank']} из {rank['students']}\n"
+        text += "\nВыберите действие:"
         
         await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
     
@@ -1045,6 +1734,64 @@ ID Степика: 123456
         except Exception as e:
             logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
     
+    def start_background_tasks(self):
+        """Запуск фоновых задач"""
+        self.instrumentation.start()
+        if STEPIK_VERIFY_ENABLED:
+            self.background_tasks.append(
+                asyncio.create_task(self.verifier.run_forever(STEPIK_VERIFY_INTERVAL))
+            )
+            logger.info("Фоновая проверка через API Степика включена")
+        if BACKUP_INTERVAL > 0:
+            self.background_tasks.append(
+                asyncio.create_task(self.backup_manager.run_forever(BACKUP_INTERVAL))
+            )
+        if ANALYTICS_INTERVAL > 0:
+            self.background_tasks.append(
+                asyncio.create_task(self.analytics.run_forever(ANALYTICS_INTERVAL))
+            )
+        if REMINDER_INTERVAL > 0:
+            self.background_tasks.append(
+                asyncio.create_task(self.reminders.run_forever(REMINDER_INTERVAL))
+            )
+        if DIGEST_WINDOW_MINUTES > 0:
+            self.background_tasks.append(
+                asyncio.create_task(self.digest.run_forever(60))
+            )
+        if NOTIFICATION_RETENTION_DAYS > 0:
+            self.background_tasks.append(
+                asyncio.create_task(self.feedback_system.run_maintenance_forever(
+                    MAINTENANCE_INTERVAL, NOTIFICATION_RETENTION_DAYS, INCREMENTAL_VACUUM_PAGES
+                ))
+            )
+    
+    async def stop_background_tasks(self):
+        """Остановка фоновых задач"""
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        self.background_tasks = []
+        await self.instrumentation.stop()
+        # Общие клиенты закрывает владелец общих ресурсов
+        if self.shared is None:
+            await self.stepik_client.close()
+        self.metadata_cache.close()
+    
+    async def start(self):
+        """Запуск приема обновлений и фоновых задач в текущем цикле событий"""
+        await self.application.initialize()
+        await self.application.start()
+        await self.application.updater.start_polling()
+        self.start_background_tasks()
+        logger.info(f"Бот курса {self.tenant['name']} запущен")
+    
+    async def stop(self):
+        """Остановка приема обновлений и фоновых задач"""
+        await self.stop_background_tasks()
+        await self.application.updater.stop()
+        await self.application.stop()
+        await self.application.shutdown()
+    
     def run(self):
         """Запуск бота"""
         logger.info("Запуск бота...")
@@ -1063,9 +1810,7 @@ ID Степика: 123456
     async def _run_async(self):
         """Асинхронный запуск бота"""
         try:
-            await self.application.initialize()
-            await self.application.start()
-            await self.application.updater.start_polling()
+            await self.start()
             logger.info("Бот запущен и работает!")
             
             # Ждем бесконечно, пока бот работает
@@ -1074,13 +1819,67 @@ ID Степика: 123456
                     await asyncio.sleep(1)
             except KeyboardInterrupt:
                 logger.info("Получен сигнал остановки...")
-                await self.application.stop()
-                await self.application.shutdown()
+                await self.stop()
                 
         except Exception as e:
             logger.error(f"Ошибка асинхронного запуска: {e}")
             raise
 
+class TenantBots:
+    """Боты нескольких курсов в одном процессе.
+
+    Каждый бот опрашивает Telegram своим токеном, поэтому обновления сразу
+    приходят нужному курсу. Цикл событий, клиенты API Степика, поток кеша
+    названий и пул потоков для блокирующих операций общие.
+    """
+    
+    def __init__(self, tenants: List[Dict]):
+        self.shared = SharedResources(
+            STEPIK_API_URL, STEPIK_CLIENT_ID, STEPIK_CLIENT_SECRET, STEPIK_MAX_CONCURRENCY
+        )
+        # Один замер задержки на общий цикл событий
+        self.instrumentation = BotInstrumentation(LOOP_LAG_INTERVAL, LOOP_BLOCK_WARN_MS)
+        self.bots = {
+            tenant['name']: StepikBot(tenant, self.shared, self.instrumentation) for tenant in tenants
+        }
+    
+    def get_bot(self, token: str) -> Optional[StepikBot]:
+        """Бот курса по токену"""
+        return next((bot for bot in self.bots.values() if bot.tenant['bot_token'] == token), None)
+    
+    async def start(self):
+        """Запуск всех ботов; курс с ошибкой запуска не мешает остальным"""
+        for name, bot in self.bots.items():
+            try:
+                await bot.start()
+            except Exception as e:
+                logger.error(f"Ошибка запуска бота курса {name}: {e}")
+    
+    async def stop(self):
+        """Остановка всех ботов и закрытие общих ресурсов"""
+        for name, bot in self.bots.items():
+            try:
+                await bot.stop()
+            except Exception as e:
+                logger.error(f"Ошибка остановки бота курса {name}: {e}")
+        await self.shared.close()
+    
+    def run(self):
+        """Запуск ботов всех курсов"""
+        logger.info(f"Запуск ботов курсов: {', '.join(self.bots)}")
+        asyncio.run(self._run_async())
+    
+    async def _run_async(self):
+        await self.start()
+        try:
+            while True:
+                await asyncio.sleep(1)
+        finally:
+            await self.stop()
+
 if __name__ == '__main__':
-    bot = StepikBot()
-    bot.run()
+    if TENANTS_FILE:
+        TenantBots(load_tenants(TENANTS_FILE, BACKUP_DIR, ANALYTICS_DIR)).run()
+    else:
+        bot = StepikBot()
+        bot.run()
@@ -8,12 +8,79 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 
 # Database
 DATABASE_NAME = 'stepik_bot.db'
+# Several courses in one process: JSON list of tenants (see tenants.py)
+TENANTS_FILE = os.getenv('TENANTS_FILE')
+# Archive of closed terms (attached to the main database on demand)
+ARCHIVE_DATABASE_NAME = os.getenv('ARCHIVE_DATABASE_NAME', 'stepik_bot_archive.db')
 
 # Admin settings
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')
 
 # Bot settings
-MAX_STUDENTS = 100
-MAX_TESTS_PER_STUDENT = 50
+MAX_STUDENTS = int(os.getenv('MAX_STUDENTS', '100'))
+MAX_TESTS_PER_STUDENT = int(os.getenv('MAX_TESTS_PER_STUDENT', '50'))
 
+# Submission rate limits (token bucket per user)
+SUBMISSION_RATE_PER_MINUTE = float(os.getenv('SUBMISSION_RATE_PER_MINUTE', '6'))
+SUBMISSION_BURST = int(os.getenv('SUBMISSION_BURST', '3'))
+# memory - per process, sqlite - shared between workers through the database
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
 
+# Notification retention: read notifications older than this are rolled up and deleted
+NOTIFICATION_RETENTION_DAYS = int(os.getenv('NOTIFICATION_RETENTION_DAYS', '90'))
+MAINTENANCE_INTERVAL = int(os.getenv('MAINTENANCE_INTERVAL', '86400'))
+INCREMENTAL_VACUUM_PAGES = int(os.getenv('INCREMENTAL_VACUUM_PAGES', '1000'))
+
+# Online backups (compressed, rotated)
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '7'))
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', '86400'))
+BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '256'))
+
+# Analytics snapshots: reports are computed from a copy, never from the live database
+ANALYTICS_DIR = os.getenv('ANALYTICS_DIR', 'analytics')
+ANALYTICS_INTERVAL = int(os.getenv('ANALYTICS_INTERVAL', '86400'))
+# Also export Parquet files (requires requirements_analytics.txt)
+ANALYTICS_PARQUET = os.getenv('ANALYTICS_PARQUET', 'false').lower() == 'true'
+
+# Review turnaround: tests waiting longer than the SLA are flagged
+REVIEW_SLA_HOURS = float(os.getenv('REVIEW_SLA_HOURS', '48'))
+TURNAROUND_WINDOW_DAYS = int(os.getenv('TURNAROUND_WINDOW_DAYS', '30'))
+
+# Grading queue: each teacher gets a batch of the oldest tests for a limited time
+GRADING_LEASE_SECONDS = int(os.getenv('GRADING_LEASE_SECONDS', '900'))
+GRADING_BATCH_SIZE = int(os.getenv('GRADING_BATCH_SIZE', '3'))
+
+# Deadline reminders: checked every REMINDER_INTERVAL seconds (0 disables),
+# sent REMINDER_HOURS_BEFORE the deadline within Telegram's rate limit
+REMINDER_INTERVAL = int(os.getenv('REMINDER_INTERVAL', '60'))
+REMINDER_HOURS_BEFORE = float(os.getenv('REMINDER_HOURS_BEFORE', '24'))
+REMINDER_MESSAGES_PER_SECOND = float(os.getenv('REMINDER_MESSAGES_PER_SECOND', '25'))
+
+# Teacher digest: new tests, feedback and overdue reviews are summarized
+# once per window instead of one notification per event (0 = immediate)
+DIGEST_WINDOW_MINUTES = int(os.getenv('DIGEST_WINDOW_MINUTES', '60'))
+
+# Event-loop instrumentation: lag is sampled every LOOP_LAG_INTERVAL seconds
+# (0 disables); a loop blocked longer than LOOP_BLOCK_WARN_MS is logged with a stack
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+LOOP_BLOCK_WARN_MS = float(os.getenv('LOOP_BLOCK_WARN_MS', '250'))
+
+# Group commit settings
+GROUP_COMMIT_DELAY = float(os.getenv('GROUP_COMMIT_DELAY_MS', '5')) / 1000
+GROUP_COMMIT_MAX_BATCH = int(os.getenv('GROUP_COMMIT_MAX_BATCH', '256'))
+
+# Stepik API settings
+STEPIK_API_URL = os.getenv('STEPIK_API_URL', 'https://stepik.org')
+STEPIK_CLIENT_ID = os.getenv('STEPIK_CLIENT_ID')
+STEPIK_CLIENT_SECRET = os.getenv('STEPIK_CLIENT_SECRET')
+STEPIK_MAX_CONCURRENCY = int(os.getenv('STEPIK_MAX_CONCURRENCY', '8'))
+
+# Background Stepik verification
+STEPIK_VERIFY_ENABLED = os.getenv('STEPIK_VERIFY_ENABLED', 'false').lower() == 'true'
+STEPIK_VERIFY_INTERVAL = int(os.getenv('STEPIK_VERIFY_INTERVAL', '600'))
+STEPIK_AUTO_GRADE = os.getenv('STEPIK_AUTO_GRADE', 'false').lower() == 'true'
+
+# Stepik metadata cache (seconds)
+STEPIK_METADATA_TTL = int(os.getenv('STEPIK_METADATA_TTL', '86400'))
+STEPIK_METADATA_NEGATIVE_TTL = int(os.getenv('STEPIK_METADATA_NEGATIVE_TTL', '3600'))
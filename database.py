@@ -1,11 +1,20 @@
 import sqlite3
 import logging
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
+
+from writer import GroupCommitWriter, WriteOperation
+from utils import normalize_stepik_url
+
+# Telegram выдает пользователям положительные ID, поэтому веб-пользователи
+# получают отрицательные ID из отдельной последовательности
+WEB_USER_SEQUENCE = 'web_user'
 
 class Database:
     def __init__(self, db_name: str = 'stepik_bot.db'):
         self.db_name = db_name
+        self.writer: Optional[GroupCommitWriter] = None
         self.init_database()
     
     def init_database(self):
@@ -13,6 +22,10 @@ class Database:
         conn = sqlite3.connect(self.db_name)
         cursor = conn.cursor()
         
+        # Новые базы сразу создаются с инкрементальной очисткой свободных страниц,
+        # для существующих режим включается миграцией (нужен VACUUM)
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        
         # Таблица пользователей
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -54,19 +67,216 @@ class Database:
             )
         ''')
         
+        # Последовательности идентификаторов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS id_sequences (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute(
+            'INSERT OR IGNORE INTO id_sequences (name, value) VALUES (?, 0)',
+            (WEB_USER_SEQUENCE,)
+        )
+        
+        # Старые базы создавались без stepik_id у пользователей
+        self._ensure_column(cursor, 'users', 'stepik_id', 'TEXT')
+        # Кто проверил тест (NULL - проверено автоматически)
+        self._ensure_column(cursor, 'tests', 'reviewed_by', 'INTEGER')
+        
+        # Группы (курсы) студентов и закрепление преподавателей за группами
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS student_groups (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS teacher_groups (
+                teacher_id INTEGER NOT NULL,
+                group_id INTEGER NOT NULL,
+                PRIMARY KEY (teacher_id, group_id)
+            )
+        ''')
+        # Группа теста повторяет группу студента, чтобы выборки тестов
+        # группы шли по индексу без соединения с пользователями
+        self._ensure_column(cursor, 'users', 'group_id', 'INTEGER')
+        self._ensure_column(cursor, 'tests', 'group_id', 'INTEGER')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_group ON users (group_id, role)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_tests_group ON tests (group_id, is_reviewed, submitted_at)')
+        
+        # Ключи идемпотентности веб-форм отправки тестов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                user_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                test_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, key)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at)')
+        
+        self._ensure_test_dedup(cursor)
+        
         conn.commit()
         conn.close()
         logging.info("База данных инициализирована")
     
+    @staticmethod
+    def _ensure_column(cursor, table: str, column: str, definition: str):
+        """Добавление колонки, если ее нет в существующей таблице"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    @classmethod
+    def _ensure_test_dedup(cls, cursor):
+        """Уникальность теста по (студент, нормализованная ссылка)
+
+        При первом запуске заполняет нормализованные ссылки и удаляет
+        накопившиеся дубликаты, иначе уникальный индекс не создать.
+        """
+        cls._ensure_column(cursor, 'tests', 'test_url_norm', 'TEXT')
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_tests_student_url'")
+        if cursor.fetchone():
+            return
+        
+        cursor.execute('SELECT id, test_url FROM tests WHERE test_url_norm IS NULL')
+        cursor.executemany(
+            'UPDATE tests SET test_url_norm = ? WHERE id = ?',
+            [(normalize_stepik_url(test_url or ''), test_id) for test_id, test_url in cursor.fetchall()]
+        )
+        removed = cls._compact_duplicate_tests(cursor)
+        if removed:
+            logging.info(f"Удалено повторных отправок тестов: {removed}")
+        
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_tests_student_url
+            ON tests (student_id, test_url_norm)
+        ''')
+    
+    @staticmethod
+    def _group_condition(column: str, group_ids: Optional[List[int]]) -> Tuple[str, List]:
+        """Условие на группы для WHERE; None - все группы"""
+        if group_ids is None:
+            return 'TRUE', []
+        return f"{column} IN ({', '.join('?' * len(group_ids))})", list(group_ids)
+    
+    @staticmethod
+    def _compact_duplicate_tests(cursor) -> int:
+        """Удаление повторных отправок: остается оцененный (с лучшим баллом) или самый ранний тест"""
+        cursor.execute('''
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY student_id, test_url_norm
+                    ORDER BY is_reviewed DESC, score DESC, submitted_at, id
+                ) AS position
+                FROM tests
+                WHERE student_id IS NOT NULL
+            )
+            WHERE position > 1
+        ''')
+        duplicate_ids = [(row[0],) for row in cursor.fetchall()]
+        if not duplicate_ids:
+            return 0
+        
+        cursor.executemany('DELETE FROM tests WHERE id = ?', duplicate_ids)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'test_verifications'")
+        if cursor.fetchone():
+            cursor.executemany('DELETE FROM test_verifications WHERE test_id = ?', duplicate_ids)
+        return len(duplicate_ids)
+    
+    def compact_duplicate_tests(self) -> int:
+        """Разовое удаление повторных отправок тестов"""
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+            removed = self._compact_duplicate_tests(cursor)
+            conn.commit()
+            conn.close()
+            return removed
+        except Exception as e:
+            logging.error(f"Ошибка удаления повторных отправок: {e}")
+            return 0
+    
+    def enable_incremental_vacuum(self) -> bool:
+        """Перевод существующей базы в режим auto_vacuum = INCREMENTAL
+        
+        Требует полного VACUUM, поэтому выполняется миграцией, а не при запуске.
+        """
+        try:
+            conn = sqlite3.connect(self.db_name)
+            try:
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    conn.execute('VACUUM')
+                return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+            finally:
+                conn.close()
+        except Exception as e:
+            logging.error(f"Ошибка включения инкрементальной очистки: {e}")
+            return False
+    
+    def incremental_vacuum(self, max_pages: int = 1000) -> int:
+        """Возврат свободных страниц файловой системе, не больше max_pages за вызов"""
+        try:
+            conn = sqlite3.connect(self.db_name, timeout=30)
+            try:
+                if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                    return 0
+                before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
+                conn.commit()
+                return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+            finally:
+                conn.close()
+        except Exception as e:
+            logging.error(f"Ошибка инкрементальной очистки: {e}")
+            return 0
+    
+    def enable_group_commit(self, max_delay: float = 0.005, max_batch: int = 256) -> GroupCommitWriter:
+        """Включение групповой фиксации записей"""
+        if self.writer is None:
+            self.writer = GroupCommitWriter(self.db_name, max_delay, max_batch)
+        return self.writer
+    
+    def run_write(self, operation: WriteOperation) -> Future:
+        """Выполнение операции записи через поток записи (или напрямую, если он выключен)"""
+        if self.writer is not None:
+            return self.writer.submit(operation)
+        
+        future = Future()
+        try:
+            conn = sqlite3.connect(self.db_name)
+            try:
+                result = operation(conn.cursor())
+                conn.commit()
+            finally:
+                conn.close()
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
     def add_user(self, user_id: int, username: str, first_name: str, last_name: str, role: str) -> bool:
         """Добавление пользователя"""
         try:
             conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             
+            # UPDATE вместо REPLACE: при замене строки не срабатывают триггеры удаления,
+            # на которых держатся счетчики и поисковый индекс
             cursor.execute('''
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, role)
+                INSERT INTO users (user_id, username, first_name, last_name, role)
                 VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    role = excluded.role,
+                    is_approved = FALSE
             ''', (user_id, username, first_name, last_name, role))
             
             conn.commit()
@@ -76,31 +286,224 @@ class Database:
             logging.error(f"Ошибка добавления пользователя: {e}")
             return False
     
+    def add_web_user(self, username: str, role: str, first_name: str = '', last_name: str = '',
+                     stepik_id: Optional[str] = None, approve: bool = True) -> Optional[int]:
+        """Добавление пользователя веб-приложения с выделением ID из последовательности"""
+        def operation(cursor):
+            # ID выделяется в той же транзакции, что и вставка пользователя
+            cursor.execute(
+                'UPDATE id_sequences SET value = value - 1 WHERE name = ?',
+                (WEB_USER_SEQUENCE,)
+            )
+            cursor.execute('SELECT value FROM id_sequences WHERE name = ?', (WEB_USER_SEQUENCE,))
+            user_id = cursor.fetchone()[0]
+            
+            cursor.execute('''
+                INSERT INTO users (user_id, username, first_name, last_name, stepik_id, role, is_approved)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, username, first_name, last_name, stepik_id, role, approve))
+            return user_id
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка добавления веб-пользователя: {e}")
+            return None
+    
+    def add_web_students(self, students: List[Tuple[str, str, str, Optional[str]]],
+                         group_id: Optional[int] = None) -> int:
+        """Массовое добавление одобренных студентов (username, first_name, last_name, stepik_id)"""
+        def operation(cursor):
+            # Выделяем блок ID одним обновлением последовательности
+            cursor.execute(
+                'UPDATE id_sequences SET value = value - ? WHERE name = ?',
+                (len(students), WEB_USER_SEQUENCE)
+            )
+            cursor.execute('SELECT value FROM id_sequences WHERE name = ?', (WEB_USER_SEQUENCE,))
+            last_id = cursor.fetchone()[0]
+            
+            cursor.executemany('''
+                INSERT INTO users (user_id, username, first_name, last_name, stepik_id, role, is_approved, group_id)
+                VALUES (?, ?, ?, ?, ?, 'student', TRUE, ?)
+            ''', [
+                (last_id + len(students) - 1 - i, username, first_name, last_name, stepik_id, group_id)
+                for i, (username, first_name, last_name, stepik_id) in enumerate(students)
+            ])
+            return len(students)
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка массового добавления студентов: {e}")
+            return 0
+    
+    def get_stepik_ids(self) -> Set[str]:
+        """Получение ID Степика всех пользователей"""
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT stepik_id FROM users WHERE stepik_id IS NOT NULL')
+            stepik_ids = {row[0] for row in cursor.fetchall()}
+            conn.close()
+            
+            return stepik_ids
+        except Exception as e:
+            logging.error(f"Ошибка получения ID Степика: {e}")
+            return set()
+    
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Получение пользователя по ID"""
         try:
             conn = sqlite3.connect(self.db_name)
+            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            cursor.execute('''
+                SELECT user_id, username, first_name, last_name, stepik_id, role, is_approved, created_at, group_id
+                FROM users WHERE user_id = ?
+            ''', (user_id,))
             user = cursor.fetchone()
             conn.close()
             
             if user:
                 return {
-                    'user_id': user[0],
-                    'username': user[1],
-                    'first_name': user[2],
-                    'last_name': user[3],
-                    'role': user[4],
-                    'is_approved': bool(user[5]),
-                    'created_at': user[6]
+                    'user_id': user['user_id'],
+                    'username': user['username'],
+                    'first_name': user['first_name'],
+                    'last_name': user['last_name'],
+                    'stepik_id': user['stepik_id'],
+                    'role': user['role'],
+                    'is_approved': bool(user['is_approved']),
+                    'created_at': user['created_at'],
+                    'group_id': user['group_id']
                 }
             return None
         except Exception as e:
             logging.error(f"Ошибка получения пользователя: {e}")
             return None
     
+    def get_teacher_ids(self) -> List[int]:
+        """ID одобренных преподавателей"""
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT user_id FROM users WHERE role = 'teacher' AND is_approved = TRUE")
+            teacher_ids = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            
+            return teacher_ids
+        except Exception as e:
+            logging.error(f"Ошибка получения преподавателей: {e}")
+            return []
+    
+    def create_group(self, name: str) -> Optional[int]:
+        """Создание группы (или получение существующей с тем же названием)"""
+        def operation(cursor):
+            cursor.execute('INSERT INTO student_groups (name) VALUES (?) ON CONFLICT (name) DO NOTHING', (name,))
+            cursor.execute('SELECT id FROM student_groups WHERE name = ?', (name,))
+            return cursor.fetchone()[0]
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка создания группы: {e}")
+            return None
+    
+    def get_groups(self) -> List[Dict]:
+        """Группы с числом одобренных студентов и преподавателей"""
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT g.id, g.name,
+                       (SELECT COUNT(*) FROM users u
+                        WHERE u.group_id = g.id AND u.role = 'student' AND u.is_approved = TRUE),
+                       (SELECT COUNT(*) FROM teacher_groups tg WHERE tg.group_id = g.id)
+                FROM student_groups g
+                ORDER BY g.name
+            ''')
+            groups = cursor.fetchall()
+            conn.close()
+            
+            return [{
+                'id': group[0],
+                'name': group[1],
+                'students': group[2],
+                'teachers': group[3]
+            } for group in groups]
+        except Exception as e:
+            logging.error(f"Ошибка получения групп: {e}")
+            return []
+    
+    def set_user_group(self, user_id: int, group_id: Optional[int]) -> bool:
+        """Перевод студента в группу вместе с его тестами"""
+        def operation(cursor):
+            cursor.execute('UPDATE users SET group_id = ? WHERE user_id = ?', (group_id, user_id))
+            cursor.execute('UPDATE tests SET group_id = ? WHERE student_id = ?', (group_id, user_id))
+            return True
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка перевода в группу: {e}")
+            return False
+    
+    def add_teacher_group(self, teacher_id: int, group_id: int) -> bool:
+        """Закрепление преподавателя за группой"""
+        def operation(cursor):
+            cursor.execute(
+                'INSERT OR IGNORE INTO teacher_groups (teacher_id, group_id) VALUES (?, ?)',
+                (teacher_id, group_id)
+            )
+            return True
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка закрепления группы: {e}")
+            return False
+    
+    def remove_teacher_group(self, teacher_id: int, group_id: int) -> bool:
+        """Открепление преподавателя от группы"""
+        def operation(cursor):
+            cursor.execute(
+                'DELETE FROM teacher_groups WHERE teacher_id = ? AND group_id = ?',
+                (teacher_id, group_id)
+            )
+            return cursor.rowcount > 0
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка открепления группы: {e}")
+            return False
+    
+    def get_teacher_group_ids(self, teacher_id: int) -> List[int]:
+        """Группы, закрепленные за преподавателем"""
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT group_id FROM teacher_groups WHERE teacher_id = ? ORDER BY group_id', (teacher_id,))
+            group_ids = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            
+            return group_ids
+        except Exception as e:
+            logging.error(f"Ошибка получения групп преподавателя: {e}")
+            return []
+    
+    def get_group_scope(self, teacher_id: int) -> Optional[List[int]]:
+        """Группы, которыми ограничены списки преподавателя; None - без ограничения
+
+        Преподаватель без закрепленных групп видит всех студентов, как до
+        появления групп.
+        """
+        return self.get_teacher_group_ids(teacher_id) or None
+    
     def approve_user(self, user_id: int) -> bool:
         """Одобрение пользователя"""
         try:
@@ -115,37 +518,141 @@ class Database:
             logging.error(f"Ошибка одобрения пользователя: {e}")
             return False
     
+    @staticmethod
+    def _upsert_test(cursor, student_id: int, full_name: str, stepik_id: str, test_url: str,
+                     test_type: str) -> Dict:
+        """Вставка теста или возврат уже отправленного по той же ссылке"""
+        test_url_norm = normalize_stepik_url(test_url)
+        cursor.execute('''
+            INSERT INTO tests (student_id, full_name, stepik_id, test_url, test_type, test_url_norm, group_id)
+            VALUES (?, ?, ?, ?, ?, ?, (SELECT group_id FROM users WHERE user_id = ?))
+            ON CONFLICT (student_id, test_url_norm) DO NOTHING
+        ''', (student_id, full_name, stepik_id, test_url, test_type, test_url_norm, student_id))
+        if cursor.rowcount:
+            return {'id': cursor.lastrowid, 'status': 'created'}
+        
+        cursor.execute('''
+            SELECT id, is_reviewed, score FROM tests
+            WHERE student_id = ? AND test_url_norm = ?
+        ''', (student_id, test_url_norm))
+        test_id, is_reviewed, score = cursor.fetchone()
+        
+        if is_reviewed and not score:
+            # Незасчитанный тест после повторной отправки снова ждет проверки
+            cursor.execute('''
+                UPDATE tests
+                SET full_name = ?, stepik_id = ?, test_url = ?, test_type = ?,
+                    is_reviewed = FALSE, score = 0, teacher_comment = NULL, reviewed_at = NULL,
+                    submitted_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (full_name, stepik_id, test_url, test_type, test_id))
+            return {'id': test_id, 'status': 'resubmitted'}
+        
+        return {'id': test_id, 'status': 'duplicate'}
+    
+    @staticmethod
+    def _replayed_submission(cursor, student_id: int, idempotency_key: str,
+                             test_urls: List[str]) -> Optional[List[Dict]]:
+        """Результат уже выполненной отправки с этим ключом или None"""
+        cursor.execute(
+            'SELECT test_id FROM idempotency_keys WHERE user_id = ? AND key = ?',
+            (student_id, idempotency_key)
+        )
+        key_row = cursor.fetchone()
+        if not key_row:
+            return None
+        
+        results = []
+        for test_url in test_urls:
+            cursor.execute(
+                'SELECT id FROM tests WHERE student_id = ? AND test_url_norm = ?',
+                (student_id, normalize_stepik_url(test_url))
+            )
+            row = cursor.fetchone()
+            results.append({'id': row[0] if row else key_row[0], 'status': 'duplicate'})
+        return results
+    
+    def find_idempotent_submission(self, student_id: int, idempotency_key: str,
+                                   test_urls: List[str]) -> Optional[List[Dict]]:
+        """Результат повтора формы с тем же ключом идемпотентности; None - отправка новая
+        
+        Проверяется до контроля нагрузки, чтобы повтор не расходовал лимит отправок.
+        """
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                return self._replayed_submission(conn.cursor(), student_id, idempotency_key, test_urls)
+        except Exception as e:
+            logging.error(f"Ошибка проверки ключа идемпотентности: {e}")
+            return None
+    
+    def _submit_tests(self, cursor, student_id: int, full_name: str, stepik_id: str,
+                      tests: List[Tuple[str, str]], idempotency_key: Optional[str]) -> List[Dict]:
+        """Отправка тестов внутри транзакции записи"""
+        if idempotency_key:
+            # Повтор запроса: возвращаем уже сохраненные тесты
+            results = self._replayed_submission(
+                cursor, student_id, idempotency_key, [test_url for test_url, _ in tests]
+            )
+            if results is not None:
+                return results
+        
+        results = [
+            self._upsert_test(cursor, student_id, full_name, stepik_id, test_url, test_type)
+            for test_url, test_type in tests
+        ]
+        
+        if idempotency_key:
+            cursor.execute(
+                'INSERT INTO idempotency_keys (user_id, key, test_id) VALUES (?, ?, ?)',
+                (student_id, idempotency_key, results[0]['id'] if results else None)
+            )
+            cursor.execute("DELETE FROM idempotency_keys WHERE created_at < datetime('now', '-1 day')")
+        return results
+    
+    def submit_tests(self, student_id: int, full_name: str, stepik_id: str, tests: List[Tuple[str, str]],
+                     idempotency_key: Optional[str] = None) -> Future:
+        """Постановка нескольких тестов (ссылка, тип) в очередь записи одной транзакцией
+        
+        Результат - список словарей {'id', 'status'} в порядке тестов: status
+        равен 'created' для нового теста, 'duplicate' для уже отправленной
+        ссылки или повтора запроса с тем же ключом идемпотентности
+        и 'resubmitted' для незасчитанного теста, отправленного заново.
+        """
+        return self.run_write(lambda cursor: self._submit_tests(
+            cursor, student_id, full_name, stepik_id, tests, idempotency_key
+        ))
+    
+    def submit_test(self, student_id: int, full_name: str, stepik_id: str, test_url: str, test_type: str,
+                    idempotency_key: Optional[str] = None) -> Future:
+        """Постановка теста в очередь записи, результат - словарь {'id', 'status'}"""
+        return self.run_write(lambda cursor: self._submit_tests(
+            cursor, student_id, full_name, stepik_id, [(test_url, test_type)], idempotency_key
+        )[0])
+    
     def add_test(self, student_id: int, full_name: str, stepik_id: str, test_url: str, test_type: str) -> bool:
         """Добавление теста"""
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO tests (student_id, full_name, stepik_id, test_url, test_type)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (student_id, full_name, stepik_id, test_url, test_type))
-            
-            conn.commit()
-            conn.close()
+            self.submit_test(student_id, full_name, stepik_id, test_url, test_type).result()
             return True
         except Exception as e:
             logging.error(f"Ошибка добавления теста: {e}")
             return False
     
-    def get_pending_tests(self) -> List[Dict]:
-        """Получение неоцененных тестов"""
+    def get_pending_tests(self, group_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Получение неоцененных тестов (только указанных групп, если они заданы)"""
         try:
             conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT t.*, u.username, u.first_name, u.last_name
+            group_condition, params = self._group_condition('t.group_id', group_ids)
+            cursor.execute(f'''
+                SELECT t.id, t.student_id, t.full_name, t.stepik_id, t.test_url, t.test_type,
+                       t.submitted_at, u.username, u.first_name, u.last_name
                 FROM tests t
                 JOIN users u ON t.student_id = u.user_id
-                WHERE t.is_reviewed = FALSE
+                WHERE t.is_reviewed = FALSE AND {group_condition}
                 ORDER BY t.submitted_at DESC
-            ''')
+            ''', params)
             
             tests = cursor.fetchall()
             conn.close()
@@ -158,15 +665,51 @@ class Database:
                 'test_url': test[4],
                 'test_type': test[5],
                 'submitted_at': test[6],
-                'username': test[8],
-                'first_name': test[9],
-                'last_name': test[10]
+                'username': test[7],
+                'first_name': test[8],
+                'last_name': test[9]
             } for test in tests]
         except Exception as e:
             logging.error(f"Ошибка получения тестов: {e}")
             return []
     
-    def review_test(self, test_id: int, score: int, comment: str = "") -> bool:
+    def get_pending_test(self, test_id: int, group_ids: Optional[List[int]] = None) -> Optional[Dict]:
+        """Неоцененный тест по ID, если он из указанных групп"""
+        try:
+            conn = sqlite3.connect(self.db_name)
+            cursor = conn.cursor()
+            
+            group_condition, params = self._group_condition('t.group_id', group_ids)
+            cursor.execute(f'''
+                SELECT t.id, t.student_id, t.full_name, t.stepik_id, t.test_url, t.test_type,
+                       t.submitted_at, u.username, u.first_name, u.last_name
+                FROM tests t
+                JOIN users u ON t.student_id = u.user_id
+                WHERE t.id = ? AND t.is_reviewed = FALSE AND {group_condition}
+            ''', [test_id] + params)
+            
+            test = cursor.fetchone()
+            conn.close()
+            
+            if not test:
+                return None
+            return {
+                'id': test[0],
+                'student_id': test[1],
+                'full_name': test[2],
+                'stepik_id': test[3],
+                'test_url': test[4],
+                'test_type': test[5],
+                'submitted_at': test[6],
+                'username': test[7],
+                'first_name': test[8],
+                'last_name': test[9]
+            }
+        except Exception as e:
+            logging.error(f"Ошибка получения теста: {e}")
+            return None
+    
+    def review_test(self, test_id: int, score: int, comment: str = "", reviewed_by: Optional[int] = None) -> bool:
         """Оценка теста"""
         try:
             conn = sqlite3.connect(self.db_name)
@@ -174,9 +717,10 @@ class Database:
             
             cursor.execute('''
                 UPDATE tests 
-                SET is_reviewed = TRUE, score = ?, teacher_comment = ?, reviewed_at = CURRENT_TIMESTAMP
+                SET is_reviewed = TRUE, score = ?, teacher_comment = ?, reviewed_at = CURRENT_TIMESTAMP,
+                    reviewed_by = ?
                 WHERE id = ?
-            ''', (score, comment, test_id))
+            ''', (score, comment, reviewed_by, test_id))
             
             conn.commit()
             conn.close()
@@ -185,6 +729,31 @@ class Database:
             logging.error(f"Ошибка оценки теста: {e}")
             return False
     
+    def review_tests(self, reviews: List[Tuple[int, int, str]], reviewed_by: Optional[int] = None) -> List[int]:
+        """Массовая оценка тестов (test_id, score, comment) одной транзакцией.
+        
+        Возвращает ID действительно оцененных тестов: уже оцененные
+        (например, преподавателем за это время) пропускаются.
+        """
+        def operation(cursor):
+            graded = []
+            for test_id, score, comment in reviews:
+                cursor.execute('''
+                    UPDATE tests 
+                    SET is_reviewed = TRUE, score = ?, teacher_comment = ?, reviewed_at = CURRENT_TIMESTAMP,
+                        reviewed_by = ?
+                    WHERE id = ? AND is_reviewed = FALSE
+                ''', (score, comment, reviewed_by, test_id))
+                if cursor.rowcount:
+                    graded.append(test_id)
+            return graded
+        
+        try:
+            return self.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка массовой оценки тестов: {e}")
+            return []
+    
     def get_student_tests(self, student_id: int) -> List[Dict]:
         """Получение тестов студента"""
         try:
@@ -200,43 +769,74 @@ class Database:
             tests = cursor.fetchall()
             conn.close()
             
-            return [{
-                'id': test[0],
-                'student_id': test[1],
-                'full_name': test[2],
-                'stepik_id': test[3],
-                'test_url': test[4],
-                'test_type': test[5],
-                'submitted_at': test[6],
-                'is_reviewed': bool(test[7]),
-                'score': test[8],
-                'teacher_comment': test[9],
-                'reviewed_at': test[10]
-            } for test in tests]
+            return [self._student_test(test) for test in tests]
         except Exception as e:
             logging.error(f"Ошибка получения тестов студента: {e}")
             return []
     
-    def get_statistics(self) -> Dict:
-        """Получение статистики"""
+    def get_tests_by_student(self, group_ids: Optional[List[int]] = None) -> Dict[int, List[Dict]]:
+        """Тесты всех одобренных студентов одним запросом: ID студента -> тесты (новые первыми)"""
+        try:
+            with sqlite3.connect(self.db_name) as conn:
+                group_condition, params = self._group_condition('u.group_id', group_ids)
+                rows = conn.execute(f'''
+                    SELECT t.id, t.student_id, t.full_name, t.stepik_id, t.test_url, t.test_type,
+                           t.submitted_at, t.is_reviewed, t.score, t.teacher_comment, t.reviewed_at
+                    FROM tests t
+                    JOIN users u ON u.user_id = t.student_id
+                    WHERE u.role = 'student' AND u.is_approved = TRUE AND {group_condition}
+                    ORDER BY t.student_id, t.submitted_at DESC
+                ''', params).fetchall()
+            
+            tests_by_student: Dict[int, List[Dict]] = {}
+            for row in rows:
+                tests_by_student.setdefault(row[1], []).append(self._student_test(row))
+            return tests_by_student
+        except Exception as e:
+            logging.error(f"Ошибка получения тестов студентов: {e}")
+            return {}
+    
+    @staticmethod
+    def _student_test(test) -> Dict:
+        """Тест из строки с колонками таблицы tests до reviewed_at"""
+        return {
+            'id': test[0],
+            'student_id': test[1],
+            'full_name': test[2],
+            'stepik_id': test[3],
+            'test_url': test[4],
+            'test_type': test[5],
+            'submitted_at': test[6],
+            'is_reviewed': bool(test[7]),
+            'score': test[8],
+            'teacher_comment': test[9],
+            'reviewed_at': test[10]
+        }
+    
+    def get_statistics(self, group_ids: Optional[List[int]] = None) -> Dict:
+        """Получение статистики (по указанным группам, если они заданы)"""
         try:
             conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
+            group_condition, params = self._group_condition('group_id', group_ids)
             
             # Общее количество студентов
-            cursor.execute('SELECT COUNT(*) FROM users WHERE role = "student" AND is_approved = TRUE')
+            cursor.execute(
+                f'SELECT COUNT(*) FROM users WHERE role = "student" AND is_approved = TRUE AND {group_condition}',
+                params
+            )
             total_students = cursor.fetchone()[0] or 0
             
             # Общее количество тестов
-            cursor.execute('SELECT COUNT(*) FROM tests')
+            cursor.execute(f'SELECT COUNT(*) FROM tests WHERE {group_condition}', params)
             total_tests = cursor.fetchone()[0] or 0
             
             # Оцененные тесты
-            cursor.execute('SELECT COUNT(*) FROM tests WHERE is_reviewed = TRUE')
+            cursor.execute(f'SELECT COUNT(*) FROM tests WHERE is_reviewed = TRUE AND {group_condition}', params)
             reviewed_tests = cursor.fetchone()[0] or 0
             
             # Средний балл
-            cursor.execute('SELECT AVG(score) FROM tests WHERE is_reviewed = TRUE')
+            cursor.execute(f'SELECT AVG(score) FROM tests WHERE is_reviewed = TRUE AND {group_condition}', params)
             avg_score = cursor.fetchone()[0] or 0
             
             conn.close()
@@ -258,13 +858,14 @@ class Database:
                 'average_score': 0
             }
     
-    def get_students_scores(self) -> List[Dict]:
-        """Получение баллов всех студентов"""
+    def get_students_scores(self, group_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Получение баллов всех студентов (только указанных групп, если они заданы)"""
         try:
             conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             
-            cursor.execute('''
+            group_condition, params = self._group_condition('u.group_id', group_ids)
+            cursor.execute(f'''
                 SELECT u.user_id, 
                        COALESCE(MAX(t.full_name), 'Не указано') as full_name,
                        COALESCE(SUM(t.score), 0) as total_score,
@@ -272,10 +873,10 @@ class Database:
                        COUNT(CASE WHEN t.is_reviewed = TRUE THEN 1 END) as reviewed_tests
                 FROM users u
                 LEFT JOIN tests t ON u.user_id = t.student_id
-                WHERE u.role = "student" AND u.is_approved = TRUE
+                WHERE u.role = "student" AND u.is_approved = TRUE AND {group_condition}
                 GROUP BY u.user_id
                 ORDER BY total_score DESC
-            ''')
+            ''', params)
             
             students = cursor.fetchall()
             conn.close()
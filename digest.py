@@ -0,0 +1,305 @@
+"""
+Сводки для преподавателей: новые тесты, обратная связь и просроченные
+проверки за окно одним сообщением вместо уведомления на каждое событие
+"""
+
+import asyncio
+import logging
+import sqlite3
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from database import Database
+
+# Окно сводки не длиннее недели, события хранятся вдвое дольше
+MAX_WINDOW_MINUTES = 7 * 24 * 60
+EVENT_RETENTION_DAYS = 14
+
+DIGEST_SCHEMA = [
+    # События общие для всех преподавателей: строка на событие, а не на
+    # преподавателя; каждый преподаватель читает их со своей позиции
+    '''
+    CREATE TABLE IF NOT EXISTS teacher_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event_type TEXT NOT NULL CHECK(event_type IN ('submission', 'feedback', 'overdue')),
+        ref_id INTEGER NOT NULL,
+        group_id INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_teacher_events_ref ON teacher_events (event_type, ref_id)',
+    'CREATE INDEX IF NOT EXISTS idx_teacher_events_created ON teacher_events (created_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS teacher_digests (
+        teacher_id INTEGER PRIMARY KEY,
+        last_event_id INTEGER NOT NULL DEFAULT 0,
+        last_sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        window_minutes INTEGER
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_tests_pending ON tests (is_reviewed, submitted_at)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS teacher_event_submission AFTER INSERT ON tests
+    WHEN NOT COALESCE(new.is_reviewed, 0) BEGIN
+        INSERT OR IGNORE INTO teacher_events (event_type, ref_id, group_id)
+        VALUES ('submission', new.id, new.group_id);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS teacher_event_feedback AFTER INSERT ON feedback BEGIN
+        INSERT OR IGNORE INTO teacher_events (event_type, ref_id, group_id)
+        VALUES ('feedback', new.id, (SELECT group_id FROM users WHERE user_id = new.user_id));
+    END
+    '''
+]
+
+
+class TeacherDigest:
+    """Сводки событий курса по преподавателям.
+
+    Новые тесты и обратная связь попадают в ``teacher_events`` триггерами,
+    просроченные проверки - периодическим проходом. У каждого преподавателя
+    хранится только позиция последнего прочитанного события, поэтому сводка
+    считается одним агрегирующим запросом по диапазону первичного ключа,
+    а отправляется одним сообщением за окно. Преподаватель с группами видит
+    тесты только своих групп; обратная связь относится ко всему курсу.
+    """
+
+    def __init__(self, db: Database, send: Optional[Callable[[int, str], Awaitable]] = None,
+                 window_minutes: int = 60, sla_hours: float = 48):
+        self.db = db
+        self.send = send
+        self.window_minutes = window_minutes
+        self.sla_hours = sla_hours
+        self.setup_digest()
+
+    def setup_digest(self):
+        """Создание таблиц событий и триггеров"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            for statement in DIGEST_SCHEMA:
+                connection.execute(statement)
+            self._register_teachers(connection)
+            connection.commit()
+
+    def _register_teachers(self, cursor):
+        """Новые преподаватели начинают получать события с текущего момента"""
+        cursor.execute('''
+            INSERT OR IGNORE INTO teacher_digests (teacher_id, last_event_id)
+            SELECT user_id, (SELECT COALESCE(MAX(id), 0) FROM teacher_events)
+            FROM users WHERE role = 'teacher' AND is_approved
+        ''')
+
+    def set_window(self, teacher_id: int, minutes: int) -> bool:
+        """Окно сводки преподавателя в минутах; 0 - сводки не отправляются"""
+        minutes = max(0, min(int(minutes), MAX_WINDOW_MINUTES))
+
+        def operation(cursor):
+            self._register_teachers(cursor)
+            cursor.execute('''
+                INSERT INTO teacher_digests (teacher_id, window_minutes) VALUES (?, ?)
+                ON CONFLICT (teacher_id) DO UPDATE SET window_minutes = excluded.window_minutes
+            ''', (teacher_id, minutes))
+            return True
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка изменения окна сводки: {e}")
+            return False
+
+    def get_window(self, teacher_id: int) -> int:
+        """Окно сводки преподавателя: свое или общее"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                row = connection.execute(
+                    'SELECT window_minutes FROM teacher_digests WHERE teacher_id = ?', (teacher_id,)
+                ).fetchone()
+            return row[0] if row and row[0] is not None else self.window_minutes
+        except Exception as e:
+            logging.error(f"Ошибка получения окна сводки: {e}")
+            return self.window_minutes
+
+    def prepare(self) -> int:
+        """Учет новых преподавателей и событий о просроченных проверках.
+
+        Событие о просроченном тесте создается один раз; возвращается
+        число новых таких событий.
+        """
+        def operation(cursor):
+            self._register_teachers(cursor)
+            cursor.execute('''
+                INSERT OR IGNORE INTO teacher_events (event_type, ref_id, group_id)
+                SELECT 'overdue', id, group_id FROM tests
+                WHERE is_reviewed = FALSE AND submitted_at <= datetime('now', ?)
+            ''', (f'-{int(self.sla_hours * 3600)} seconds',))
+            return cursor.rowcount
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка подготовки сводок: {e}")
+            return 0
+
+    def collect(self, teacher_id: int) -> Dict:
+        """Сводка новых для преподавателя событий без сдвига его позиции"""
+        summary = {'teacher_id': teacher_id, 'submission': 0, 'feedback': 0, 'overdue': 0,
+                   'pending': 0, 'feedback_items': [], 'from_event_id': 0, 'last_event_id': 0}
+        group_ids = self.db.get_group_scope(teacher_id)
+        group_condition, group_params = Database._group_condition('e.group_id', group_ids)
+        pending_condition, pending_params = Database._group_condition('group_id', group_ids)
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                row = connection.execute(
+                    'SELECT last_event_id FROM teacher_digests WHERE teacher_id = ?', (teacher_id,)
+                ).fetchone()
+                from_event_id = row[0] if row else 0
+                # Граница берется до подсчета, чтобы событие, записанное во время
+                # сборки, попало в следующую сводку; позиция сдвигается и за
+                # события чужих групп
+                last_event_id = connection.execute(
+                    'SELECT COALESCE(MAX(id), ?) FROM teacher_events', (from_event_id,)
+                ).fetchone()[0]
+                summary['from_event_id'], summary['last_event_id'] = from_event_id, last_event_id
+
+                rows = connection.execute(f'''
+                    SELECT e.event_type, COUNT(*)
+                    FROM teacher_events e
+                    WHERE e.id > ? AND e.id <= ? AND (e.event_type = 'feedback' OR {group_condition})
+                    GROUP BY e.event_type
+                ''', [from_event_id, last_event_id] + group_params).fetchall()
+                for event_type, count in rows:
+                    summary[event_type] = count
+
+                if summary['feedback']:
+                    summary['feedback_items'] = [
+                        {'feedback_type': feedback_type, 'message': message}
+                        for feedback_type, message in connection.execute('''
+                            SELECT f.feedback_type, f.message
+                            FROM teacher_events e JOIN feedback f ON f.id = e.ref_id
+                            WHERE e.id > ? AND e.id <= ? AND e.event_type = 'feedback'
+                            ORDER BY e.id DESC
+                            LIMIT 3
+                        ''', (from_event_id, last_event_id)).fetchall()
+                    ]
+                summary['pending'] = connection.execute(
+                    f'SELECT COUNT(*) FROM tests WHERE is_reviewed = FALSE AND {pending_condition}',
+                    pending_params
+                ).fetchone()[0]
+        except Exception as e:
+            logging.error(f"Ошибка сбора сводки: {e}")
+        return summary
+
+    def get_due_teachers(self) -> List[int]:
+        """Преподаватели, у которых закончилось окно сводки"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute('''
+                    SELECT d.teacher_id FROM teacher_digests d
+                    JOIN users u ON u.user_id = d.teacher_id AND u.role = 'teacher' AND u.is_approved
+                    WHERE COALESCE(d.window_minutes, ?) > 0
+                      AND d.last_sent_at <= datetime('now', '-' || COALESCE(d.window_minutes, ?) || ' minutes')
+                      AND EXISTS (SELECT 1 FROM teacher_events e WHERE e.id > d.last_event_id)
+                    ORDER BY d.teacher_id
+                ''', (self.window_minutes, self.window_minutes)).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logging.error(f"Ошибка выбора преподавателей для сводки: {e}")
+            return []
+
+    def _advance(self, summaries: List[Dict], notify: bool = True):
+        """Сдвиг позиций и уведомления в приложении одной транзакцией"""
+        def operation(cursor):
+            cursor.executemany('''
+                UPDATE teacher_digests SET last_event_id = ?, last_sent_at = CURRENT_TIMESTAMP
+                WHERE teacher_id = ?
+            ''', [(summary['last_event_id'], summary['teacher_id']) for summary in summaries])
+            cursor.executemany('''
+                INSERT INTO notifications (user_id, message, notification_type) VALUES (?, ?, 'info')
+            ''', [(summary['teacher_id'], format_digest(summary, html=False))
+                  for summary in summaries if notify and has_events(summary)])
+
+        self.db.run_write(operation).result()
+
+    def take_digest(self, teacher_id: int) -> Dict:
+        """Сводка по запросу преподавателя; окно начинается заново"""
+        self.prepare()
+        summary = self.collect(teacher_id)
+        try:
+            # Сводка уже показана в ответе, уведомление не нужно
+            self._advance([summary], notify=False)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения позиции сводки: {e}")
+        return summary
+
+    async def send_digests(self) -> int:
+        """Отправка сводок всем преподавателям, у которых закончилось окно"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.prepare)
+        teacher_ids = await loop.run_in_executor(None, self.get_due_teachers)
+
+        summaries = [await loop.run_in_executor(None, self.collect, teacher_id) for teacher_id in teacher_ids]
+        sent = 0
+        for summary in summaries:
+            # Веб-преподаватели (отрицательные ID) получают сводку только в приложении
+            if not has_events(summary) or self.send is None or summary['teacher_id'] < 0:
+                continue
+            try:
+                await self.send(summary['teacher_id'], format_digest(summary, self.get_window(summary['teacher_id'])))
+                sent += 1
+            except Exception as e:
+                logging.error(f"Ошибка отправки сводки преподавателю {summary['teacher_id']}: {e}")
+        if summaries:
+            await loop.run_in_executor(None, self._advance, summaries)
+        return sent
+
+    def prune_events(self, days: int = EVENT_RETENTION_DAYS) -> int:
+        """Удаление старых событий"""
+        def operation(cursor):
+            cursor.execute("DELETE FROM teacher_events WHERE created_at < datetime('now', ?)", (f'-{days} days',))
+            return cursor.rowcount
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка очистки событий преподавателей: {e}")
+            return 0
+
+    async def run_forever(self, interval: float = 60):
+        """Периодическая отправка сводок в фоне"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self.send_digests()
+                await loop.run_in_executor(None, self.prune_events)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка фоновой отправки сводок: {e}")
+            await asyncio.sleep(interval)
+
+
+def has_events(summary: Dict) -> bool:
+    """Есть ли в сводке что сообщить"""
+    return bool(summary['submission'] or summary['feedback'] or summary['overdue'])
+
+
+def format_digest(summary: Dict, window_minutes: Optional[int] = None, html: bool = True) -> str:
+    """Сводка для сообщения бота; без разметки - для уведомления в приложении"""
+    bold = (lambda text: f"<b>{text}</b>") if html else (lambda text: text)
+    period = f" за {window_minutes} мин" if window_minutes else ""
+    if not has_events(summary):
+        return f"📬 {bold('Сводка' + period)}: новых событий нет. Ждут проверки: {summary['pending']}."
+
+    text = f"📬 {bold('Сводка' + period)}\n\n"
+    if summary['submission']:
+        text += f"📝 Новых тестов: {summary['submission']}\n"
+    if summary['overdue']:
+        text += f"⚠️ Ждут проверки дольше срока: {summary['overdue']}\n"
+    if summary['feedback']:
+        text += f"💬 Обратная связь: {summary['feedback']}\n"
+        for item in summary['feedback_items']:
+            message = item['message'] if len(item['message']) <= 80 else item['message'][:80] + '...'
+            if html:
+                message = message.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            text += f"   • {item['feedback_type']}: {message}\n"
+    text += f"\n📋 Всего ждут проверки: {summary['pending']}"
+    return text
@@ -2,14 +2,39 @@
 Модуль обратной связи для бота
 """
 
+import asyncio
 import logging
+import re
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from database import Database
 
+FEEDBACK_TYPES = ('bug', 'suggestion', 'compliment', 'question')
+
+# Поиск по тексту отзывов: rowid индекса совпадает с ID отзыва
+FEEDBACK_SEARCH_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_feedback USING fts5(
+        message, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_feedback_insert AFTER INSERT ON feedback BEGIN
+        INSERT INTO search_feedback (rowid, message) VALUES (new.id, new.message);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_feedback_delete AFTER DELETE ON feedback BEGIN
+        DELETE FROM search_feedback WHERE rowid = old.id;
+    END
+    '''
+]
+
 class FeedbackSystem:
     def __init__(self, db: Database):
         self.db = db
+        self.search_enabled = False
         self.setup_feedback_tables()
     
     def setup_feedback_tables(self):
@@ -46,8 +71,84 @@ class FeedbackSystem:
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_notifications_user
+                ON notifications (user_id, is_read, created_at)
+            ''')
+            
+            # Свертка удаленных по сроку хранения уведомлений: сколько было по месяцам
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notification_rollups (
+                    user_id INTEGER NOT NULL,
+                    month TEXT NOT NULL,
+                    notification_type TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, month, notification_type)
+                )
+            ''')
             
+            # Счетчик непрочитанных, который поддерживают триггеры
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'notification_counters'")
+            counters_created = cursor.fetchone() is None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notification_counters (
+                    user_id INTEGER PRIMARY KEY,
+                    unread INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS notifications_unread_insert AFTER INSERT ON notifications
+                WHEN NOT COALESCE(new.is_read, 0) BEGIN
+                    INSERT INTO notification_counters (user_id, unread) VALUES (new.user_id, 1)
+                    ON CONFLICT (user_id) DO UPDATE SET unread = unread + 1;
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS notifications_unread_update AFTER UPDATE OF is_read ON notifications
+                WHEN COALESCE(old.is_read, 0) != COALESCE(new.is_read, 0) BEGIN
+                    UPDATE notification_counters
+                    SET unread = unread + CASE WHEN COALESCE(new.is_read, 0) THEN -1 ELSE 1 END
+                    WHERE user_id = new.user_id;
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS notifications_unread_delete AFTER DELETE ON notifications
+                WHEN NOT COALESCE(old.is_read, 0) BEGIN
+                    UPDATE notification_counters SET unread = unread - 1 WHERE user_id = old.user_id;
+                END
+            ''')
+            if counters_created:
+                cursor.execute('''
+                    INSERT INTO notification_counters (user_id, unread)
+                    SELECT user_id, COUNT(*) FROM notifications
+                    WHERE is_read = FALSE
+                    GROUP BY user_id
+                ''')
+            
+            # Разбор входящих отзывов: кто и когда обработал
+            Database._ensure_column(cursor, 'feedback', 'processed_at', 'TIMESTAMP')
+            Database._ensure_column(cursor, 'feedback', 'processed_by', 'INTEGER')
+            # Необработанных отзывов немного: частичный индекс для списка входящих
+            # не растет вместе с архивом обработанных
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_feedback_unprocessed
+                ON feedback (id) WHERE is_processed = FALSE
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_type ON feedback (feedback_type, id)')
             connection.commit()
+            
+            try:
+                cursor.execute("SELECT name FROM sqlite_master WHERE name = 'search_feedback'")
+                search_created = cursor.fetchone() is None
+                for statement in FEEDBACK_SEARCH_SCHEMA:
+                    cursor.execute(statement)
+                if search_created:
+                    cursor.execute('INSERT INTO search_feedback (rowid, message) SELECT id, message FROM feedback')
+                connection.commit()
+                self.search_enabled = True
+            except sqlite3.OperationalError as e:
+                connection.rollback()
+                logging.warning(f"FTS5 недоступен, поиск по отзывам будет работать через LIKE: {e}")
     
     def submit_feedback(self, user_id: int, feedback_type: str, message: str, rating: Optional[int] = None) -> bool:
         """Отправка отзыва"""
@@ -104,6 +205,106 @@ class FeedbackSystem:
             logging.error(f"Ошибка получения статистики отзывов: {e}")
             return {}
     
+    def get_feedback_inbox(self, feedback_type: Optional[str] = None, rating: Optional[int] = None,
+                           processed: Optional[bool] = False, query: Optional[str] = None,
+                           before_id: Optional[int] = None, limit: int = 20) -> Dict:
+        """Страница входящих отзывов, новые первыми.
+        
+        Постраничный вывод по ключу: следующая страница запрашивается с
+        ``before_id`` из ответа, поэтому глубокие страницы не дороже первой.
+        ``processed=None`` - все отзывы, ``query`` - поиск по тексту.
+        """
+        conditions, params = [], []
+        if processed is not None:
+            # Условие дословно совпадает с частичным индексом
+            conditions.append('f.is_processed = FALSE' if not processed else 'f.is_processed = TRUE')
+        if feedback_type:
+            conditions.append('f.feedback_type = ?')
+            params.append(feedback_type)
+        if rating:
+            conditions.append('f.rating = ?')
+            params.append(rating)
+        if before_id:
+            conditions.append('f.id < ?')
+            params.append(before_id)
+        
+        join = ''
+        if query and query.strip():
+            terms = re.findall(r'\w+', query.lower())
+            if self.search_enabled and terms:
+                join = 'JOIN search_feedback s ON s.rowid = f.id'
+                conditions.append('search_feedback MATCH ?')
+                params.append(' '.join(f'"{term}"*' for term in terms))
+            else:
+                conditions.append('f.message LIKE ?')
+                params.append(f'%{query.strip()}%')
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        try:
+            import sqlite3
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute(f'''
+                    SELECT f.id, f.user_id, f.feedback_type, f.message, f.rating, f.is_processed,
+                           f.created_at, f.processed_at, f.processed_by,
+                           TRIM(COALESCE(u.last_name, '') || ' ' || COALESCE(u.first_name, '')), u.username
+                    FROM feedback f {join}
+                    LEFT JOIN users u ON u.user_id = f.user_id
+                    {where}
+                    ORDER BY f.id DESC
+                    LIMIT ?
+                ''', params + [limit + 1]).fetchall()
+            items = [self._feedback_item(row) for row in rows[:limit]]
+            return {
+                'items': items,
+                'next_before_id': items[-1]['id'] if len(rows) > limit else None
+            }
+        except Exception as e:
+            logging.error(f"Ошибка получения входящих отзывов: {e}")
+            return {'items': [], 'next_before_id': None}
+    
+    def mark_feedback_processed(self, feedback_ids: List[int], processed_by: Optional[int] = None,
+                                processed: bool = True) -> int:
+        """Отметка отзывов обработанными (или возврат во входящие) одной транзакцией"""
+        feedback_ids = list(dict.fromkeys(feedback_ids))
+        if not feedback_ids:
+            return 0
+        
+        def operation(cursor):
+            changed = 0
+            # Порции по 500, чтобы не упереться в лимит параметров SQLite
+            for start in range(0, len(feedback_ids), 500):
+                chunk = feedback_ids[start:start + 500]
+                cursor.execute(f'''
+                    UPDATE feedback
+                    SET is_processed = ?,
+                        processed_at = CASE WHEN ? THEN CURRENT_TIMESTAMP END,
+                        processed_by = CASE WHEN ? THEN ? END
+                    WHERE id IN ({', '.join('?' * len(chunk))}) AND is_processed != ?
+                ''', [processed, processed, processed, processed_by] + chunk + [processed])
+                changed += cursor.rowcount
+            return changed
+        
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка отметки отзывов: {e}")
+            return 0
+    
+    @staticmethod
+    def _feedback_item(row) -> Dict:
+        return {
+            'id': row[0],
+            'user_id': row[1],
+            'feedback_type': row[2],
+            'message': row[3],
+            'rating': row[4],
+            'is_processed': bool(row[5]),
+            'created_at': row[6],
+            'processed_at': row[7],
+            'processed_by': row[8],
+            'author': row[9] or row[10] or (f"Пользователь #{row[1]}" if row[1] is not None else "Без автора")
+        }
+    
     def send_notification(self, user_id: int, message: str, notification_type: str = 'info') -> bool:
         """Отправка уведомления пользователю"""
         try:
@@ -122,6 +323,24 @@ class FeedbackSystem:
             logging.error(f"Ошибка отправки уведомления: {e}")
             return False
     
+    def send_notifications(self, notifications: List[Tuple[int, str, str]]) -> bool:
+        """Массовая отправка уведомлений (user_id, message, notification_type)"""
+        try:
+            import sqlite3
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                
+                cursor.executemany('''
+                    INSERT INTO notifications (user_id, message, notification_type)
+                    VALUES (?, ?, ?)
+                ''', notifications)
+                
+                connection.commit()
+                return True
+        except Exception as e:
+            logging.error(f"Ошибка массовой отправки уведомлений: {e}")
+            return False
+    
     def get_user_notifications(self, user_id: int, unread_only: bool = True) -> List[Dict]:
         """Получение уведомлений пользователя"""
         try:
@@ -171,6 +390,124 @@ class FeedbackSystem:
             logging.error(f"Ошибка отметки уведомления: {e}")
             return False
     
+    def mark_all_read(self, user_id: int) -> int:
+        """Отметка всех уведомлений пользователя как прочитанных одним запросом"""
+        try:
+            import sqlite3
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                
+                cursor.execute('''
+                    UPDATE notifications
+                    SET is_read = TRUE
+                    WHERE user_id = ? AND is_read = FALSE
+                ''', (user_id,))
+                
+                connection.commit()
+                return cursor.rowcount
+        except Exception as e:
+            logging.error(f"Ошибка отметки уведомлений: {e}")
+            return 0
+    
+    def get_unread_count(self, user_id: int) -> int:
+        """Число непрочитанных уведомлений по счетчику"""
+        try:
+            import sqlite3
+            with sqlite3.connect(self.db.db_name) as connection:
+                row = connection.execute(
+                    'SELECT unread FROM notification_counters WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                return row[0] if row else 0
+        except Exception as e:
+            logging.error(f"Ошибка получения числа уведомлений: {e}")
+            return 0
+    
+    def apply_retention(self, read_days: int = 90, batch_size: int = 5000) -> Dict:
+        """Свертка и удаление прочитанных уведомлений старше read_days дней
+        
+        Удаление идет порциями по batch_size строк, чтобы не держать
+        блокировку записи долго; счетчики по месяцам остаются в notification_rollups.
+        """
+        started = time.perf_counter()
+        cutoff = f'-{int(read_days)} days'
+        
+        def operation(cursor):
+            cursor.execute('''
+                SELECT MAX(id) FROM (
+                    SELECT id FROM notifications
+                    WHERE is_read = TRUE AND created_at < datetime('now', ?)
+                    ORDER BY id
+                    LIMIT ?
+                )
+            ''', (cutoff, batch_size))
+            last_id = cursor.fetchone()[0]
+            if last_id is None:
+                return 0
+            
+            condition = "is_read = TRUE AND created_at < datetime('now', ?) AND id <= ?"
+            cursor.execute(f'''
+                INSERT INTO notification_rollups (user_id, month, notification_type, count)
+                SELECT user_id, strftime('%Y-%m', created_at), COALESCE(notification_type, 'info'), COUNT(*)
+                FROM notifications
+                WHERE {condition}
+                GROUP BY 1, 2, 3
+                ON CONFLICT (user_id, month, notification_type) DO UPDATE SET count = count + excluded.count
+            ''', (cutoff, last_id))
+            cursor.execute(f'DELETE FROM notifications WHERE {condition}', (cutoff, last_id))
+            return cursor.rowcount
+        
+        deleted = 0
+        try:
+            while True:
+                removed = self.db.run_write(operation).result()
+                deleted += removed
+                if removed < batch_size:
+                    break
+        except Exception as e:
+            logging.error(f"Ошибка очистки уведомлений: {e}")
+        
+        return {'deleted': deleted, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+    
+    def get_notification_history(self, user_id: int) -> List[Dict]:
+        """Свернутые уведомления пользователя по месяцам"""
+        try:
+            import sqlite3
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    SELECT month, notification_type, count
+                    FROM notification_rollups
+                    WHERE user_id = ?
+                    ORDER BY month DESC
+                ''', (user_id,))
+                return [{
+                    'month': row[0],
+                    'notification_type': row[1],
+                    'count': row[2]
+                } for row in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"Ошибка получения истории уведомлений: {e}")
+            return []
+    
+    async def run_maintenance_forever(self, interval: float = 86400, read_days: int = 90,
+                                      vacuum_pages: int = 1000):
+        """Периодическая очистка уведомлений и возврат свободного места"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                report = await loop.run_in_executor(None, self.apply_retention, read_days)
+                freed = await loop.run_in_executor(None, self.db.incremental_vacuum, vacuum_pages)
+                if report['deleted'] or freed:
+                    logging.info(
+                        f"Очистка уведомлений: удалено {report['deleted']} за {report['elapsed_ms']} мс, "
+                        f"освобождено страниц {freed}"
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка обслуживания уведомлений: {e}")
+            await asyncio.sleep(interval)
+    
     def get_feedback_form_keyboard(self):
         """Клавиатура для формы обратной связи"""
         from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -198,4 +535,22 @@ class FeedbackSystem:
         return InlineKeyboardMarkup(keyboard)
 
 
+FEEDBACK_ICONS = {'bug': '🐛', 'suggestion': '💡', 'compliment': '👍', 'question': '❓'}
+
 
+def format_feedback_inbox(page: Dict, unprocessed: int) -> str:
+    """Страница входящих отзывов для сообщения бота"""
+    import html
+    
+    text = f"📥 <b>Входящие отзывы</b> (необработанных: {unprocessed})\n\n"
+    if not page['items']:
+        return text + "Отзывов нет."
+    
+    for item in page['items']:
+        rating = f" · {'⭐' * item['rating']}" if item['rating'] else ""
+        status = " · ✅" if item['is_processed'] else ""
+        message = item['message'] if len(item['message']) <= 200 else item['message'][:200] + '...'
+        text += (f"#{item['id']} {FEEDBACK_ICONS.get(item['feedback_type'], '💬')}{rating}{status} · "
+                 f"{html.escape(item['author'])} · {(item['created_at'] or '')[:10]}\n"
+                 f"{html.escape(message)}\n\n")
+    return text
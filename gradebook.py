@@ -0,0 +1,249 @@
+"""
+Автоматическая оценка тестов по выгрузке успеваемости Степика
+"""
+
+import csv
+import io
+import logging
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from database import Database
+from roster import decode_upload
+from utils import parse_stepik_url
+
+# Ключ сопоставления: (ID Степика, ID урока, номер шага или None)
+MatchKey = Tuple[str, int, Optional[int]]
+
+USER_COLUMNS = {'user_id', 'user', 'stepik_id', 'id степика', 'learner_id'}
+LESSON_COLUMNS = {'lesson_id', 'lesson', 'урок'}
+STEP_COLUMNS = {'step', 'step_position', 'position', 'шаг'}
+URL_COLUMNS = {'url', 'step_url', 'lesson_url', 'ссылка', 'ссылка на тест'}
+STATUS_COLUMNS = {'status', 'is_passed', 'passed', 'score', 'result', 'статус', 'балл'}
+
+# Заголовок колонки широкой выгрузки: "lesson/123456/step/2", "123456/2" или "123456-2"
+STEP_HEADER_PATTERN = re.compile(r'(?:lesson/)?(\d{3,})(?:/step/|[/_-])(\d+)')
+
+PASSED_VALUES = {'correct', 'passed', 'true', 'yes', 'да', '+', 'зачтено'}
+
+GRADEBOOK_COMMENT = "Засчитано по выгрузке Степика"
+
+
+def read_table(data: bytes, file_name: str) -> Iterator[Sequence]:
+    """Построчное чтение CSV или XLSX"""
+    if file_name.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("Для чтения XLSX установите пакет openpyxl")
+
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ['' if cell is None else str(cell) for cell in row]
+        workbook.close()
+        return
+
+    text = decode_upload(data)
+    first_line = text.split('\n', 1)[0]
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    yield from csv.reader(io.StringIO(text), delimiter=delimiter)
+
+
+def _normalize_user_id(value: str) -> str:
+    """ID пользователя из таблицы (XLSX отдает числа как 123.0)"""
+    value = value.strip()
+    if value.endswith('.0') and value[:-2].isdigit():
+        return value[:-2]
+    return value
+
+
+def _is_passed(value: str) -> bool:
+    """Признак успешного прохождения по значению ячейки"""
+    value = value.strip().lower()
+    if value in PASSED_VALUES:
+        return True
+    try:
+        return float(value.replace(',', '.')) > 0
+    except ValueError:
+        return False
+
+
+def _find_column(header: List[str], names: set) -> Optional[int]:
+    return next((i for i, cell in enumerate(header) if cell in names), None)
+
+
+def iter_gradebook_records(rows: Iterable[Sequence],
+                           skipped: Optional[List[int]] = None) -> Iterator[Tuple[MatchKey, bool]]:
+    """Разбор выгрузки в записи (ключ сопоставления, пройден ли шаг)
+
+    Поддерживаются длинный формат (строка на пару пользователь-шаг с колонками
+    user_id, lesson_id/step или url и status/score) и широкий формат
+    (строка на пользователя, колонка на шаг). Номера строк, которые не
+    удалось разобрать (короткие или с нечисловым уроком и шагом),
+    добавляются в ``skipped``, а разбор продолжается.
+    """
+    def skip(number: int, row: Sequence):
+        if skipped is not None and any(str(cell).strip() for cell in row):
+            skipped.append(number)
+
+    rows = enumerate(rows, 1)
+    header_row = next((row for _, row in rows if any(str(cell).strip() for cell in row)), None)
+    if header_row is None:
+        return
+
+    header = [str(cell).strip().lower() for cell in header_row]
+    user_index = _find_column(header, USER_COLUMNS)
+    if user_index is None:
+        raise ValueError("В выгрузке нет колонки с ID пользователя (user_id)")
+
+    lesson_index = _find_column(header, LESSON_COLUMNS)
+    step_index = _find_column(header, STEP_COLUMNS)
+    url_index = _find_column(header, URL_COLUMNS)
+    status_index = _find_column(header, STATUS_COLUMNS)
+
+    if status_index is not None and (lesson_index is not None or url_index is not None):
+        # Длинный формат
+        for number, row in rows:
+            if len(row) <= max(user_index, status_index):
+                skip(number, row)
+                continue
+            user_id = _normalize_user_id(str(row[user_index]))
+            key = None
+            if url_index is not None and url_index < len(row) and row[url_index]:
+                parsed = parse_stepik_url(str(row[url_index]))
+                if parsed and parsed['kind'] == 'lesson':
+                    key = (user_id, parsed['object_id'], parsed['step'])
+            elif lesson_index is not None and lesson_index < len(row) and str(row[lesson_index]).strip():
+                # Ячейка вида "—" или повторенный посреди файла заголовок
+                try:
+                    lesson_id = int(float(str(row[lesson_index])))
+                    step = None
+                    if step_index is not None and step_index < len(row) and str(row[step_index]).strip():
+                        step = int(float(str(row[step_index])))
+                except ValueError:
+                    skip(number, row)
+                    continue
+                key = (user_id, lesson_id, step)
+            if key:
+                yield key, _is_passed(str(row[status_index]))
+        return
+
+    # Широкий формат: находим колонки, заголовок которых ссылается на шаг урока
+    step_columns = []
+    for index, cell in enumerate(header):
+        match = STEP_HEADER_PATTERN.search(cell)
+        if match and index != user_index:
+            step_columns.append((index, int(match.group(1)), int(match.group(2))))
+
+    if not step_columns:
+        raise ValueError("Не удалось определить колонки шагов в выгрузке")
+
+    for number, row in rows:
+        if len(row) <= user_index:
+            skip(number, row)
+            continue
+        user_id = _normalize_user_id(str(row[user_index]))
+        for index, lesson_id, step in step_columns:
+            if index < len(row):
+                yield (user_id, lesson_id, step), _is_passed(str(row[index]))
+
+
+def build_pending_index(tests: List[Dict]) -> Tuple[Dict[MatchKey, List[Dict]], int]:
+    """Хеш-индекс неоцененных тестов по (ID Степика, урок, шаг)"""
+    index: Dict[MatchKey, List[Dict]] = defaultdict(list)
+    unparsed = 0
+
+    for test in tests:
+        parsed = parse_stepik_url(test['test_url'])
+        if not parsed or parsed['kind'] != 'lesson':
+            unparsed += 1
+            continue
+        index[(str(test['stepik_id']).strip(), parsed['object_id'], parsed['step'])].append(test)
+
+    return index, unparsed
+
+
+def import_gradebook(db: Database, data: bytes, file_name: str, dry_run: bool = False,
+                     feedback_system=None) -> Dict:
+    """Сопоставление выгрузки с неоцененными тестами и массовая оценка"""
+    started = time.perf_counter()
+    index, unparsed_urls = build_pending_index(db.get_pending_tests())
+
+    passed_tests: Dict[int, Dict] = {}
+    failed_tests = set()
+    records = 0
+    skipped_rows: List[int] = []
+
+    for key, passed in iter_gradebook_records(read_table(data, file_name), skipped_rows):
+        records += 1
+        for test in index.get(key, ()):
+            if passed:
+                passed_tests[test['id']] = test
+            else:
+                failed_tests.add(test['id'])
+
+    failed_tests -= passed_tests.keys()
+    reviews = [
+        (test_id, int(test['test_type']) if test['test_type'] else 5, GRADEBOOK_COMMENT)
+        for test_id, test in passed_tests.items()
+    ]
+
+    graded = 0
+    if reviews and not dry_run:
+        # Уведомления - только об оцененных сейчас тестах: тест, который
+        # преподаватель успел оценить сам, пропускается при записи
+        graded_ids = set(db.review_tests(reviews))
+        graded = len(graded_ids)
+        if feedback_system is not None and graded:
+            feedback_system.send_notifications([
+                (passed_tests[test_id]['student_id'],
+                 f"Ваш тест #{test_id} оценен! Баллов: {score}",
+                 'success')
+                for test_id, score, _ in reviews if test_id in graded_ids
+            ])
+
+    pending_total = sum(len(tests) for tests in index.values()) + unparsed_urls
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logging.info(f"Импорт выгрузки Степика: {records} записей, {len(skipped_rows)} строк пропущено, "
+                 f"{len(reviews)} совпадений, {graded} оценено, {elapsed_ms:.1f} мс")
+
+    return {
+        'records': records,
+        'skipped_rows': len(skipped_rows),
+        'skipped_lines': skipped_rows[:10],
+        'pending_tests': pending_total,
+        'matched_passed': len(reviews),
+        'matched_not_passed': len(failed_tests),
+        'unmatched': pending_total - unparsed_urls - len(reviews) - len(failed_tests),
+        'unparsed_urls': unparsed_urls,
+        'graded': graded,
+        'dry_run': dry_run,
+        'test_ids': sorted(passed_tests),
+        'elapsed_ms': round(elapsed_ms, 1)
+    }
+
+
+def format_gradebook_report(report: Dict) -> str:
+    """Текстовый отчет об импорте выгрузки"""
+    title = "Проверка выгрузки Степика" if report['dry_run'] else "Импорт выгрузки Степика"
+    text = f"📊 <b>{title}</b>\n\n"
+    text += f"📄 Записей в выгрузке: {report['records']}\n"
+    if report['skipped_rows']:
+        lines = ', '.join(str(line) for line in report['skipped_lines'])
+        more = "…" if report['skipped_rows'] > len(report['skipped_lines']) else ""
+        text += f"⚠️ Пропущено строк с ошибками: {report['skipped_rows']} (строки {lines}{more})\n"
+    text += f"⏳ Неоцененных тестов: {report['pending_tests']}\n"
+    text += f"✅ Пройдено по Степику: {report['matched_passed']}\n"
+    text += f"❌ Не пройдено: {report['matched_not_passed']}\n"
+    text += f"❔ Нет в выгрузке: {report['unmatched']}\n"
+    text += f"🔗 Ссылки не на урок: {report['unparsed_urls']}\n"
+
+    if report['dry_run']:
+        text += "\nℹ️ Режим проверки: оценки не выставлены."
+    else:
+        text += f"\n🎯 Оценено тестов: {report['graded']}"
+    text += f"\n⏱ Время: {report['elapsed_ms']} мс"
+
+    return text
@@ -0,0 +1,256 @@
+"""
+Очередь проверки: распределение непроверенных тестов между преподавателями
+с временной арендой
+"""
+
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from database import Database
+
+GRADING_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS grading_leases (
+        test_id INTEGER PRIMARY KEY,
+        teacher_id INTEGER NOT NULL,
+        leased_until REAL NOT NULL,
+        claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_grading_leases_teacher ON grading_leases (teacher_id)',
+    'CREATE INDEX IF NOT EXISTS idx_grading_leases_until ON grading_leases (leased_until)',
+    # Выбор самых старых непроверенных тестов без сортировки всей таблицы
+    'CREATE INDEX IF NOT EXISTS idx_tests_pending ON tests (is_reviewed, submitted_at)',
+    # Проверенный или удаленный тест освобождается сразу, не дожидаясь конца аренды
+    '''
+    CREATE TRIGGER IF NOT EXISTS grading_lease_reviewed AFTER UPDATE OF is_reviewed ON tests
+    WHEN new.is_reviewed BEGIN
+        DELETE FROM grading_leases WHERE test_id = new.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS grading_lease_deleted AFTER DELETE ON tests BEGIN
+        DELETE FROM grading_leases WHERE test_id = old.id;
+    END
+    '''
+]
+
+LEASED_TEST_QUERY = '''
+    SELECT t.id, t.student_id, t.full_name, t.stepik_id, t.test_url, t.test_type,
+           t.submitted_at, l.leased_until
+    FROM grading_leases l
+    JOIN tests t ON t.id = l.test_id
+    WHERE l.teacher_id = ? AND t.is_reviewed = FALSE
+    ORDER BY t.submitted_at, t.id
+'''
+
+
+class GradingQueue:
+    """Очередь непроверенных тестов с арендой.
+
+    Преподаватель забирает порцию самых старых свободных тестов на
+    ``lease_seconds``; пока аренда действует, другие преподаватели эти
+    тесты не получают. Аренда, которую не продлили, истекает сама, и
+    тесты возвращаются в очередь. Выдача выполняется одной транзакцией
+    записи, поэтому два преподавателя не могут получить один тест.
+    """
+
+    def __init__(self, db: Database, lease_seconds: int = 900, batch_size: int = 3):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.setup_queue()
+
+    def setup_queue(self):
+        """Создание таблицы аренды и триггеров"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            for statement in GRADING_SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+
+    def claim_next(self, teacher_id: int, batch_size: Optional[int] = None,
+                   test_type: Optional[str] = None, group_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Выдача преподавателю порции самых старых свободных тестов.
+
+        Уже выданные преподавателю тесты продлеваются и входят в порцию,
+        так что повторный запрос не увеличивает число удерживаемых тестов.
+        """
+        batch_size = batch_size or self.batch_size
+
+        def operation(cursor):
+            now = time.time()
+            leased_until = now + self.lease_seconds
+            # Удаление истекших аренд первым запросом сразу берет блокировку записи
+            cursor.execute('DELETE FROM grading_leases WHERE leased_until <= ?', (now,))
+            cursor.execute(
+                'UPDATE grading_leases SET leased_until = ? WHERE teacher_id = ?',
+                (leased_until, teacher_id)
+            )
+            cursor.execute('SELECT COUNT(*) FROM grading_leases WHERE teacher_id = ?', (teacher_id,))
+            missing = batch_size - cursor.fetchone()[0]
+
+            if missing > 0:
+                type_filter = 'AND t.test_type = ?' if test_type else ''
+                group_condition, group_params = Database._group_condition('t.group_id', group_ids)
+                params = ([teacher_id, leased_until] + ([test_type] if test_type else [])
+                          + group_params + [missing])
+                cursor.execute(f'''
+                    INSERT INTO grading_leases (test_id, teacher_id, leased_until)
+                    SELECT t.id, ?, ?
+                    FROM tests t
+                    WHERE t.is_reviewed = FALSE {type_filter} AND {group_condition}
+                      AND NOT EXISTS (SELECT 1 FROM grading_leases l WHERE l.test_id = t.id)
+                    ORDER BY t.submitted_at, t.id
+                    LIMIT ?
+                ''', params)
+
+            cursor.execute(LEASED_TEST_QUERY, (teacher_id,))
+            return cursor.fetchall()
+
+        try:
+            return [self._to_dict(row) for row in self.db.run_write(operation).result()]
+        except Exception as e:
+            logging.error(f"Ошибка выдачи тестов на проверку: {e}")
+            return []
+
+    def claim(self, test_id: int, teacher_id: int) -> bool:
+        """Аренда конкретного теста; False, если его держит другой преподаватель"""
+        def operation(cursor):
+            now = time.time()
+            cursor.execute('DELETE FROM grading_leases WHERE leased_until <= ?', (now,))
+            cursor.execute('''
+                INSERT INTO grading_leases (test_id, teacher_id, leased_until)
+                SELECT id, ?, ? FROM tests WHERE id = ? AND is_reviewed = FALSE
+                ON CONFLICT (test_id) DO UPDATE SET leased_until = excluded.leased_until
+                WHERE teacher_id = excluded.teacher_id
+            ''', (teacher_id, now + self.lease_seconds, test_id))
+            cursor.execute('SELECT teacher_id FROM grading_leases WHERE test_id = ?', (test_id,))
+            row = cursor.fetchone()
+            return row is not None and row[0] == teacher_id
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка аренды теста: {e}")
+            return False
+
+    def review(self, test_id: int, teacher_id: int, score: int, comment: str = "") -> bool:
+        """Оценка теста с проверкой аренды в одной транзакции записи.
+
+        False, если тест уже оценен или его держит другой преподаватель:
+        после истечения аренды старая кнопка или форма не перезапишет
+        оценку того, кто забрал тест следующим.
+        """
+        def operation(cursor):
+            cursor.execute('DELETE FROM grading_leases WHERE leased_until <= ?', (time.time(),))
+            cursor.execute('SELECT teacher_id FROM grading_leases WHERE test_id = ?', (test_id,))
+            row = cursor.fetchone()
+            if row is not None and row[0] != teacher_id:
+                return False
+            cursor.execute('''
+                UPDATE tests
+                SET is_reviewed = TRUE, score = ?, teacher_comment = ?, reviewed_at = CURRENT_TIMESTAMP,
+                    reviewed_by = ?
+                WHERE id = ? AND is_reviewed = FALSE
+            ''', (score, comment, teacher_id, test_id))
+            return cursor.rowcount > 0
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка оценки теста: {e}")
+            return False
+
+    def release(self, teacher_id: int, test_id: Optional[int] = None) -> int:
+        """Возврат теста (или всех тестов преподавателя) в очередь"""
+        def operation(cursor):
+            if test_id is None:
+                cursor.execute('DELETE FROM grading_leases WHERE teacher_id = ?', (teacher_id,))
+            else:
+                cursor.execute('DELETE FROM grading_leases WHERE teacher_id = ? AND test_id = ?',
+                               (teacher_id, test_id))
+            return cursor.rowcount
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка возврата тестов в очередь: {e}")
+            return 0
+
+    def get_holder(self, test_id: int) -> Optional[int]:
+        """Преподаватель, у которого тест в действующей аренде"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                row = connection.execute(
+                    'SELECT teacher_id FROM grading_leases WHERE test_id = ? AND leased_until > ?',
+                    (test_id, time.time())
+                ).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logging.error(f"Ошибка проверки аренды теста: {e}")
+            return None
+
+    def get_held_by_others(self, teacher_id: int) -> Dict[int, int]:
+        """Тесты в действующей аренде у других преподавателей: {test_id: teacher_id}"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute(
+                    'SELECT test_id, teacher_id FROM grading_leases WHERE teacher_id != ? AND leased_until > ?',
+                    (teacher_id, time.time())
+                ).fetchall()
+            return dict(rows)
+        except Exception as e:
+            logging.error(f"Ошибка получения аренд: {e}")
+            return {}
+
+    def get_leases(self, teacher_id: int) -> List[Dict]:
+        """Тесты, выданные преподавателю и еще не проверенные"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute(LEASED_TEST_QUERY, (teacher_id,)).fetchall()
+            now = time.time()
+            return [self._to_dict(row) for row in rows if row[7] > now]
+        except Exception as e:
+            logging.error(f"Ошибка получения выданных тестов: {e}")
+            return []
+
+    def get_queue_stats(self) -> Dict:
+        """Размер очереди: всего непроверенных, в аренде, свободных и по преподавателям"""
+        stats = {'pending': 0, 'leased': 0, 'available': 0, 'by_teacher': {}}
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                now = time.time()
+                stats['pending'] = connection.execute(
+                    'SELECT COUNT(*) FROM tests WHERE is_reviewed = FALSE'
+                ).fetchone()[0]
+                stats['by_teacher'] = dict(connection.execute(
+                    'SELECT teacher_id, COUNT(*) FROM grading_leases WHERE leased_until > ? GROUP BY teacher_id',
+                    (now,)
+                ).fetchall())
+            stats['leased'] = sum(stats['by_teacher'].values())
+            stats['available'] = max(stats['pending'] - stats['leased'], 0)
+        except Exception as e:
+            logging.error(f"Ошибка получения статистики очереди: {e}")
+        return stats
+
+    @staticmethod
+    def _to_dict(row) -> Dict:
+        return {
+            'id': row[0],
+            'student_id': row[1],
+            'full_name': row[2],
+            'stepik_id': row[3],
+            'test_url': row[4],
+            'test_type': row[5],
+            'submitted_at': row[6],
+            'leased_until': row[7]
+        }
+
+
+def format_queue_stats(stats: Dict) -> str:
+    """Состояние очереди проверки для бота"""
+    text = (f"\n📥 <b>Очередь проверки:</b> свободно {stats['available']}, "
+            f"на проверке у преподавателей {stats['leased']}\n")
+    return text
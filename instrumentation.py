@@ -0,0 +1,235 @@
+"""
+Инструментирование бота: задержка цикла событий, время обработчиков
+и блокировки цикла синхронным кодом
+"""
+
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+
+def _percentile(values: List[float], q: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+class _TimedCoroutine:
+    """Обертка корутины обработчика, которая измеряет каждый шаг.
+
+    Шаг - выполнение от одного ``await`` до следующего; все это время
+    цикл событий занят обработчиком, поэтому сумма шагов - время, когда
+    обработчик блокировал цикл. Остальное время обработчик ждал ввода-вывода.
+    """
+
+    def __init__(self, coro, owner: 'BotInstrumentation', name: str):
+        self.coro = coro
+        self.owner = owner
+        self.name = name
+        self.blocking = 0.0
+        self.max_step = 0.0
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            self.owner.current_handler = self.name
+            started = time.perf_counter()
+            try:
+                if error is None:
+                    yielded = self.coro.send(value)
+                else:
+                    yielded = self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                step = time.perf_counter() - started
+                self.blocking += step
+                self.max_step = max(self.max_step, step)
+                self.owner.current_handler = None
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                self.coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+class BotInstrumentation:
+    """Метрики цикла событий и обработчиков обновлений бота.
+
+    Фоновая задача раз в ``lag_interval`` секунд засыпает и замеряет, на
+    сколько позже проснулась, - это задержка цикла событий. Она же
+    обновляет отметку жизни, по которой сторожевой поток замечает, что цикл
+    занят дольше ``block_threshold_ms``, и пишет в журнал стек потока цикла
+    вместе с именем выполняющегося обработчика. Обработчики оборачиваются
+    через ``instrument_application``: для каждого считаются вызовы, ошибки,
+    полное время и время, проведенное в синхронном коде на потоке цикла.
+    """
+
+    def __init__(self, lag_interval: float = 0.5, block_threshold_ms: float = 250, history: int = 1200):
+        self.lag_interval = lag_interval
+        self.block_threshold = block_threshold_ms / 1000
+        self.lag_samples = deque(maxlen=history)
+        self.handlers: Dict[str, Dict] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.current_handler: Optional[str] = None
+        self.blocked_events = 0
+        self.last_block: Optional[Dict] = None
+        self._beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Запуск замера задержки и сторожевого потока в текущем цикле событий"""
+        if self._task is not None or self.lag_interval <= 0:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure_lag())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        """Остановка фоновой задачи и сторожевого потока"""
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._watchdog = None
+
+    async def _measure_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.lag_samples.append(max(0.0, loop.time() - started - self.lag_interval))
+            self._beat = time.monotonic()
+
+    def _watch(self):
+        """Сторожевой поток: стек потока цикла, пока тот заблокирован"""
+        reported_beat = None
+        while not self._stopped.wait(self.block_threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.lag_interval
+            if stalled < self.block_threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame, limit=15)) if frame else ''
+            handler = self.current_handler or 'вне обработчиков'
+            self.blocked_events += 1
+            self.last_block = {'handler': handler, 'stalled_ms': round(stalled * 1000), 'stack': stack,
+                               'at': time.time()}
+            logging.warning(
+                f"Цикл событий заблокирован более {round(stalled * 1000)} мс ({handler}):\n{stack}"
+            )
+
+    def wrap(self, name: str, callback: Callable) -> Callable:
+        """Обработчик, который записывает свое время"""
+        @functools.wraps(callback)
+        async def instrumented(*args, **kwargs):
+            result = callback(*args, **kwargs)
+            if not asyncio.iscoroutine(result):
+                return result
+            return await self.measure(name, result)
+        instrumented.__instrumented__ = True
+        return instrumented
+
+    async def measure(self, name: str, coro):
+        """Выполнение корутины с учетом полного и блокирующего времени"""
+        stats = self.handlers.setdefault(name, {
+            'calls': 0, 'errors': 0, 'wall': 0.0, 'blocking': 0.0, 'max_wall': 0.0, 'max_step': 0.0
+        })
+        timed = _TimedCoroutine(coro, self, name)
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            return await timed
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            wall = time.perf_counter() - started
+            self.in_flight -= 1
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['blocking'] += timed.blocking
+            stats['max_wall'] = max(stats['max_wall'], wall)
+            stats['max_step'] = max(stats['max_step'], timed.max_step)
+
+    def instrument_application(self, application) -> int:
+        """Обертка обработчиков приложения, включая вложенные в диалоги"""
+        def instrument(handler) -> int:
+            count = 0
+            # ConversationHandler хранит свои обработчики во входах, состояниях и выходах
+            nested = [getattr(handler, 'entry_points', None) or [], getattr(handler, 'fallbacks', None) or []]
+            nested += list((getattr(handler, 'states', None) or {}).values())
+            for handlers in nested:
+                count += sum(instrument(inner) for inner in handlers)
+            callback = getattr(handler, 'callback', None)
+            if callback is not None and not getattr(callback, '__instrumented__', False):
+                handler.callback = self.wrap(getattr(callback, '__name__', type(handler).__name__), callback)
+                count += 1
+            return count
+
+        return sum(instrument(handler) for handlers in application.handlers.values() for handler in handlers)
+
+    def get_report(self, top: int = 5) -> Dict:
+        """Задержка цикла, обновления в работе и самые блокирующие обработчики"""
+        lags = sorted(self.lag_samples)
+        handlers = [{
+            'name': name,
+            'calls': stats['calls'],
+            'errors': stats['errors'],
+            'avg_wall_ms': round(stats['wall'] / stats['calls'] * 1000, 1) if stats['calls'] else 0.0,
+            'avg_blocking_ms': round(stats['blocking'] / stats['calls'] * 1000, 1) if stats['calls'] else 0.0,
+            'max_wall_ms': round(stats['max_wall'] * 1000, 1),
+            'max_blocking_ms': round(stats['max_step'] * 1000, 1),
+            'blocking_share': round(stats['blocking'] / stats['wall'] * 100, 1) if stats['wall'] else 0.0,
+            'total_blocking': stats['blocking']
+        } for name, stats in list(self.handlers.items())]
+        handlers.sort(key=lambda handler: handler['total_blocking'], reverse=True)
+        return {
+            'lag_ms': {
+                'p50': round(_percentile(lags, 50) * 1000, 1),
+                'p95': round(_percentile(lags, 95) * 1000, 1),
+                'p99': round(_percentile(lags, 99) * 1000, 1),
+                'max': round(lags[-1] * 1000, 1) if lags else 0.0,
+                'samples': len(lags)
+            },
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'blocked_events': self.blocked_events,
+            'last_block': self.last_block,
+            'handlers': handlers[:top]
+        }
+
+
+def format_instrumentation_report(report: Dict) -> str:
+    """Метрики цикла событий для админ-панели бота"""
+    lag = report['lag_ms']
+    text = (f"\n⏱️ <b>Цикл событий:</b>\n"
+            f"• Задержка: p50 {lag['p50']} мс, p95 {lag['p95']} мс, макс. {lag['max']} мс\n"
+            f"• Обновлений в работе: {report['in_flight']} (пик {report['peak_in_flight']})\n"
+            f"• Блокировок цикла: {report['blocked_events']}\n")
+    if report['last_block']:
+        text += f"• Последняя: {report['last_block']['handler']}, {report['last_block']['stalled_ms']} мс\n"
+    for handler in report['handlers']:
+        text += (f"• {handler['name']}: {handler['calls']} выз., {handler['avg_wall_ms']} мс, "
+                 f"из них блокирует {handler['avg_blocking_ms']} мс\n")
+    return text
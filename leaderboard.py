@@ -0,0 +1,286 @@
+"""
+Рейтинг студентов: место в рейтинге, лидеры и соседи по рейтингу
+"""
+
+import logging
+import sqlite3
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from database import Database
+
+# Баллы студентов ведут триггеры; каждая измененная строка получает
+# новую версию, по ней индекс в памяти забирает только изменения
+LEADERBOARD_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('leaderboard', 0)",
+    '''
+    CREATE TABLE IF NOT EXISTS student_scores (
+        student_id INTEGER PRIMARY KEY,
+        total_score INTEGER NOT NULL DEFAULT 0,
+        reviewed_tests INTEGER NOT NULL DEFAULT 0,
+        total_tests INTEGER NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_student_scores_version ON student_scores (version)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leaderboard_tests_insert AFTER INSERT ON tests
+    WHEN new.student_id IS NOT NULL BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'leaderboard';
+        INSERT INTO student_scores (student_id, total_score, reviewed_tests, total_tests, version)
+        VALUES (
+            new.student_id,
+            CASE WHEN new.is_reviewed THEN COALESCE(new.score, 0) ELSE 0 END,
+            CASE WHEN new.is_reviewed THEN 1 ELSE 0 END,
+            1,
+            (SELECT version FROM data_versions WHERE name = 'leaderboard')
+        )
+        ON CONFLICT (student_id) DO UPDATE SET
+            total_score = total_score + excluded.total_score,
+            reviewed_tests = reviewed_tests + excluded.reviewed_tests,
+            total_tests = total_tests + 1,
+            version = excluded.version;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leaderboard_tests_update AFTER UPDATE OF student_id, score, is_reviewed ON tests
+    WHEN old.student_id IS NOT new.student_id OR old.score IS NOT new.score
+         OR old.is_reviewed IS NOT new.is_reviewed BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'leaderboard';
+        UPDATE student_scores SET
+            total_score = total_score - CASE WHEN old.is_reviewed THEN COALESCE(old.score, 0) ELSE 0 END,
+            reviewed_tests = reviewed_tests - CASE WHEN old.is_reviewed THEN 1 ELSE 0 END,
+            total_tests = total_tests - 1,
+            version = (SELECT version FROM data_versions WHERE name = 'leaderboard')
+        WHERE student_id = old.student_id;
+        INSERT INTO student_scores (student_id, total_score, reviewed_tests, total_tests, version)
+        SELECT new.student_id,
+               CASE WHEN new.is_reviewed THEN COALESCE(new.score, 0) ELSE 0 END,
+               CASE WHEN new.is_reviewed THEN 1 ELSE 0 END,
+               1,
+               (SELECT version FROM data_versions WHERE name = 'leaderboard')
+        WHERE new.student_id IS NOT NULL
+        ON CONFLICT (student_id) DO UPDATE SET
+            total_score = total_score + excluded.total_score,
+            reviewed_tests = reviewed_tests + excluded.reviewed_tests,
+            total_tests = total_tests + 1,
+            version = excluded.version;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leaderboard_tests_delete AFTER DELETE ON tests
+    WHEN old.student_id IS NOT NULL BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'leaderboard';
+        UPDATE student_scores SET
+            total_score = total_score - CASE WHEN old.is_reviewed THEN COALESCE(old.score, 0) ELSE 0 END,
+            reviewed_tests = reviewed_tests - CASE WHEN old.is_reviewed THEN 1 ELSE 0 END,
+            total_tests = total_tests - 1,
+            version = (SELECT version FROM data_versions WHERE name = 'leaderboard')
+        WHERE student_id = old.student_id;
+    END
+    ''',
+    # Одобрение и удаление студентов меняют состав рейтинга
+    '''
+    CREATE TRIGGER IF NOT EXISTS leaderboard_users_insert AFTER INSERT ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'leaderboard';
+        INSERT INTO student_scores (student_id, version)
+        VALUES (new.user_id, (SELECT version FROM data_versions WHERE name = 'leaderboard'))
+        ON CONFLICT (student_id) DO UPDATE SET version = excluded.version;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leaderboard_users_update AFTER UPDATE OF role, is_approved ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'leaderboard';
+        INSERT INTO student_scores (student_id, version)
+        VALUES (new.user_id, (SELECT version FROM data_versions WHERE name = 'leaderboard'))
+        ON CONFLICT (student_id) DO UPDATE SET version = excluded.version;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS leaderboard_users_delete AFTER DELETE ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'leaderboard';
+        UPDATE student_scores SET version = (SELECT version FROM data_versions WHERE name = 'leaderboard')
+        WHERE student_id = old.user_id;
+    END
+    '''
+]
+
+
+class Leaderboard:
+    """Рейтинг одобренных студентов по сумме баллов за проверенные тесты.
+
+    Суммы хранятся в таблице student_scores, которую обновляют триггеры.
+    В памяти процесса поддерживается отсортированный список
+    (-баллы, студент): место, лидеры и соседи находятся двоичным поиском
+    за O(log n), а перед запросом из базы читаются только строки,
+    изменившиеся с прошлого раза, в том числе изменения других процессов.
+    Равные баллы делят место (1, 2, 2, 4).
+
+    Изменение суммы студента - это поиск за O(log n) и сдвиг хвоста списка
+    за O(n). Курс ограничен MAX_STUDENTS (по умолчанию 100), а сдвиг - это
+    копирование памяти: около 1 мкс на 100 студентов, 5 мкс на 10 000 и
+    30 мкс на 100 000. До сотен тысяч студентов дерево поиска не нужно.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._keys: List[Tuple[int, int]] = []
+        self._scores: Dict[int, int] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        self.setup_scores()
+
+    def setup_scores(self):
+        """Создание таблицы баллов и триггеров; первичный подсчет при создании"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'student_scores'")
+            created = cursor.fetchone() is None
+
+            for statement in LEADERBOARD_SCHEMA:
+                cursor.execute(statement)
+
+            if created:
+                cursor.execute("UPDATE data_versions SET version = 1 WHERE name = 'leaderboard'")
+                cursor.execute('''
+                    INSERT INTO student_scores (student_id, total_score, reviewed_tests, total_tests, version)
+                    SELECT student_id,
+                           SUM(CASE WHEN is_reviewed THEN COALESCE(score, 0) ELSE 0 END),
+                           SUM(CASE WHEN is_reviewed THEN 1 ELSE 0 END),
+                           COUNT(*),
+                           1
+                    FROM tests
+                    WHERE student_id IS NOT NULL
+                    GROUP BY student_id
+                ''')
+                cursor.execute('INSERT OR IGNORE INTO student_scores (student_id, version) SELECT user_id, 1 FROM users')
+            connection.commit()
+
+    def refresh(self) -> int:
+        """Применение изменений из базы к индексу; возвращает число изменений"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            rows = connection.execute('''
+                SELECT s.student_id, s.total_score,
+                       COALESCE(u.role = 'student' AND u.is_approved, 0), s.version
+                FROM student_scores s
+                LEFT JOIN users u ON u.user_id = s.student_id
+                WHERE s.version > ?
+                ORDER BY s.version
+            ''', (self._version,)).fetchall()
+
+        # Каждое изменение: поиск за O(log n) и сдвиг элементов списка за O(n)
+        for student_id, total_score, ranked, version in rows:
+            previous = self._scores.pop(student_id, None)
+            if previous is not None:
+                position = bisect_left(self._keys, (-previous, student_id))
+                del self._keys[position]
+            if ranked:
+                self._scores[student_id] = total_score
+                insort(self._keys, (-total_score, student_id))
+            self._version = version
+        return len(rows)
+
+    def _rank(self, total_score: int) -> int:
+        """Место для суммы баллов: 1 + число студентов с большей суммой"""
+        return bisect_left(self._keys, (-total_score,)) + 1
+
+    def _entries(self, keys: List[Tuple[int, int]]) -> List[Dict]:
+        return [{'rank': self._rank(-negative_score), 'student_id': student_id, 'total_score': -negative_score}
+                for negative_score, student_id in keys]
+
+    def get_standing(self, student_id: Optional[int] = None, top: int = 10, radius: int = 2) -> Dict:
+        """Лидеры, место студента и его соседи по рейтингу"""
+        standing = {'students': 0, 'top': [], 'me': None, 'neighbours': []}
+        try:
+            with self._lock:
+                self.refresh()
+                standing['students'] = len(self._keys)
+                standing['top'] = self._entries(self._keys[:top])
+
+                if student_id in self._scores:
+                    total_score = self._scores[student_id]
+                    position = bisect_left(self._keys, (-total_score, student_id))
+                    standing['me'] = {'rank': self._rank(total_score), 'student_id': student_id,
+                                      'total_score': total_score}
+                    standing['neighbours'] = self._entries(
+                        self._keys[max(0, position - radius):position + radius + 1]
+                    )
+
+            self._add_details(standing['top'] + standing['neighbours'])
+        except Exception as e:
+            logging.error(f"Ошибка получения рейтинга: {e}")
+        return standing
+
+    def get_rank(self, student_id: int) -> Optional[Dict]:
+        """Место студента: {'rank', 'total_score', 'students'} или None"""
+        standing = self.get_standing(student_id, top=0, radius=0)
+        if standing['me'] is None:
+            return None
+        return dict(standing['me'], students=standing['students'])
+
+    def get_top(self, limit: int = 10) -> List[Dict]:
+        """Первые ``limit`` мест рейтинга"""
+        return self.get_standing(top=limit)['top']
+
+    def get_totals(self) -> Dict:
+        """Число студентов в рейтинге и сумма их баллов"""
+        with self._lock:
+            self.refresh()
+            return {'students': len(self._keys), 'total_score': sum(self._scores.values())}
+
+    def _add_details(self, entries: List[Dict]):
+        """Имена и число тестов для показанных строк рейтинга одним запросом"""
+        student_ids = list({entry['student_id'] for entry in entries})
+        if not student_ids:
+            return
+        with sqlite3.connect(self.db.db_name) as connection:
+            rows = connection.execute(f'''
+                SELECT u.user_id,
+                       COALESCE((SELECT t.full_name FROM tests t WHERE t.student_id = u.user_id LIMIT 1),
+                                NULLIF(TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')), '')),
+                       COALESCE(s.reviewed_tests, 0), COALESCE(s.total_tests, 0)
+                FROM users u
+                LEFT JOIN student_scores s ON s.student_id = u.user_id
+                WHERE u.user_id IN ({', '.join('?' * len(student_ids))})
+            ''', student_ids).fetchall()
+        details = {row[0]: row[1:] for row in rows}
+        for entry in entries:
+            full_name, reviewed_tests, total_tests = details.get(entry['student_id'], (None, 0, 0))
+            entry['full_name'] = full_name or f"Студент #{entry['student_id']}"
+            entry['reviewed_tests'] = reviewed_tests
+            entry['total_tests'] = total_tests
+
+
+def format_leaderboard(standing: Dict, student_id: Optional[int] = None) -> str:
+    """Рейтинг для бота: лидеры и соседи студента"""
+    if not standing['students']:
+        return "🏆 Рейтинг пока пуст."
+
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+
+    def line(entry: Dict) -> str:
+        marker = medals.get(entry['rank'], f"{entry['rank']}.")
+        name = entry['full_name']
+        if entry['student_id'] == student_id:
+            name = f"<b>{name} (вы)</b>"
+        return f"{marker} {name} — {entry['total_score']}\n"
+
+    text = f"🏆 <b>Рейтинг</b> (студентов: {standing['students']})\n\n"
+    text += ''.join(line(entry) for entry in standing['top'])
+
+    me = standing['me']
+    if me:
+        text += f"\n📍 <b>Ваше место:</b> {me['rank']} из {standing['students']} ({me['total_score']} баллов)\n"
+        top_ids = {entry['student_id'] for entry in standing['top']}
+        neighbours = [entry for entry in standing['neighbours'] if entry['student_id'] not in top_ids]
+        if neighbours:
+            text += "\n👥 <b>Рядом с вами:</b>\n"
+            text += ''.join(line(entry) for entry in neighbours)
+    return text
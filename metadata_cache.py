@@ -0,0 +1,238 @@
+"""
+Кеш названий уроков и курсов Степика
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from database import Database
+from stepik_api import StepikAPIError, StepikClient
+from utils import parse_stepik_url
+
+# Ключ кеша: (тип объекта, ID объекта)
+MetadataKey = Tuple[str, int]
+
+# Сколько ID запрашивать в одном обращении к API
+IDS_PER_REQUEST = 100
+
+RESOURCES = {'lesson': 'lessons', 'course': 'courses', 'step': 'steps'}
+
+
+class MetadataCache:
+    """Кеш названий объектов Степика с TTL и отрицательным кешированием.
+
+    Чтение никогда не ждет API: свежие записи отдаются сразу, устаревшие
+    отдаются как есть и обновляются в фоне, отсутствующие просто не
+    показываются до завершения фонового запроса. Запросы к API выполняются
+    в отдельном потоке со своим циклом событий, поэтому кеш можно
+    использовать и из бота, и из Flask. Клиент должен использоваться только
+    этим кешем.
+
+    Если передан ``loop``, запросы выполняются в этом уже работающем цикле
+    (общем для кешей нескольких курсов), а клиент может быть общим для
+    всех кешей этого цикла; закрывает их владелец цикла.
+    """
+
+    def __init__(self, db: Database, client: StepikClient, ttl: float = 86400,
+                 negative_ttl: float = 3600, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.db = db
+        self.client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._in_flight: Set[MetadataKey] = set()
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = loop
+        self._owns_loop = loop is None
+        self.setup_metadata_table()
+
+    def setup_metadata_table(self):
+        """Создание таблицы кеша"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS stepik_metadata (
+                    kind TEXT NOT NULL,
+                    object_id INTEGER NOT NULL,
+                    title TEXT,
+                    lesson_id INTEGER,
+                    position INTEGER,
+                    found BOOLEAN NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (kind, object_id)
+                )
+            ''')
+            connection.commit()
+
+    @staticmethod
+    def url_keys(url: str) -> List[MetadataKey]:
+        """Объекты, названия которых нужны для ссылки"""
+        parsed = parse_stepik_url(url or '')
+        if not parsed:
+            return []
+        return [(parsed['kind'], parsed['object_id'])]
+
+    def _load(self, keys: Set[MetadataKey]) -> Dict[MetadataKey, Tuple]:
+        """Чтение записей кеша одним запросом"""
+        if not keys:
+            return {}
+
+        conditions = ' OR '.join(['(kind = ? AND object_id = ?)'] * len(keys))
+        params = [value for key in keys for value in key]
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute(f'''
+                    SELECT kind, object_id, title, lesson_id, position, found, expires_at
+                    FROM stepik_metadata
+                    WHERE {conditions}
+                ''', params)
+                return {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+        except Exception as e:
+            logging.error(f"Ошибка чтения кеша Степика: {e}")
+            return {}
+
+    def get_titles(self, urls: Iterable[str]) -> Dict[str, str]:
+        """Названия для ссылок без ожидания API (stale-while-revalidate)"""
+        urls = [url for url in set(urls) if url]
+        url_keys = {url: self.url_keys(url) for url in urls}
+        keys = {key for keys in url_keys.values() for key in keys}
+        rows = self._load(keys)
+
+        # Для шагов нужно и название урока, в который они входят
+        lesson_keys = {('lesson', row[1]) for key, row in rows.items()
+                       if key[0] == 'step' and row[1] is not None}
+        rows.update(self._load(lesson_keys - rows.keys()))
+
+        now = time.time()
+        to_refresh = {key for key in keys | lesson_keys
+                      if key not in rows or rows[key][4] <= now}
+        if to_refresh:
+            self.refresh(to_refresh)
+
+        titles = {}
+        for url, keys_for_url in url_keys.items():
+            for kind, object_id in keys_for_url:
+                title = self._format_title(kind, object_id, rows)
+                if title:
+                    titles[url] = title
+        return titles
+
+    @staticmethod
+    def _format_title(kind: str, object_id: int, rows: Dict[MetadataKey, Tuple]) -> Optional[str]:
+        row = rows.get((kind, object_id))
+        if not row or not row[3]:
+            return None
+
+        if kind == 'step':
+            lesson = rows.get(('lesson', row[1]))
+            if not lesson or not lesson[3]:
+                return None
+            return f"{lesson[0]}, шаг {row[2]}"
+        if kind == 'course':
+            return f"Курс: {row[0]}"
+        return row[0]
+
+    def annotate(self, tests: List[Dict]) -> List[Dict]:
+        """Добавление названия урока (ключ lesson_title) к тестам страницы"""
+        titles = self.get_titles(test['test_url'] for test in tests)
+        for test in tests:
+            title = titles.get(test['test_url'])
+            parsed = parse_stepik_url(test['test_url'] or '')
+            if title and parsed and parsed['kind'] == 'lesson' and parsed['step']:
+                title = f"{title}, шаг {parsed['step']}"
+            test['lesson_title'] = title
+        return tests
+
+    def refresh(self, keys: Iterable[MetadataKey]) -> Future:
+        """Фоновое обновление записей (повторные запросы одних ключей объединяются)"""
+        with self._lock:
+            keys = set(keys) - self._in_flight
+            self._in_flight.update(keys)
+            loop = self._ensure_loop()
+
+        if not keys:
+            future: Future = Future()
+            future.set_result(0)
+            return future
+        return asyncio.run_coroutine_threadsafe(self._refresh(keys), loop)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Запуск потока с циклом событий для запросов к API"""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self._loop.run_forever, name='stepik-metadata', daemon=True
+            ).start()
+        return self._loop
+
+    async def _fetch(self, kind: str, ids: List[int]) -> Dict[int, Dict]:
+        """Пакетная загрузка объектов одного типа"""
+        resource = RESOURCES[kind]
+        chunks = [ids[i:i + IDS_PER_REQUEST] for i in range(0, len(ids), IDS_PER_REQUEST)]
+        responses = await asyncio.gather(*(
+            self.client.get(f'/api/{resource}', {'ids[]': chunk}, use_cache=False)
+            for chunk in chunks
+        ))
+        return {item['id']: item for response in responses for item in response.get(resource, [])}
+
+    async def _refresh(self, keys: Set[MetadataKey]) -> int:
+        """Загрузка названий и запись в кеш"""
+        try:
+            rows = []
+            step_ids = sorted(object_id for kind, object_id in keys if kind == 'step')
+            steps = await self._fetch('step', step_ids) if step_ids else {}
+            rows.extend(self._rows('step', step_ids, steps))
+
+            # Уроки шагов загружаем вместе с остальными уроками
+            lesson_ids = {object_id for kind, object_id in keys if kind == 'lesson'}
+            lesson_ids.update(step['lesson'] for step in steps.values() if step.get('lesson'))
+            course_ids = sorted(object_id for kind, object_id in keys if kind == 'course')
+
+            lessons, courses = await asyncio.gather(
+                self._fetch('lesson', sorted(lesson_ids)) if lesson_ids else asyncio.sleep(0, {}),
+                self._fetch('course', course_ids) if course_ids else asyncio.sleep(0, {})
+            )
+            rows.extend(self._rows('lesson', sorted(lesson_ids), lessons))
+            rows.extend(self._rows('course', course_ids, courses))
+
+            await asyncio.wrap_future(self.db.run_write(lambda cursor: cursor.executemany('''
+                INSERT OR REPLACE INTO stepik_metadata
+                    (kind, object_id, title, lesson_id, position, found, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)))
+            return len(rows)
+        except StepikAPIError as e:
+            # Временная ошибка API не кешируется как отсутствие объекта
+            logging.warning(f"Не удалось обновить кеш Степика: {e}")
+            return 0
+        except Exception as e:
+            logging.error(f"Ошибка обновления кеша Степика: {e}")
+            return 0
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(keys)
+
+    def _rows(self, kind: str, ids: Iterable[int], items: Dict[int, Dict]) -> List[Tuple]:
+        """Строки кеша: найденные объекты и отрицательные записи для остальных"""
+        now = time.time()
+        rows = []
+        for object_id in ids:
+            item = items.get(object_id)
+            if item is None:
+                rows.append((kind, object_id, None, None, None, False, now + self.negative_ttl))
+            else:
+                rows.append((kind, object_id, item.get('title'), item.get('lesson'),
+                             item.get('position'), True, now + self.ttl))
+        return rows
+
+    def close(self, timeout: float = 5.0):
+        """Остановка потока запросов и закрытие клиента"""
+        if self._loop is None or not self._owns_loop:
+            return
+        asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
@@ -3,12 +3,42 @@
 
 """
 Скрипт для миграции базы данных
-Добавляет колонку stepik_id в таблицу users
+Добавляет колонку stepik_id в таблицу users, удаляет повторные
+отправки тестов, переносит веб-пользователей в отдельное пространство ID
+и включает инкрементальную очистку свободных страниц
 """
 
 import sqlite3
 import os
 
+# Все колонки с ID пользователя. Таблица, в которой хранится ID
+# пользователя, должна попасть в этот список, иначе перенос веб-пользователей
+# оставит в ней старые ID
+USER_ID_COLUMNS = [
+    ('users', 'user_id'),
+    ('tests', 'student_id'),
+    ('tests', 'reviewed_by'),
+    ('feedback', 'user_id'),
+    ('feedback', 'processed_by'),
+    ('notifications', 'user_id'),
+    ('notification_rollups', 'user_id'),
+    ('notification_counters', 'user_id'),
+    ('idempotency_keys', 'user_id'),
+    ('teacher_groups', 'teacher_id'),
+    ('grading_leases', 'teacher_id'),
+    ('review_latency', 'teacher_id'),
+    ('deadlines', 'created_by'),
+    ('reminder_deliveries', 'student_id'),
+    ('teacher_digests', 'teacher_id')
+]
+
+# Счетчики, которые триггеры переносят вместе с tests.student_id:
+# после переноса у старого ID остаются пустые строки
+TRIGGER_MOVED_COLUMNS = [
+    ('student_scores', 'student_id'),
+    ('student_test_counts', 'student_id')
+]
+
 def migrate_database():
     """Миграция базы данных"""
     db_name = 'stepik_bot.db'
@@ -60,7 +90,130 @@ def migrate_database():
         print(f"❌ Ошибка миграции: {e}")
         return False
 
+def migrate_web_user_ids(db_name: str = 'stepik_bot.db'):
+    """Перенос пользователей веб-приложения в пространство отрицательных ID
+    
+    Раньше веб-регистрация выдавала ID вида hash() % 1000000, которые могли
+    совпасть с настоящими Telegram ID. Такие пользователи узнаются по пустым
+    first_name и last_name (у Telegram-пользователей имя всегда заполнено).
+    ID меняются во всех колонках из USER_ID_COLUMNS.
+    """
+    
+    if not os.path.exists(db_name):
+        print("❌ База данных не найдена!")
+        return False
+    
+    try:
+        # Создаем таблицу последовательностей, если ее еще нет
+        from database import Database, WEB_USER_SEQUENCE
+        Database(db_name)
+        
+        conn = sqlite3.connect(db_name)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT user_id FROM users
+            WHERE user_id BETWEEN 0 AND 999999
+              AND COALESCE(first_name, '') = '' AND COALESCE(last_name, '') = ''
+            ORDER BY created_at, user_id
+        ''')
+        old_ids = [row[0] for row in cursor.fetchall()]
+        
+        if not old_ids:
+            print("✅ Веб-пользователей со старыми ID нет")
+            conn.close()
+            return True
+        
+        print(f"🔄 Переносим {len(old_ids)} веб-пользователей...")
+        
+        # Выделяем блок ID одной операцией
+        cursor.execute('SELECT value FROM id_sequences WHERE name = ?', (WEB_USER_SEQUENCE,))
+        last_value = cursor.fetchone()[0]
+        mapping = [(last_value - i - 1, old_id) for i, old_id in enumerate(old_ids)]
+        cursor.execute(
+            'UPDATE id_sequences SET value = ? WHERE name = ?',
+            (last_value - len(old_ids), WEB_USER_SEQUENCE)
+        )
+        
+        def has_column(table, column):
+            cursor.execute(f"PRAGMA table_info({table})")
+            return column in {row[1] for row in cursor.fetchall()}
+        
+        # Новые ID свободны, поэтому обновления не задевают первичные ключи
+        for table, column in USER_ID_COLUMNS:
+            if has_column(table, column):
+                cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE {column} = ?', mapping)
+        for table, column in TRIGGER_MOVED_COLUMNS:
+            if has_column(table, column):
+                cursor.executemany(
+                    f'DELETE FROM {table} WHERE {column} = ?', [(old_id,) for _, old_id in mapping]
+                )
+        
+        conn.commit()
+        conn.close()
+        
+        print("✅ Веб-пользователи перенесены успешно!")
+        print("ℹ️ Им потребуется заново войти в веб-приложение")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка переноса веб-пользователей: {e}")
+        return False
+
+def migrate_test_duplicates():
+    """Удаление повторных отправок тестов и создание уникального индекса"""
+    db_name = 'stepik_bot.db'
+    
+    if not os.path.exists(db_name):
+        print("❌ База данных не найдена!")
+        return False
+    
+    try:
+        conn = sqlite3.connect(db_name)
+        tests_before = conn.execute('SELECT COUNT(*) FROM tests').fetchone()[0]
+        conn.close()
+        
+        # Database при первом запуске удаляет дубликаты и создает индекс
+        from database import Database
+        db = Database(db_name)
+        db.compact_duplicate_tests()
+        
+        conn = sqlite3.connect(db_name)
+        tests_after = conn.execute('SELECT COUNT(*) FROM tests').fetchone()[0]
+        conn.close()
+        
+        if tests_before == tests_after:
+            print("✅ Повторных отправок тестов нет")
+        else:
+            print(f"✅ Удалено повторных отправок: {tests_before - tests_after} "
+                  f"(осталось тестов: {tests_after})")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка удаления повторных отправок: {e}")
+        return False
+
+def migrate_incremental_vacuum():
+    """Включение инкрементальной очистки (одноразовый VACUUM всей базы)"""
+    db_name = 'stepik_bot.db'
+    
+    if not os.path.exists(db_name):
+        print("❌ База данных не найдена!")
+        return False
+    
+    from database import Database
+    size_before = os.path.getsize(db_name)
+    if not Database(db_name).enable_incremental_vacuum():
+        print("❌ Не удалось включить инкрементальную очистку")
+        return False
+    
+    print(f"✅ Инкрементальная очистка включена (размер базы: {size_before} → {os.path.getsize(db_name)} байт)")
+    return True
+
 if __name__ == "__main__":
     print("🗄️ Миграция базы данных...")
     migrate_database()
+    migrate_test_duplicates()
+    migrate_web_user_ids()
+    migrate_incremental_vacuum()
 
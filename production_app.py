@@ -1,8 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
+from flask import (
+    Flask, render_template, request, jsonify, redirect, url_for, session, flash, g, abort, has_request_context
+)
+from werkzeug.local import LocalProxy
 from database import Database
+from utils import split_test_urls
+from roster import decode_upload, import_roster
+from gradebook import import_gradebook
+from stepik_api import StepikClient
+from metadata_cache import MetadataCache
+from search import SearchIndex
+from admission import AdmissionControl, create_rate_limiter
+from progress import ProgressReports
+from turnaround import TurnaroundTracker
+from leaderboard import Leaderboard
+from grading_queue import GradingQueue
+from feedback import FeedbackSystem, FEEDBACK_TYPES
+from tenants import SharedResources, default_tenant, load_tenants, resolve_tenant
+from storage import sqlite_path
+from typing import Dict, Optional
 import json
 import os
 import secrets
@@ -18,18 +36,123 @@ app = Flask(__name__, template_folder='templates_student')
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 app.config['DEBUG'] = os.environ.get('DEBUG', 'False').lower() == 'true'
 
-# Инициализация базы данных
-db = Database()
+def create_services(tenant: Dict, shared: Optional[SharedResources] = None) -> Dict:
+    """База и сервисы одного курса"""
+    db = Database(tenant['database'])
+    db.enable_group_commit(
+        float(os.environ.get('GROUP_COMMIT_DELAY_MS', '5')) / 1000,
+        int(os.environ.get('GROUP_COMMIT_MAX_BATCH', '256'))
+    )
+    
+    # Кеш названий уроков Степика; у нескольких курсов общие клиент и поток запросов
+    metadata_cache = MetadataCache(
+        db,
+        shared.metadata_client if shared else StepikClient(
+            os.environ.get('STEPIK_API_URL', 'https://stepik.org'),
+            os.environ.get('STEPIK_CLIENT_ID'),
+            os.environ.get('STEPIK_CLIENT_SECRET')
+        ),
+        int(os.environ.get('STEPIK_METADATA_TTL', '86400')),
+        int(os.environ.get('STEPIK_METADATA_NEGATIVE_TTL', '3600')),
+        shared.metadata_loop if shared else None
+    )
+    
+    # Ограничение частоты отправок и квоты
+    admission = AdmissionControl(
+        db,
+        create_rate_limiter(
+            db,
+            os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+            float(os.environ.get('SUBMISSION_RATE_PER_MINUTE', '6')),
+            int(os.environ.get('SUBMISSION_BURST', '3'))
+        ),
+        int(os.environ.get('MAX_TESTS_PER_STUDENT', '50')),
+        int(os.environ.get('MAX_STUDENTS', '100'))
+    )
+    
+    return {
+        'tenant': tenant,
+        'db': db,
+        'metadata_cache': metadata_cache,
+        # Полнотекстовый поиск
+        'search_index': SearchIndex(db),
+        'admission': admission,
+        # Отчеты об успеваемости с кешем по версии данных
+        'progress_reports': ProgressReports(db),
+        # Рейтинг студентов
+        'leaderboard': Leaderboard(db),
+        # Время проверки тестов и срок проверки
+        'turnaround': TurnaroundTracker(
+            db,
+            float(os.environ.get('REVIEW_SLA_HOURS', '48')),
+            int(os.environ.get('TURNAROUND_WINDOW_DAYS', '30'))
+        ),
+        # Очередь проверки с арендой тестов преподавателями
+        'grading_queue': GradingQueue(
+            db,
+            int(os.environ.get('GRADING_LEASE_SECONDS', '900')),
+            int(os.environ.get('GRADING_BATCH_SIZE', '3'))
+        ),
+        # Входящие отзывы
+        'feedback_system': FeedbackSystem(db)
+    }
+
+# Курсы (арендаторы): у каждого своя база, курс запроса выбирается по имени хоста
+if os.environ.get('TENANTS_FILE'):
+    tenants = load_tenants(
+        os.environ['TENANTS_FILE'],
+        os.environ.get('BACKUP_DIR', 'backups'),
+        os.environ.get('ANALYTICS_DIR', 'analytics')
+    )
+    shared_resources = SharedResources(
+        os.environ.get('STEPIK_API_URL', 'https://stepik.org'),
+        os.environ.get('STEPIK_CLIENT_ID'),
+        os.environ.get('STEPIK_CLIENT_SECRET')
+    )
+else:
+    # Та же база, что у веб-приложений и бота (DATABASE_URL)
+    tenants = [default_tenant(os.environ.get('BOT_TOKEN', ''), sqlite_path())]
+    shared_resources = None
+tenant_services = {tenant['name']: create_services(tenant, shared_resources) for tenant in tenants}
+
+def current_services() -> Dict:
+    """Сервисы курса текущего запроса; вне запроса - первого курса"""
+    if not has_request_context():
+        return tenant_services[tenants[0]['name']]
+    if 'tenant_services' not in g:
+        tenant = resolve_tenant(tenants, request.host)
+        if tenant is None:
+            abort(404)
+        # Ключ сессий общий для всех курсов, а ID веб-пользователей в разных
+        # курсах совпадают: сессия действует только в курсе, где выполнен вход
+        if 'user_id' in session and session.get('tenant') != tenant['name']:
+            session.clear()
+        g.tenant_services = tenant_services[tenant['name']]
+    return g.tenant_services
+
+# Обработчики обращаются к сервисам курса текущего запроса через эти имена
+db = LocalProxy(lambda: current_services()['db'])
+metadata_cache = LocalProxy(lambda: current_services()['metadata_cache'])
+search_index = LocalProxy(lambda: current_services()['search_index'])
+admission = LocalProxy(lambda: current_services()['admission'])
+progress_reports = LocalProxy(lambda: current_services()['progress_reports'])
+leaderboard = LocalProxy(lambda: current_services()['leaderboard'])
+turnaround = LocalProxy(lambda: current_services()['turnaround'])
+grading_queue = LocalProxy(lambda: current_services()['grading_queue'])
+feedback_system = LocalProxy(lambda: current_services()['feedback_system'])
 
 # Конфигурация
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
+# Токен для сборщика метрик (заголовок Authorization: Bearer <токен>); пустой - только преподаватели
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+MAX_TESTS_PER_FORM = 20
 BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
 
 @app.before_request
 def before_request():
     """Настройки для каждого запроса"""
-    # Устанавливаем заголовки безопасности
-    pass
+    # Курс определяется по хосту до обработчика: неизвестный хост получает 404
+    current_services()
 
 @app.after_request
 def after_request(response):
@@ -82,25 +205,18 @@ def register_student():
             flash('Пожалуйста, введите полное ФИО (минимум имя и фамилию)', 'error')
             return redirect(url_for('register'))
         
-        # Создаем уникальный user_id
-        user_id = abs(hash(full_name + str(os.urandom(16).hex()))) % 1000000
-        
-        # Проверяем, что такой ID не существует
-        while db.get_user(user_id):
-            user_id = abs(hash(full_name + str(os.urandom(16).hex()))) % 1000000
+        rejection = admission.check_registration()
+        if rejection:
+            flash(f'{rejection} Обратитесь к преподавателю.', 'error')
+            return redirect(url_for('register'))
         
-        success = db.add_user(
-            user_id, 
-            full_name.lower().replace(' ', '_'),
-            '',  # first_name
-            '',  # last_name
-            'student'
-        )
+        # ID выделяется из отдельной последовательности веб-пользователей
+        user_id = db.add_web_user(full_name.lower().replace(' ', '_'), 'student')
         
-        if success:
-            db.approve_user(user_id)
+        if user_id is not None:
             session['user_id'] = user_id
             session['role'] = 'student'
+            session['tenant'] = current_services()['tenant']['name']
             session['full_name'] = full_name
             flash(f'Регистрация успешна! Добро пожаловать, {full_name}!', 'success')
             return redirect(url_for('student_dashboard'))
@@ -128,25 +244,13 @@ def register_teacher():
             flash('Пожалуйста, введите полное ФИО (минимум имя и фамилию)', 'error')
             return redirect(url_for('register'))
         
-        # Создаем уникальный user_id
-        user_id = abs(hash(full_name + str(os.urandom(16).hex()))) % 1000000
-        
-        # Проверяем, что такой ID не существует
-        while db.get_user(user_id):
-            user_id = abs(hash(full_name + str(os.urandom(16).hex()))) % 1000000
+        # ID выделяется из отдельной последовательности веб-пользователей
+        user_id = db.add_web_user(full_name.lower().replace(' ', '_'), 'teacher')
         
-        success = db.add_user(
-            user_id, 
-            full_name.lower().replace(' ', '_'),
-            '',  # first_name
-            '',  # last_name
-            'teacher'
-        )
-        
-        if success:
-            db.approve_user(user_id)
+        if user_id is not None:
             session['user_id'] = user_id
             session['role'] = 'teacher'
+            session['tenant'] = current_services()['tenant']['name']
             session['full_name'] = full_name
             flash(f'Регистрация успешна! Добро пожаловать, {full_name}!', 'success')
             return redirect(url_for('teacher_dashboard'))
@@ -181,7 +285,8 @@ def student_dashboard():
                          total_tests=total_tests,
                          reviewed_tests=reviewed_tests,
                          total_score=total_score,
-                         tests=student_tests[:5])
+                         tests=student_tests[:5],
+                         leaderboard=leaderboard.get_standing(session['user_id'], top=5, radius=2))
 
 @app.route('/submit_test', methods=['GET', 'POST'])
 def submit_test():
@@ -194,7 +299,7 @@ def submit_test():
             # Получаем данные формы
             full_name = request.form.get('full_name', '').strip()
             stepik_id = request.form.get('stepik_id', '').strip()
-            test_url = request.form.get('test_url', '').strip()
+            test_urls = split_test_urls(request.form.get('test_url', ''))
             test_type = request.form.get('test_type', '').strip()
             
             # Валидация
@@ -203,35 +308,60 @@ def submit_test():
                 errors.append('ФИО обязательно')
             if not stepik_id:
                 errors.append('ID Степика обязателен')
-            if not test_url:
+            if not test_urls:
                 errors.append('Ссылка на тест обязательна')
+            if len(test_urls) > MAX_TESTS_PER_FORM:
+                errors.append(f'Не больше {MAX_TESTS_PER_FORM} ссылок за одну отправку')
             if test_type not in ['3', '5']:
                 errors.append('Тип теста должен быть 3 или 5')
             
             if errors:
                 flash('Ошибки в данных: ' + ', '.join(errors), 'error')
-                return render_template('submit_test.html')
+                return render_template('submit_test.html', idempotency_key=secrets.token_urlsafe(16))
             
-            # Сохраняем тест
-            success = db.add_test(
-                session['user_id'],
-                full_name,
-                stepik_id,
-                test_url,
-                test_type
-            )
+            # Повтор той же формы возвращает прежний результат и не расходует лимит отправок
+            idempotency_key = request.form.get('idempotency_key') or None
+            results = None
+            if idempotency_key:
+                results = db.find_idempotent_submission(session['user_id'], idempotency_key, test_urls)
+            
+            if results is None:
+                rejection = admission.check_submission(session['user_id'], len(test_urls))
+                if rejection:
+                    flash(rejection, 'warning')
+                    return render_template('submit_test.html', idempotency_key=secrets.token_urlsafe(16))
+                
+                # Сохраняем тесты одной транзакцией; повтор той же формы или ссылки не создает копию
+                results = db.submit_tests(
+                    session['user_id'],
+                    full_name,
+                    stepik_id,
+                    [(test_url, test_type) for test_url in test_urls],
+                    idempotency_key
+                ).result()
             
-            if success:
+            statuses = [result['status'] for result in results]
+            duplicates = statuses.count('duplicate')
+            if len(results) == 1 and statuses[0] == 'duplicate':
+                flash(f'Этот тест уже отправлен (тест #{results[0]["id"]}).', 'info')
+            elif len(results) == 1 and statuses[0] == 'resubmitted':
+                flash('Тест отправлен на повторную проверку.', 'success')
+            elif len(results) == 1:
                 flash('Тест успешно отправлен! Преподаватель оценит его в ближайшее время.', 'success')
-                return redirect(url_for('student_dashboard'))
+            elif duplicates == len(results):
+                flash('Все эти тесты уже отправлены.', 'info')
             else:
-                flash('Ошибка при сохранении теста.', 'error')
+                message = f'Отправлено тестов: {len(results) - duplicates} из {len(results)}.'
+                if duplicates:
+                    message += f' Уже были отправлены ранее: {duplicates}.'
+                flash(message, 'success')
+            return redirect(url_for('student_dashboard'))
                 
         except Exception as e:
             logger.error(f"Ошибка отправки теста: {e}")
             flash(f'Ошибка: {str(e)}', 'error')
     
-    return render_template('submit_test.html')
+    return render_template('submit_test.html', idempotency_key=secrets.token_urlsafe(16))
 
 @app.route('/my_results')
 def my_results():
@@ -262,16 +392,36 @@ def teacher_dashboard():
         session.clear()
         return redirect(url_for('index'))
     
-    # Получаем статистику
-    stats = db.get_statistics()
-    pending_tests = db.get_pending_tests()
-    students_scores = db.get_students_scores()
+    # Получаем статистику групп преподавателя
+    group_ids = db.get_group_scope(session['user_id'])
+    stats = db.get_statistics(group_ids)
+    pending_tests = db.get_pending_tests(group_ids)
+    students_scores = db.get_students_scores(group_ids)
     
     return render_template('teacher_dashboard.html', 
                          user_data=user_data,
                          stats=stats,
                          pending_tests=pending_tests[:5],
-                         students_scores=students_scores[:10])
+                         students_scores=students_scores[:10],
+                         progress=progress_reports.get_chart_data(group_ids=group_ids),
+                         turnaround=turnaround.get_summary(group_ids),
+                         overdue_tests=turnaround.get_overdue_tests(5, group_ids),
+                         queue=grading_queue.get_queue_stats(),
+                         my_leases=grading_queue.get_leases(session['user_id']))
+
+@app.route('/grade_next')
+def grade_next():
+    """Следующий тест из очереди проверки"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return redirect(url_for('index'))
+    
+    tests = grading_queue.claim_next(session['user_id'], test_type=request.args.get('test_type') or None,
+                                     group_ids=db.get_group_scope(session['user_id']))
+    if not tests:
+        flash('Свободных тестов в очереди нет', 'info')
+        return redirect(url_for('teacher_dashboard'))
+    
+    return redirect(url_for('evaluate_test', test_id=tests[0]['id']))
 
 @app.route('/pending_tests')
 def pending_tests():
@@ -279,7 +429,7 @@ def pending_tests():
     if 'user_id' not in session or session.get('role') != 'teacher':
         return redirect(url_for('index'))
     
-    pending_tests = db.get_pending_tests()
+    pending_tests = metadata_cache.annotate(db.get_pending_tests(db.get_group_scope(session['user_id'])))
     return render_template('pending_tests_teacher.html', tests=pending_tests)
 
 @app.route('/students_list')
@@ -288,22 +438,139 @@ def students_list():
     if 'user_id' not in session or session.get('role') != 'teacher':
         return redirect(url_for('index'))
     
-    students_scores = db.get_students_scores()
+    students_scores = db.get_students_scores(db.get_group_scope(session['user_id']))
     return render_template('students_list_teacher.html', students=students_scores)
 
+@app.route('/feedback_inbox')
+def feedback_inbox():
+    """Входящие отзывы с фильтрами, поиском и постраничным выводом по ключу"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return redirect(url_for('index'))
+    
+    filters = {
+        'type': request.args.get('type') if request.args.get('type') in FEEDBACK_TYPES else '',
+        'rating': request.args.get('rating', type=int) or '',
+        'status': request.args.get('status') if request.args.get('status') in ('processed', 'all') else 'new',
+        'q': request.args.get('q', '').strip()
+    }
+    page = feedback_system.get_feedback_inbox(
+        filters['type'] or None,
+        filters['rating'] or None,
+        {'new': False, 'processed': True, 'all': None}[filters['status']],
+        filters['q'] or None,
+        request.args.get('before', type=int),
+        50
+    )
+    return render_template('feedback_inbox.html',
+                         feedback=page['items'],
+                         next_before_id=page['next_before_id'],
+                         filters=filters,
+                         feedback_types=FEEDBACK_TYPES,
+                         stats=feedback_system.get_feedback_stats())
+
+@app.route('/feedback_inbox/process', methods=['POST'])
+def process_feedback():
+    """Массовая отметка выбранных отзывов"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return redirect(url_for('index'))
+    
+    feedback_ids = [int(value) for value in request.form.getlist('feedback_id') if value.isdigit()]
+    processed = request.form.get('action') != 'reopen'
+    changed = feedback_system.mark_feedback_processed(feedback_ids, session['user_id'], processed)
+    flash(f"{'Отмечено обработанными' if processed else 'Возвращено во входящие'}: {changed}", 'success')
+    # Возврат к списку с теми же фильтрами
+    filters = {key: request.form[key] for key in ('type', 'rating', 'status', 'q') if request.form.get(key)}
+    return redirect(url_for('feedback_inbox', **filters))
+
+@app.route('/import_roster', methods=['POST'])
+def upload_roster():
+    """Массовый импорт студентов из CSV"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return redirect(url_for('index'))
+    
+    roster_file = request.files.get('roster')
+    if not roster_file or not roster_file.filename:
+        flash('Выберите CSV-файл со списком студентов', 'error')
+        return redirect(url_for('teacher_dashboard'))
+    
+    try:
+        dry_run = request.form.get('dry_run') == 'on'
+        group_name = request.form.get('group', '').strip()
+        group_id = None
+        if group_name and not dry_run:
+            group_id = db.create_group(group_name)
+            db.add_teacher_group(session['user_id'], group_id)
+        report = import_roster(db, decode_upload(roster_file.read()).splitlines(), dry_run,
+                               admission.remaining_student_slots(), group_id)
+        
+        message = (f"Строк: {report['total_rows']}, добавлено: {report['imported']}, "
+                   f"ошибок: {len(report['errors'])} ({report['elapsed_ms']} мс)")
+        if report['errors']:
+            message += '. ' + '; '.join(
+                f"строка {error['line']}: {error['error']}" for error in report['errors'][:10]
+            )
+        if dry_run:
+            message = 'Проверка без сохранения. ' + message
+        
+        flash(message, 'warning' if report['errors'] else 'success')
+    except Exception as e:
+        logger.error(f"Ошибка импорта студентов: {e}")
+        flash(f'Ошибка: {str(e)}', 'error')
+    
+    return redirect(url_for('teacher_dashboard'))
+
+@app.route('/import_gradebook', methods=['POST'])
+def upload_gradebook():
+    """Автоматическая оценка тестов по выгрузке Степика"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return redirect(url_for('index'))
+    
+    gradebook_file = request.files.get('gradebook')
+    if not gradebook_file or not gradebook_file.filename:
+        flash('Выберите файл выгрузки Степика (CSV или XLSX)', 'error')
+        return redirect(url_for('teacher_dashboard'))
+    
+    try:
+        dry_run = request.form.get('dry_run') == 'on'
+        report = import_gradebook(db, gradebook_file.read(), gradebook_file.filename, dry_run)
+        
+        message = (f"Записей: {report['records']}, неоцененных тестов: {report['pending_tests']}, "
+                   f"пройдено: {report['matched_passed']}, не пройдено: {report['matched_not_passed']}, "
+                   f"нет в выгрузке: {report['unmatched']}")
+        if report['skipped_rows']:
+            message += (f", пропущено строк с ошибками: {report['skipped_rows']} "
+                        f"(строки {', '.join(str(line) for line in report['skipped_lines'])})")
+        if dry_run:
+            message = 'Проверка без сохранения. ' + message
+        else:
+            message += f". Оценено тестов: {report['graded']}"
+        
+        flash(message, 'success')
+    except ValueError as e:
+        flash(str(e), 'error')
+    except Exception as e:
+        logger.error(f"Ошибка импорта выгрузки: {e}")
+        flash(f'Ошибка: {str(e)}', 'error')
+    
+    return redirect(url_for('teacher_dashboard'))
+
 @app.route('/evaluate_test/<int:test_id>')
 def evaluate_test(test_id):
     """Страница оценки теста"""
     if 'user_id' not in session or session.get('role') != 'teacher':
         return redirect(url_for('index'))
     
-    pending_tests = db.get_pending_tests()
-    test = next((t for t in pending_tests if t['id'] == test_id), None)
+    test = db.get_pending_test(test_id, db.get_group_scope(session['user_id']))
     
     if not test:
         flash('Тест не найден', 'error')
         return redirect(url_for('teacher_dashboard'))
-        
+    
+    if not grading_queue.claim(test_id, session['user_id']):
+        flash('Этот тест уже проверяет другой преподаватель', 'warning')
+        return redirect(url_for('teacher_dashboard'))
+    
+    metadata_cache.annotate([test])
     return render_template('evaluate_test_teacher.html', test=test)
 
 @app.route('/submit_evaluation', methods=['POST'])
@@ -317,14 +584,15 @@ def submit_evaluation():
         score = int(request.form['score'])
         comment = request.form.get('comment', 'Оценено преподавателем')
         
-        success = db.review_test(test_id, score, comment)
+        # Оценка проходит, только если тест не забрал другой преподаватель
+        success = grading_queue.review(test_id, session['user_id'], score, comment)
         
         if success:
             flash('Тест успешно оценен!', 'success')
             return redirect(url_for('teacher_dashboard'))
         else:
-            flash('Ошибка при оценке теста', 'error')
-            return redirect(url_for('evaluate_test', test_id=test_id))
+            flash('Тест уже оценен или его проверяет другой преподаватель', 'error')
+            return redirect(url_for('teacher_dashboard'))
             
     except Exception as e:
         logger.error(f"Ошибка оценки теста: {e}")
@@ -347,6 +615,52 @@ def health_check():
         'version': '1.0.0'
     })
 
+@app.route('/api/v1/search')
+def api_search():
+    """Поиск студентов и тестов"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    
+    if not query:
+        return jsonify({'query': '', 'students': [], 'tests': [], 'elapsed_ms': 0})
+    
+    return jsonify(search_index.search(query, limit, db.get_group_scope(session['user_id'])))
+
+@app.route('/api/v1/progress')
+def api_progress():
+    """Данные об успеваемости группы для графиков"""
+    if 'user_id' not in session or session.get('role') != 'teacher':
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    try:
+        top = min(max(int(request.args.get('top', 10)), 1), 100)
+    except ValueError:
+        top = 10
+    
+    return jsonify(progress_reports.get_chart_data(top, db.get_group_scope(session['user_id'])))
+
+@app.route('/metrics')
+def metrics():
+    """Метрики приложения (для преподавателя или по токену сборщика метрик)"""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    is_teacher = 'user_id' in session and session.get('role') == 'teacher'
+    if not is_teacher and not (METRICS_TOKEN and secrets.compare_digest(token, METRICS_TOKEN)):
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    return jsonify({
+        'tenant': current_services()['tenant']['name'],
+        'writer': db.writer.get_stats() if db.writer else {},
+        'admission': admission.get_stats(),
+        'turnaround': turnaround.get_summary(),
+        'grading_queue': grading_queue.get_queue_stats()
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     return render_template('404.html'), 404
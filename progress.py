@@ -0,0 +1,239 @@
+"""
+Отчеты об успеваемости: накопленные баллы студентов, активность по неделям
+и распределение баллов группы
+"""
+
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from analytics import WEEKLY_ACTIVITY_QUERY, percentile
+from database import Database
+
+# Версия данных растет при любом изменении тестов и пользователей,
+# по ней отчет пересчитывается только после изменений
+VERSION_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('progress', 0)",
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_tests_insert AFTER INSERT ON tests BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_tests_update AFTER UPDATE ON tests BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_tests_delete AFTER DELETE ON tests BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_users_insert AFTER INSERT ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_users_update AFTER UPDATE OF role, is_approved ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_users_delete AFTER DELETE ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    ''',
+    # Отчеты строятся по группам: перевод студента без тестов тоже меняет отчет
+    '''
+    CREATE TRIGGER IF NOT EXISTS progress_version_users_group AFTER UPDATE OF group_id ON users BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'progress';
+    END
+    '''
+]
+
+PERCENTILES = [25, 50, 75, 90]
+
+
+class ProgressReports:
+    """Отчеты об успеваемости группы с кешем по версии данных.
+
+    Каждый раздел отчета считается одним сгруппированным запросом по всей
+    группе, без запросов по каждому студенту. Отчет строится по группам
+    преподавателя (``group_ids``, None - все группы); готовые отчеты
+    хранятся по набору групп, пока не изменится версия данных.
+    """
+
+    def __init__(self, db: Database, bucket_size: int = 5):
+        self.db = db
+        self.bucket_size = bucket_size
+        self._cache: Dict[Optional[Tuple[int, ...]], Dict] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'builds': 0}
+        self.setup_versioning()
+
+    def setup_versioning(self):
+        """Создание счетчика версии и триггеров"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            for statement in VERSION_SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+
+    def get_data_version(self) -> int:
+        """Текущая версия данных"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            row = connection.execute("SELECT version FROM data_versions WHERE name = 'progress'").fetchone()
+        return row[0] if row else 0
+
+    def get_report(self, group_ids: Optional[List[int]] = None) -> Dict:
+        """Отчет из кеша или новый, если данные изменились"""
+        try:
+            version = self.get_data_version()
+            key = tuple(sorted(group_ids)) if group_ids is not None else None
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None and cached['version'] == version:
+                    self.stats['hits'] += 1
+                    return cached
+                report = self._build_report(group_ids)
+                report['version'] = version
+                # Отчеты по другим группам тоже устарели
+                self._cache = {k: v for k, v in self._cache.items() if v['version'] == version}
+                self._cache[key] = report
+                self.stats['builds'] += 1
+                return report
+        except Exception as e:
+            logging.error(f"Ошибка построения отчета об успеваемости: {e}")
+            return {'version': None, 'curves': {}, 'weekly': [], 'score_histogram': {},
+                    'total_histogram': [], 'total_percentiles': {}, 'students': 0}
+
+    def _build_report(self, group_ids: Optional[List[int]] = None) -> Dict:
+        """Все разделы отчета по одному запросу на раздел"""
+        tests_condition, tests_params = Database._group_condition('group_id', group_ids)
+        users_condition, users_params = Database._group_condition('u.group_id', group_ids)
+        with sqlite3.connect(self.db.db_name) as connection:
+            cursor = connection.cursor()
+
+            # Накопленные баллы по дням проверки для всех студентов сразу
+            cursor.execute(f'''
+                SELECT student_id, MAX(full_name), date(reviewed_at) AS day,
+                       SUM(SUM(score)) OVER (PARTITION BY student_id ORDER BY date(reviewed_at))
+                FROM tests
+                WHERE is_reviewed AND reviewed_at IS NOT NULL AND student_id IS NOT NULL AND {tests_condition}
+                GROUP BY student_id, day
+                ORDER BY student_id, day
+            ''', tests_params)
+            curves: Dict[int, Dict] = {}
+            for student_id, full_name, day, cumulative in cursor.fetchall():
+                curve = curves.setdefault(student_id, {'full_name': full_name, 'points': []})
+                curve['full_name'] = full_name or curve['full_name']
+                curve['points'].append((day, cumulative))
+
+            cursor.execute(WEEKLY_ACTIVITY_QUERY.format(condition=tests_condition), tests_params * 2)
+            weekly = [
+                {'week': week, 'submissions': submissions, 'reviews': reviews, 'active_students': active}
+                for week, submissions, reviews, active in cursor.fetchall()
+            ]
+
+            cursor.execute(
+                f'SELECT score, COUNT(*) FROM tests WHERE is_reviewed AND {tests_condition} GROUP BY score ORDER BY score',
+                tests_params
+            )
+            score_histogram = {score: count for score, count in cursor.fetchall()}
+
+            # Итоговые баллы одобренных студентов, включая тех, у кого еще нет оценок
+            cursor.execute(f'''
+                SELECT COALESCE(SUM(CASE WHEN t.is_reviewed THEN t.score END), 0) AS total
+                FROM users u
+                LEFT JOIN tests t ON t.student_id = u.user_id
+                WHERE u.role = 'student' AND u.is_approved AND {users_condition}
+                GROUP BY u.user_id
+                ORDER BY total
+            ''', users_params)
+            totals = [row[0] for row in cursor.fetchall()]
+
+        return {
+            'curves': curves,
+            'weekly': weekly,
+            'score_histogram': score_histogram,
+            'total_histogram': self._bucket(totals),
+            'total_percentiles': {q: round(percentile(totals, q), 1) for q in PERCENTILES},
+            'students': len(totals)
+        }
+
+    def _bucket(self, totals: List[int]) -> List[Dict]:
+        """Гистограмма итоговых баллов по интервалам ``bucket_size``"""
+        if not totals:
+            return []
+        counts: Dict[int, int] = {}
+        for total in totals:
+            start = total // self.bucket_size * self.bucket_size
+            counts[start] = counts.get(start, 0) + 1
+        return [
+            {'from': start, 'to': start + self.bucket_size - 1, 'students': counts.get(start, 0)}
+            for start in range(min(counts), max(counts) + 1, self.bucket_size)
+        ]
+
+    def get_student_curve(self, student_id: int, group_ids: Optional[List[int]] = None) -> List:
+        """Накопленные баллы студента [(день, баллы), ...] из отчета по группам"""
+        curve = self.get_report(group_ids)['curves'].get(student_id)
+        return curve['points'] if curve else []
+
+    def get_chart_data(self, top: int = 10, group_ids: Optional[List[int]] = None) -> Dict:
+        """Данные для графиков панели преподавателя"""
+        report = self.get_report(group_ids)
+        leaders = sorted(report['curves'].items(), key=lambda item: item[1]['points'][-1][1], reverse=True)
+        return {
+            'weeks': [week['week'] for week in report['weekly']],
+            'submissions': [week['submissions'] for week in report['weekly']],
+            'reviews': [week['reviews'] for week in report['weekly']],
+            'score_labels': [str(score) for score in report['score_histogram']],
+            'score_counts': list(report['score_histogram'].values()),
+            'total_labels': [f"{bucket['from']}–{bucket['to']}" for bucket in report['total_histogram']],
+            'total_counts': [bucket['students'] for bucket in report['total_histogram']],
+            'curves': [
+                {
+                    'label': curve['full_name'] or f"Студент #{student_id}",
+                    'points': [{'x': day, 'y': score} for day, score in curve['points']]
+                }
+                for student_id, curve in leaders[:top]
+            ],
+            'percentiles': report['total_percentiles']
+        }
+
+
+def format_progress_summary(report: Dict, weeks: int = 4) -> str:
+    """Сводка успеваемости для бота"""
+    if not report.get('students'):
+        return ""
+
+    percentiles = report['total_percentiles']
+    text = "\n📈 <b>Успеваемость группы:</b>\n"
+    text += (f"• Итоговые баллы: медиана {percentiles[50]}, "
+             f"25–75%: {percentiles[25]}–{percentiles[75]}, 90%: {percentiles[90]}\n")
+    if report['score_histogram']:
+        text += "• Оценки: " + ', '.join(
+            f"{score} — {count}" for score, count in report['score_histogram'].items()
+        ) + "\n"
+    if report['weekly']:
+        text += "• По неделям (отправлено/проверено):\n"
+        for week in report['weekly'][-weeks:]:
+            text += f"  {week['week']}: {week['submissions']}/{week['reviews']}\n"
+    return text
+
+
+def format_student_curve(points: List, limit: int = 6) -> str:
+    """Динамика накопленных баллов студента для бота"""
+    if not points:
+        return ""
+    shown = points[-limit:]
+    return "📈 <b>Динамика баллов:</b> " + " → ".join(
+        f"{day[8:10]}.{day[5:7]}: {score}" for day, score in shown
+    ) + "\n"
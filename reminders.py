@@ -0,0 +1,377 @@
+"""
+Сроки сдачи и напоминания студентам, которые еще не отправили тест
+"""
+
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from admission import TokenBucket
+from database import Database
+from utils import normalize_stepik_url
+
+REMINDER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS deadlines (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        test_url_norm TEXT NOT NULL,
+        group_id INTEGER,
+        due_at TIMESTAMP NOT NULL,
+        remind_at TIMESTAMP NOT NULL,
+        reminded_at TIMESTAMP,
+        reminded_students INTEGER NOT NULL DEFAULT 0,
+        created_by INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_deadlines_remind ON deadlines (reminded_at, remind_at)',
+    # Очередь доставки: строка на студента, поэтому повторный запуск
+    # после перезапуска бота не отправляет напоминание дважды
+    '''
+    CREATE TABLE IF NOT EXISTS reminder_deliveries (
+        deadline_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        notified BOOLEAN NOT NULL DEFAULT FALSE,
+        sent_at TIMESTAMP,
+        PRIMARY KEY (deadline_id, student_id)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_reminder_deliveries_status ON reminder_deliveries (status, deadline_id)',
+    'CREATE INDEX IF NOT EXISTS idx_tests_url_student ON tests (test_url_norm, student_id)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS deadline_deleted AFTER DELETE ON deadlines BEGIN
+        DELETE FROM reminder_deliveries WHERE deadline_id = old.id;
+    END
+    '''
+]
+
+# Студенты группы срока, которые не отправили ни одного теста по ссылке.
+# Срок на урок покрывает и отправки отдельных шагов урока.
+MISSING_STUDENTS_QUERY = '''
+    SELECT u.user_id FROM users u, deadlines d
+    WHERE d.id = :deadline_id AND u.role = 'student' AND u.is_approved
+      AND (d.group_id IS NULL OR u.group_id = d.group_id)
+    EXCEPT
+    SELECT t.student_id FROM tests t, deadlines d
+    WHERE d.id = :deadline_id
+      AND (t.test_url_norm = d.test_url_norm
+           OR substr(t.test_url_norm, 1, length(d.test_url_norm) + 1) = d.test_url_norm || '/')
+'''
+
+DEADLINE_COLUMNS = '''
+    d.id, d.title, d.test_url_norm, d.group_id, d.due_at, d.remind_at, d.reminded_at,
+    d.reminded_students, g.name
+'''
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+MAX_ATTEMPTS = 3
+
+
+def parse_due_at(date_text: str, time_text: Optional[str] = None) -> Optional[datetime]:
+    """Срок из 'ГГГГ-ММ-ДД' и необязательного 'ЧЧ:ММ'; без времени - конец дня"""
+    try:
+        if time_text:
+            return datetime.strptime(f'{date_text} {time_text}', '%Y-%m-%d %H:%M')
+        return datetime.strptime(date_text, '%Y-%m-%d').replace(hour=23, minute=59)
+    except ValueError:
+        return None
+
+
+def format_reminder(deadline: Dict) -> str:
+    """Текст напоминания студенту"""
+    return (f"⏰ <b>Напоминание о сроке</b>\n\n"
+            f"До {deadline['due_at'][:16]} нужно отправить тест «{deadline['title']}».\n"
+            f"🔗 {deadline['test_url_norm']}\n\n"
+            f"Если тест уже выполнен, отправьте ссылку на него боту.")
+
+
+class ReminderScheduler:
+    """Напоминания о сроках сдачи.
+
+    Когда подходит время напоминания, студенты без отправки выбираются
+    одним запросом с EXCEPT и одной вставкой попадают в очередь доставки
+    вместе с уведомлениями в приложении. Очередь разбирается порциями,
+    а частоту сообщений в Телеграм ограничивает общий TokenBucket.
+    Веб-студенты (отрицательные ID) получают только уведомление в приложении.
+    """
+
+    def __init__(self, db: Database, send: Optional[Callable[[int, str], Awaitable]] = None,
+                 remind_before_hours: float = 24, messages_per_second: float = 25,
+                 batch_size: int = 100):
+        self.db = db
+        self.send = send
+        self.remind_before_hours = remind_before_hours
+        self.batch_size = batch_size
+        # Телеграм допускает около 30 сообщений в секунду на бота
+        self.limiter = TokenBucket(messages_per_second * 60, max(1, int(messages_per_second)))
+        self.setup_reminders()
+
+    def setup_reminders(self):
+        """Создание таблиц сроков и очереди доставки"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            for statement in REMINDER_SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+
+    def add_deadline(self, title: str, test_url: str, due_at: datetime, group_id: Optional[int] = None,
+                     created_by: Optional[int] = None, remind_before_hours: Optional[float] = None) -> Optional[int]:
+        """Добавление срока; напоминание уходит за ``remind_before_hours`` до него"""
+        hours = self.remind_before_hours if remind_before_hours is None else remind_before_hours
+        remind_at = due_at - timedelta(hours=hours)
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    INSERT INTO deadlines (title, test_url_norm, group_id, due_at, remind_at, created_by)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (title, normalize_stepik_url(test_url), group_id, due_at.strftime(TIME_FORMAT),
+                      remind_at.strftime(TIME_FORMAT), created_by))
+                connection.commit()
+                return cursor.lastrowid
+        except Exception as e:
+            logging.error(f"Ошибка добавления срока: {e}")
+            return None
+
+    def delete_deadline(self, deadline_id: int) -> bool:
+        """Удаление срока вместе с его очередью доставки"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.execute('DELETE FROM deadlines WHERE id = ?', (deadline_id,))
+                connection.commit()
+                return cursor.rowcount > 0
+        except Exception as e:
+            logging.error(f"Ошибка удаления срока: {e}")
+            return False
+
+    def get_deadline(self, deadline_id: int) -> Optional[Dict]:
+        """Срок по ID"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                row = connection.execute(f'''
+                    SELECT {DEADLINE_COLUMNS} FROM deadlines d
+                    LEFT JOIN student_groups g ON g.id = d.group_id
+                    WHERE d.id = ?
+                ''', (deadline_id,)).fetchone()
+            return self._to_dict(row) if row else None
+        except Exception as e:
+            logging.error(f"Ошибка получения срока: {e}")
+            return None
+
+    def get_deadlines(self, upcoming_only: bool = True, group_ids: Optional[List[int]] = None,
+                      now: Optional[datetime] = None) -> List[Dict]:
+        """Сроки по возрастанию даты с числом студентов, которые еще не сдали"""
+        now = now or datetime.now()
+        group_condition, group_params = Database._group_condition('d.group_id', group_ids)
+        if group_ids is not None:
+            group_condition = f'(d.group_id IS NULL OR {group_condition})'
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute(f'''
+                    SELECT {DEADLINE_COLUMNS} FROM deadlines d
+                    LEFT JOIN student_groups g ON g.id = d.group_id
+                    WHERE {group_condition} {'AND d.due_at > ?' if upcoming_only else ''}
+                    ORDER BY d.due_at, d.id
+                ''', group_params + ([now.strftime(TIME_FORMAT)] if upcoming_only else [])).fetchall()
+                deadlines = [self._to_dict(row) for row in rows]
+                for deadline in deadlines:
+                    deadline['missing'] = connection.execute(
+                        f'SELECT COUNT(*) FROM ({MISSING_STUDENTS_QUERY})', {'deadline_id': deadline['id']}
+                    ).fetchone()[0]
+            return deadlines
+        except Exception as e:
+            logging.error(f"Ошибка получения сроков: {e}")
+            return []
+
+    def get_missing_students(self, deadline_id: int) -> List[int]:
+        """Студенты, которые еще не отправили тест к сроку"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute(
+                    f'{MISSING_STUDENTS_QUERY} ORDER BY 1', {'deadline_id': deadline_id}
+                ).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logging.error(f"Ошибка выбора студентов без отправки: {e}")
+            return []
+
+    def enqueue_due(self, now: Optional[datetime] = None, deadline_id: Optional[int] = None) -> int:
+        """Постановка в очередь напоминаний по срокам, для которых подошло время.
+
+        С ``deadline_id`` срок ставится в очередь сразу, не дожидаясь
+        времени напоминания. Возвращает число поставленных напоминаний.
+        """
+        now_text = (now or datetime.now()).strftime(TIME_FORMAT)
+
+        def operation(cursor):
+            if deadline_id is None:
+                cursor.execute('''
+                    SELECT id, title, test_url_norm, due_at FROM deadlines
+                    WHERE reminded_at IS NULL AND remind_at <= ? AND due_at > ?
+                ''', (now_text, now_text))
+            else:
+                cursor.execute('SELECT id, title, test_url_norm, due_at FROM deadlines WHERE id = ?',
+                               (deadline_id,))
+            queued = 0
+            for row in cursor.fetchall():
+                deadline = {'id': row[0], 'title': row[1], 'test_url_norm': row[2], 'due_at': row[3]}
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO reminder_deliveries (deadline_id, student_id, status)
+                    SELECT :deadline_id, user_id, CASE WHEN user_id > 0 THEN 'queued' ELSE 'in_app' END
+                    FROM ({MISSING_STUDENTS_QUERY})
+                ''', {'deadline_id': deadline['id']})
+                added = cursor.rowcount
+                # Уведомление в приложении - только студентам, впервые попавшим в очередь
+                cursor.execute('''
+                    INSERT INTO notifications (user_id, message, notification_type)
+                    SELECT student_id, ?, 'warning' FROM reminder_deliveries
+                    WHERE deadline_id = ? AND NOT notified
+                ''', (format_reminder(deadline), deadline['id']))
+                cursor.execute(
+                    'UPDATE reminder_deliveries SET notified = TRUE WHERE deadline_id = ? AND NOT notified',
+                    (deadline['id'],)
+                )
+                cursor.execute('''
+                    UPDATE deadlines SET reminded_at = ?, reminded_students = reminded_students + ?
+                    WHERE id = ?
+                ''', (now_text, added, deadline['id']))
+                queued += added
+            return queued
+
+        try:
+            return self.db.run_write(operation).result()
+        except Exception as e:
+            logging.error(f"Ошибка постановки напоминаний в очередь: {e}")
+            return 0
+
+    def _next_batch(self) -> List[Dict]:
+        """Очередная порция сообщений в Телеграм"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            rows = connection.execute('''
+                SELECT r.deadline_id, r.student_id, d.title, d.test_url_norm, d.due_at
+                FROM reminder_deliveries r
+                JOIN deadlines d ON d.id = r.deadline_id
+                WHERE r.status = 'queued'
+                ORDER BY r.deadline_id, r.student_id
+                LIMIT ?
+            ''', (self.batch_size,)).fetchall()
+        return [{'deadline_id': row[0], 'student_id': row[1], 'title': row[2],
+                 'test_url_norm': row[3], 'due_at': row[4]} for row in rows]
+
+    def _record_batch(self, sent: List[tuple], failed: List[tuple]):
+        """Итоги порции одной транзакцией записи"""
+        def operation(cursor):
+            cursor.executemany('''
+                UPDATE reminder_deliveries SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP
+                WHERE deadline_id = ? AND student_id = ?
+            ''', sent)
+            cursor.executemany('''
+                UPDATE reminder_deliveries
+                SET attempts = attempts + 1,
+                    status = CASE WHEN ? OR attempts + 1 >= ? THEN 'failed' ELSE 'queued' END
+                WHERE deadline_id = ? AND student_id = ?
+            ''', [(permanent, MAX_ATTEMPTS, deadline, student) for deadline, student, permanent in failed])
+
+        self.db.run_write(operation).result()
+
+    async def _acquire(self):
+        """Ожидание разрешения ограничителя на одно сообщение"""
+        while True:
+            allowed, retry_after = self.limiter.consume('telegram')
+            if allowed:
+                return
+            await asyncio.sleep(retry_after)
+
+    async def deliver_pending(self) -> Dict:
+        """Отправка очереди напоминаний в Телеграм порциями"""
+        report = {'sent': 0, 'failed': 0}
+        if self.send is None:
+            return report
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await loop.run_in_executor(None, self._next_batch)
+            if not batch:
+                break
+            sent, failed = [], []
+            for delivery in batch:
+                await self._acquire()
+                key = (delivery['deadline_id'], delivery['student_id'])
+                try:
+                    await self.send(delivery['student_id'], format_reminder(delivery))
+                    sent.append(key)
+                except RetryAfter as e:
+                    # Телеграм просит подождать: остаток порции остается в очереди без попытки
+                    retry_after = e.retry_after
+                    if isinstance(retry_after, timedelta):
+                        retry_after = retry_after.total_seconds()
+                    await asyncio.sleep(retry_after)
+                    break
+                except Exception as e:
+                    # Студент заблокировал бота или чат не найден - повтор не поможет
+                    failed.append(key + (isinstance(e, (Forbidden, BadRequest)),))
+                    logging.error(f"Ошибка отправки напоминания {delivery['student_id']}: {e}")
+            await loop.run_in_executor(None, self._record_batch, sent, failed)
+            report['sent'] += len(sent)
+            report['failed'] += len(failed)
+        return report
+
+    def get_delivery_stats(self, deadline_id: int) -> Dict[str, int]:
+        """Состояние доставки напоминаний по сроку"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                return dict(connection.execute(
+                    'SELECT status, COUNT(*) FROM reminder_deliveries WHERE deadline_id = ? GROUP BY status',
+                    (deadline_id,)
+                ).fetchall())
+        except Exception as e:
+            logging.error(f"Ошибка получения статистики напоминаний: {e}")
+            return {}
+
+    async def run_forever(self, interval: float = 60):
+        """Проверка сроков и отправка напоминаний в фоне"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.enqueue_due)
+                await self.deliver_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка фоновой отправки напоминаний: {e}")
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _to_dict(row) -> Dict:
+        return {
+            'id': row[0],
+            'title': row[1],
+            'test_url_norm': row[2],
+            'group_id': row[3],
+            'due_at': row[4],
+            'remind_at': row[5],
+            'reminded_at': row[6],
+            'reminded_students': row[7],
+            'group_name': row[8]
+        }
+
+
+def format_deadlines(deadlines: List[Dict]) -> str:
+    """Список сроков для сообщения бота"""
+    if not deadlines:
+        return "📆 Сроков сдачи нет."
+
+    text = "📆 <b>Сроки сдачи:</b>\n\n"
+    for deadline in deadlines:
+        group = f", группа {deadline['group_name']}" if deadline['group_id'] else ""
+        status = (f"напомнили {deadline['reminded_students']}" if deadline['reminded_at']
+                  else f"напоминание {deadline['remind_at'][:16]}")
+        text += (f"#{deadline['id']} {deadline['title']}{group}\n"
+                 f"   до {deadline['due_at'][:16]}, не сдали {deadline.get('missing', 0)}, {status}\n")
+    return text
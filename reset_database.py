@@ -14,8 +14,14 @@ def reset_database():
     
     print("🗑️ Сброс базы данных...")
     
-    # Удаляем старую базу данных
+    # Удаляем старую базу данных, предварительно сохранив копию
     if os.path.exists(db_name):
+        from backup import BackupManager
+        report = BackupManager(db_name).create_backup('before-reset')
+        if report['error']:
+            print(f"❌ Не удалось сохранить копию базы, сброс отменен: {report['error']}")
+            return False
+        print(f"💾 Копия сохранена: {report['path']}")
         os.remove(db_name)
         print(f"✅ Удален файл: {db_name}")
     else:
@@ -0,0 +1,135 @@
+"""
+Массовый импорт списка студентов из CSV
+"""
+
+import csv
+import itertools
+import logging
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database import Database
+from utils import validate_full_name, validate_stepik_id
+
+# Допустимые заголовки колонок
+NAME_COLUMNS = {'фио', 'full_name', 'name', 'имя', 'студент', 'фамилия имя', 'фамилия имя отчество'}
+STEPIK_ID_COLUMNS = {'id степика', 'stepik_id', 'stepik id', 'stepik', 'степик id'}
+
+
+def decode_upload(data: bytes) -> str:
+    """Декодирование загруженного файла (UTF-8 или Windows-1251 из Excel)"""
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251')
+
+
+def iter_roster_rows(lines: Iterable[str]) -> Iterator[Tuple[int, str, str]]:
+    """Потоковый разбор CSV: (номер строки, ФИО, ID Степика)"""
+    lines = iter(lines)
+    first_line = next((line for line in lines if line.strip()), None)
+    if first_line is None:
+        return
+
+    # Excel в русской локали сохраняет CSV через точку с запятой
+    delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+    rows = csv.reader(itertools.chain([first_line], lines), delimiter=delimiter)
+
+    header_row = next(rows)
+    header = [cell.strip().lower() for cell in header_row]
+    name_index = next((i for i, cell in enumerate(header) if cell in NAME_COLUMNS), None)
+    stepik_index = next((i for i, cell in enumerate(header) if cell in STEPIK_ID_COLUMNS), None)
+    first_number = 2
+
+    if name_index is None:
+        # Файл без заголовка: первая колонка - ФИО, вторая - ID Степика
+        name_index, stepik_index = 0, 1
+        rows = itertools.chain([header_row], rows)
+        first_number = 1
+
+    for line_number, row in enumerate(rows, first_number):
+        if not any(cell.strip() for cell in row):
+            continue
+        full_name = row[name_index].strip() if name_index < len(row) else ''
+        stepik_id = ''
+        if stepik_index is not None and stepik_index < len(row):
+            stepik_id = row[stepik_index].strip()
+        yield line_number, full_name, stepik_id
+
+
+def import_roster(db: Database, lines: Iterable[str], dry_run: bool = False,
+                  limit: Optional[int] = None, group_id: Optional[int] = None) -> Dict:
+    """Импорт студентов: проверка строк и вставка одной транзакцией
+
+    limit - сколько студентов еще можно добавить (None - без ограничения),
+    group_id - группа, в которую попадают все студенты файла.
+    """
+    started = time.perf_counter()
+    existing_stepik_ids = db.get_stepik_ids()
+
+    students: List[Tuple[str, str, str, Optional[str]]] = []
+    errors: List[Dict] = []
+    total_rows = 0
+
+    for line_number, full_name, stepik_id in iter_roster_rows(lines):
+        total_rows += 1
+
+        if not validate_full_name(full_name):
+            errors.append({'line': line_number, 'error': f"Некорректное ФИО: {full_name or '—'}"})
+            continue
+        if stepik_id and not validate_stepik_id(stepik_id):
+            errors.append({'line': line_number, 'error': f"Некорректный ID Степика: {stepik_id}"})
+            continue
+        if stepik_id and stepik_id in existing_stepik_ids:
+            errors.append({'line': line_number, 'error': f"Студент с ID Степика {stepik_id} уже есть"})
+            continue
+        if limit is not None and len(students) >= limit:
+            errors.append({'line': line_number, 'error': "Превышено максимальное число студентов"})
+            continue
+
+        if stepik_id:
+            existing_stepik_ids.add(stepik_id)
+        parts = full_name.split()
+        students.append((
+            full_name.lower().replace(' ', '_'),
+            ' '.join(parts[1:]),  # first_name
+            parts[0],  # last_name
+            stepik_id or None
+        ))
+
+    imported = 0
+    if students and not dry_run:
+        imported = db.add_web_students(students, group_id)
+        if imported == 0:
+            errors.append({'line': 0, 'error': "Ошибка сохранения студентов в базу данных"})
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logging.info(f"Импорт списка: {total_rows} строк, {imported} добавлено, "
+                 f"{len(errors)} ошибок, {elapsed_ms:.1f} мс")
+
+    return {
+        'total_rows': total_rows,
+        'valid_rows': len(students),
+        'imported': imported,
+        'errors': errors,
+        'dry_run': dry_run,
+        'elapsed_ms': round(elapsed_ms, 1)
+    }
+
+
+def format_import_report(report: Dict, max_errors: int = 10) -> str:
+    """Текстовый отчет об импорте"""
+    text = "📥 <b>Импорт студентов</b>\n\n"
+    text += f"📄 Строк в файле: {report['total_rows']}\n"
+    text += f"✅ Добавлено: {report['imported']}\n"
+    text += f"❌ Ошибок: {len(report['errors'])}\n"
+    text += f"⏱ Время: {report['elapsed_ms']} мс\n"
+
+    if report['errors']:
+        text += "\n<b>Ошибки:</b>\n"
+        for error in report['errors'][:max_errors]:
+            text += f"• Строка {error['line']}: {error['error']}\n"
+        if len(report['errors']) > max_errors:
+            text += f"... и еще {len(report['errors']) - max_errors}\n"
+
+    return text
@@ -0,0 +1,255 @@
+"""
+Полнотекстовый поиск по студентам и тестам
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from database import Database
+
+# Поля поиска: ФИО, ID Степика, имя пользователя, комментарий преподавателя
+SEARCH_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_users USING fts5(
+        full_name, stepik_id, username, role UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_tests USING fts5(
+        full_name, stepik_id, teacher_comment,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+    # rowid индексов совпадает с ID пользователя и теста. INSERT OR REPLACE
+    # в users не вызывает триггер удаления, поэтому запись индекса заменяется
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_users_insert AFTER INSERT ON users BEGIN
+        INSERT OR REPLACE INTO search_users (rowid, full_name, stepik_id, username, role)
+        VALUES (new.user_id, TRIM(COALESCE(new.last_name, '') || ' ' || COALESCE(new.first_name, '')),
+                COALESCE(new.stepik_id, ''), COALESCE(new.username, ''), new.role);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_users_update
+    AFTER UPDATE OF user_id, username, first_name, last_name, stepik_id, role ON users BEGIN
+        DELETE FROM search_users WHERE rowid = old.user_id;
+        INSERT INTO search_users (rowid, full_name, stepik_id, username, role)
+        VALUES (new.user_id, TRIM(COALESCE(new.last_name, '') || ' ' || COALESCE(new.first_name, '')),
+                COALESCE(new.stepik_id, ''), COALESCE(new.username, ''), new.role);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_users_delete AFTER DELETE ON users BEGIN
+        DELETE FROM search_users WHERE rowid = old.user_id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_tests_insert AFTER INSERT ON tests BEGIN
+        INSERT INTO search_tests (rowid, full_name, stepik_id, teacher_comment)
+        VALUES (new.id, COALESCE(new.full_name, ''), COALESCE(new.stepik_id, ''),
+                COALESCE(new.teacher_comment, ''));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_tests_update
+    AFTER UPDATE OF full_name, stepik_id, teacher_comment ON tests BEGIN
+        DELETE FROM search_tests WHERE rowid = old.id;
+        INSERT INTO search_tests (rowid, full_name, stepik_id, teacher_comment)
+        VALUES (new.id, COALESCE(new.full_name, ''), COALESCE(new.stepik_id, ''),
+                COALESCE(new.teacher_comment, ''));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_tests_delete AFTER DELETE ON tests BEGIN
+        DELETE FROM search_tests WHERE rowid = old.id;
+    END
+    '''
+]
+
+
+class SearchIndex:
+    """Поиск по FTS5-индексу, который триггеры держат в актуальном состоянии.
+
+    Если SQLite собран без FTS5, используется медленный поиск через LIKE.
+    Результаты последних запросов кешируются на ``cache_ttl`` секунд.
+    """
+
+    def __init__(self, db: Database, cache_ttl: float = 30, cache_size: int = 256):
+        self.db = db
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.fts_enabled = False
+        self._cache: "OrderedDict[Tuple, Tuple[float, Dict]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.setup_search_index()
+
+    def setup_search_index(self):
+        """Создание индекса и триггеров; первичное заполнение при создании"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE name = 'search_users'")
+                created = cursor.fetchone() is None
+
+                for statement in SEARCH_SCHEMA:
+                    cursor.execute(statement)
+
+                if created:
+                    cursor.execute('''
+                        INSERT INTO search_users (rowid, full_name, stepik_id, username, role)
+                        SELECT user_id, TRIM(COALESCE(last_name, '') || ' ' || COALESCE(first_name, '')),
+                               COALESCE(stepik_id, ''), COALESCE(username, ''), role
+                        FROM users
+                    ''')
+                    cursor.execute('''
+                        INSERT INTO search_tests (rowid, full_name, stepik_id, teacher_comment)
+                        SELECT id, COALESCE(full_name, ''), COALESCE(stepik_id, ''),
+                               COALESCE(teacher_comment, '')
+                        FROM tests
+                    ''')
+                connection.commit()
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"FTS5 недоступен, поиск будет работать через LIKE: {e}")
+
+    @staticmethod
+    def build_match_query(text: str) -> str:
+        """Запрос FTS5: все слова как префиксы"""
+        terms = re.findall(r'\w+', text.lower())
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, text: str, limit: int = 20, group_ids: Optional[List[int]] = None) -> Dict:
+        """Поиск студентов и тестов по ФИО, ID Степика, логину и комментариям
+
+        ``group_ids`` ограничивает поиск группами преподавателя (None - все группы).
+        """
+        text = text.strip()
+        key = (text.lower(), limit, tuple(sorted(group_ids)) if group_ids is not None else None)
+        now = time.monotonic()
+
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > now:
+                self._cache.move_to_end(key)
+                return entry[1]
+
+        started = time.perf_counter()
+        if self.fts_enabled:
+            students, tests = self._search_fts(text, limit, group_ids)
+        else:
+            students, tests = self._search_like(text, limit, group_ids)
+
+        result = {
+            'query': text,
+            'students': students,
+            'tests': tests,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+        }
+
+        with self._cache_lock:
+            self._cache[key] = (now + self.cache_ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return result
+
+    def _search_fts(self, text: str, limit: int,
+                    group_ids: Optional[List[int]] = None) -> Tuple[List[Dict], List[Dict]]:
+        match = self.build_match_query(text)
+        if not match:
+            return [], []
+
+        users_condition, users_params = Database._group_condition('u.group_id', group_ids)
+        tests_condition, tests_params = Database._group_condition('t.group_id', group_ids)
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute(f'''
+                    SELECT u.user_id, u.first_name, u.last_name, u.username, u.stepik_id
+                    FROM search_users s
+                    JOIN users u ON u.user_id = s.rowid
+                    WHERE search_users MATCH ? AND s.role = 'student' AND {users_condition}
+                    ORDER BY s.rank
+                    LIMIT ?
+                ''', [match] + users_params + [limit])
+                students = [self._student(row) for row in cursor.fetchall()]
+
+                cursor.execute(f'''
+                    SELECT t.id, t.student_id, t.full_name, t.stepik_id, t.test_url,
+                           t.is_reviewed, t.score, t.teacher_comment
+                    FROM search_tests s
+                    JOIN tests t ON t.id = s.rowid
+                    WHERE search_tests MATCH ? AND {tests_condition}
+                    ORDER BY s.rank
+                    LIMIT ?
+                ''', [match] + tests_params + [limit])
+                tests = [self._test(row) for row in cursor.fetchall()]
+
+                return students, tests
+        except Exception as e:
+            logging.error(f"Ошибка полнотекстового поиска: {e}")
+            return [], []
+
+    def _search_like(self, text: str, limit: int,
+                     group_ids: Optional[List[int]] = None) -> Tuple[List[Dict], List[Dict]]:
+        if not text:
+            return [], []
+
+        pattern = f'%{text}%'
+        group_condition, group_params = Database._group_condition('group_id', group_ids)
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute(f'''
+                    SELECT user_id, first_name, last_name, username, stepik_id
+                    FROM users
+                    WHERE role = 'student' AND {group_condition}
+                      AND (last_name || ' ' || first_name LIKE ? OR username LIKE ? OR stepik_id LIKE ?)
+                    LIMIT ?
+                ''', group_params + [pattern, pattern, pattern, limit])
+                students = [self._student(row) for row in cursor.fetchall()]
+
+                cursor.execute(f'''
+                    SELECT id, student_id, full_name, stepik_id, test_url,
+                           is_reviewed, score, teacher_comment
+                    FROM tests
+                    WHERE {group_condition}
+                      AND (full_name LIKE ? OR stepik_id LIKE ? OR teacher_comment LIKE ?)
+                    ORDER BY submitted_at DESC
+                    LIMIT ?
+                ''', group_params + [pattern, pattern, pattern, limit])
+                tests = [self._test(row) for row in cursor.fetchall()]
+
+                return students, tests
+        except Exception as e:
+            logging.error(f"Ошибка поиска: {e}")
+            return [], []
+
+    @staticmethod
+    def _student(row) -> Dict:
+        return {
+            'user_id': row[0],
+            'full_name': f"{row[2] or ''} {row[1] or ''}".strip() or row[3],
+            'username': row[3],
+            'stepik_id': row[4]
+        }
+
+    @staticmethod
+    def _test(row) -> Dict:
+        return {
+            'id': row[0],
+            'student_id': row[1],
+            'full_name': row[2],
+            'stepik_id': row[3],
+            'test_url': row[4],
+            'is_reviewed': bool(row[5]),
+            'score': row[6],
+            'teacher_comment': row[7]
+        }
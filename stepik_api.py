@@ -0,0 +1,178 @@
+"""
+Асинхронный клиент API Степика
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class StepikAPIError(Exception):
+    """Ошибка обращения к API Степика"""
+
+
+class StepikClient:
+    """Клиент API Степика с пулом соединений, ограничением параллельности,
+    кешированием ответов и повторами с экспоненциальной задержкой.
+
+    Клиент привязан к циклу событий, в котором был сделан первый запрос.
+    """
+
+    def __init__(self, base_url: str = 'https://stepik.org', client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None, max_concurrency: int = 8,
+                 cache_ttl: float = 300, max_retries: int = 3, backoff: float = 0.5,
+                 timeout: float = 10, max_cache_entries: int = 4096):
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.max_concurrency = max_concurrency
+        self.cache_ttl = cache_ttl
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_cache_entries = max_cache_entries
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._cache: Dict[Tuple, Tuple[float, Any]] = {}
+        self._token: Optional[str] = None
+        self._token_expires = 0.0
+        self.stats = {
+            'requests': 0,
+            'cache_hits': 0,
+            'retries': 0,
+            'errors': 0,
+            'total_latency_ms': 0.0
+        }
+
+    def _ensure_client(self) -> httpx.AsyncClient:
+        """Ленивое создание пула соединений внутри работающего цикла событий"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def close(self):
+        """Закрытие пула соединений"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    async def _authorize(self) -> Dict[str, str]:
+        """Заголовок авторизации OAuth2 (client credentials), если заданы ключи"""
+        if not self.client_id or not self.client_secret:
+            return {}
+
+        if self._token is None or time.monotonic() >= self._token_expires:
+            response = await self._ensure_client().post(
+                '/oauth2/token/',
+                data={'grant_type': 'client_credentials'},
+                auth=(self.client_id, self.client_secret)
+            )
+            if response.status_code != 200:
+                raise StepikAPIError(f"Ошибка авторизации в API Степика: {response.status_code}")
+            payload = response.json()
+            self._token = payload['access_token']
+            # Обновляем токен заранее, за минуту до истечения
+            self._token_expires = time.monotonic() + payload.get('expires_in', 36000) - 60
+
+        return {'Authorization': f'Bearer {self._token}'}
+
+    def _cache_get(self, key: Tuple) -> Optional[Any]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, data = entry
+        if time.monotonic() >= expires:
+            del self._cache[key]
+            return None
+        return data
+
+    def _cache_put(self, key: Tuple, data: Any):
+        if len(self._cache) >= self.max_cache_entries:
+            now = time.monotonic()
+            for stale_key in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+                del self._cache[stale_key]
+            if len(self._cache) >= self.max_cache_entries:
+                # Вытесняем самые старые записи
+                for old_key in list(self._cache)[:self.max_cache_entries // 4]:
+                    del self._cache[old_key]
+        self._cache[key] = (time.monotonic() + self.cache_ttl, data)
+
+    async def get(self, path: str, params: Optional[Dict] = None, use_cache: bool = True) -> Any:
+        """GET-запрос к API с кешированием и повторами"""
+        key = (path, tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in (params or {}).items()
+        )))
+        if use_cache:
+            cached = self._cache_get(key)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                return cached
+
+        client = self._ensure_client()
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats['retries'] += 1
+            delay = self.backoff * (2 ** attempt)
+
+            async with self._semaphore:
+                started = time.perf_counter()
+                try:
+                    headers = await self._authorize()
+                    response = await client.get(path, params=params, headers=headers)
+                except httpx.TransportError as e:
+                    last_error = e
+                    response = None
+                finally:
+                    self.stats['requests'] += 1
+                    self.stats['total_latency_ms'] += (time.perf_counter() - started) * 1000
+
+            if response is not None:
+                if response.status_code == 200:
+                    data = response.json()
+                    if use_cache:
+                        self._cache_put(key, data)
+                    return data
+                if response.status_code == 401:
+                    # Токен мог истечь раньше срока
+                    self._token = None
+                if response.status_code not in RETRY_STATUSES | {401}:
+                    self.stats['errors'] += 1
+                    raise StepikAPIError(f"API Степика вернул {response.status_code} для {path}")
+                last_error = StepikAPIError(f"API Степика вернул {response.status_code} для {path}")
+                retry_after = response.headers.get('Retry-After')
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+
+        self.stats['errors'] += 1
+        logging.warning(f"Запрос к API Степика не удался после {self.max_retries + 1} попыток: {last_error}")
+        raise StepikAPIError(str(last_error))
+
+    def get_stats(self) -> Dict:
+        """Статистика обращений к API"""
+        stats = dict(self.stats)
+        total_latency_ms = stats.pop('total_latency_ms')
+        stats['avg_latency_ms'] = round(total_latency_ms / stats['requests'], 2) if stats['requests'] else 0
+        stats['cache_size'] = len(self._cache)
+        return stats
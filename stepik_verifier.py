@@ -0,0 +1,251 @@
+"""
+Фоновая проверка прохождения тестов через API Степика
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import Database
+from stepik_api import StepikAPIError, StepikClient
+from utils import parse_stepik_url
+
+AUTO_GRADE_COMMENT = "Проверено автоматически по данным Степика"
+
+# Статусы проверки
+PASSED, NOT_PASSED, UNVERIFIABLE, ERROR = 'passed', 'not_passed', 'unverifiable', 'error'
+
+
+class StepikVerifier:
+    """Проверка неоцененных тестов по решениям студентов на Степике.
+
+    Для каждого теста находится шаг урока (/api/steps) и ищутся верные решения
+    студента (/api/submissions). Результат сохраняется как пометка для
+    преподавателя, а при auto_grade пройденные тесты сразу засчитываются.
+    """
+
+    def __init__(self, db: Database, client: StepikClient, auto_grade: bool = False,
+                 feedback_system=None, recheck_after: int = 3600, batch_size: int = 200):
+        self.db = db
+        self.client = client
+        self.auto_grade = auto_grade
+        self.feedback_system = feedback_system
+        self.recheck_after = recheck_after
+        self.batch_size = batch_size
+        self.last_report: Dict = {}
+        self.setup_verification_table()
+
+    def setup_verification_table(self):
+        """Создание таблицы результатов проверки"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS test_verifications (
+                    test_id INTEGER PRIMARY KEY,
+                    status TEXT CHECK(status IN ('passed', 'not_passed', 'unverifiable', 'error')),
+                    details TEXT,
+                    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (test_id) REFERENCES tests (id)
+                )
+            ''')
+            connection.commit()
+
+    def get_tests_to_verify(self) -> List[Dict]:
+        """Неоцененные тесты, которые давно (или никогда) не проверялись"""
+        try:
+            with sqlite3.connect(self.db.db_name) as connection:
+                cursor = connection.cursor()
+                cursor.execute('''
+                    SELECT t.id, t.student_id, t.stepik_id, t.test_url, t.test_type
+                    FROM tests t
+                    LEFT JOIN test_verifications v ON v.test_id = t.id
+                    WHERE t.is_reviewed = FALSE
+                      AND (v.checked_at IS NULL OR v.checked_at < datetime('now', ?))
+                    ORDER BY t.submitted_at
+                    LIMIT ?
+                ''', (f'-{self.recheck_after} seconds', self.batch_size))
+
+                return [{
+                    'id': row[0],
+                    'student_id': row[1],
+                    'stepik_id': row[2],
+                    'test_url': row[3],
+                    'test_type': row[4]
+                } for row in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"Ошибка получения тестов для проверки: {e}")
+            return []
+
+    async def _get_step_id(self, lesson_id: int, position: int) -> Optional[int]:
+        """ID шага по уроку и номеру шага (ответ кешируется клиентом)"""
+        data = await self.client.get('/api/steps', {'lesson': lesson_id, 'position': position})
+        steps = data.get('steps', [])
+        return steps[0]['id'] if steps else None
+
+    async def verify_test(self, test: Dict) -> Tuple[str, str]:
+        """Проверка одного теста: (статус, пояснение)"""
+        parsed = parse_stepik_url(test['test_url'])
+        if not parsed or parsed['kind'] != 'lesson' or parsed['step'] is None:
+            return UNVERIFIABLE, "Ссылка не указывает на шаг урока"
+        if not str(test['stepik_id']).isdigit():
+            return UNVERIFIABLE, "Некорректный ID Степика"
+
+        try:
+            step_id = await self._get_step_id(parsed['object_id'], parsed['step'])
+            if step_id is None:
+                return UNVERIFIABLE, "Шаг не найден на Степике"
+
+            # Решения меняются, поэтому этот ответ не кешируем
+            data = await self.client.get('/api/submissions', {
+                'step': step_id,
+                'user': test['stepik_id'],
+                'status': 'correct'
+            }, use_cache=False)
+        except StepikAPIError as e:
+            return ERROR, str(e)
+
+        if data.get('submissions'):
+            return PASSED, f"Верное решение шага {step_id}"
+        return NOT_PASSED, f"Нет верных решений шага {step_id}"
+
+    async def verify_pending(self) -> Dict:
+        """Проверка очередной порции неоцененных тестов"""
+        loop = asyncio.get_running_loop()
+        tests = await loop.run_in_executor(None, self.get_tests_to_verify)
+        started = time.perf_counter()
+        latencies: List[float] = []
+
+        async def timed_verify(test: Dict) -> Tuple[str, str]:
+            test_started = time.perf_counter()
+            try:
+                return await self.verify_test(test)
+            finally:
+                latencies.append((time.perf_counter() - test_started) * 1000)
+
+        # Параллельность ограничивается семафором клиента
+        results = await asyncio.gather(*(timed_verify(test) for test in tests))
+        elapsed = time.perf_counter() - started
+
+        await self._save_results([
+            (test['id'], status, details) for test, (status, details) in zip(tests, results)
+        ])
+
+        graded = 0
+        passed_tests = [test for test, (status, _) in zip(tests, results) if status == PASSED]
+        if self.auto_grade and passed_tests:
+            graded = await loop.run_in_executor(None, self._grade, passed_tests)
+
+        counts = {PASSED: 0, NOT_PASSED: 0, UNVERIFIABLE: 0, ERROR: 0}
+        for status, _ in results:
+            counts[status] += 1
+
+        latencies.sort()
+        self.last_report = {
+            'checked': len(tests),
+            'passed': counts[PASSED],
+            'not_passed': counts[NOT_PASSED],
+            'unverifiable': counts[UNVERIFIABLE],
+            'errors': counts[ERROR],
+            'graded': graded,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'tests_per_second': round(len(tests) / elapsed, 2) if tests and elapsed > 0 else 0,
+            'avg_latency_ms': round(sum(latencies) / len(latencies), 1) if latencies else 0,
+            'p95_latency_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else 0,
+            'api': self.client.get_stats(),
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+        if tests:
+            logging.info(
+                f"Проверка Степика: {len(tests)} тестов за {self.last_report['elapsed_ms']} мс "
+                f"({self.last_report['tests_per_second']} тест/с), пройдено {counts[PASSED]}, "
+                f"ошибок {counts[ERROR]}"
+            )
+        return self.last_report
+
+    async def _save_results(self, results: List[Tuple[int, str, str]]):
+        """Сохранение результатов проверки одной транзакцией"""
+        if not results:
+            return
+
+        def operation(cursor):
+            cursor.executemany('''
+                INSERT INTO test_verifications (test_id, status, details, checked_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(test_id) DO UPDATE SET
+                    status = excluded.status,
+                    details = excluded.details,
+                    checked_at = excluded.checked_at
+            ''', results)
+
+        try:
+            await asyncio.wrap_future(self.db.run_write(operation))
+        except Exception as e:
+            logging.error(f"Ошибка сохранения результатов проверки: {e}")
+
+    def _grade(self, tests: List[Dict]) -> int:
+        """Автоматическая оценка пройденных тестов"""
+        reviews = [
+            (test['id'], int(test['test_type']) if test['test_type'] else 5, AUTO_GRADE_COMMENT)
+            for test in tests
+        ]
+        # Тест, который за это время оценил преподаватель, не перезаписывается
+        # и не получает уведомления об автоматической оценке
+        graded = set(self.db.review_tests(reviews))
+        if graded and self.feedback_system is not None:
+            self.feedback_system.send_notifications([
+                (test['student_id'], f"Ваш тест #{test_id} оценен! Баллов: {score}", 'success')
+                for test, (test_id, score, _) in zip(tests, reviews) if test_id in graded
+            ])
+        return len(graded)
+
+    async def run_forever(self, interval: float = 600):
+        """Периодическая проверка в фоне"""
+        while True:
+            try:
+                await self.verify_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка фоновой проверки Степика: {e}")
+            await asyncio.sleep(interval)
+
+
+def get_verifications(db: Database, test_ids: Iterable[int]) -> Dict[int, Dict]:
+    """Результаты проверки для набора тестов"""
+    test_ids = list(test_ids)
+    if not test_ids:
+        return {}
+
+    try:
+        with sqlite3.connect(db.db_name) as connection:
+            cursor = connection.cursor()
+            placeholders = ','.join('?' * len(test_ids))
+            cursor.execute(f'''
+                SELECT test_id, status, details, checked_at
+                FROM test_verifications
+                WHERE test_id IN ({placeholders})
+            ''', test_ids)
+            return {
+                row[0]: {'status': row[1], 'details': row[2], 'checked_at': row[3]}
+                for row in cursor.fetchall()
+            }
+    except sqlite3.OperationalError:
+        # Проверка через Степик еще ни разу не запускалась
+        return {}
+    except Exception as e:
+        logging.error(f"Ошибка получения результатов проверки: {e}")
+        return {}
+
+
+def format_verification(verification: Optional[Dict]) -> str:
+    """Краткая пометка о проверке для преподавателя"""
+    if not verification:
+        return ""
+    labels = {
+        PASSED: "✅ пройден на Степике",
+        NOT_PASSED: "❌ нет верного решения на Степике",
+        UNVERIFIABLE: "❔ не удалось проверить",
+        ERROR: "⚠️ ошибка проверки"
+    }
+    return f"🤖 Степик: {labels.get(verification['status'], verification['status'])}"
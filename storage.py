@@ -0,0 +1,326 @@
+"""
+Хранилище данных: общий интерфейс и его реализация на SQLite
+"""
+
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from database import Database
+from feedback import FeedbackSystem
+
+
+class StorageBackend(ABC):
+    """Операции с данными, общие для бота и веб-приложений.
+
+    Методы возвращают те же структуры, что и ``Database``: словари с
+    теми же ключами, даты строками ``ГГГГ-ММ-ДД ЧЧ:ММ:СС``, отправка тестов
+    возвращает Future со списком {'id', 'status'}. Соответствие реализаций
+    проверяет storage_conformance.py.
+    """
+
+    # Пользователи
+    @abstractmethod
+    def add_user(self, user_id: int, username: str, first_name: str, last_name: str, role: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_web_user(self, username: str, role: str, first_name: str = '', last_name: str = '',
+                     stepik_id: Optional[str] = None, approve: bool = True) -> Optional[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def approve_user(self, user_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_teacher_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    # Группы: списки и статистика с ``group_ids`` ограничены этими группами,
+    # None - все группы
+    @abstractmethod
+    def create_group(self, name: str) -> Optional[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_groups(self) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_user_group(self, user_id: int, group_id: Optional[int]) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_teacher_group(self, teacher_id: int, group_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_teacher_group(self, teacher_id: int, group_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_teacher_group_ids(self, teacher_id: int) -> List[int]:
+        raise NotImplementedError
+
+    def get_group_scope(self, teacher_id: int) -> Optional[List[int]]:
+        """Группы преподавателя или None, если группы за ним не закреплены"""
+        return self.get_teacher_group_ids(teacher_id) or None
+
+    # Тесты
+    @abstractmethod
+    def submit_tests(self, student_id: int, full_name: str, stepik_id: str, tests: List[Tuple[str, str]],
+                     idempotency_key: Optional[str] = None) -> Future:
+        raise NotImplementedError
+
+    def submit_test(self, student_id: int, full_name: str, stepik_id: str, test_url: str, test_type: str,
+                    idempotency_key: Optional[str] = None) -> Future:
+        """Отправка одного теста, результат - словарь {'id', 'status'}"""
+        future: Future = Future()
+        batch = self.submit_tests(student_id, full_name, stepik_id, [(test_url, test_type)], idempotency_key)
+        batch.add_done_callback(
+            lambda done: future.set_exception(done.exception()) if done.exception()
+            else future.set_result(done.result()[0])
+        )
+        return future
+
+    @abstractmethod
+    def find_idempotent_submission(self, student_id: int, idempotency_key: str,
+                                   test_urls: List[str]) -> Optional[List[Dict]]:
+        """Результат повтора формы с тем же ключом; None - отправка новая"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_pending_tests(self, group_ids: Optional[List[int]] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_pending_test(self, test_id: int, group_ids: Optional[List[int]] = None) -> Optional[Dict]:
+        """Неоцененный тест по ID, если он из указанных групп"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def review_test(self, test_id: int, score: int, comment: str = "", reviewed_by: Optional[int] = None) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def review_tests(self, reviews: List[Tuple[int, int, str]], reviewed_by: Optional[int] = None) -> List[int]:
+        """ID действительно оцененных тестов; уже оцененные пропускаются"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_student_tests(self, student_id: int) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_tests_by_student(self, group_ids: Optional[List[int]] = None) -> Dict[int, List[Dict]]:
+        """Тесты всех одобренных студентов одним запросом: ID студента -> тесты"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_statistics(self, group_ids: Optional[List[int]] = None) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_students_scores(self, group_ids: Optional[List[int]] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_student_tests(self, student_id: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_approved_students(self) -> int:
+        raise NotImplementedError
+
+    # Обратная связь и уведомления
+    @abstractmethod
+    def submit_feedback(self, user_id: int, feedback_type: str, message: str, rating: Optional[int] = None) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_feedback_inbox(self, feedback_type: Optional[str] = None, rating: Optional[int] = None,
+                           processed: Optional[bool] = False, query: Optional[str] = None,
+                           before_id: Optional[int] = None, limit: int = 20) -> Dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_feedback_processed(self, feedback_ids: List[int], processed_by: Optional[int] = None,
+                                processed: bool = True) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def send_notification(self, user_id: int, message: str, notification_type: str = 'info') -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def send_notifications(self, notifications: List[Tuple[int, str, str]]) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user_notifications(self, user_id: int, unread_only: bool = True) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def mark_all_read(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_unread_count(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        """Освобождение соединений"""
+
+
+class SQLiteStorage(StorageBackend):
+    """Хранилище в файле SQLite: обертка над Database и FeedbackSystem"""
+
+    def __init__(self, db_name: str = 'stepik_bot.db', database: Optional[Database] = None):
+        self.database = database or Database(db_name)
+        self.feedback = FeedbackSystem(self.database)
+
+    @property
+    def db_name(self) -> str:
+        return self.database.db_name
+
+    def add_user(self, user_id, username, first_name, last_name, role):
+        return self.database.add_user(user_id, username, first_name, last_name, role)
+
+    def add_web_user(self, username, role, first_name='', last_name='', stepik_id=None, approve=True):
+        return self.database.add_web_user(username, role, first_name, last_name, stepik_id, approve)
+
+    def approve_user(self, user_id):
+        return self.database.approve_user(user_id)
+
+    def get_user(self, user_id):
+        return self.database.get_user(user_id)
+
+    def get_teacher_ids(self):
+        return self.database.get_teacher_ids()
+
+    def create_group(self, name):
+        return self.database.create_group(name)
+
+    def get_groups(self):
+        return self.database.get_groups()
+
+    def set_user_group(self, user_id, group_id):
+        return self.database.set_user_group(user_id, group_id)
+
+    def add_teacher_group(self, teacher_id, group_id):
+        return self.database.add_teacher_group(teacher_id, group_id)
+
+    def remove_teacher_group(self, teacher_id, group_id):
+        return self.database.remove_teacher_group(teacher_id, group_id)
+
+    def get_teacher_group_ids(self, teacher_id):
+        return self.database.get_teacher_group_ids(teacher_id)
+
+    def submit_tests(self, student_id, full_name, stepik_id, tests, idempotency_key=None):
+        return self.database.submit_tests(student_id, full_name, stepik_id, tests, idempotency_key)
+
+    def submit_test(self, student_id, full_name, stepik_id, test_url, test_type, idempotency_key=None):
+        return self.database.submit_test(student_id, full_name, stepik_id, test_url, test_type, idempotency_key)
+
+    def find_idempotent_submission(self, student_id, idempotency_key, test_urls):
+        return self.database.find_idempotent_submission(student_id, idempotency_key, test_urls)
+
+    def get_pending_tests(self, group_ids=None):
+        return self.database.get_pending_tests(group_ids)
+
+    def get_pending_test(self, test_id, group_ids=None):
+        return self.database.get_pending_test(test_id, group_ids)
+
+    def review_test(self, test_id, score, comment="", reviewed_by=None):
+        return self.database.review_test(test_id, score, comment, reviewed_by)
+
+    def review_tests(self, reviews, reviewed_by=None):
+        return self.database.review_tests(reviews, reviewed_by)
+
+    def get_student_tests(self, student_id):
+        return self.database.get_student_tests(student_id)
+
+    def get_tests_by_student(self, group_ids=None):
+        return self.database.get_tests_by_student(group_ids)
+
+    def get_statistics(self, group_ids=None):
+        return self.database.get_statistics(group_ids)
+
+    def get_students_scores(self, group_ids=None):
+        return self.database.get_students_scores(group_ids)
+
+    def count_student_tests(self, student_id):
+        with sqlite3.connect(self.db_name) as connection:
+            return connection.execute(
+                'SELECT COUNT(*) FROM tests WHERE student_id = ?', (student_id,)
+            ).fetchone()[0]
+
+    def count_approved_students(self):
+        with sqlite3.connect(self.db_name) as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM users WHERE role = 'student' AND is_approved = TRUE"
+            ).fetchone()[0]
+
+    def submit_feedback(self, user_id, feedback_type, message, rating=None):
+        return self.feedback.submit_feedback(user_id, feedback_type, message, rating)
+
+    def get_feedback_inbox(self, feedback_type=None, rating=None, processed=False, query=None,
+                           before_id=None, limit=20):
+        return self.feedback.get_feedback_inbox(feedback_type, rating, processed, query, before_id, limit)
+
+    def mark_feedback_processed(self, feedback_ids, processed_by=None, processed=True):
+        return self.feedback.mark_feedback_processed(feedback_ids, processed_by, processed)
+
+    def send_notification(self, user_id, message, notification_type='info'):
+        return self.feedback.send_notification(user_id, message, notification_type)
+
+    def send_notifications(self, notifications):
+        return self.feedback.send_notifications(notifications)
+
+    def get_user_notifications(self, user_id, unread_only=True):
+        return self.feedback.get_user_notifications(user_id, unread_only)
+
+    def mark_all_read(self, user_id):
+        return self.feedback.mark_all_read(user_id)
+
+    def get_unread_count(self, user_id):
+        return self.feedback.get_unread_count(user_id)
+
+    def close(self):
+        if self.database.writer is not None:
+            self.database.writer.close()
+
+
+def is_postgres_url(url: Optional[str]) -> bool:
+    return bool(url) and url.startswith(('postgres://', 'postgresql://'))
+
+
+def sqlite_path(url: Optional[str] = None, db_name: str = 'stepik_bot.db') -> str:
+    """Файл SQLite по DATABASE_URL (путь или sqlite:///путь), иначе ``db_name``.
+
+    Бот, production_app и модули поверх них (очередь проверки, напоминания,
+    сводки, поиск и другие) работают с файлом SQLite напрямую, поэтому
+    другой СУБД в DATABASE_URL быть не может: такой адрес отклоняется явно,
+    а не принимается за имя файла.
+    """
+    url = url if url is not None else os.environ.get('DATABASE_URL')
+    if is_postgres_url(url):
+        raise ValueError(
+            "DATABASE_URL указывает на PostgreSQL, но бот и production_app работают только с SQLite; "
+            "укажите файл SQLite (sqlite:///путь) или уберите DATABASE_URL"
+        )
+    if url and url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return url or db_name
+
+
+def create_storage(url: Optional[str] = None, db_name: str = 'stepik_bot.db') -> StorageBackend:
+    """Хранилище по DATABASE_URL - файл SQLite, общий для бота и всех веб-приложений"""
+    return SQLiteStorage(sqlite_path(url, db_name))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка соответствия хранилища общему интерфейсу
+
+Использование:
+    python storage_conformance.py                      - временная база SQLite
+    python storage_conformance.py sqlite:///путь.db    - отдельная тестовая база
+                                                         (или переменная TEST_DATABASE_URL)
+
+Проверка создает пользователей со случайными ID и не удаляет их,
+поэтому запускать ее нужно на тестовой, а не на рабочей базе.
+"""
+
+import os
+import random
+import re
+import sys
+import tempfile
+from typing import List
+
+from storage import StorageBackend, create_storage
+
+TIMESTAMP_FORMAT = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+TEST_KEYS = {'id', 'student_id', 'full_name', 'stepik_id', 'test_url', 'test_type', 'submitted_at',
+             'is_reviewed', 'score', 'teacher_comment', 'reviewed_at'}
+
+
+def run_conformance(storage: StorageBackend) -> List[str]:
+    """Проверка контракта хранилища; возвращает список нарушений"""
+    failures = []
+
+    def check(condition: bool, description: str):
+        if not condition:
+            failures.append(description)
+
+    base = random.randint(10 ** 9, 2 * 10 ** 9)
+    teacher_id, student_id = base, base + 1
+    lesson = base % 100000
+
+    # Пользователи
+    students_before = storage.count_approved_students()
+    check(storage.add_user(teacher_id, "teacher", "Анна", "Смирнова", "teacher"), "add_user преподавателя")
+    check(storage.add_user(student_id, "student", "Иван", "Петров", "student"), "add_user студента")
+    user = storage.get_user(student_id)
+    check(user is not None and user['role'] == 'student' and user['is_approved'] is False,
+          "get_user: новый пользователь не одобрен")
+    check(user is not None and bool(TIMESTAMP_FORMAT.match(str(user['created_at']))),
+          "get_user: created_at в формате ГГГГ-ММ-ДД ЧЧ:ММ:СС")
+    storage.approve_user(teacher_id)
+    storage.approve_user(student_id)
+    check(storage.get_user(student_id)['is_approved'] is True, "approve_user")
+    check(storage.count_approved_students() == students_before + 1, "count_approved_students")
+    check(teacher_id in storage.get_teacher_ids(), "get_teacher_ids")
+    check(storage.get_user(base - 1) is None, "get_user: неизвестный пользователь")
+
+    first_web, second_web = storage.add_web_user("web_a", 'student'), storage.add_web_user("web_b", 'student')
+    check(first_web is not None and second_web is not None and second_web < first_web < 0,
+          "add_web_user: отрицательные убывающие ID")
+
+    # Отправка тестов
+    url = f"https://stepik.org/lesson/{lesson}/step/1"
+    results = storage.submit_tests(student_id, "Петров Иван", "777", [
+        (url, '5'), (url + '?unit=1', '5'), (f"https://stepik.org/lesson/{lesson}/step/2", '3')
+    ]).result()
+    check([result['status'] for result in results] == ['created', 'duplicate', 'created'],
+          "submit_tests: статусы created/duplicate")
+    check(results[0]['id'] == results[1]['id'], "submit_tests: дубликат возвращает ID существующего теста")
+
+    check(storage.find_idempotent_submission(student_id, f"key-{base}", [url]) is None,
+          "find_idempotent_submission: новый ключ")
+    keyed = storage.submit_test(student_id, "Петров Иван", "777",
+                                f"https://stepik.org/lesson/{lesson}/step/3", '5', f"key-{base}").result()
+    replay = storage.submit_test(student_id, "Петров Иван", "777",
+                                 f"https://stepik.org/lesson/{lesson}/step/3", '5', f"key-{base}").result()
+    check(keyed['status'] == 'created' and replay == {'id': keyed['id'], 'status': 'duplicate'},
+          "submit_test: повтор с ключом идемпотентности")
+    check(storage.find_idempotent_submission(student_id, f"key-{base}",
+                                             [f"https://stepik.org/lesson/{lesson}/step/3"])
+          == [{'id': keyed['id'], 'status': 'duplicate'}],
+          "find_idempotent_submission: повтор с тем же ключом")
+    check(storage.count_student_tests(student_id) == 3, "count_student_tests")
+
+    pending = [test for test in storage.get_pending_tests() if test['student_id'] == student_id]
+    check(len(pending) == 3 and all(test['username'] == 'student' for test in pending),
+          "get_pending_tests: тесты студента с данными пользователя")
+    check(storage.get_pending_test(results[0]['id']) == next(test for test in pending if test['id'] == results[0]['id']),
+          "get_pending_test: тест по ID")
+
+    # Оценка
+    check(storage.review_test(results[0]['id'], 0, "Не засчитано"), "review_test")
+    check(storage.review_tests([(results[2]['id'], 3, ""), (results[0]['id'], 5, "")]) == [results[2]['id']],
+          "review_tests: уже оцененные тесты пропускаются")
+    again = storage.submit_test(student_id, "Петров Иван", "777", url, '5').result()
+    check(again == {'id': results[0]['id'], 'status': 'resubmitted'},
+          "submit_test: незасчитанный тест отправляется повторно")
+
+    tests = storage.get_student_tests(student_id)
+    check(len(tests) == 3 and all(set(test) == TEST_KEYS for test in tests), "get_student_tests: поля теста")
+    reviewed = [test for test in tests if test['is_reviewed']]
+    check(len(reviewed) == 1 and reviewed[0]['score'] == 3
+          and bool(TIMESTAMP_FORMAT.match(str(reviewed[0]['reviewed_at']))),
+          "get_student_tests: оценка и дата проверки")
+    tests_by_student = storage.get_tests_by_student()
+    check(tests_by_student.get(student_id) == tests and first_web not in tests_by_student,
+          "get_tests_by_student: те же тесты, что у get_student_tests")
+
+    scores = {student['user_id']: student for student in storage.get_students_scores()}
+    check(student_id in scores and scores[student_id]['total_score'] == 3
+          and scores[student_id]['total_tests'] == 3 and scores[student_id]['reviewed_tests'] == 1,
+          "get_students_scores")
+    statistics = storage.get_statistics()
+    check(set(statistics) == {'total_students', 'total_tests', 'reviewed_tests', 'pending_tests',
+                              'average_score'}
+          and statistics['total_tests'] - statistics['reviewed_tests'] == statistics['pending_tests'],
+          "get_statistics")
+
+    # Группы
+    group_id = storage.create_group(f"Группа {base}")
+    other_group_id = storage.create_group(f"Группа {base + 1}")
+    check(group_id is not None and storage.create_group(f"Группа {base}") == group_id,
+          "create_group: повторное создание возвращает ту же группу")
+    check(storage.set_user_group(student_id, group_id) and storage.get_user(student_id)['group_id'] == group_id,
+          "set_user_group")
+    check(storage.add_teacher_group(teacher_id, group_id) and storage.add_teacher_group(teacher_id, group_id)
+          and storage.get_group_scope(teacher_id) == [group_id], "add_teacher_group")
+    grouped = storage.get_pending_tests([group_id])
+    check(len(grouped) == 2 and all(test['student_id'] == student_id for test in grouped)
+          and storage.get_pending_tests([other_group_id]) == [],
+          "get_pending_tests: только тесты группы")
+    check(storage.get_pending_test(grouped[0]['id'], [group_id]) is not None
+          and storage.get_pending_test(grouped[0]['id'], [other_group_id]) is None,
+          "get_pending_test: только тест группы")
+    check([student['user_id'] for student in storage.get_students_scores([group_id])] == [student_id]
+          and storage.get_statistics([group_id])['total_tests'] == 3,
+          "get_students_scores и get_statistics по группе")
+    check(list(storage.get_tests_by_student([group_id])) == [student_id]
+          and storage.get_tests_by_student([other_group_id]) == {},
+          "get_tests_by_student по группе")
+    group = next((group for group in storage.get_groups() if group['id'] == group_id), None)
+    check(group is not None and group['students'] == 1 and group['teachers'] == 1, "get_groups")
+    check(storage.remove_teacher_group(teacher_id, group_id) and storage.get_group_scope(teacher_id) is None,
+          "remove_teacher_group")
+
+    # Обратная связь и уведомления
+    check(storage.submit_feedback(student_id, 'suggestion', "Предложение", 5), "submit_feedback")
+    storage.submit_feedback(student_id, 'bug', "Ошибка в тесте")
+    storage.submit_feedback(student_id, 'question', "Когда откроется модуль?")
+    first_page = storage.get_feedback_inbox(limit=2)
+    second_page = storage.get_feedback_inbox(limit=2, before_id=first_page['next_before_id'])
+    feedback_ids = [item['id'] for item in first_page['items'] + second_page['items']]
+    check(len(feedback_ids) == 3 and feedback_ids == sorted(feedback_ids, reverse=True)
+          and second_page['next_before_id'] is None, "get_feedback_inbox: страницы по ключу")
+    check([item['feedback_type'] for item in storage.get_feedback_inbox(feedback_type='bug')['items']] == ['bug']
+          and [item['rating'] for item in storage.get_feedback_inbox(rating=5)['items']] == [5]
+          and [item['feedback_type'] for item in storage.get_feedback_inbox(query='ошибка')['items']] == ['bug'],
+          "get_feedback_inbox: фильтры и поиск")
+    check(storage.mark_feedback_processed(feedback_ids[:2], teacher_id) == 2
+          and storage.mark_feedback_processed(feedback_ids[:2], teacher_id) == 0
+          and [item['id'] for item in storage.get_feedback_inbox()['items']] == feedback_ids[2:]
+          and all(item['processed_by'] == teacher_id
+                  for item in storage.get_feedback_inbox(processed=True)['items']),
+          "mark_feedback_processed")
+    check(storage.send_notifications([(student_id, f"Уведомление {n}", 'info') for n in range(12)]),
+          "send_notifications")
+    check(storage.send_notification(student_id, "Еще одно", 'success'), "send_notification")
+    check(storage.get_unread_count(student_id) == 13, "get_unread_count")
+    notifications = storage.get_user_notifications(student_id)
+    check(len(notifications) == 10 and not any(n['is_read'] for n in notifications),
+          "get_user_notifications: последние 10 непрочитанных")
+    check(storage.mark_all_read(student_id) == 13 and storage.get_unread_count(student_id) == 0,
+          "mark_all_read")
+    check(storage.get_user_notifications(student_id) == [], "get_user_notifications после прочтения")
+
+    return failures
+
+
+def main() -> bool:
+    url = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        url = os.path.join(tempfile.mkdtemp(), 'conformance.db')
+
+    storage = create_storage(url)
+    try:
+        failures = run_conformance(storage)
+    finally:
+        storage.close()
+
+    print(f"🧪 Хранилище: {type(storage).__name__}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        print(f"⚠️ Нарушений контракта: {len(failures)}")
+        return False
+    print("✅ Хранилище соответствует интерфейсу")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -2,20 +2,39 @@
 # -*- coding: utf-8 -*-
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
-from database import Database
+from storage import SQLiteStorage, create_storage
+from utils import split_test_urls
+from admission import AdmissionControl, create_rate_limiter
+from leaderboard import Leaderboard
 import json
-from datetime import datetime
 import os
 import secrets
 
 app = Flask(__name__, template_folder='templates_student')
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(16))
 
-# Инициализация базы данных
-db = Database()
+# Инициализация хранилища: та же база, что у бота (DATABASE_URL)
+db = create_storage()
+
+# Ограничение частоты отправок и квоты
+admission = AdmissionControl(
+    db,
+    create_rate_limiter(
+        db,
+        os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+        float(os.environ.get('SUBMISSION_RATE_PER_MINUTE', '6')),
+        int(os.environ.get('SUBMISSION_BURST', '3'))
+    ),
+    int(os.environ.get('MAX_TESTS_PER_STUDENT', '50')),
+    int(os.environ.get('MAX_STUDENTS', '100'))
+)
+
+# Рейтинг студентов на триггерах SQLite
+leaderboard = Leaderboard(db.database) if isinstance(db, SQLiteStorage) else None
 
 # Конфигурация
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'admin123')
+MAX_TESTS_PER_FORM = 20
 
 @app.route('/')
 def index():
@@ -48,23 +67,15 @@ def register_student():
             flash('Пожалуйста, введите полное ФИО (минимум имя и фамилию)', 'error')
             return redirect(url_for('register'))
         
-        # Создаем уникальный user_id (в реальном приложении это будет Telegram ID)
-        user_id = hash(full_name + str(datetime.now())) % 1000000
-        
-        # Проверяем, что такой ID не существует
-        while db.get_user(user_id):
-            user_id = hash(full_name + str(datetime.now()) + str(user_id)) % 1000000
+        rejection = admission.check_registration()
+        if rejection:
+            flash(f'{rejection} Обратитесь к преподавателю.', 'error')
+            return redirect(url_for('register'))
         
-        success = db.add_user(
-            user_id, 
-            full_name.lower().replace(' ', '_'),  # username
-            '',  # first_name (будет пустым)
-            '',  # last_name (будет пустым)
-            'student'
-        )
+        # ID выделяется из отдельной последовательности веб-пользователей
+        user_id = db.add_web_user(full_name.lower().replace(' ', '_'), 'student')
         
-        if success:
-            db.approve_user(user_id)
+        if user_id is not None:
             session['user_id'] = user_id
             session['role'] = 'student'
             session['full_name'] = full_name
@@ -93,23 +104,10 @@ def register_teacher():
             flash('Пожалуйста, введите полное ФИО (минимум имя и фамилию)', 'error')
             return redirect(url_for('register'))
         
-        # Создаем уникальный user_id
-        user_id = hash(full_name + str(datetime.now())) % 1000000
-        
-        # Проверяем, что такой ID не существует
-        while db.get_user(user_id):
-            user_id = hash(full_name + str(datetime.now()) + str(user_id)) % 1000000
+        # ID выделяется из отдельной последовательности веб-пользователей
+        user_id = db.add_web_user(full_name.lower().replace(' ', '_'), 'teacher')
         
-        success = db.add_user(
-            user_id, 
-            full_name.lower().replace(' ', '_'),  # username
-            '',  # first_name (будет пустым)
-            '',  # last_name (будет пустым)
-            'teacher'
-        )
-        
-        if success:
-            db.approve_user(user_id)
+        if user_id is not None:
             session['user_id'] = user_id
             session['role'] = 'teacher'
             session['full_name'] = full_name
@@ -145,7 +143,8 @@ def student_dashboard():
                          total_tests=total_tests,
                          reviewed_tests=reviewed_tests,
                          total_score=total_score,
-                         tests=student_tests[:5])  # Показываем последние 5 тестов
+                         tests=student_tests[:5],  # Показываем последние 5 тестов
+                         leaderboard=leaderboard.get_standing(session['user_id'], top=5, radius=2) if leaderboard else None)
 
 @app.route('/submit_test', methods=['GET', 'POST'])
 def submit_test():
@@ -158,7 +157,7 @@ def submit_test():
             # Получаем данные формы
             full_name = request.form.get('full_name', '').strip()
             stepik_id = request.form.get('stepik_id', '').strip()
-            test_url = request.form.get('test_url', '').strip()
+            test_urls = split_test_urls(request.form.get('test_url', ''))
             test_type = request.form.get('test_type', '').strip()
             
             # Валидация
@@ -167,34 +166,59 @@ def submit_test():
                 errors.append('ФИО обязательно')
             if not stepik_id:
                 errors.append('ID Степика обязателен')
-            if not test_url:
+            if not test_urls:
                 errors.append('Ссылка на тест обязательна')
+            if len(test_urls) > MAX_TESTS_PER_FORM:
+                errors.append(f'Не больше {MAX_TESTS_PER_FORM} ссылок за одну отправку')
             if test_type not in ['3', '5']:
                 errors.append('Тип теста должен быть 3 или 5')
             
             if errors:
                 flash('Ошибки в данных: ' + ', '.join(errors), 'error')
-                return render_template('submit_test.html')
+                return render_template('submit_test.html', idempotency_key=secrets.token_urlsafe(16))
+            
+            # Повтор той же формы возвращает прежний результат и не расходует лимит отправок
+            idempotency_key = request.form.get('idempotency_key') or None
+            results = None
+            if idempotency_key:
+                results = db.find_idempotent_submission(session['user_id'], idempotency_key, test_urls)
             
-            # Сохраняем тест
-            success = db.add_test(
-                session['user_id'],
-                full_name,
-                stepik_id,
-                test_url,
-                test_type
-            )
+            if results is None:
+                rejection = admission.check_submission(session['user_id'], len(test_urls))
+                if rejection:
+                    flash(rejection, 'warning')
+                    return render_template('submit_test.html', idempotency_key=secrets.token_urlsafe(16))
+                
+                # Сохраняем тесты одной транзакцией; повтор той же формы или ссылки не создает копию
+                results = db.submit_tests(
+                    session['user_id'],
+                    full_name,
+                    stepik_id,
+                    [(test_url, test_type) for test_url in test_urls],
+                    idempotency_key
+                ).result()
             
-            if success:
+            statuses = [result['status'] for result in results]
+            duplicates = statuses.count('duplicate')
+            if len(results) == 1 and statuses[0] == 'duplicate':
+                flash(f'Этот тест уже отправлен (тест #{results[0]["id"]}).', 'info')
+            elif len(results) == 1 and statuses[0] == 'resubmitted':
+                flash('Тест отправлен на повторную проверку.', 'success')
+            elif len(results) == 1:
                 flash('Тест успешно отправлен! Преподаватель оценит его в ближайшее время.', 'success')
-                return redirect(url_for('student_dashboard'))
+            elif duplicates == len(results):
+                flash('Все эти тесты уже отправлены.', 'info')
             else:
-                flash('Ошибка при сохранении теста.', 'error')
+                message = f'Отправлено тестов: {len(results) - duplicates} из {len(results)}.'
+                if duplicates:
+                    message += f' Уже были отправлены ранее: {duplicates}.'
+                flash(message, 'success')
+            return redirect(url_for('student_dashboard'))
                 
         except Exception as e:
             flash(f'Ошибка: {str(e)}', 'error')
     
-    return render_template('submit_test.html')
+    return render_template('submit_test.html', idempotency_key=secrets.token_urlsafe(16))
 
 @app.route('/my_results')
 def my_results():
@@ -280,7 +304,7 @@ def submit_evaluation():
         score = int(request.form['score'])
         comment = request.form.get('comment', 'Оценено преподавателем')
         
-        success = db.review_test(test_id, score, comment)
+        success = db.review_test(test_id, score, comment, session['user_id'])
         
         if success:
             flash('Тест успешно оценен!', 'success')
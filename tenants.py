@@ -0,0 +1,115 @@
+"""
+Несколько курсов (арендаторов) в одном процессе: у каждого курса свой токен
+бота и своя база, а цикл событий, клиенты API Степика и пул потоков общие
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+from stepik_api import StepikClient
+
+# Файл арендаторов - JSON-список курсов:
+# [{"name": "python-101", "bot_token": "123:ABC", "hosts": ["python101.example.org"]}, ...]
+# Необязательные поля: database, archive_database, backup_dir, analytics_dir
+TENANT_FIELDS = {'name', 'bot_token', 'hosts', 'database', 'archive_database', 'backup_dir', 'analytics_dir'}
+
+
+def default_tenant(bot_token: Optional[str] = None, database: str = 'stepik_bot.db',
+                   archive_database: str = 'stepik_bot_archive.db', backup_dir: str = 'backups',
+                   analytics_dir: str = 'analytics') -> Dict:
+    """Единственный арендатор, когда файл арендаторов не задан"""
+    return {
+        'name': 'default',
+        'bot_token': bot_token,
+        'hosts': [],
+        'database': database,
+        'archive_database': archive_database,
+        'backup_dir': backup_dir,
+        'analytics_dir': analytics_dir
+    }
+
+
+def load_tenants(path: str, backup_dir: str = 'backups', analytics_dir: str = 'analytics') -> List[Dict]:
+    """Чтение и проверка файла арендаторов.
+
+    База, архив и каталоги копий и снимков по умолчанию называются по
+    имени курса. Ошибки конфигурации (повторные имена, токены, базы или
+    хосты) вызывают ValueError при запуске, а не во время работы.
+    """
+    with open(path, encoding='utf-8') as config_file:
+        entries = json.load(config_file)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: ожидается непустой список курсов")
+
+    tenants = []
+    for number, entry in enumerate(entries, 1):
+        name = str(entry.get('name') or '').strip()
+        if not name:
+            raise ValueError(f"{path}: у курса #{number} нет имени")
+        unknown = set(entry) - TENANT_FIELDS
+        if unknown:
+            raise ValueError(f"{path}: неизвестные поля курса {name}: {', '.join(sorted(unknown))}")
+        tenants.append({
+            'name': name,
+            'bot_token': entry.get('bot_token'),
+            'hosts': [host.lower() for host in entry.get('hosts', [])],
+            'database': entry.get('database', f'{name}.db'),
+            'archive_database': entry.get('archive_database', f'{name}_archive.db'),
+            'backup_dir': entry.get('backup_dir', os.path.join(backup_dir, name)),
+            'analytics_dir': entry.get('analytics_dir', os.path.join(analytics_dir, name))
+        })
+
+    for field in ('name', 'bot_token', 'database'):
+        values = [tenant[field] for tenant in tenants if tenant[field]]
+        duplicates = {value for value in values if values.count(value) > 1}
+        if duplicates:
+            raise ValueError(f"{path}: повторяется {field}: {', '.join(sorted(duplicates))}")
+    hosts = [host for tenant in tenants for host in tenant['hosts']]
+    duplicates = {host for host in hosts if hosts.count(host) > 1}
+    if duplicates:
+        raise ValueError(f"{path}: хост указан у нескольких курсов: {', '.join(sorted(duplicates))}")
+
+    return tenants
+
+
+def resolve_tenant(tenants: List[Dict], host: str) -> Optional[Dict]:
+    """Арендатор по имени хоста запроса (без порта)"""
+    host = host.split(':', 1)[0].lower()
+    for tenant in tenants:
+        if host in tenant['hosts']:
+            return tenant
+    # Единственный курс обслуживается на любом хосте
+    return tenants[0] if len(tenants) == 1 else None
+
+
+class SharedResources:
+    """Ресурсы, общие для всех арендаторов процесса.
+
+    Клиент API Степика для проверки тестов работает в общем цикле событий
+    ботов; клиент кеша названий - в одном фоновом потоке на все курсы,
+    а не в своем потоке у каждого курса.
+    """
+
+    def __init__(self, base_url: str = 'https://stepik.org', client_id: Optional[str] = None,
+                 client_secret: Optional[str] = None, max_concurrency: int = 8):
+        self.stepik_client = StepikClient(base_url, client_id, client_secret, max_concurrency)
+        self.metadata_client = StepikClient(base_url, client_id, client_secret, max_concurrency)
+        self.metadata_loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self.metadata_loop.run_forever, name='stepik-metadata-shared', daemon=True
+        ).start()
+
+    async def close(self):
+        """Закрытие клиентов и остановка общего потока кеша"""
+        await self.stepik_client.close()
+        try:
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.metadata_client.close(), self.metadata_loop)
+            )
+        except Exception as e:
+            logging.error(f"Ошибка закрытия общего клиента Степика: {e}")
+        self.metadata_loop.call_soon_threadsafe(self.metadata_loop.stop)
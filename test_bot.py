@@ -160,6 +160,1933 @@ def test_feedback():
         print(f"❌ Ошибка тестирования системы обратной связи: {e}")
         return False
 
+def test_group_commit():
+    """Тестирование групповой фиксации записей"""
+    print("📦 Тестирование групповой фиксации...")
+    
+    try:
+        import tempfile
+        import threading
+        from database import Database
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_group_commit.db'))
+        writer = db.enable_group_commit(max_delay=0.01)
+        db.add_user(777, "burst_user", "Burst", "User", "student")
+        
+        # Одновременная отправка множества тестов
+        futures = []
+        lock = threading.Lock()
+        
+        def submit(n):
+            future = db.submit_test(777, "Burst User", "123456", f"https://stepik.org/lesson/{n}/step/1", "3")
+            with lock:
+                futures.append(future)
+        
+        threads = [threading.Thread(target=submit, args=(n,)) for n in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        test_ids = [future.result(timeout=10)['id'] for future in futures]
+        if len(set(test_ids)) == 50 and len(db.get_student_tests(777)) == 50:
+            print("✅ Все записи зафиксированы с уникальными ID")
+        else:
+            print("❌ Ошибка групповой фиксации")
+            return False
+        
+        stats = writer.get_stats()
+        if stats['requests'] == 50 and stats['batches'] <= 50:
+            print(f"✅ Пакетов: {stats['batches']}, средний размер: {stats['avg_batch_size']}")
+        else:
+            print("❌ Ошибка статистики групповой фиксации")
+            return False
+        
+        writer.close()
+        
+        # Заблокированная база: ошибку получают все запросы пакета, никто не ждет вечно
+        import sqlite3
+        from concurrent.futures import wait
+        from writer import GroupCommitWriter
+        locked_writer = GroupCommitWriter(db.db_name, max_delay=0.05, timeout=0.1)
+        blocker = sqlite3.connect(db.db_name, isolation_level=None)
+        blocker.execute('BEGIN IMMEDIATE')
+        locked = [locked_writer.submit(lambda cursor: cursor.execute('SELECT 1').fetchone()) for _ in range(3)]
+        done, not_done = wait(locked, timeout=10)
+        blocker.execute('ROLLBACK')
+        blocker.close()
+        errors = [future.exception() for future in done]
+        after = locked_writer.execute(lambda cursor: cursor.execute('SELECT 1').fetchone()[0], timeout=10)
+        locked_writer.close()
+        if (not not_done and all(isinstance(error, sqlite3.OperationalError) for error in errors)
+                and after == 1 and locked_writer.get_stats()['failed_batches'] >= 1):
+            print("✅ Ошибка блокировки базы передается всем запросам пакета")
+        else:
+            print(f"❌ Запросы заблокированной базы не завершены: {len(not_done)}, {errors}")
+            return False
+        
+        print("✅ Все тесты групповой фиксации пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования групповой фиксации: {e}")
+        return False
+
+def test_web_user_ids():
+    """Тестирование выделения ID веб-пользователей"""
+    print("🆔 Тестирование выделения ID...")
+    
+    try:
+        import tempfile
+        from database import Database
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_user_ids.db'))
+        
+        user_ids = [db.add_web_user(f"web_user_{n}", "student") for n in range(100)]
+        if all(user_id is not None and user_id < 0 for user_id in user_ids) and len(set(user_ids)) == 100:
+            print("✅ ID выделяются без коллизий с Telegram ID")
+        else:
+            print("❌ Ошибка выделения ID")
+            return False
+        
+        user = db.get_user(user_ids[0])
+        if user and user['role'] == 'student' and user['is_approved']:
+            print("✅ Веб-пользователь создан и одобрен")
+        else:
+            print("❌ Ошибка создания веб-пользователя")
+            return False
+        
+        # Перенос старого веб-пользователя затрагивает все таблицы с его ID
+        import sqlite3
+        from feedback import FeedbackSystem
+        from leaderboard import Leaderboard
+        from migrate_db import USER_ID_COLUMNS, TRIGGER_MOVED_COLUMNS, migrate_web_user_ids
+        feedback = FeedbackSystem(db)
+        Leaderboard(db)
+        with sqlite3.connect(db.db_name) as conn:
+            conn.execute("INSERT INTO users (user_id, username, role, is_approved) VALUES (4242, 'old_web', 'student', 1)")
+        db.submit_test(4242, "Старый Веб", "777", "https://stepik.org/lesson/1/step/1", "3",
+                       idempotency_key="old-key").result()
+        feedback.submit_feedback(4242, "bug", "Старый отзыв")
+        feedback.send_notification(4242, "Старое уведомление")
+        feedback.mark_feedback_processed([1], processed_by=4242)
+        
+        if not migrate_web_user_ids(db.db_name):
+            print("❌ Ошибка переноса веб-пользователей")
+            return False
+        with sqlite3.connect(db.db_name) as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            stale = [
+                f"{table}.{column}" for table, column in USER_ID_COLUMNS + TRIGGER_MOVED_COLUMNS
+                if table in tables and conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {column} = 4242').fetchone()[0]
+            ]
+            new_id = conn.execute("SELECT user_id FROM users WHERE username = 'old_web'").fetchone()[0]
+            moved = conn.execute('SELECT total_tests FROM student_scores WHERE student_id = ?', (new_id,)).fetchone()
+        if stale or new_id >= 0 or not moved or moved[0] != 1:
+            print(f"❌ Старые ID остались после переноса: {stale}, {new_id}, {moved}")
+            return False
+        
+        print("✅ Все тесты выделения ID пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования выделения ID: {e}")
+        return False
+
+def test_roster_import():
+    """Тестирование массового импорта студентов"""
+    print("📥 Тестирование импорта студентов...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from roster import import_roster
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_roster.db'))
+        
+        lines = ["ФИО;ID Степика"]
+        lines += [f"Иванов Иван;{100000 + n}" for n in range(300)]
+        lines += ["Иванов;123456", "Петров Петр;12", "Сидоров Сидор;100000"]
+        
+        report = import_roster(db, lines)
+        if report['imported'] == 300 and len(report['errors']) == 3:
+            print(f"✅ Импортировано {report['imported']} студентов за {report['elapsed_ms']} мс")
+        else:
+            print(f"❌ Ошибка импорта: {report}")
+            return False
+        
+        if [error['line'] for error in report['errors']] == [302, 303, 304]:
+            print("✅ Ошибки привязаны к строкам файла")
+        else:
+            print("❌ Ошибка нумерации строк")
+            return False
+        
+        if len(db.get_students_scores()) == 300:
+            print("✅ Студенты добавлены и одобрены")
+        else:
+            print("❌ Студенты не одобрены")
+            return False
+        
+        print("✅ Все тесты импорта студентов пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования импорта студентов: {e}")
+        return False
+
+def test_gradebook_import():
+    """Тестирование оценки по выгрузке Степика"""
+    print("📊 Тестирование импорта выгрузки Степика...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from gradebook import import_gradebook
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_gradebook.db'))
+        db.add_user(555, "grade_user", "Grade", "User", "student")
+        db.approve_user(555)
+        db.add_test(555, "Grade User", "98765", "https://stepik.org/lesson/1001/step/1", "3")
+        db.add_test(555, "Grade User", "98765", "https://stepik.org/lesson/1001/step/2", "5")
+        db.add_test(555, "Grade User", "98765", "https://stepik.org/lesson/1002/step/1", "5")
+        
+        long_export = (
+            "user_id,lesson_id,step,status\n"
+            "98765,1001,1,correct\n"
+            "98765,1001,2,wrong\n"
+            "11111,1002,1,correct\n"
+        ).encode('utf-8')
+        
+        report = import_gradebook(db, long_export, 'export.csv', dry_run=True)
+        if report['matched_passed'] == 1 and report['graded'] == 0 and len(db.get_pending_tests()) == 3:
+            print("✅ Режим проверки ничего не меняет")
+        else:
+            print(f"❌ Ошибка режима проверки: {report}")
+            return False
+        
+        report = import_gradebook(db, long_export, 'export.csv')
+        if report['graded'] == 1 and report['matched_not_passed'] == 1 and len(db.get_pending_tests()) == 2:
+            print("✅ Длинный формат выгрузки обработан")
+        else:
+            print(f"❌ Ошибка длинного формата: {report}")
+            return False
+        
+        wide_export = "user_id;1001/2;1002/1\n98765;1;0\n".encode('utf-8')
+        report = import_gradebook(db, wide_export, 'grades.csv')
+        if report['graded'] == 1 and len(db.get_pending_tests()) == 1:
+            print("✅ Широкий формат выгрузки обработан")
+        else:
+            print(f"❌ Ошибка широкого формата: {report}")
+            return False
+        
+        # Нечисловые ячейки и повторенный заголовок пропускаются, а не прерывают импорт
+        broken_export = (
+            "user_id,lesson_id,step,status\n"
+            "98765,—,1,correct\n"
+            "user_id,lesson_id,step,status\n"
+            "98765,1002,1,correct\n"
+        ).encode('utf-8')
+        report = import_gradebook(db, broken_export, 'export.csv', dry_run=True)
+        if report['matched_passed'] == 1 and report['skipped_rows'] == 2 and report['skipped_lines'] == [2, 3]:
+            print("✅ Строки с ошибками пропущены и учтены")
+        else:
+            print(f"❌ Ошибка пропуска строк: {report}")
+            return False
+        
+        # Тест оценен преподавателем между сопоставлением и записью оценок
+        from feedback import FeedbackSystem
+        feedback = FeedbackSystem(db)
+        db.add_test(555, "Grade User", "98765", "https://stepik.org/lesson/1003/step/1", "3")
+        review_tests = db.review_tests
+        teacher_graded = []
+        
+        def review_after_teacher(reviews, reviewed_by=None):
+            teacher_graded.append(reviews[0][0])
+            db.review_test(reviews[0][0], 2, "Проверено вручную", reviewed_by=700)
+            return review_tests(reviews, reviewed_by)
+        
+        db.review_tests = review_after_teacher
+        export = "user_id,lesson_id,step,status\n98765,1002,1,correct\n98765,1003,1,correct\n".encode('utf-8')
+        report = import_gradebook(db, export, 'export.csv', feedback_system=feedback)
+        auto_graded = [test_id for test_id in report['test_ids'] if test_id not in teacher_graded]
+        scores = {test['id']: test['score'] for test in db.get_student_tests(555)}
+        messages = [notification['message'] for notification in feedback.get_user_notifications(555)]
+        if (report['matched_passed'] == 2 and report['graded'] == 1 and len(auto_graded) == 1
+                and messages == [f"Ваш тест #{auto_graded[0]} оценен! Баллов: {scores[auto_graded[0]]}"]):
+            print("✅ Уведомления только об оцененных при импорте тестах")
+        else:
+            print(f"❌ Ошибка уведомлений импорта: {report}, {messages}")
+            return False
+        
+        print("✅ Все тесты импорта выгрузки пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования импорта выгрузки: {e}")
+        return False
+
+def test_stepik_verifier():
+    """Тестирование проверки тестов через API Степика на локальной заглушке"""
+    print("🤖 Тестирование проверки через API Степика...")
+    
+    try:
+        import asyncio
+        import json
+        import tempfile
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qs
+        from database import Database
+        from stepik_api import StepikClient
+        from stepik_verifier import StepikVerifier, get_verifications
+        
+        class StubHandler(BaseHTTPRequestHandler):
+            """Заглушка API Степика: шаг 1 урока 2001 решен пользователем 98765"""
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                if url.path == '/api/steps':
+                    step_id = int(params['lesson'][0]) * 10 + int(params['position'][0])
+                    payload = {'steps': [{'id': step_id}]}
+                elif url.path == '/api/submissions':
+                    solved = params['step'][0] == '20011' and params['user'][0] == '98765'
+                    payload = {'submissions': [{'id': 1, 'status': 'correct'}] if solved else []}
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_verifier.db'))
+        db.add_user(556, "verify_user", "Verify", "User", "student")
+        db.add_test(556, "Verify User", "98765", "https://stepik.org/lesson/2001/step/1", "5")
+        db.add_test(556, "Verify User", "98765", "https://stepik.org/lesson/2001/step/2", "3")
+        db.add_test(556, "Verify User", "98765", "https://stepik.org/course/2001", "3")
+        
+        client = StepikClient(f"http://127.0.0.1:{server.server_address[1]}", max_concurrency=4)
+        verifier = StepikVerifier(db, client, auto_grade=True)
+        
+        async def run():
+            try:
+                return await verifier.verify_pending()
+            finally:
+                await client.close()
+        
+        report = asyncio.run(run())
+        server.shutdown()
+        
+        if report['passed'] == 1 and report['not_passed'] == 1 and report['unverifiable'] == 1:
+            print(f"✅ Проверено {report['checked']} тестов ({report['tests_per_second']} тест/с)")
+        else:
+            print(f"❌ Ошибка проверки: {report}")
+            return False
+        
+        if report['graded'] == 1 and len(db.get_pending_tests()) == 2:
+            print("✅ Пройденный тест засчитан автоматически")
+        else:
+            print("❌ Ошибка автоматической оценки")
+            return False
+        
+        if len(get_verifications(db, [1, 2, 3])) == 3:
+            print("✅ Результаты проверки сохранены для преподавателя")
+        else:
+            print("❌ Результаты проверки не сохранены")
+            return False
+        
+        # Тест, оцененный преподавателем до автоматической оценки, не перезаписывается
+        # и не получает уведомления с чужой оценкой
+        from feedback import FeedbackSystem
+        verifier.feedback_system = FeedbackSystem(db)
+        pending = sorted(db.get_pending_tests(), key=lambda test: test['id'])
+        db.review_test(pending[0]['id'], 1, "Проверено вручную", reviewed_by=700)
+        graded = verifier._grade(pending)
+        messages = [notification['message'] for notification in verifier.feedback_system.get_user_notifications(556)]
+        teacher_score = next(test['score'] for test in db.get_student_tests(556) if test['id'] == pending[0]['id'])
+        if graded == 1 and messages == [f"Ваш тест #{pending[1]['id']} оценен! Баллов: 3"] and teacher_score == 1:
+            print("✅ Уведомления только об автоматически оцененных тестах")
+        else:
+            print(f"❌ Ошибка уведомлений автоматической оценки: {graded}, {messages}, {teacher_score}")
+            return False
+        
+        print("✅ Все тесты проверки через API Степика пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования проверки через API Степика: {e}")
+        return False
+
+def test_metadata_cache():
+    """Тестирование кеша названий уроков Степика"""
+    print("📚 Тестирование кеша названий Степика...")
+    
+    try:
+        import json
+        import sqlite3
+        import tempfile
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qs
+        from database import Database
+        from stepik_api import StepikClient
+        from metadata_cache import MetadataCache
+        
+        objects = {
+            'lessons': {2001: {'id': 2001, 'title': 'Циклы'}},
+            'steps': {30001: {'id': 30001, 'lesson': 2001, 'position': 2}},
+            'courses': {500: {'id': 500, 'title': 'Python'}}
+        }
+        api_requests = []
+        
+        class StubHandler(BaseHTTPRequestHandler):
+            """Заглушка API Степика для пакетных запросов по ids[]"""
+            def do_GET(self):
+                url = urlparse(self.path)
+                resource = url.path.split('/')[-1]
+                ids = [int(value) for value in parse_qs(url.query).get('ids[]', [])]
+                api_requests.append((resource, ids))
+                items = [objects[resource][i] for i in ids if i in objects.get(resource, {})]
+                body = json.dumps({resource: items}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_metadata.db'))
+        cache = MetadataCache(db, StepikClient(f"http://127.0.0.1:{server.server_address[1]}"))
+        urls = [
+            "https://stepik.org/lesson/2001/step/1",
+            "https://stepik.org/step/30001",
+            "https://stepik.org/course/500",
+            "https://stepik.org/lesson/9999/step/1"
+        ]
+        
+        # Первый вызов не ждет API и запускает фоновую загрузку
+        if cache.get_titles(urls):
+            print("❌ Названия появились без обращения к API")
+            return False
+        
+        titles = {}
+        for _ in range(50):
+            time.sleep(0.1)
+            titles = cache.get_titles(urls)
+            if len(titles) == 3:
+                break
+        
+        expected = {
+            urls[0]: "Циклы",
+            urls[1]: "Циклы, шаг 2",
+            urls[2]: "Курс: Python"
+        }
+        if titles == expected and len(api_requests) == 3:
+            print(f"✅ Названия загружены пакетно за {len(api_requests)} запроса к API")
+        else:
+            print(f"❌ Ошибка загрузки названий: {titles}, запросы: {api_requests}")
+            return False
+        
+        requests_before = len(api_requests)
+        cache.get_titles(urls)
+        time.sleep(0.2)
+        if len(api_requests) == requests_before:
+            print("✅ Отсутствующий урок закеширован как отрицательный результат")
+        else:
+            print("❌ Повторный запрос несуществующего урока")
+            return False
+        
+        # Устаревшая запись отдается сразу и обновляется в фоне
+        with sqlite3.connect(db.db_name) as connection:
+            connection.execute("UPDATE stepik_metadata SET expires_at = 0 WHERE kind = 'lesson' AND object_id = 2001")
+        tests = cache.annotate([{'test_url': urls[0]}])
+        time.sleep(0.3)
+        cache.close()
+        server.shutdown()
+        
+        if tests[0]['lesson_title'] == "Циклы, шаг 1" and api_requests[-1] == ('lessons', [2001]):
+            print("✅ Устаревшее название показано и обновлено в фоне")
+        else:
+            print(f"❌ Ошибка обновления устаревшей записи: {tests}, {api_requests}")
+            return False
+        
+        print("✅ Все тесты кеша названий пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования кеша названий: {e}")
+        return False
+
+def test_search():
+    """Тестирование полнотекстового поиска"""
+    print("🔎 Тестирование поиска...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from search import SearchIndex
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_search.db'))
+        db.add_user(601, "petrov", "Иван", "Петров", "student")
+        search_index = SearchIndex(db, cache_ttl=0)
+        
+        # Записи после создания индекса попадают в него через триггеры
+        db.add_web_user("kuznetsova_anna", "student", "Анна", "Кузнецова", "31337")
+        db.add_user(602, "teacher", "Ольга", "Сидорова", "teacher")
+        db.add_test(601, "Петров Иван", "777", "https://stepik.org/lesson/1/step/1", "5")
+        test_id = db.get_pending_tests()[0]['id']
+        db.review_test(test_id, 5, "Отличная работа")
+        
+        checks = [
+            ("пет", 1, 1),      # префикс фамилии: студент и его тест
+            ("31337", 1, 0),    # ID Степика
+            ("kuznetsova", 1, 0),  # имя пользователя
+            ("отличн", 0, 1),   # комментарий преподавателя
+            ("сидорова", 0, 0)  # преподаватели в поиск не попадают
+        ]
+        for query, students, tests in checks:
+            result = search_index.search(query)
+            if len(result['students']) != students or len(result['tests']) != tests:
+                print(f"❌ Неверный результат поиска '{query}': {result}")
+                return False
+        print("✅ Поиск по ФИО, ID Степика, логину и комментариям работает")
+        
+        db.review_test(test_id, 5, "Нужно доработать")
+        if not search_index.search("отличн")['tests'] and search_index.search("доработ")['tests']:
+            print("✅ Индекс обновляется при изменении комментария")
+        else:
+            print("❌ Индекс не обновился после изменения комментария")
+            return False
+        
+        print("✅ Все тесты поиска пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования поиска: {e}")
+        return False
+
+def test_duplicate_submissions():
+    """Тестирование защиты от повторных отправок тестов"""
+    print("🔁 Тестирование повторных отправок...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        
+        db_path = os.path.join(tempfile.mkdtemp(), 'test_dedup.db')
+        
+        # База со старыми дубликатами, созданная до уникального индекса
+        conn = sqlite3.connect(db_path)
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, '
+                     'last_name TEXT, role TEXT, is_approved BOOLEAN DEFAULT FALSE, '
+                     'created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        conn.execute('CREATE TABLE tests (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, '
+                     'full_name TEXT NOT NULL, stepik_id TEXT NOT NULL, test_url TEXT NOT NULL, '
+                     'test_type TEXT, submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, '
+                     'is_reviewed BOOLEAN DEFAULT FALSE, score INTEGER DEFAULT 0, '
+                     'teacher_comment TEXT, reviewed_at TIMESTAMP)')
+        conn.execute("INSERT INTO users (user_id, username, first_name, last_name, role, is_approved) "
+                     "VALUES (701, 'dup', 'Иван', 'Петров', 'student', TRUE)")
+        conn.executemany(
+            "INSERT INTO tests (student_id, full_name, stepik_id, test_url, test_type, is_reviewed, score) "
+            "VALUES (701, 'Петров Иван', '777', ?, '5', ?, ?)",
+            [("https://stepik.org/lesson/1/step/1", False, 0),
+             ("https://stepik.org/lesson/1/step/1/", True, 5),
+             ("https://stepik.org/lesson/1/step/1?unit=3", False, 0),
+             ("https://stepik.org/lesson/2/step/1", False, 0)]
+        )
+        conn.commit()
+        conn.close()
+        
+        db = Database(db_path)
+        tests = db.get_student_tests(701)
+        if len(tests) == 2 and any(t['is_reviewed'] and t['score'] == 5 for t in tests):
+            print("✅ Старые дубликаты удалены, оцененный тест сохранен")
+        else:
+            print(f"❌ Ошибка удаления дубликатов: {tests}")
+            return False
+        
+        url = "https://stepik.org/lesson/3/step/2"
+        first = db.submit_test(701, "Петров Иван", "777", url, "5").result()
+        second = db.submit_test(701, "Петров Иван", "777", url + "?unit=9", "5").result()
+        if first['status'] == 'created' and second == {'id': first['id'], 'status': 'duplicate'}:
+            print("✅ Повторная отправка возвращает существующий тест")
+        else:
+            print(f"❌ Ошибка повторной отправки: {first}, {second}")
+            return False
+        
+        keyed = db.submit_test(701, "Петров Иван", "777", "https://stepik.org/lesson/4/step/1", "3", "form-1").result()
+        replay = db.submit_test(701, "Петров Иван", "777", "https://stepik.org/lesson/5/step/1", "3", "form-1").result()
+        if replay == {'id': keyed['id'], 'status': 'duplicate'}:
+            print("✅ Повтор запроса с тем же ключом идемпотентности не создает тест")
+        else:
+            print(f"❌ Ошибка ключа идемпотентности: {keyed}, {replay}")
+            return False
+        
+        db.review_test(first['id'], 0, "Не засчитано")
+        again = db.submit_test(701, "Петров Иван", "777", url, "5").result()
+        pending_ids = [t['id'] for t in db.get_pending_tests()]
+        if again['status'] == 'resubmitted' and first['id'] in pending_ids:
+            print("✅ Незасчитанный тест можно отправить повторно")
+        else:
+            print(f"❌ Ошибка повторной отправки незасчитанного теста: {again}")
+            return False
+        
+        print("✅ Все тесты повторных отправок пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования повторных отправок: {e}")
+        return False
+
+def test_batch_submission():
+    """Тестирование отправки нескольких тестов одним сообщением"""
+    print("📦 Тестирование пакетной отправки тестов...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from utils import parse_test_submissions
+        
+        text = (
+            "ФИО: Петров Иван\n"
+            "ID Степика: 777\n"
+            "Тип теста: 3\n"
+            "https://stepik.org/lesson/10/step/1\n"
+            "https://stepik.org/lesson/10/step/2\n"
+            "Ссылка на тест: https://stepik.org/lesson/11/step/1\n"
+            "Тип теста: 5"
+        )
+        submission = parse_test_submissions(text)
+        types = [test['test_type'] for test in submission['tests']]
+        if not submission['errors'] and types == ['3', '3', '5']:
+            print("✅ Сообщение с тремя тестами разобрано за один проход")
+        else:
+            print(f"❌ Ошибка разбора: {submission}")
+            return False
+        
+        invalid = parse_test_submissions(text + "\nСсылка на тест: https://example.com/x\nТип теста: 4")
+        if len(invalid['errors']) == 2 and all(e.startswith("Тест 4:") for e in invalid['errors']):
+            print("✅ Ошибки собраны по всем тестам сразу")
+        else:
+            print(f"❌ Ошибка проверки тестов: {invalid['errors']}")
+            return False
+        
+        if parse_test_submissions("Привет! Когда будет зачет?") is None:
+            print("✅ Обычное сообщение не считается отправкой тестов")
+        else:
+            print("❌ Обычное сообщение распознано как тест")
+            return False
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_batch.db'))
+        db.add_user(801, "batch", "Иван", "Петров", "student")
+        db.add_test(801, "Петров Иван", "777", "https://stepik.org/lesson/10/step/2", "3")
+        
+        results = db.submit_tests(
+            801, submission['full_name'], submission['stepik_id'],
+            [(test['test_url'], test['test_type']) for test in submission['tests']]
+        ).result()
+        statuses = [result['status'] for result in results]
+        if statuses == ['created', 'duplicate', 'created'] and len(db.get_student_tests(801)) == 3:
+            print("✅ Тесты сохранены одной транзакцией, дубликат пропущен")
+        else:
+            print(f"❌ Ошибка пакетного сохранения: {results}")
+            return False
+        
+        print("✅ Все тесты пакетной отправки пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования пакетной отправки: {e}")
+        return False
+
+def test_admission():
+    """Тестирование ограничения частоты отправок и квот"""
+    print("🚦 Тестирование контроля нагрузки...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from roster import import_roster
+        from admission import AdmissionControl, SQLiteTokenBucket, TokenBucket
+        
+        bucket = TokenBucket(rate_per_minute=6, burst=3)
+        decisions = [bucket.consume('submit:1') for _ in range(4)]
+        if [allowed for allowed, _ in decisions] == [True, True, True, False] and 0 < decisions[3][1] <= 10:
+            print(f"✅ После серии из 3 отправок повтор через {decisions[3][1]:.1f} с")
+        else:
+            print(f"❌ Ошибка ограничения частоты: {decisions}")
+            return False
+        
+        db = Database(os.path.join(tempfile.mkdtemp(), 'test_admission.db'))
+        first, second = SQLiteTokenBucket(db, 6, 2), SQLiteTokenBucket(db, 6, 2)
+        shared = [first.consume('submit:1')[0], second.consume('submit:1')[0], first.consume('submit:1')[0]]
+        if shared == [True, True, False]:
+            print("✅ Состояние ограничителя общее для процессов")
+        else:
+            print(f"❌ Ошибка общего ограничителя: {shared}")
+            return False
+        
+        db.add_user(901, "quota", "Иван", "Петров", "student")
+        db.approve_user(901)
+        admission = AdmissionControl(db, None, max_tests_per_student=3, max_students=2)
+        db.submit_tests(901, "Петров Иван", "777", [
+            (f"https://stepik.org/lesson/{n}/step/1", "5") for n in range(2)
+        ]).result()
+        rejection = admission.check_submission(901, 2)
+        if admission.get_test_count(901) == 2 and rejection and admission.check_submission(901, 1) is None:
+            print(f"✅ Квота тестов: {rejection}")
+        else:
+            print(f"❌ Ошибка квоты тестов: {admission.get_test_count(901)}, {rejection}")
+            return False
+        
+        # Повторная регистрация через /start не должна ломать счетчик
+        db.add_user(901, "quota", "Иван", "Петров", "student")
+        db.approve_user(901)
+        db.add_user(902, "second", "Петр", "Сидоров", "student")
+        db.approve_user(902)
+        if (admission.get_student_count() == 2 and admission.check_registration()
+                and admission.check_registration(902) is None):
+            print("✅ Набор закрыт, зарегистрированные студенты проходят")
+        else:
+            print(f"❌ Ошибка лимита студентов: {admission.get_student_count()}")
+            return False
+        
+        # Повтор формы узнается по ключу до контроля нагрузки
+        form_urls = ["https://stepik.org/lesson/7/step/1"]
+        before = db.find_idempotent_submission(902, "form-1", form_urls)
+        saved = db.submit_tests(902, "Сидоров Петр", "888", [(form_urls[0], "5")], "form-1").result()
+        replay = db.find_idempotent_submission(902, "form-1", form_urls)
+        if before is None and replay == [{'id': saved[0]['id'], 'status': 'duplicate'}]:
+            print("✅ Повтор формы узнается без расхода лимита")
+        else:
+            print(f"❌ Ошибка поиска повтора формы: {before}, {replay}")
+            return False
+        
+        report = import_roster(db, ["Иванов Иван;100001"], limit=admission.remaining_student_slots())
+        if report['imported'] == 0 and len(report['errors']) == 1:
+            print("✅ Импорт списка учитывает лимит студентов")
+        else:
+            print(f"❌ Ошибка лимита при импорте: {report}")
+            return False
+        
+        print("✅ Все тесты контроля нагрузки пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования контроля нагрузки: {e}")
+        return False
+
+def test_archive():
+    """Тестирование архивирования прошедших семестров"""
+    print("📦 Тестирование архива семестров...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from feedback import FeedbackSystem
+        from archive import TermArchive
+        
+        db_path = os.path.join(tempfile.mkdtemp(), 'test_archive.db')
+        db = Database(db_path)
+        feedback = FeedbackSystem(db)
+        archive = TermArchive(db)
+        
+        db.add_user(1001, "old", "Иван", "Петров", "student")
+        db.approve_user(1001)
+        group_id = db.create_group("ПИ-25")
+        db.set_user_group(1001, group_id)
+        results = db.submit_tests(1001, "Петров Иван", "777", [
+            (f"https://stepik.org/lesson/{n}/step/1", "5") for n in range(3)
+        ]).result()
+        db.review_tests([(results[0]['id'], 5, ""), (results[1]['id'], 3, "")], reviewed_by=1900)
+        feedback.send_notification(1001, "Старое уведомление")
+        feedback.submit_feedback(1001, 'suggestion', "Старый отзыв", 5)
+        feedback.mark_feedback_processed([1], processed_by=1900)
+        
+        # Тесты и уведомления прошлого семестра
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE tests SET submitted_at = '2025-10-01 12:00:00'")
+            conn.execute("UPDATE notifications SET is_read = TRUE, created_at = '2025-10-02 12:00:00'")
+            conn.execute("UPDATE feedback SET created_at = '2025-10-03 12:00:00'")
+        db.submit_test(1001, "Петров Иван", "777", "https://stepik.org/lesson/9/step/1", "3").result()
+        
+        term_id = archive.add_term("Осень 2025", "2025-09-01", "2026-01-31")
+        future_id = archive.add_term("Будущий", "2025-09-01", "2999-01-31")
+        if archive.archive_term(future_id)['error']:
+            print("✅ Незакончившийся семестр не архивируется")
+        else:
+            print("❌ Незакончившийся семестр перенесен в архив")
+            return False
+        
+        report = archive.archive_term(term_id)
+        live_ids = [test['id'] for test in db.get_student_tests(1001)]
+        if (report['tests'] == 2 and report['notifications'] == 1 and report['feedback'] == 1 and len(live_ids) == 2
+                and results[2]['id'] in live_ids and db.get_statistics()['reviewed_tests'] == 0):
+            print(f"✅ Оцененные тесты семестра перенесены в архив за {report['elapsed_ms']} мс")
+        else:
+            print(f"❌ Ошибка архивирования: {report}, {live_ids}")
+            return False
+        
+        archived = archive.get_archived_tests(student_id=1001)
+        summary = archive.get_student_archive_summary(1001)
+        if (len(archived) == 2 and archived[0]['term_name'] == "Осень 2025"
+                and summary == [{'term_id': term_id, 'term_name': "Осень 2025", 'tests': 2, 'total_score': 8}]):
+            print("✅ Архив доступен для запросов")
+        else:
+            print(f"❌ Ошибка чтения архива: {archived}, {summary}")
+            return False
+        
+        # Колонки, добавленные в рабочую базу позже, переносятся в архив,
+        # а в старый файл архива добавляются при подключении
+        with sqlite3.connect(archive.archive_path) as conn:
+            reviewers = set(conn.execute('SELECT reviewed_by, group_id FROM tests').fetchall())
+            processed = conn.execute('SELECT processed_by, processed_at IS NOT NULL FROM feedback').fetchall()
+        old_path = os.path.join(os.path.dirname(db_path), 'old_archive.db')
+        with sqlite3.connect(old_path) as conn:
+            conn.execute('''
+                CREATE TABLE feedback (
+                    id INTEGER PRIMARY KEY, user_id INTEGER, feedback_type TEXT, message TEXT, rating INTEGER,
+                    is_processed BOOLEAN, created_at TIMESTAMP,
+                    term_id INTEGER NOT NULL, archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE tests (
+                    id INTEGER PRIMARY KEY, student_id INTEGER, full_name TEXT, stepik_id TEXT,
+                    test_url TEXT, test_type TEXT, submitted_at TIMESTAMP, is_reviewed BOOLEAN,
+                    score INTEGER, teacher_comment TEXT, reviewed_at TIMESTAMP, test_url_norm TEXT,
+                    term_id INTEGER NOT NULL, archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        TermArchive(db, old_path)
+        with sqlite3.connect(old_path) as conn:
+            old_columns = {row[1] for row in conn.execute('PRAGMA table_info(tests)')}
+            old_columns |= {row[1] for row in conn.execute('PRAGMA table_info(feedback)')}
+        if (reviewers == {(1900, group_id)} and processed == [(1900, 1)]
+                and {'reviewed_by', 'group_id', 'processed_at', 'processed_by'} <= old_columns):
+            print("✅ Новые колонки есть в архиве и в старом файле архива")
+        else:
+            print(f"❌ Ошибка колонок архива: {reviewers}, {processed}, {old_columns}")
+            return False
+        
+        if archive.archive_term(term_id)['tests'] == 0 and len(archive.get_archived_tests(term_id=term_id)) == 2:
+            print("✅ Повторное архивирование ничего не дублирует")
+        else:
+            print("❌ Ошибка повторного архивирования")
+            return False
+        
+        print("✅ Все тесты архива семестров пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования архива семестров: {e}")
+        return False
+
+def test_notification_retention():
+    """Тестирование хранения и очистки уведомлений"""
+    print("🔔 Тестирование очистки уведомлений...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from feedback import FeedbackSystem
+        
+        db_path = os.path.join(tempfile.mkdtemp(), 'test_notifications.db')
+        db = Database(db_path)
+        feedback = FeedbackSystem(db)
+        
+        feedback.send_notifications([(1101, f"Уведомление {n}", 'info') for n in range(30)])
+        feedback.send_notification(1102, "Другому пользователю", 'success')
+        if feedback.get_unread_count(1101) == 30 and len(feedback.get_user_notifications(1101)) == 10:
+            print("✅ Счетчик непрочитанных ведется триггерами")
+        else:
+            print(f"❌ Ошибка счетчика: {feedback.get_unread_count(1101)}")
+            return False
+        
+        marked = feedback.mark_all_read(1101)
+        if marked == 30 and feedback.get_unread_count(1101) == 0 and feedback.get_unread_count(1102) == 1:
+            print("✅ Все уведомления отмечены прочитанными одним запросом")
+        else:
+            print(f"❌ Ошибка отметки уведомлений: {marked}")
+            return False
+        
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("UPDATE notifications SET created_at = '2025-01-15 10:00:00' WHERE user_id = 1101 AND id <= 25")
+        report = feedback.apply_retention(read_days=90, batch_size=10)
+        history = feedback.get_notification_history(1101)
+        remaining = len(feedback.get_user_notifications(1101, unread_only=False))
+        if (report['deleted'] == 25 and history == [{'month': '2025-01', 'notification_type': 'info', 'count': 25}]
+                and remaining == 5 and feedback.get_unread_count(1102) == 1):
+            print(f"✅ Старые прочитанные уведомления свернуты и удалены за {report['elapsed_ms']} мс")
+        else:
+            print(f"❌ Ошибка очистки: {report}, {history}, {remaining}")
+            return False
+        
+        with sqlite3.connect(db_path) as conn:
+            auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum == 2 and db.incremental_vacuum() >= 0:
+            print("✅ Новая база создана с инкрементальной очисткой")
+        else:
+            print(f"❌ Режим auto_vacuum: {auto_vacuum}")
+            return False
+        
+        print("✅ Все тесты очистки уведомлений пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования очистки уведомлений: {e}")
+        return False
+
+def test_backup():
+    """Тестирование резервного копирования"""
+    print("💾 Тестирование резервного копирования...")
+    
+    try:
+        import threading
+        import tempfile
+        from database import Database
+        from backup import BackupManager
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_backup.db'))
+        db.enable_group_commit()
+        db.add_user(1201, "backup", "Иван", "Петров", "student")
+        db.submit_tests(1201, "Петров Иван", "777", [
+            (f"https://stepik.org/lesson/{n}/step/1", "5") for n in range(500)
+        ]).result()
+        
+        # Запись продолжается во время копирования
+        stop = threading.Event()
+        written = []
+        def writer():
+            n = 1000
+            while not stop.is_set():
+                db.submit_test(1201, "Петров Иван", "777", f"https://stepik.org/lesson/{n}/step/1", "3").result()
+                written.append(n)
+                n += 1
+        thread = threading.Thread(target=writer)
+        thread.start()
+        
+        manager = BackupManager(db.db_name, os.path.join(workdir, 'backups'), keep=2, pages_per_step=4)
+        report = manager.create_backup()
+        stop.set()
+        thread.join()
+        if not report['error'] and report['steps'] > 1 and written:
+            print(f"✅ Копия создана за {report['elapsed_ms']} мс ({report['pages_per_second']} стр/с), "
+                  f"записей во время копирования: {len(written)}")
+        else:
+            print(f"❌ Ошибка резервного копирования: {report}")
+            return False
+        
+        for stamp in ['20250101-000000', '20250102-000000']:
+            open(os.path.join(manager.backup_dir, f'test_backup-{stamp}.db.gz'), 'wb').close()
+        manager.rotate()
+        names = [backup['name'] for backup in manager.list_backups()]
+        if len(names) == 2 and names[0] == os.path.basename(report['path']):
+            print("✅ Старые копии удаляются при ротации")
+        else:
+            print(f"❌ Ошибка ротации: {names}")
+            return False
+        
+        before = len(db.get_student_tests(1201))
+        db.review_test(db.get_student_tests(1201)[0]['id'], 5, "")
+        with_restore = manager.restore(report['path'])
+        restored = db.get_student_tests(1201)
+        labels = [name for name in (b['name'] for b in manager.list_backups()) if 'before-restore' in name]
+        if with_restore and labels and 500 <= len(restored) <= before and not any(t['is_reviewed'] for t in restored):
+            print(f"✅ База восстановлена из копии ({len(restored)} тестов), текущая сохранена перед этим")
+        else:
+            print(f"❌ Ошибка восстановления: {with_restore}, {len(restored)}, {labels}")
+            return False
+        
+        db.writer.close()
+        print("✅ Все тесты резервного копирования пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования резервного копирования: {e}")
+        return False
+
+def test_storage_backend():
+    """Тестирование хранилища SQLite по общему контракту"""
+    print("🗄️ Тестирование хранилищ...")
+    
+    try:
+        import tempfile
+        from storage import SQLiteStorage, create_storage
+        from storage_conformance import run_conformance
+        from admission import AdmissionControl
+        
+        workdir = tempfile.mkdtemp()
+        storage = create_storage('sqlite:///' + os.path.join(workdir, 'test_storage.db'))
+        if not isinstance(storage, SQLiteStorage):
+            print(f"❌ Ошибка выбора хранилища: {type(storage).__name__}")
+            return False
+        
+        # Неполная реализация хранилища не создается
+        from storage import StorageBackend
+        try:
+            type('PartialStorage', (StorageBackend,), {})()
+            print("❌ Неполное хранилище создано")
+            return False
+        except TypeError:
+            print("✅ Неполное хранилище отклонено при создании")
+        
+        # Бот и веб-приложения работают только с SQLite
+        try:
+            create_storage('postgresql://user@localhost/stepik')
+            print("❌ PostgreSQL в DATABASE_URL не отклонен")
+            return False
+        except ValueError:
+            print("✅ PostgreSQL в DATABASE_URL отклоняется")
+        
+        failures = run_conformance(storage)
+        if failures:
+            print(f"❌ SQLite нарушает контракт: {failures}")
+            return False
+        print("✅ SQLite соответствует контракту хранилища")
+        
+        admission = AdmissionControl(storage, None, max_tests_per_student=3)
+        student_id = storage.get_students_scores()[0]['user_id']
+        if admission.check_submission(student_id) and admission.counter_db is storage.database:
+            print("✅ Контроль нагрузки работает через хранилище")
+        else:
+            print("❌ Ошибка контроля нагрузки через хранилище")
+            return False
+        storage.close()
+        
+        print("✅ Все тесты хранилищ пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования хранилищ: {e}")
+        return False
+
+def test_analytics():
+    """Тестирование аналитики по снимкам"""
+    print("📈 Тестирование аналитики...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from feedback import FeedbackSystem
+        from analytics import AnalyticsSnapshot, format_analytics_report
+        
+        workdir = tempfile.mkdtemp()
+        db_path = os.path.join(workdir, 'test_analytics.db')
+        db = Database(db_path)
+        feedback = FeedbackSystem(db)
+        for student_id in (1301, 1302):
+            db.add_user(student_id, f"student{student_id}", "Иван", "Петров", "student")
+            db.approve_user(student_id)
+            for step in range(1, 4):
+                db.submit_test(student_id, "Петров Иван", "777",
+                               f"https://stepik.org/lesson/130/step/{step}", '5').result()
+        feedback.submit_feedback(1301, 'suggestion', "Больше задач", 4)
+        feedback.submit_feedback(1302, 'suggestion', "Разборы", 5)
+        
+        # Отправки на неделе 2025-03-03, проверки через 2, 4 и 10 часов
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("UPDATE tests SET submitted_at = '2025-03-05 10:00:00'")
+            for test_id, (hours, score) in zip((1, 2, 4), ((2, 5), (4, 3), (10, 5))):
+                connection.execute(
+                    "UPDATE tests SET is_reviewed = 1, score = ?, reviewed_at = datetime('2025-03-05 10:00:00', ?) "
+                    "WHERE id = ?", (score, f'+{hours} hours', test_id)
+                )
+        
+        snapshot = AnalyticsSnapshot(db_path, os.path.join(workdir, 'analytics'))
+        report = snapshot.create_snapshot()
+        if not report['error'] and report['rows'] == {'users': 2, 'tests': 6, 'feedback': 2}:
+            print(f"✅ Снимок создан за {report['elapsed_ms']} мс")
+        else:
+            print(f"❌ Ошибка создания снимка: {report}")
+            return False
+        
+        # Изменения после снимка в отчеты не попадают, снимок только для чтения
+        db.review_test(3, 4, "")
+        try:
+            snapshot.connect().execute("DELETE FROM tests")
+            print("❌ Снимок доступен для записи")
+            return False
+        except sqlite3.OperationalError:
+            print("✅ Снимок открывается только для чтения")
+        
+        reports = snapshot.compute_reports()
+        turnaround = reports['turnaround_hours']
+        if (reports['reviewed_tests'] == 3 and reports['score_distribution'] == {3: 1, 5: 2}
+                and turnaround['count'] == 3 and turnaround['median'] == 4.0 and turnaround['p90'] == 8.8):
+            print("✅ Распределение баллов и время проверки посчитаны по снимку")
+        else:
+            print(f"❌ Ошибка отчетов: {reports}")
+            return False
+        
+        if (reports['weekly_activity'] == [{'week': '2025-03-03', 'submissions': 6, 'reviews': 3,
+                                            'active_students': 2}]
+                and reports['feedback'] == {'suggestion': {'count': 2, 'average_rating': 4.5}}):
+            print("✅ Активность по неделям и обратная связь")
+        else:
+            print(f"❌ Ошибка недельной активности: {reports['weekly_activity']}, {reports['feedback']}")
+            return False
+        
+        if "медиана 4.0 ч" in format_analytics_report(reports):
+            print("✅ Отчет для бота сформирован")
+        else:
+            print("❌ Ошибка форматирования отчета")
+            return False
+        
+        if snapshot.ensure_fresh(3600)['path'] == snapshot.path and snapshot.get_age() < 3600:
+            print("✅ Свежий снимок переиспользуется")
+        else:
+            print("❌ Ошибка проверки возраста снимка")
+            return False
+        
+        print("✅ Все тесты аналитики пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования аналитики: {e}")
+        return False
+
+def test_progress_reports():
+    """Тестирование отчетов об успеваемости"""
+    print("📉 Тестирование отчетов об успеваемости...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from progress import ProgressReports, format_progress_summary, format_student_curve
+        
+        workdir = tempfile.mkdtemp()
+        db_path = os.path.join(workdir, 'test_progress.db')
+        db = Database(db_path)
+        for student_id in (1401, 1402, 1403):
+            db.add_user(student_id, f"student{student_id}", "Иван", "Петров", "student")
+            db.approve_user(student_id)
+        for student_id in (1401, 1402):
+            for step in range(1, 4):
+                db.submit_test(student_id, f"Студент {student_id}", "777",
+                               f"https://stepik.org/lesson/140/step/{step}", '5').result()
+        
+        reports = ProgressReports(db, bucket_size=5)
+        # Проверки в разные дни: у 1401 баллы копятся 5 -> 8 -> 13
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("UPDATE tests SET submitted_at = '2025-03-04 09:00:00'")
+            for test_id, score, day in ((1, 5, '2025-03-05'), (2, 3, '2025-03-11'), (3, 5, '2025-03-12'),
+                                        (4, 4, '2025-03-05')):
+                connection.execute(
+                    "UPDATE tests SET is_reviewed = 1, score = ?, reviewed_at = ? WHERE id = ?",
+                    (score, f'{day} 12:00:00', test_id)
+                )
+        
+        report = reports.get_report()
+        curve = reports.get_student_curve(1401)
+        if curve == [('2025-03-05', 5), ('2025-03-11', 8), ('2025-03-12', 13)] and reports.get_student_curve(1403) == []:
+            print("✅ Накопленные баллы студентов посчитаны одним запросом")
+        else:
+            print(f"❌ Ошибка накопленных баллов: {curve}")
+            return False
+        
+        if (report['weekly'] == [{'week': '2025-03-03', 'submissions': 6, 'reviews': 2, 'active_students': 2},
+                                 {'week': '2025-03-10', 'submissions': 0, 'reviews': 2, 'active_students': 0}]
+                and report['score_histogram'] == {3: 1, 4: 1, 5: 2}):
+            print("✅ Активность по неделям и распределение оценок")
+        else:
+            print(f"❌ Ошибка недельной активности: {report['weekly']}, {report['score_histogram']}")
+            return False
+        
+        # Итоги: 0, 4, 13 - студент без оценок тоже учитывается
+        if (report['students'] == 3 and report['total_percentiles'][50] == 4.0
+                and [bucket['students'] for bucket in report['total_histogram']] == [2, 0, 1]):
+            print("✅ Перцентили и гистограмма итоговых баллов группы")
+        else:
+            print(f"❌ Ошибка перцентилей: {report['total_percentiles']}, {report['total_histogram']}")
+            return False
+        
+        reports.stats = {'hits': 0, 'builds': 0}
+        reports.get_report()
+        db.review_test(5, 2, "")
+        updated = reports.get_report()
+        if reports.stats == {'hits': 1, 'builds': 1} and updated['score_histogram'][2] == 1:
+            print("✅ Отчет берется из кеша, пока данные не изменились")
+        else:
+            print(f"❌ Ошибка кеширования отчета: {reports.stats}")
+            return False
+        
+        chart = reports.get_chart_data(top=1)
+        summary = format_progress_summary(updated)
+        if (chart['curves'][0]['points'][-1] == {'x': '2025-03-12', 'y': 13} and "медиана" in summary
+                and "12.03: 13" in format_student_curve(curve)):
+            print("✅ Данные для графиков и сводка для бота")
+        else:
+            print(f"❌ Ошибка данных для графиков: {chart['curves']}")
+            return False
+        
+        print("✅ Все тесты отчетов об успеваемости пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования отчетов об успеваемости: {e}")
+        return False
+
+def test_turnaround():
+    """Тестирование времени проверки и срока проверки"""
+    print("⏱️ Тестирование времени проверки...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from turnaround import TurnaroundTracker, histogram_percentiles, format_turnaround_summary
+        
+        workdir = tempfile.mkdtemp()
+        db_path = os.path.join(workdir, 'test_turnaround.db')
+        db = Database(db_path)
+        db.add_user(1500, "teacher", "Анна", "Смирнова", "teacher")
+        db.add_user(1501, "student", "Иван", "Петров", "student")
+        for step in range(1, 12):
+            db.submit_test(1501, "Петров Иван", "777", f"https://stepik.org/lesson/150/step/{step}",
+                           '5' if step <= 8 else '3').result()
+        
+        # Тест 1 проверен до создания гистограммы - попадает в нее при первичном заполнении
+        with sqlite3.connect(db_path) as connection:
+            connection.execute("UPDATE tests SET submitted_at = datetime('now', '-3 days')")
+            connection.execute("UPDATE tests SET submitted_at = datetime('now', '-1 hours') WHERE id = 11")
+        db.review_test(1, 5, "", 1500)
+        
+        tracker = TurnaroundTracker(db, sla_hours=48, window_days=30)
+        # Задержки тестов 2-9: 10 минут ... 70 часов
+        delays = {2: '+10 minutes', 3: '+20 minutes', 4: '+50 minutes', 5: '+90 minutes',
+                  6: '+3 hours', 7: '+6 hours', 8: '+20 hours', 9: '+70 hours'}
+        with sqlite3.connect(db_path) as connection:
+            for test_id, delay in delays.items():
+                connection.execute("UPDATE tests SET submitted_at = datetime('now', ?) WHERE id = ?",
+                                   (delay.replace('+', '-'), test_id))
+        for test_id in delays:
+            db.review_test(test_id, 5, "", 1500 if test_id != 9 else None)
+        db.review_test(2, 4, "Повторная оценка", 1500)
+        
+        summary = tracker.get_summary()
+        overall = summary['overall']
+        if overall['count'] == 9 and 0 < overall['p50'] <= 4 and overall['p99'] >= 48:
+            print(f"✅ Перцентили задержки: p50 {overall['p50']} ч, p90 {overall['p90']} ч, p99 {overall['p99']} ч")
+        else:
+            print(f"❌ Ошибка перцентилей задержки: {overall}")
+            return False
+        
+        teachers = {teacher['name']: teacher for teacher in summary['by_teacher']}
+        if (teachers["Анна Смирнова"]['count'] == 8 and teachers["Автоматически"]['count'] == 1
+                and summary['by_test_type']['3']['count'] == 1 and overall['within_sla'] == round(7 / 9 * 100, 1)):
+            print("✅ Разбивка по проверяющим и типам тестов, доля в срок")
+        else:
+            print(f"❌ Ошибка разбивки: {summary['by_teacher']}, {summary['by_test_type']}")
+            return False
+        
+        overdue = tracker.get_overdue_tests()
+        if summary['overdue'] == 1 and [test['id'] for test in overdue] == [10] and overdue[0]['waiting_hours'] >= 72:
+            print("✅ Тесты сверх срока отмечены")
+        else:
+            print(f"❌ Ошибка просроченных тестов: {summary['overdue']}, {overdue}")
+            return False
+        
+        exact = histogram_percentiles([(3600, 50), (7200, 50)])
+        if exact['p50'] == 1.0 and exact['p90'] == 1.8 and "Медиана" in format_turnaround_summary(summary):
+            print("✅ Интерполяция внутри интервала и сводка для бота")
+        else:
+            print(f"❌ Ошибка интерполяции: {exact}")
+            return False
+        
+        print("✅ Все тесты времени проверки пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования времени проверки: {e}")
+        return False
+
+def test_leaderboard():
+    """Тестирование рейтинга студентов"""
+    print("🏆 Тестирование рейтинга...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from leaderboard import Leaderboard, format_leaderboard
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_leaderboard.db'))
+        # Студенту 1600 + i достается i проверенных тестов по 5 баллов
+        for i in range(8):
+            student_id = 1600 + i
+            db.add_user(student_id, f"student{i}", "Студент", str(i), "student")
+            db.approve_user(student_id)
+            for step in range(1, i + 1):
+                result = db.submit_test(student_id, f"Студент {i}", "777",
+                                        f"https://stepik.org/lesson/160/step/{step}", '5').result()
+                db.review_test(result['id'], 5, "")
+        db.add_user(1699, "pending", "Новый", "Студент", "student")
+        
+        leaderboard = Leaderboard(db)
+        standing = leaderboard.get_standing(1603, top=3, radius=1)
+        if ([entry['student_id'] for entry in standing['top']] == [1607, 1606, 1605]
+                and standing['me'] == {'rank': 5, 'student_id': 1603, 'total_score': 15}
+                and [entry['rank'] for entry in standing['neighbours']] == [4, 5, 6]
+                and standing['students'] == 8):
+            print("✅ Лидеры, место и соседи по рейтингу")
+        else:
+            print(f"❌ Ошибка рейтинга: {standing}")
+            return False
+        
+        # Изменения применяются к индексу без пересчета всего рейтинга
+        result = db.submit_test(1600, "Студент 0", "777", "https://stepik.org/lesson/160/step/40", '5').result()
+        db.review_test(result['id'], 5, "")
+        db.review_test(result['id'], 30, "Пересмотр")
+        db.approve_user(1699)
+        changes = leaderboard.refresh()
+        rank = leaderboard.get_rank(1600)
+        if 0 < changes <= 4 and rank == {'rank': 2, 'student_id': 1600, 'total_score': 30, 'students': 9}:
+            print(f"✅ Индекс обновлен по {changes} изменениям")
+        else:
+            print(f"❌ Ошибка обновления рейтинга: {changes}, {rank}")
+            return False
+        
+        # Равные баллы делят место; второй процесс видит те же данные
+        db.review_test(result['id'], 35, "Пересмотр")
+        other = Leaderboard(db)
+        top = other.get_top(3)
+        if [(entry['rank'], entry['total_score']) for entry in top] == [(1, 35), (1, 35), (3, 30)]:
+            print("✅ Равные баллы делят место")
+        else:
+            print(f"❌ Ошибка равных баллов: {top}")
+            return False
+        
+        if leaderboard.get_rank(1699)['rank'] == 9 and leaderboard.get_totals()['total_score'] == 175:
+            print("✅ Новый студент без оценок в конце рейтинга")
+        else:
+            print(f"❌ Ошибка нового студента: {leaderboard.get_rank(1699)}")
+            return False
+        
+        text = format_leaderboard(leaderboard.get_standing(1603, top=3, radius=1), 1603)
+        if "Ваше место:</b> 6 из 9" in text and "(вы)" in text:
+            print("✅ Рейтинг для бота сформирован")
+        else:
+            print(f"❌ Ошибка форматирования рейтинга: {text}")
+            return False
+        
+        print("✅ Все тесты рейтинга пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования рейтинга: {e}")
+        return False
+
+def test_grading_queue():
+    """Тестирование очереди проверки с арендой"""
+    print("📥 Тестирование очереди проверки...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from grading_queue import GradingQueue, format_queue_stats
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_grading_queue.db'))
+        db.add_user(1700, "student", "Студент", "Очереди", "student")
+        db.approve_user(1700)
+        test_ids = []
+        for step in range(1, 8):
+            test_type = '3' if step == 7 else '5'
+            result = db.submit_test(1700, "Студент Очереди", "777",
+                                    f"https://stepik.org/lesson/170/step/{step}", test_type).result()
+            test_ids.append(result['id'])
+        
+        queue = GradingQueue(db, lease_seconds=600, batch_size=3)
+        first = [test['id'] for test in queue.claim_next(1)]
+        second = [test['id'] for test in queue.claim_next(2)]
+        if first == test_ids[:3] and second == test_ids[3:6]:
+            print("✅ Преподаватели получают разные порции, самые старые первыми")
+        else:
+            print(f"❌ Ошибка выдачи порций: {first}, {second}")
+            return False
+        
+        # Повторный запрос продлевает ту же порцию, а не набирает новую
+        again = [test['id'] for test in queue.claim_next(1)]
+        typed = [test['id'] for test in queue.claim_next(3, test_type='3')]
+        if again == first and typed == [test_ids[6]] and queue.claim_next(4) == []:
+            print("✅ Продление аренды и фильтр по типу теста")
+        else:
+            print(f"❌ Ошибка продления или фильтра: {again}, {typed}")
+            return False
+        
+        if not queue.claim(first[0], 2) and queue.claim(first[0], 1) and queue.get_holder(first[0]) == 1:
+            print("✅ Тест в аренде нельзя забрать у другого преподавателя")
+        else:
+            print("❌ Ошибка аренды конкретного теста")
+            return False
+        
+        # Проверенный тест освобождается, истекшая аренда возвращает тесты в очередь
+        db.review_test(first[0], 5, "", 1)
+        with sqlite3.connect(db.db_name) as connection:
+            connection.execute('UPDATE grading_leases SET leased_until = 0 WHERE teacher_id = 2')
+        reclaimed = [test['id'] for test in queue.claim_next(4)]
+        stats = queue.get_queue_stats()
+        if (reclaimed == second and [test['id'] for test in queue.get_leases(1)] == first[1:]
+                and stats == {'pending': 6, 'leased': 6, 'available': 0, 'by_teacher': {1: 2, 3: 1, 4: 3}}):
+            print("✅ Проверенные и просроченные тесты возвращаются в очередь")
+        else:
+            print(f"❌ Ошибка возврата в очередь: {reclaimed}, {stats}")
+            return False
+        
+        released = queue.release(4)
+        if released == 3 and queue.claim(second[0], 2) and "свободно 2" in format_queue_stats(queue.get_queue_stats()):
+            print("✅ Возврат тестов и состояние очереди")
+        else:
+            print(f"❌ Ошибка возврата тестов: {released}")
+            return False
+        
+        # Аренда истекла, тест забрал другой преподаватель: старая кнопка не перезаписывает оценку
+        with sqlite3.connect(db.db_name) as connection:
+            connection.execute('UPDATE grading_leases SET leased_until = 0 WHERE teacher_id = 2')
+        reclaimed = queue.claim(second[0], 4)
+        stale = queue.review(second[0], 2, 0, "Старая оценка")
+        graded = queue.review(second[0], 4, 5, "")
+        late = queue.review(second[0], 2, 0, "Старая оценка")
+        with sqlite3.connect(db.db_name) as connection:
+            score, reviewed_by = connection.execute(
+                'SELECT score, reviewed_by FROM tests WHERE id = ?', (second[0],)
+            ).fetchone()
+        if reclaimed and not stale and graded and not late and (score, reviewed_by) == (5, 4):
+            print("✅ Оценка по истекшей аренде отклоняется")
+        else:
+            print(f"❌ Ошибка проверки аренды при оценке: {stale}, {graded}, {late}, {score}, {reviewed_by}")
+            return False
+        
+        print("✅ Все тесты очереди проверки пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования очереди проверки: {e}")
+        return False
+
+def test_groups():
+    """Тестирование групп студентов"""
+    print("👥 Тестирование групп...")
+    
+    try:
+        import tempfile
+        from database import Database
+        from grading_queue import GradingQueue
+        from progress import ProgressReports
+        from roster import import_roster
+        from search import SearchIndex
+        from turnaround import TurnaroundTracker
+        from utils import format_groups
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_groups.db'))
+        first = db.create_group("ПИ-21")
+        second = db.create_group("ПИ-22")
+        db.add_teacher_group(1800, first)
+        
+        report = import_roster(db, ["ФИО;ID Степика", "Иванов Иван;180001", "Петров Петр;180002"], group_id=first)
+        db.add_user(1810, "other", "Сидор", "Сидоров", "student")
+        db.approve_user(1810)
+        db.set_user_group(1810, second)
+        students = [student['user_id'] for student in db.get_students_scores()]
+        if report['imported'] == 2 and db.get_user(1810)['group_id'] == second and len(students) == 3:
+            print("✅ Студенты распределены по группам")
+        else:
+            print(f"❌ Ошибка распределения: {report}, {students}")
+            return False
+        
+        ivanov = min(student['user_id'] for student in db.get_students_scores([first]))
+        for student_id, name in [(ivanov, "Иванов Иван"), (1810, "Сидоров Сидор")]:
+            for step in (1, 2):
+                db.submit_test(student_id, name, "1", f"https://stepik.org/lesson/180/step/{step}", '5').result()
+        scope = db.get_group_scope(1800)
+        pending = db.get_pending_tests(scope)
+        stats = db.get_statistics(scope)
+        if (scope == [first] and {test['student_id'] for test in pending} == {ivanov}
+                and len(db.get_students_scores(scope)) == 2
+                and (stats['total_students'], stats['total_tests']) == (2, 2)
+                and db.get_group_scope(1801) is None and len(db.get_pending_tests()) == 4):
+            print("✅ Списки и статистика ограничены группами преподавателя")
+        else:
+            print(f"❌ Ошибка ограничения по группам: {scope}, {pending}, {stats}")
+            return False
+        
+        # Тест чужой группы не открывается по ID, а отчеты, сроки и поиск его не видят
+        reviewed_test, other_test = sorted(test['id'] for test in db.get_pending_tests() if test['student_id'] == 1810)
+        db.review_test(reviewed_test, 5, "")
+        progress = ProgressReports(db).get_report(scope)
+        turnaround = TurnaroundTracker(db, sla_hours=0)
+        found = SearchIndex(db).search("Сидоров", group_ids=scope)
+        if (db.get_pending_test(pending[0]['id'], scope) is not None
+                and db.get_pending_test(other_test, scope) is None
+                and db.get_pending_test(other_test) is not None
+                and 1810 not in progress['curves'] and progress['students'] == 2
+                and {test['student_id'] for test in turnaround.get_overdue_tests(group_ids=scope)} == {ivanov}
+                and turnaround.count_overdue(scope) == 2 and turnaround.count_overdue() == 3
+                and turnaround.get_summary(scope)['overall']['count'] == 0
+                and turnaround.get_summary()['overall']['count'] == 1
+                and found['students'] == [] and found['tests'] == []
+                and SearchIndex(db).search("Сидоров")['tests']):
+            print("✅ Тест по ID, отчеты, сроки и поиск ограничены группами преподавателя")
+        else:
+            print(f"❌ Ошибка ограничения отчетов по группам: {progress}, {found}")
+            return False
+        
+        # Тесты переходят в новую группу вместе со студентом
+        queue = GradingQueue(db, batch_size=5)
+        before = [test['student_id'] for test in queue.claim_next(1800, group_ids=scope)]
+        queue.release(1800)
+        db.set_user_group(1810, first)
+        after = [test['student_id'] for test in queue.claim_next(1800, group_ids=scope)]
+        if before == [ivanov, ivanov] and sorted(after) == sorted([ivanov, ivanov, 1810]):
+            print("✅ Очередь проверки выдает тесты групп преподавателя")
+        else:
+            print(f"❌ Ошибка очереди по группам: {before}, {after}")
+            return False
+        
+        groups = db.get_groups()
+        text = format_groups(groups, [first])
+        if ([(group['name'], group['students'], group['teachers']) for group in groups]
+                == [("ПИ-21", 3, 1), ("ПИ-22", 0, 0)]
+                and "⭐ #" in text and db.remove_teacher_group(1800, first)
+                and db.get_group_scope(1800) is None):
+            print("✅ Список групп и открепление преподавателя")
+        else:
+            print(f"❌ Ошибка списка групп: {groups}")
+            return False
+        
+        print("✅ Все тесты групп пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования групп: {e}")
+        return False
+
+def test_tenants():
+    """Тестирование нескольких курсов в одном процессе"""
+    print("🏫 Тестирование курсов-арендаторов...")
+    
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from database import Database
+        from metadata_cache import MetadataCache
+        from tenants import SharedResources, load_tenants, resolve_tenant
+        
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, 'tenants.json')
+        with open(path, 'w', encoding='utf-8') as config_file:
+            json.dump([
+                {"name": "python", "bot_token": "1:a", "hosts": ["Python.example.org"]},
+                {"name": "sql", "bot_token": "2:b", "hosts": ["sql.example.org"],
+                 "database": os.path.join(workdir, 'sql.db')}
+            ], config_file)
+        tenants = load_tenants(path, backup_dir=os.path.join(workdir, 'backups'))
+        if (tenants[0]['database'] == 'python.db' and tenants[0]['hosts'] == ['python.example.org']
+                and tenants[0]['backup_dir'] == os.path.join(workdir, 'backups', 'python')
+                and tenants[1]['database'] == os.path.join(workdir, 'sql.db')):
+            print("✅ Файл курсов прочитан, пути по умолчанию по имени курса")
+        else:
+            print(f"❌ Ошибка чтения курсов: {tenants}")
+            return False
+        
+        if (resolve_tenant(tenants, 'sql.example.org:5000')['name'] == 'sql'
+                and resolve_tenant(tenants, 'PYTHON.example.org')['name'] == 'python'
+                and resolve_tenant(tenants, 'other.example.org') is None
+                and resolve_tenant(tenants[:1], 'localhost')['name'] == 'python'):
+            print("✅ Курс выбирается по имени хоста")
+        else:
+            print("❌ Ошибка выбора курса по хосту")
+            return False
+        
+        with open(path, 'w', encoding='utf-8') as config_file:
+            json.dump([{"name": "a", "bot_token": "1:a"}, {"name": "b", "bot_token": "1:a"}], config_file)
+        try:
+            load_tenants(path)
+            print("❌ Повторный токен не обнаружен")
+            return False
+        except ValueError:
+            print("✅ Повторный токен отклонен при запуске")
+        
+        # Кеши названий двух курсов работают в одном общем потоке
+        shared = SharedResources()
+        caches = [
+            MetadataCache(Database(os.path.join(workdir, f'{name}.db')), shared.metadata_client,
+                          loop=shared.metadata_loop)
+            for name in ('first', 'second')
+        ]
+        results = [cache.refresh([]).result(timeout=5) for cache in caches]
+        caches[0].close()
+        still_running = shared.metadata_loop.is_running()
+        asyncio.run(shared.close())
+        if results == [0, 0] and still_running and all(cache._loop is shared.metadata_loop for cache in caches):
+            print("✅ Общий поток кеша не останавливается кешем одного курса")
+        else:
+            print(f"❌ Ошибка общих ресурсов: {results}, {still_running}")
+            return False
+        
+        print("✅ Все тесты курсов-арендаторов пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования курсов-арендаторов: {e}")
+        return False
+
+def test_reminders():
+    """Тестирование сроков сдачи и напоминаний"""
+    print("⏰ Тестирование напоминаний...")
+    
+    try:
+        import asyncio
+        import tempfile
+        from datetime import datetime
+        from telegram.error import Forbidden
+        from database import Database
+        from feedback import FeedbackSystem
+        from reminders import ReminderScheduler, format_deadlines, parse_due_at
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_reminders.db'))
+        feedback_system = FeedbackSystem(db)
+        for user_id in (1801, 1802, 1803, -1804):
+            db.add_user(user_id, f"student{user_id}", "Студент", f"Срока{user_id}", "student")
+            db.approve_user(user_id)
+        group_id = db.create_group("Поток Б")
+        db.set_user_group(1803, group_id)
+        db.submit_test(1801, "Студент Срока1801", "1801", "https://stepik.org/lesson/180/step/2", '3').result()
+        db.submit_test(1802, "Студент Срока1802", "1802", "https://stepik.org/lesson/1800/step/1", '3').result()
+        
+        sent = []
+        
+        async def send(chat_id, text):
+            if chat_id == 1803:
+                raise Forbidden("bot was blocked by the user")
+            sent.append((chat_id, text))
+        
+        scheduler = ReminderScheduler(db, send, remind_before_hours=24, messages_per_second=1000)
+        due_at = parse_due_at('2030-05-20', '18:00')
+        deadline_id = scheduler.add_deadline("Урок 180", "https://stepik.org/lesson/180?unit=5", due_at)
+        group_deadline = scheduler.add_deadline("Урок 181", "https://stepik.org/lesson/181", due_at, group_id)
+        
+        missing = scheduler.get_missing_students(deadline_id)
+        if missing == [-1804, 1802, 1803] and scheduler.get_missing_students(group_deadline) == [1803]:
+            print("✅ Студенты без отправки выбираются с учетом шагов урока и группы")
+        else:
+            print(f"❌ Ошибка выбора студентов: {missing}")
+            return False
+        
+        early = scheduler.enqueue_due(now=datetime(2030, 5, 19, 12, 0))
+        queued = scheduler.enqueue_due(now=datetime(2030, 5, 19, 18, 0))
+        again = scheduler.enqueue_due(now=datetime(2030, 5, 19, 19, 0))
+        if early == 0 and queued == 4 and again == 0:
+            print("✅ Напоминания ставятся в очередь один раз, когда подходит время")
+        else:
+            print(f"❌ Ошибка постановки в очередь: {early}, {queued}, {again}")
+            return False
+        
+        report = asyncio.run(scheduler.deliver_pending())
+        stats = scheduler.get_delivery_stats(deadline_id)
+        web_notes = feedback_system.get_user_notifications(-1804)
+        if (report == {'sent': 1, 'failed': 2} and [chat_id for chat_id, _ in sent] == [1802]
+                and stats == {'sent': 1, 'failed': 1, 'in_app': 1} and len(web_notes) == 1
+                and "Урок 180" in web_notes[0]['message']):
+            print("✅ Отправка порциями, блокировка бота и уведомления веб-студентам")
+        else:
+            print(f"❌ Ошибка отправки напоминаний: {report}, {sent}, {stats}")
+            return False
+        
+        # Повторное напоминание вручную не дублирует уже отправленные
+        requeued = scheduler.enqueue_due(deadline_id=deadline_id)
+        listed = scheduler.get_deadlines(now=datetime(2030, 5, 19, 19, 0))
+        scoped = scheduler.get_deadlines(group_ids=[], now=datetime(2030, 5, 19, 19, 0))
+        if (requeued == 0 and [deadline['missing'] for deadline in listed] == [3, 1]
+                and [deadline['id'] for deadline in scoped] == [deadline_id]
+                and "Поток Б" in format_deadlines(listed) and scheduler.delete_deadline(group_deadline)
+                and scheduler.get_delivery_stats(group_deadline) == {}):
+            print("✅ Список сроков, область групп и удаление")
+        else:
+            print(f"❌ Ошибка списка сроков: {requeued}, {listed}")
+            return False
+        
+        print("✅ Все тесты напоминаний пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования напоминаний: {e}")
+        return False
+
+def test_digest():
+    """Тестирование сводок для преподавателей"""
+    print("📬 Тестирование сводок...")
+    
+    try:
+        import asyncio
+        import sqlite3
+        import tempfile
+        from database import Database
+        from feedback import FeedbackSystem
+        from digest import TeacherDigest, format_digest
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_digest.db'))
+        feedback_system = FeedbackSystem(db)
+        for user_id, role in ((1901, 'teacher'), (1902, 'teacher'), (1911, 'student'), (1912, 'student')):
+            db.add_user(user_id, f"user{user_id}", "Пользователь", str(user_id), role)
+            db.approve_user(user_id)
+        group_id = db.create_group("Поток сводки")
+        db.add_teacher_group(1902, group_id)
+        db.set_user_group(1911, group_id)
+        
+        sent = []
+        
+        async def send(chat_id, text):
+            sent.append((chat_id, text))
+        
+        digest = TeacherDigest(db, send, window_minutes=30, sla_hours=1)
+        first = db.submit_test(1911, "Студент 1911", "1911", "https://stepik.org/lesson/190/step/1", '3').result()
+        db.submit_test(1911, "Студент 1911", "1911", "https://stepik.org/lesson/190/step/2", '3').result()
+        db.submit_test(1912, "Студент 1912", "1912", "https://stepik.org/lesson/191/step/1", '3').result()
+        feedback_system.submit_feedback(1912, 'question', "Когда <откроется> следующий модуль?")
+        with sqlite3.connect(db.db_name) as connection:
+            connection.execute("UPDATE tests SET submitted_at = datetime('now', '-2 hours') WHERE id = ?",
+                               (first['id'],))
+        
+        if asyncio.run(digest.send_digests()) == 0 and sent == []:
+            print("✅ Сводка не отправляется до конца окна")
+        else:
+            print(f"❌ Сводка отправлена раньше окна: {sent}")
+            return False
+        
+        with sqlite3.connect(db.db_name) as connection:
+            connection.execute("UPDATE teacher_digests SET last_sent_at = datetime('now', '-31 minutes')")
+        count = asyncio.run(digest.send_digests())
+        texts = dict(sent)
+        if (count == 2 and "Новых тестов: 3" in texts[1901] and "Новых тестов: 2" in texts[1902]
+                and "дольше срока: 1" in texts[1902] and "&lt;откроется&gt;" in texts[1902]
+                and "Всего ждут проверки: 2" in texts[1902]):
+            print("✅ Одна сводка на преподавателя с учетом его групп")
+        else:
+            print(f"❌ Ошибка содержимого сводок: {count}, {texts}")
+            return False
+        
+        # Позиция сдвинута: повторной сводки нет, уведомление в приложении одно
+        with sqlite3.connect(db.db_name) as connection:
+            connection.execute("UPDATE teacher_digests SET last_sent_at = datetime('now', '-31 minutes')")
+            notifications = connection.execute(
+                'SELECT COUNT(*) FROM notifications WHERE user_id IN (1901, 1902)'
+            ).fetchone()[0]
+        if asyncio.run(digest.send_digests()) == 0 and notifications == 2:
+            print("✅ События входят в сводку один раз")
+        else:
+            print(f"❌ Повторная сводка или лишние уведомления: {notifications}")
+            return False
+        
+        db.submit_test(1912, "Студент 1912", "1912", "https://stepik.org/lesson/192/step/1", '3').result()
+        manual = digest.take_digest(1901)
+        if (digest.set_window(1902, 0) and digest.get_window(1902) == 0 and digest.get_window(1901) == 30
+                and manual['submission'] == 1 and digest.take_digest(1901)['submission'] == 0
+                and "новых событий нет" in format_digest(digest.collect(1901))):
+            print("✅ Сводка по запросу и отключение сводок")
+        else:
+            print(f"❌ Ошибка сводки по запросу: {manual}")
+            return False
+        
+        print("✅ Все тесты сводок пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования сводок: {e}")
+        return False
+
+def test_feedback_inbox():
+    """Тестирование входящих отзывов"""
+    print("📥 Тестирование входящих отзывов...")
+    
+    try:
+        import sqlite3
+        import tempfile
+        from database import Database
+        from feedback import FeedbackSystem, format_feedback_inbox
+        
+        workdir = tempfile.mkdtemp()
+        db = Database(os.path.join(workdir, 'test_feedback_inbox.db'))
+        feedback = FeedbackSystem(db)
+        db.add_user(2001, "inbox_student", "Ольга", "Входящая", "student")
+        types = ['bug', 'suggestion', 'question']
+        for number in range(30):
+            message = f"Не открывается задание {number}" if number % 10 == 0 else f"Сообщение {number}"
+            feedback.submit_feedback(2001, types[number % 3], message, number % 5 + 1)
+        
+        pages, before_id = [], None
+        while True:
+            page = feedback.get_feedback_inbox(before_id=before_id, limit=8)
+            pages.append([item['id'] for item in page['items']])
+            before_id = page['next_before_id']
+            if before_id is None:
+                break
+        listed = [feedback_id for page in pages for feedback_id in page]
+        if [len(page) for page in pages] == [8, 8, 8, 6] and listed == list(range(30, 0, -1)):
+            print("✅ Постраничный вывод по ключу без пропусков и повторов")
+        else:
+            print(f"❌ Ошибка постраничного вывода: {pages}")
+            return False
+        
+        bugs = feedback.get_feedback_inbox('bug', limit=100)['items']
+        rated = feedback.get_feedback_inbox(rating=5, limit=100)['items']
+        found = feedback.get_feedback_inbox(query="открывается", limit=100)['items']
+        if (len(bugs) == 10 and all(item['feedback_type'] == 'bug' for item in bugs)
+                and len(rated) == 6 and [item['id'] for item in found] == [21, 11, 1]
+                and found[0]['author'] == "Входящая Ольга"):
+            print("✅ Фильтры по типу и оценке, поиск по тексту")
+        else:
+            print(f"❌ Ошибка фильтров: {len(bugs)}, {len(rated)}, {[item['id'] for item in found]}")
+            return False
+        
+        marked = feedback.mark_feedback_processed(list(range(1, 21)) + [1, 2], processed_by=77)
+        stats = feedback.get_feedback_stats()
+        inbox = feedback.get_feedback_inbox(limit=100)['items']
+        processed = feedback.get_feedback_inbox(processed=True, limit=100)['items']
+        if (marked == 20 and stats['unprocessed_feedback'] == 10 and len(inbox) == 10
+                and all(item['processed_by'] == 77 and item['processed_at'] for item in processed)):
+            print("✅ Массовая отметка одной транзакцией")
+        else:
+            print(f"❌ Ошибка массовой отметки: {marked}, {stats}")
+            return False
+        
+        reopened = feedback.mark_feedback_processed([5], processed=False)
+        with sqlite3.connect(db.db_name) as connection:
+            plan = connection.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM feedback WHERE is_processed = FALSE ORDER BY id DESC LIMIT 5'
+            ).fetchall()
+        text = format_feedback_inbox(feedback.get_feedback_inbox(limit=3), 11)
+        if (reopened == 1 and any('idx_feedback_unprocessed' in row[-1] for row in plan)
+                and "необработанных: 11" in text and "#30" in text):
+            print("✅ Частичный индекс и страница для бота")
+        else:
+            print(f"❌ Ошибка индекса или форматирования: {plan}")
+            return False
+        
+        print("✅ Все тесты входящих отзывов пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования входящих отзывов: {e}")
+        return False
+
+def test_instrumentation():
+    """Тестирование замера цикла событий"""
+    print("⏱️ Тестирование замера цикла событий...")
+    
+    try:
+        import asyncio
+        import time
+        from telegram.ext import Application, CommandHandler
+        from instrumentation import BotInstrumentation, format_instrumentation_report
+        
+        monitor = BotInstrumentation(lag_interval=0.05, block_threshold_ms=100)
+        
+        async def slow_handler(update, context):
+            time.sleep(0.3)
+            await asyncio.sleep(0.2)
+            return 'ok'
+        
+        async def waiting_handler(update, context):
+            await asyncio.sleep(0.1)
+        
+        async def failing_handler(update, context):
+            raise ValueError("сбой")
+        
+        async def scenario():
+            monitor.start()
+            await asyncio.sleep(0.2)
+            result = await monitor.wrap('slow', slow_handler)(None, None)
+            waiting = monitor.wrap('waiting', waiting_handler)
+            await asyncio.gather(*(waiting(None, None) for _ in range(5)))
+            try:
+                await monitor.wrap('failing', failing_handler)(None, None)
+                raised = False
+            except ValueError:
+                raised = True
+            await asyncio.sleep(0.1)
+            await monitor.stop()
+            return result, raised
+        
+        result, raised = asyncio.run(scenario())
+        if result != 'ok' or not raised:
+            print(f"❌ Ошибка обертки обработчиков: {result}, {raised}")
+            return False
+        
+        report = monitor.get_report()
+        slow = next(handler for handler in report['handlers'] if handler['name'] == 'slow')
+        if not (280 <= slow['avg_blocking_ms'] < 400 and slow['avg_wall_ms'] >= 480):
+            print(f"❌ Ошибка разделения времени обработчика: {slow}")
+            return False
+        
+        waiting = next(handler for handler in report['handlers'] if handler['name'] == 'waiting')
+        failing = next(handler for handler in report['handlers'] if handler['name'] == 'failing')
+        if waiting['calls'] != 5 or waiting['blocking_share'] > 50 or failing['errors'] != 1:
+            print(f"❌ Ошибка учета вызовов: {waiting}, {failing}")
+            return False
+        
+        if report['in_flight'] != 0 or report['peak_in_flight'] < 5:
+            print(f"❌ Ошибка счетчика обновлений в работе: {report['in_flight']}, {report['peak_in_flight']}")
+            return False
+        
+        if report['lag_ms']['max'] < 200 or report['lag_ms']['samples'] == 0:
+            print(f"❌ Ошибка замера задержки цикла: {report['lag_ms']}")
+            return False
+        
+        block = report['last_block']
+        if report['blocked_events'] < 1 or block['handler'] != 'slow' or 'slow_handler' not in block['stack']:
+            print(f"❌ Ошибка обнаружения блокировки: {report['blocked_events']}, {block}")
+            return False
+        
+        # Обработчики приложения оборачиваются один раз
+        application = Application.builder().token('1:a').build()
+        application.add_handler(CommandHandler('slow', slow_handler))
+        wrapped = monitor.instrument_application(application)
+        again = monitor.instrument_application(application)
+        if wrapped != 1 or again != 0 or not application.handlers[0][0].callback.__instrumented__:
+            print(f"❌ Ошибка инструментирования приложения: {wrapped}, {again}")
+            return False
+        
+        text = format_instrumentation_report(report)
+        if 'Цикл событий' not in text or 'slow' not in text:
+            print(f"❌ Ошибка форматирования отчета: {text}")
+            return False
+        
+        print("✅ Все тесты замера цикла событий пройдены")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Ошибка тестирования замера цикла событий: {e}")
+        return False
+
 def main():
     """Главная функция тестирования"""
     print("🧪 Тестирование Stepik Telegram Bot")
@@ -168,7 +2095,32 @@ def main():
     tests = [
         ("База данных", test_database),
         ("Утилиты", test_utils),
-        ("Система обратной связи", test_feedback)
+        ("Система обратной связи", test_feedback),
+        ("Групповая фиксация", test_group_commit),
+        ("Выделение ID", test_web_user_ids),
+        ("Импорт студентов", test_roster_import),
+        ("Импорт выгрузки Степика", test_gradebook_import),
+        ("Проверка через API Степика", test_stepik_verifier),
+        ("Кеш названий Степика", test_metadata_cache),
+        ("Полнотекстовый поиск", test_search),
+        ("Повторные отправки тестов", test_duplicate_submissions),
+        ("Пакетная отправка тестов", test_batch_submission),
+        ("Контроль нагрузки", test_admission),
+        ("Архив семестров", test_archive),
+        ("Очистка уведомлений", test_notification_retention),
+        ("Резервное копирование", test_backup),
+        ("Хранилища данных", test_storage_backend),
+        ("Аналитика по снимкам", test_analytics),
+        ("Отчеты об успеваемости", test_progress_reports),
+        ("Время проверки", test_turnaround),
+        ("Рейтинг студентов", test_leaderboard),
+        ("Очередь проверки", test_grading_queue),
+        ("Группы студентов", test_groups),
+        ("Курсы в одном процессе", test_tenants),
+        ("Напоминания о сроках", test_reminders),
+        ("Сводки для преподавателей", test_digest),
+        ("Входящие отзывы", test_feedback_inbox),
+        ("Замер цикла событий", test_instrumentation)
     ]
     
     passed = 0
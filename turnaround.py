@@ -0,0 +1,276 @@
+"""
+Время проверки тестов: перцентили задержки и контроль срока проверки (SLA)
+"""
+
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from database import Database
+
+# Границы интервалов гистограммы задержки в минутах: от 5 минут до двух недель
+LATENCY_BUCKETS_MINUTES = [5, 15, 30, 60, 120, 240, 480, 720, 1440, 2880, 4320, 10080, 20160]
+# Последний интервал без верхней границы
+OVERFLOW_SECONDS = 10 ** 12
+
+AUTOMATIC_REVIEWER = 0
+
+TURNAROUND_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS review_latency_buckets (
+        upper_seconds INTEGER PRIMARY KEY
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS review_latency (
+        day TEXT NOT NULL,
+        teacher_id INTEGER NOT NULL,
+        test_type TEXT NOT NULL,
+        upper_seconds INTEGER NOT NULL,
+        reviews INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, teacher_id, test_type, upper_seconds)
+    )
+    ''',
+    # Задержка учитывается один раз - когда тест становится проверенным
+    '''
+    CREATE TRIGGER IF NOT EXISTS review_latency_record AFTER UPDATE OF is_reviewed ON tests
+    WHEN new.is_reviewed AND NOT COALESCE(old.is_reviewed, 0) AND new.reviewed_at IS NOT NULL BEGIN
+        INSERT INTO review_latency (day, teacher_id, test_type, upper_seconds, reviews)
+        VALUES (
+            date(new.reviewed_at),
+            COALESCE(new.reviewed_by, 0),
+            COALESCE(new.test_type, ''),
+            (SELECT MIN(upper_seconds) FROM review_latency_buckets
+             WHERE upper_seconds >= (julianday(new.reviewed_at) - julianday(new.submitted_at)) * 86400),
+            1
+        )
+        ON CONFLICT (day, teacher_id, test_type, upper_seconds) DO UPDATE SET reviews = reviews + 1;
+    END
+    '''
+]
+
+PERCENTILES = [50, 90, 99]
+
+
+def histogram_percentiles(histogram: List[Tuple[int, int]]) -> Dict:
+    """Перцентили задержки в часах по гистограмме [(верхняя граница в секундах, число)].
+
+    Внутри интервала значение интерполируется линейно; для последнего
+    интервала без границы берется его нижняя граница.
+    """
+    total = sum(count for _, count in histogram)
+    result = {'count': total}
+    for q in PERCENTILES:
+        result[f'p{q}'] = 0.0
+
+    if not total:
+        return result
+
+    histogram = sorted(histogram)
+    for q in PERCENTILES:
+        rank = total * q / 100
+        cumulative, lower = 0, 0
+        for upper, count in histogram:
+            if cumulative + count >= rank:
+                if upper >= OVERFLOW_SECONDS:
+                    value = lower
+                else:
+                    value = lower + (upper - lower) * (rank - cumulative) / count
+                break
+            cumulative += count
+            lower = upper
+        result[f'p{q}'] = round(value / 3600, 1)
+    return result
+
+
+class TurnaroundTracker:
+    """Задержка проверки тестов по преподавателям и типам тестов.
+
+    Задержка каждого проверенного теста попадает в дневную гистограмму
+    триггером при оценке, поэтому перцентили за скользящее окно считаются
+    по нескольким десяткам строк гистограммы, а не по истории тестов.
+    """
+
+    def __init__(self, db: Database, sla_hours: float = 48, window_days: int = 30):
+        self.db = db
+        self.sla_hours = sla_hours
+        self.window_days = window_days
+        self.setup_histogram()
+
+    def setup_histogram(self):
+        """Создание гистограммы и триггера; первичное заполнение по проверенным тестам"""
+        with sqlite3.connect(self.db.db_name) as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'review_latency'")
+            created = cursor.fetchone() is None
+
+            for statement in TURNAROUND_SCHEMA:
+                cursor.execute(statement)
+
+            # Граница срока проверки тоже становится границей интервала,
+            # чтобы долю тестов в срок можно было посчитать точно
+            bounds = [minutes * 60 for minutes in LATENCY_BUCKETS_MINUTES]
+            bounds += [int(self.sla_hours * 3600), OVERFLOW_SECONDS]
+            cursor.executemany(
+                'INSERT OR IGNORE INTO review_latency_buckets (upper_seconds) VALUES (?)',
+                [(bound,) for bound in bounds]
+            )
+
+            if created:
+                cursor.execute('''
+                    INSERT INTO review_latency (day, teacher_id, test_type, upper_seconds, reviews)
+                    SELECT day, teacher_id, test_type, upper_seconds, COUNT(*) FROM (
+                        SELECT date(t.reviewed_at) AS day,
+                               COALESCE(t.reviewed_by, 0) AS teacher_id,
+                               COALESCE(t.test_type, '') AS test_type,
+                               (SELECT MIN(b.upper_seconds) FROM review_latency_buckets b
+                                WHERE b.upper_seconds >=
+                                      (julianday(t.reviewed_at) - julianday(t.submitted_at)) * 86400
+                               ) AS upper_seconds
+                        FROM tests t
+                        WHERE t.is_reviewed AND t.reviewed_at IS NOT NULL
+                    )
+                    GROUP BY day, teacher_id, test_type, upper_seconds
+                ''')
+            connection.commit()
+
+    def _load_histogram(self, group_ids: Optional[List[int]] = None) -> List[Tuple[int, str, int, int]]:
+        """Строки гистограммы за окно: (преподаватель, тип теста, граница, число)
+
+        В гистограмме нет групп, поэтому для преподавателя с ограниченным
+        набором групп те же строки собираются по тестам его групп за окно.
+        """
+        with sqlite3.connect(self.db.db_name) as connection:
+            if group_ids is None:
+                return connection.execute('''
+                    SELECT teacher_id, test_type, upper_seconds, SUM(reviews)
+                    FROM review_latency
+                    WHERE day >= date('now', ?)
+                    GROUP BY teacher_id, test_type, upper_seconds
+                ''', (f'-{self.window_days} days',)).fetchall()
+
+            group_condition, group_params = Database._group_condition('t.group_id', group_ids)
+            return connection.execute(f'''
+                SELECT teacher_id, test_type, upper_seconds, COUNT(*) FROM (
+                    SELECT COALESCE(t.reviewed_by, 0) AS teacher_id,
+                           COALESCE(t.test_type, '') AS test_type,
+                           (SELECT MIN(b.upper_seconds) FROM review_latency_buckets b
+                            WHERE b.upper_seconds >=
+                                  (julianday(t.reviewed_at) - julianday(t.submitted_at)) * 86400
+                           ) AS upper_seconds
+                    FROM tests t
+                    WHERE t.is_reviewed AND t.reviewed_at IS NOT NULL
+                      AND date(t.reviewed_at) >= date('now', ?) AND {group_condition}
+                )
+                GROUP BY teacher_id, test_type, upper_seconds
+            ''', [f'-{self.window_days} days'] + group_params).fetchall()
+
+    def _summarize(self, rows: List[Tuple[int, int]]) -> Dict:
+        """Перцентили и доля проверенных в срок"""
+        merged: Dict[int, int] = {}
+        for upper, count in rows:
+            merged[upper] = merged.get(upper, 0) + count
+        summary = histogram_percentiles(list(merged.items()))
+        sla_seconds = self.sla_hours * 3600
+        within = sum(count for upper, count in merged.items() if upper <= sla_seconds)
+        summary['within_sla'] = round(within / summary['count'] * 100, 1) if summary['count'] else 100.0
+        return summary
+
+    def get_overdue_tests(self, limit: int = 20, group_ids: Optional[List[int]] = None) -> List[Dict]:
+        """Непроверенные тесты, которые ждут дольше срока, самые старые первыми"""
+        try:
+            group_condition, group_params = Database._group_condition('group_id', group_ids)
+            with sqlite3.connect(self.db.db_name) as connection:
+                rows = connection.execute(f'''
+                    SELECT id, student_id, full_name, test_type, submitted_at,
+                           ROUND((julianday('now') - julianday(submitted_at)) * 24, 1)
+                    FROM tests
+                    WHERE is_reviewed = FALSE AND submitted_at <= datetime('now', ?) AND {group_condition}
+                    ORDER BY submitted_at
+                    LIMIT ?
+                ''', [f'-{int(self.sla_hours * 3600)} seconds'] + group_params + [limit]).fetchall()
+            return [{
+                'id': row[0],
+                'student_id': row[1],
+                'full_name': row[2],
+                'test_type': row[3],
+                'submitted_at': row[4],
+                'waiting_hours': row[5]
+            } for row in rows]
+        except Exception as e:
+            logging.error(f"Ошибка получения просроченных тестов: {e}")
+            return []
+
+    def count_overdue(self, group_ids: Optional[List[int]] = None) -> int:
+        """Число непроверенных тестов сверх срока"""
+        try:
+            group_condition, group_params = Database._group_condition('group_id', group_ids)
+            with sqlite3.connect(self.db.db_name) as connection:
+                return connection.execute(
+                    f"SELECT COUNT(*) FROM tests "
+                    f"WHERE is_reviewed = FALSE AND submitted_at <= datetime('now', ?) AND {group_condition}",
+                    [f'-{int(self.sla_hours * 3600)} seconds'] + group_params
+                ).fetchone()[0]
+        except Exception as e:
+            logging.error(f"Ошибка подсчета просроченных тестов: {e}")
+            return 0
+
+    def get_summary(self, group_ids: Optional[List[int]] = None) -> Dict:
+        """Перцентили задержки в целом, по преподавателям и по типам тестов"""
+        summary = {'window_days': self.window_days, 'sla_hours': self.sla_hours,
+                   'overall': histogram_percentiles([]), 'by_teacher': [], 'by_test_type': {},
+                   'overdue': 0}
+        summary['overall']['within_sla'] = 100.0
+        try:
+            rows = self._load_histogram(group_ids)
+            summary['overall'] = self._summarize([(upper, count) for _, _, upper, count in rows])
+
+            teachers: Dict[int, List] = {}
+            test_types: Dict[str, List] = {}
+            for teacher_id, test_type, upper, count in rows:
+                teachers.setdefault(teacher_id, []).append((upper, count))
+                test_types.setdefault(test_type, []).append((upper, count))
+
+            names = self._teacher_names([teacher_id for teacher_id in teachers if teacher_id != AUTOMATIC_REVIEWER])
+            summary['by_teacher'] = sorted(
+                (dict(self._summarize(histogram), teacher_id=teacher_id,
+                      name=names.get(teacher_id, "Автоматически" if teacher_id == AUTOMATIC_REVIEWER
+                                     else f"Преподаватель #{teacher_id}"))
+                 for teacher_id, histogram in teachers.items()),
+                key=lambda teacher: teacher['count'], reverse=True
+            )
+            summary['by_test_type'] = {
+                test_type: self._summarize(histogram) for test_type, histogram in sorted(test_types.items())
+            }
+            summary['overdue'] = self.count_overdue(group_ids)
+        except Exception as e:
+            logging.error(f"Ошибка расчета времени проверки: {e}")
+        return summary
+
+    def _teacher_names(self, teacher_ids: List[int]) -> Dict[int, str]:
+        """Имена преподавателей одним запросом"""
+        if not teacher_ids:
+            return {}
+        with sqlite3.connect(self.db.db_name) as connection:
+            rows = connection.execute(
+                f"SELECT user_id, TRIM(COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')), username "
+                f"FROM users WHERE user_id IN ({', '.join('?' * len(teacher_ids))})",
+                teacher_ids
+            ).fetchall()
+        return {user_id: name or username or f"Преподаватель #{user_id}" for user_id, name, username in rows}
+
+
+def format_turnaround_summary(summary: Dict) -> str:
+    """Время проверки для бота"""
+    overall = summary['overall']
+    text = f"\n⏱️ <b>Время проверки</b> (за {summary['window_days']} дн., срок {summary['sla_hours']:g} ч):\n"
+    if overall['count']:
+        text += (f"• Медиана {overall['p50']} ч, 90% за {overall['p90']} ч, 99% за {overall['p99']} ч\n"
+                 f"• В срок: {overall['within_sla']}% из {overall['count']}\n")
+        for teacher in summary['by_teacher'][:5]:
+            text += f"• {teacher['name']}: медиана {teacher['p50']} ч, {teacher['count']} тестов\n"
+    else:
+        text += "• Проверенных тестов за период нет\n"
+    if summary['overdue']:
+        text += f"⚠️ Ждут дольше срока: {summary['overdue']}\n"
+    return text
@@ -12,6 +12,36 @@ def validate_stepik_url(url: str) -> bool:
     pattern = r'^https://stepik\.org/(lesson|course|step)/\d+'
     return bool(re.match(pattern, url))
 
+def parse_stepik_url(url: str) -> Optional[Dict]:
+    """Разбор ссылки на Степик: тип объекта, его ID и номер шага"""
+    match = re.match(
+        r'^https?://(?:www\.)?stepik\.org/(lesson|course|step)/(\d+)[^/?#]*(?:/step/(\d+))?',
+        url.strip(),
+        re.IGNORECASE
+    )
+    if not match:
+        return None
+    
+    return {
+        'kind': match.group(1).lower(),
+        'object_id': int(match.group(2)),
+        'step': int(match.group(3)) if match.group(3) else None
+    }
+
+def normalize_stepik_url(url: str) -> str:
+    """Каноническая форма ссылки для поиска повторных отправок"""
+    parsed = parse_stepik_url(url)
+    if parsed:
+        normalized = f"https://stepik.org/{parsed['kind']}/{parsed['object_id']}"
+        if parsed['step'] is not None:
+            normalized += f"/step/{parsed['step']}"
+        return normalized
+    
+    # Прочие ссылки: без параметров, якоря и завершающего слеша, домен в нижнем регистре
+    url = re.split(r'[?#]', url.strip(), maxsplit=1)[0].rstrip('/')
+    match = re.match(r'^(?:https?://)?(?:www\.)?([^/]*)(.*)$', url, re.IGNORECASE)
+    return f"https://{match.group(1).lower()}{match.group(2)}"
+
 def validate_stepik_id(stepik_id: str) -> bool:
     """Проверка корректности ID Степика"""
     return stepik_id.isdigit() and len(stepik_id) >= 3
@@ -79,6 +109,13 @@ ID Степика: 123456
 • Ссылка: должна быть с stepik.org
 • Тип теста: 3 или 5 баллов
 
+<b>Несколько тестов одним сообщением:</b>
+<code>ФИО: Иванов Иван Иванович
+ID Степика: 123456
+Тип теста: 3
+https://stepik.org/lesson/123456/step/1
+https://stepik.org/lesson/123456/step/2</code>
+
 <b>Примеры ссылок:</b>
 • https://stepik.org/lesson/123456/step/1
 • https://stepik.org/course/789012/step/2
@@ -140,6 +177,86 @@ def validate_test_data(data: Dict[str, str]) -> Dict[str, str]:
         'errors': errors
     }
 
+def split_test_urls(value: str) -> List[str]:
+    """Ссылки, перечисленные через пробел, запятую или с новой строки"""
+    return [url for url in re.split(r'[\s,;]+', value) if url]
+
+def parse_test_submissions(text: str, max_tests: int = 20) -> Optional[Dict]:
+    """Разбор сообщения с одним или несколькими тестами за один проход
+    
+    Поддерживаются повторяющиеся блоки "Ссылка на тест / Тип теста" и список
+    ссылок (по одной в строке) с общими ФИО, ID Степика и типом теста. Тип,
+    указанный до ссылок, действует для всех ссылок без своего типа; тип после
+    ссылки относится к ее блоку. Возвращает None, если сообщение не похоже
+    на отправку тестов.
+    """
+    fields: Dict[str, List[str]] = {'ФИО': [], 'ID Степика': []}
+    tests: List[Dict[str, str]] = []
+    pending: List[Dict[str, str]] = []  # тесты без типа
+    block: List[Dict[str, str]] = []  # тесты текущего блока
+    default_type = None
+    
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        
+        if line.lower().startswith(('http://', 'https://')):
+            key, value = None, line
+        elif ':' in line:
+            key, value = (part.strip() for part in line.split(':', 1))
+        else:
+            continue
+        
+        if key is None or key == 'Ссылка на тест':
+            if key is not None:
+                block = []
+            for url in split_test_urls(value):
+                test = {'Ссылка на тест': url}
+                tests.append(test)
+                pending.append(test)
+                block.append(test)
+        elif key == 'Тип теста':
+            targets = block if default_type is not None else pending
+            if targets:
+                for test in targets:
+                    test['Тип теста'] = value
+                pending = [test for test in pending if 'Тип теста' not in test]
+                block = []
+            else:
+                default_type = value
+        elif key in fields:
+            fields[key].append(value)
+    
+    if not tests or not fields['ФИО'] or not fields['ID Степика']:
+        return None
+    
+    errors = []
+    for key, values in fields.items():
+        if len(set(values)) > 1:
+            errors.append(f"Разные значения поля «{key}» в одном сообщении")
+    if len(tests) > max_tests:
+        errors.append(f"Не больше {max_tests} тестов в одном сообщении")
+    
+    full_name, stepik_id = fields['ФИО'][0], fields['ID Степика'][0]
+    for number, test in enumerate(tests, 1):
+        if 'Тип теста' not in test and default_type is not None:
+            test['Тип теста'] = default_type
+        validation = validate_test_data({'ФИО': full_name, 'ID Степика': stepik_id, **test})
+        prefix = f"Тест {number}: " if len(tests) > 1 else ""
+        # Ошибки общих полей показываем один раз
+        errors.extend(
+            prefix + error for error in validation['errors']
+            if number == 1 or error not in ("Некорректное ФИО", "Некорректный ID Степика")
+        )
+    
+    return {
+        'full_name': full_name,
+        'stepik_id': stepik_id,
+        'tests': [{'test_url': test['Ссылка на тест'], 'test_type': test.get('Тип теста')} for test in tests],
+        'errors': errors
+    }
+
 def format_statistics_summary(stats: Dict) -> str:
     """Форматирование сводки статистики"""
     total_tests = stats.get('total_tests', 0)
@@ -163,6 +280,20 @@ def format_statistics_summary(stats: Dict) -> str:
 {get_emoji_for_score(avg_score, 5)} Общая оценка: {calculate_grade_percentage(avg_score, 5)}
 """
 
+def format_groups(groups: List[Dict], my_group_ids: List[int]) -> str:
+    """Список групп с отметкой групп преподавателя"""
+    if not groups:
+        return "👥 <b>Группы</b>\n\nГрупп пока нет."
+    
+    text = "👥 <b>Группы</b>\n\n"
+    for group in groups:
+        mark = "⭐ " if group['id'] in my_group_ids else ""
+        text += (f"{mark}#{group['id']} {group['name']}: студентов {group['students']}, "
+                 f"преподавателей {group['teachers']}\n")
+    if not my_group_ids:
+        text += "\nЗа вами группы не закреплены, списки показывают всех студентов."
+    return text
+
 def generate_feedback_message(score: int, max_score: int, comment: str = "") -> str:
     """Генерация сообщения с обратной связью"""
     emoji = get_emoji_for_score(score, max_score)
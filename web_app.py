@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from flask import Flask, render_template, request, jsonify, redirect, url_for
-from database import Database
+from storage import create_storage
 import json
 from datetime import datetime
 import os
@@ -11,7 +11,7 @@ app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-here')
 
 # Инициализация базы данных
-db = Database()
+db = create_storage()
 
 @app.route('/')
 def index():
@@ -22,73 +22,23 @@ def index():
 def students():
     """Страница со списком студентов"""
     try:
-        # Получаем всех студентов с их тестами
+        # Получаем всех одобренных студентов с их тестами
         students_data = []
+        scores = sorted(db.get_students_scores(), key=lambda student: student['full_name'])
+        # Тесты всех студентов одним запросом, а не запросом на каждого
+        tests_by_student = db.get_tests_by_student()
         
-        # Получаем всех одобренных студентов
-        conn = db.db_name
-        import sqlite3
-        conn = sqlite3.connect(conn)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT u.user_id, 
-                   COALESCE(MAX(t.full_name), 'Не указано') as full_name,
-                   COUNT(t.id) as total_tests,
-                   COUNT(CASE WHEN t.is_reviewed = TRUE THEN 1 END) as reviewed_tests,
-                   COALESCE(SUM(t.score), 0) as total_score
-            FROM users u
-            LEFT JOIN tests t ON u.user_id = t.student_id
-            WHERE u.role = "student" AND u.is_approved = TRUE
-            GROUP BY u.user_id
-            ORDER BY COALESCE(MAX(t.full_name), 'Не указано')
-        ''')
-        
-        students = cursor.fetchall()
-        
-        for student in students:
-            student_data = {
-                'user_id': student[0],
-                'full_name': student[1] or 'Не указано',
-                'stepik_id': '',  # Будет заполнено из тестов
-                'total_tests': student[2],
-                'reviewed_tests': student[3],
-                'total_score': student[4],
-                'tests': []
-            }
+        for student in scores:
+            student_data = dict(student, tests=tests_by_student.get(student['user_id'], []))
             
-            # Получаем тесты этого студента
-            cursor.execute('''
-                SELECT id, full_name, stepik_id, test_url, test_type, 
-                       submitted_at, is_reviewed, score, teacher_comment
-                FROM tests 
-                WHERE student_id = ?
-                ORDER BY submitted_at DESC
-            ''', (student[0],))
-            
-            tests = cursor.fetchall()
-            for test in tests:
-                test_data = {
-                    'id': test[0],
-                    'full_name': test[1],
-                    'stepik_id': test[2],
-                    'test_url': test[3],
-                    'test_type': test[4],
-                    'submitted_at': test[5],
-                    'is_reviewed': bool(test[6]),
-                    'score': test[7],
-                    'teacher_comment': test[8]
-                }
-                student_data['tests'].append(test_data)
-                
-                # Берем stepik_id из первого теста
-                if not student_data['stepik_id'] and test[2]:
-                    student_data['stepik_id'] = test[2]
+            # Берем stepik_id из первого теста
+            for test in student_data['tests']:
+                if test['stepik_id']:
+                    student_data['stepik_id'] = test['stepik_id']
+                    break
             
             students_data.append(student_data)
         
-        conn.close()
-        
         return render_template('students.html', students=students_data)
         
     except Exception as e:
@@ -107,8 +57,7 @@ def pending_tests():
 def evaluate_test(test_id):
     """Страница оценки теста"""
     try:
-        tests = db.get_pending_tests()
-        test = next((t for t in tests if t['id'] == test_id), None)
+        test = db.get_pending_test(test_id)
         
         if not test:
             return "Тест не найден", 404
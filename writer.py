@@ -0,0 +1,181 @@
+"""
+Групповая фиксация записей в базу данных
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Операция записи получает курсор открытой транзакции и возвращает результат запроса
+WriteOperation = Callable[[sqlite3.Cursor], Any]
+
+
+class GroupCommitWriter:
+    """Поток записи, объединяющий одновременные запросы в одну транзакцию.
+
+    SQLite допускает только одного писателя, и каждая отдельная транзакция
+    платит за свой fsync. Запросы, пришедшие в течение ``max_delay`` секунд
+    после первого, фиксируются вместе; результат каждого запроса
+    возвращается через его Future. Если пакет не удалось зафиксировать
+    (например, база заблокирована дольше ``timeout`` секунд), ошибку
+    получают все его запросы.
+    """
+
+    def __init__(self, db_name: str, max_delay: float = 0.005, max_batch: int = 256,
+                 timeout: float = 30):
+        self.db_name = db_name
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[Tuple[WriteOperation, Future]]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'requests': 0,
+            'failed_requests': 0,
+            'failed_batches': 0,
+            'max_batch_size': 0,
+            'last_batch_size': 0,
+            'total_commit_ms': 0.0,
+            'max_commit_ms': 0.0,
+            'last_commit_ms': 0.0,
+        }
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='db-group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: WriteOperation) -> Future:
+        """Постановка операции записи в очередь"""
+        future: Future = Future()
+        if self._closed:
+            future.set_exception(RuntimeError("Поток записи остановлен"))
+            return future
+
+        self._queue.put((operation, future))
+        return future
+
+    def execute(self, operation: WriteOperation, timeout: Optional[float] = None) -> Any:
+        """Синхронное выполнение операции записи"""
+        return self.submit(operation).result(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Остановка потока записи после обработки очереди"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        """Статистика размеров пакетов и задержки фиксации"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        batches = stats.pop('batches')
+        total_commit_ms = stats.pop('total_commit_ms')
+        stats['batches'] = batches
+        stats['queue_size'] = self._queue.qsize()
+        stats['avg_batch_size'] = round(stats['requests'] / batches, 2) if batches else 0
+        stats['avg_commit_ms'] = round(total_commit_ms / batches, 3) if batches else 0
+        stats['max_commit_ms'] = round(stats['max_commit_ms'], 3)
+        stats['last_commit_ms'] = round(stats['last_commit_ms'], 3)
+        return stats
+
+    def _collect_batch(self) -> Tuple[List[Tuple[WriteOperation, Future]], bool]:
+        """Сбор запросов, пришедших в окне ожидания"""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _run(self):
+        """Основной цикл потока записи"""
+        connection = sqlite3.connect(self.db_name, timeout=self.timeout, isolation_level=None)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+        except sqlite3.Error as e:
+            logging.warning(f"Не удалось включить WAL: {e}")
+
+        try:
+            while True:
+                batch, stop = self._collect_batch()
+                if batch:
+                    self._commit_batch(connection, batch)
+                if stop:
+                    break
+        finally:
+            connection.close()
+
+    def _commit_batch(self, connection: sqlite3.Connection, batch: List[Tuple[WriteOperation, Future]]):
+        """Выполнение пакета запросов в одной транзакции"""
+        started = time.perf_counter()
+        results = []
+        failed = 0
+        cursor = connection.cursor()
+
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                # Ошибка одного запроса не должна откатывать остальные
+                cursor.execute('SAVEPOINT request')
+                try:
+                    result = operation(cursor)
+                    cursor.execute('RELEASE SAVEPOINT request')
+                    results.append((future, result, None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO SAVEPOINT request')
+                    cursor.execute('RELEASE SAVEPOINT request')
+                    results.append((future, None, e))
+                    failed += 1
+            cursor.execute('COMMIT')
+        except Exception as e:
+            logging.error(f"Ошибка групповой фиксации ({len(batch)} запросов): {e}")
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            # Ошибку получают и запросы, до которых очередь не дошла
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._stats_lock:
+                self._stats['failed_batches'] += 1
+                self._stats['failed_requests'] += len(batch)
+            return
+
+        commit_ms = (time.perf_counter() - started) * 1000
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        with self._stats_lock:
+            self._stats['batches'] += 1
+            self._stats['requests'] += len(batch)
+            self._stats['failed_requests'] += failed
+            self._stats['last_batch_size'] = len(batch)
+            self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            self._stats['total_commit_ms'] += commit_ms
+            self._stats['last_commit_ms'] = commit_ms
+            self._stats['max_commit_ms'] = max(self._stats['max_commit_ms'], commit_ms)